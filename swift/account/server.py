@@ -23,7 +23,8 @@ from eventlet import Timeout
 import swift.common.db
 from swift.account.backend import AccountBroker, DATADIR
 from swift.account.utils import account_listing_response, get_response_headers
-from swift.common.db import DatabaseConnectionError, DatabaseAlreadyExists
+from swift.common.db import DatabaseConnectionError, DatabaseAlreadyExists, \
+    PendingCommitter
 from swift.common.request_helpers import get_param, get_listing_content_type, \
     split_and_validate_path
 from swift.common.utils import get_logger, hash_path, public, \
@@ -59,6 +60,20 @@ class AccountController(BaseStorageServer):
             conf.get('auto_create_account_prefix') or '.'
         swift.common.db.DB_PREALLOCATION = \
             config_true_value(conf.get('db_preallocation', 'f'))
+        self.committer = None
+        if config_true_value(conf.get('async_commits', 'false')):
+            self.committer = PendingCommitter(
+                self.logger,
+                interval=float(conf.get('async_commit_interval', 1)),
+                max_time=float(conf.get('async_commit_max_time', 0.05)),
+                pending_cap=int(conf.get('async_commit_pending_cap',
+                                         1048576)),
+                rcache=os.path.join(
+                    conf.get('recon_cache_path', '/var/cache/swift'),
+                    'account.recon'),
+                recon_key='account_db_committer',
+                stats_interval=float(
+                    conf.get('async_commit_stats_interval', 30)))
 
     def _get_account_broker(self, drive, part, account, **kwargs):
         hsh = hash_path(account)
@@ -66,6 +81,7 @@ class AccountController(BaseStorageServer):
         db_path = os.path.join(self.root, drive, db_dir, hsh + '.db')
         kwargs.setdefault('account', account)
         kwargs.setdefault('logger', self.logger)
+        kwargs.setdefault('committer', self.committer)
         return AccountBroker(db_path, **kwargs)
 
     def _deleted_response(self, broker, req, resp, body=''):
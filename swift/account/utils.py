@@ -13,10 +13,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
 import time
-from xml.sax import saxutils
 
+from swift.common.listing_formats import encode_json_listing, \
+    encode_plain_listing, encode_xml_account_listing
 from swift.common.swob import HTTPOk, HTTPNoContent
 from swift.common.utils import Timestamp
 from swift.common.storage_policy import POLICIES
@@ -79,37 +79,23 @@ def account_listing_response(account, req, response_content_type, broker=None,
 
     account_list = broker.list_containers_iter(limit, marker, end_marker,
                                                prefix, delimiter, reverse)
+    # the listing is encoded as it is sent, rather than all at once
+    records = ({'subdir': name} if is_subdir else
+               {'name': name, 'count': object_count, 'bytes': bytes_used}
+               for (name, object_count, bytes_used, is_subdir)
+               in account_list)
     if response_content_type == 'application/json':
-        data = []
-        for (name, object_count, bytes_used, is_subdir) in account_list:
-            if is_subdir:
-                data.append({'subdir': name})
-            else:
-                data.append({'name': name, 'count': object_count,
-                             'bytes': bytes_used})
-        account_list = json.dumps(data)
+        body = encode_json_listing(records)
     elif response_content_type.endswith('/xml'):
-        output_list = ['<?xml version="1.0" encoding="UTF-8"?>',
-                       '<account name=%s>' % saxutils.quoteattr(account)]
-        for (name, object_count, bytes_used, is_subdir) in account_list:
-            if is_subdir:
-                output_list.append(
-                    '<subdir name=%s />' % saxutils.quoteattr(name))
-            else:
-                item = '<container><name>%s</name><count>%s</count>' \
-                       '<bytes>%s</bytes></container>' % \
-                       (saxutils.escape(name), object_count, bytes_used)
-                output_list.append(item)
-        output_list.append('</account>')
-        account_list = '\n'.join(output_list)
+        body = encode_xml_account_listing(account, records)
     else:
         if not account_list:
             resp = HTTPNoContent(request=req, headers=resp_headers)
             resp.content_type = response_content_type
             resp.charset = 'utf-8'
             return resp
-        account_list = '\n'.join(r[0] for r in account_list) + '\n'
-    ret = HTTPOk(body=account_list, request=req, headers=resp_headers)
+        body = encode_plain_listing(r[0] for r in account_list)
+    ret = HTTPOk(app_iter=body, request=req, headers=resp_headers)
     ret.content_type = response_content_type
     ret.charset = 'utf-8'
     return ret
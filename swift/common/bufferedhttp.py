@@ -17,7 +17,7 @@
 Monkey Patch httplib.HTTPResponse to buffer reads of headers. This can improve
 performance when making large numbers of small HTTP requests.  This module
 also provides helper functions to make HTTP connections using
-BufferedHTTPResponse.
+BufferedHTTPResponse, and a pool of persistent connections for them to reuse.
 
 .. warning::
 
@@ -28,13 +28,15 @@ BufferedHTTPResponse.
 
 from swift import gettext_ as _
 from swift.common import constraints
+from collections import defaultdict, deque
 import logging
+import select
 import time
 import socket
 
 import eventlet
-from eventlet.green.httplib import CONTINUE, HTTPConnection, HTTPMessage, \
-    HTTPResponse, HTTPSConnection, _UNKNOWN
+from eventlet.green.httplib import BadStatusLine, CONTINUE, HTTPConnection, \
+    HTTPMessage, HTTPResponse, HTTPSConnection, _UNKNOWN
 from six.moves.urllib.parse import quote
 import six
 
@@ -44,6 +46,129 @@ else:
     httplib = eventlet.import_patched('http.client')
 httplib._MAXHEADERS = constraints.MAX_HEADER_COUNT
 
+# the pool that http_connect() reuses connections from, if any; see
+# set_connection_pool()
+_connection_pool = None
+
+
+class ConnectionPool(object):
+    """
+    A pool of idle persistent connections to backend servers, for each
+    process to reuse rather than setting up a new connection for each
+    request.
+
+    A connection is returned to the pool once its response has been read to
+    the end, unless the server said it would close it.  Connections idle for
+    longer than ``idle_timeout`` are closed, as are any beyond
+    ``max_idle_per_node`` for each server.
+
+    :param max_idle_per_node: maximum number of idle connections to keep to
+                              each server
+    :param idle_timeout: seconds after which an idle connection is closed;
+                         this should be less than the keepalive_timeout of
+                         the servers
+    :param logger: a logger to send the pool's statsd metrics to
+    """
+
+    def __init__(self, max_idle_per_node=8, idle_timeout=10.0, logger=None):
+        self.max_idle_per_node = max_idle_per_node
+        self.idle_timeout = idle_timeout
+        self.logger = logger
+        # host -> deque of (socket, time it was returned to the pool)
+        self._idle = defaultdict(deque)
+        self._last_evict = time.time()
+
+    def _increment(self, metric):
+        if self.logger:
+            self.logger.increment('backend_pool.' + metric)
+
+    def _close(self, sock):
+        try:
+            sock.close()
+        except (socket.error, IOError):
+            pass
+
+    def _usable(self, sock):
+        # an idle connection should have nothing to read; if it does, the
+        # server has closed it (or sent something it should not have)
+        try:
+            readable = select.select([sock.fileno()], [], [], 0)[0]
+        except (socket.error, select.error, ValueError):
+            return False
+        return not readable
+
+    def _evict(self, now):
+        """
+        Close the connections which have been idle for too long.
+        """
+        self._last_evict = now
+        for host, idle in list(self._idle.items()):
+            while idle and idle[0][1] < now - self.idle_timeout:
+                self._close(idle.popleft()[0])
+                self._increment('evictions')
+            if not idle:
+                del self._idle[host]
+
+    def get(self, host):
+        """
+        Returns an idle connection's socket to host, or None if there are
+        none.
+
+        :param host: the server's ``ip:port``
+        """
+        now = time.time()
+        if now - self._last_evict >= self.idle_timeout:
+            self._evict(now)
+        idle = self._idle.get(host)
+        while idle:
+            # most recently used first, as it is least likely to have been
+            # closed by the server
+            sock, idle_since = idle.pop()
+            if idle_since >= now - self.idle_timeout and self._usable(sock):
+                self._increment('hits')
+                return sock
+            self._close(sock)
+            self._increment('evictions')
+        self._increment('misses')
+        return None
+
+    def put(self, host, sock):
+        """
+        Return a connection's socket to the pool.
+
+        :param host: the server's ``ip:port``
+        :param sock: the socket of a connection with no request outstanding
+        """
+        idle = self._idle[host]
+        if len(idle) >= self.max_idle_per_node:
+            self._close(sock)
+            self._increment('discards')
+            return
+        idle.append((sock, time.time()))
+
+    def close(self):
+        """
+        Close all of the idle connections.
+        """
+        for idle in self._idle.values():
+            for sock, idle_since in idle:
+                self._close(sock)
+        self._idle.clear()
+
+
+def set_connection_pool(pool):
+    """
+    Make :func:`http_connect` and :func:`http_connect_raw` reuse persistent
+    connections from a pool for requests without ssl, and return them to
+    it once their responses have been read.
+
+    :param pool: a ConnectionPool, or None to stop reusing connections
+    """
+    global _connection_pool
+    if _connection_pool is not None and _connection_pool is not pool:
+        _connection_pool.close()
+    _connection_pool = pool
+
 
 class BufferedHTTPResponse(HTTPResponse):
     """HTTPResponse class that buffers reading of headers"""
@@ -72,6 +197,10 @@ class BufferedHTTPResponse(HTTPResponse):
         self.length = _UNKNOWN          # number of bytes left in response
         self.will_close = _UNKNOWN      # conn will close at end of response
         self._readline_buffer = ''
+        # set by BufferedHTTPConnection.getresponse() if the connection came
+        # from a ConnectionPool
+        self._conn = None
+        self._conn_pool = None
 
     def expect_response(self):
         if self.fp:
@@ -147,6 +276,17 @@ class BufferedHTTPResponse(HTTPResponse):
         self.close()
 
     def close(self):
+        pool, self._conn_pool = self._conn_pool, None
+        # the response has been read to the end if httplib is closing it
+        # with nothing left to read
+        if pool is not None and self.sock is not None and \
+                self.length == 0 and not self.chunked and \
+                not self.will_close:
+            # the connection no longer owns the socket, so that closing it
+            # does not close the socket under whoever reuses it next
+            self._conn.sock = None
+            pool.put(self._conn.host_port, self.sock)
+        self._conn = None
         HTTPResponse.close(self)
         self.sock = None
         self._real_socket = None
@@ -155,6 +295,11 @@ class BufferedHTTPResponse(HTTPResponse):
 class BufferedHTTPConnection(HTTPConnection):
     """HTTPConnection class that uses BufferedHTTPResponse"""
     response_class = BufferedHTTPResponse
+    # the ConnectionPool to return the connection to after its response
+    _conn_pool = None
+    # (method, path, headers) of a request that may be sent again on a new
+    # connection if the pooled one it was sent on turns out to be closed
+    _retry_request = None
 
     def connect(self):
         self._connected_time = time.time()
@@ -168,6 +313,11 @@ class BufferedHTTPConnection(HTTPConnection):
         return HTTPConnection.putrequest(self, method, url, skip_host,
                                          skip_accept_encoding)
 
+    def send(self, data):
+        # a request with a body cannot be sent again
+        self._retry_request = None
+        return HTTPConnection.send(self, data)
+
     def getexpect(self):
         response = BufferedHTTPResponse(self.sock, strict=self.strict,
                                         method=self._method)
@@ -175,7 +325,23 @@ class BufferedHTTPConnection(HTTPConnection):
         return response
 
     def getresponse(self):
-        response = HTTPConnection.getresponse(self)
+        try:
+            response = HTTPConnection.getresponse(self)
+        except (socket.error, BadStatusLine):
+            if self._retry_request is None:
+                raise
+            # the server closed the pooled connection before answering (e.g.
+            # it timed out idle as the request went out); send the request
+            # once more on a new connection
+            method, path, headers = self._retry_request
+            self._retry_request = None
+            self.close()
+            _send_request(self, method, path, headers)
+            response = HTTPConnection.getresponse(self)
+        self._retry_request = None
+        if self._conn_pool is not None and not response.will_close:
+            response._conn = self
+            response._conn_pool = self._conn_pool
         logging.debug("HTTP PERF: %(time).5f seconds to %(method)s "
                       "%(host)s:%(port)s %(path)s)",
                       {'time': time.time() - self._connected_time,
@@ -235,16 +401,47 @@ def http_connect_raw(ipaddr, port, method, path, headers=None,
     """
     if not port:
         port = 443 if ssl else 80
-    if ssl:
-        conn = HTTPSConnection('%s:%s' % (ipaddr, port))
-    else:
-        conn = BufferedHTTPConnection('%s:%s' % (ipaddr, port))
-    if query_string:
-        path += '?' + query_string
-    conn.path = path
-    conn.putrequest(method, path, skip_host=(headers and 'Host' in headers))
+    host_port = '%s:%s' % (ipaddr, port)
+    pool = None if ssl else _connection_pool
+    sock = pool.get(host_port) if pool else None
+    while True:
+        if ssl:
+            conn = HTTPSConnection(host_port)
+        else:
+            conn = BufferedHTTPConnection(host_port)
+            conn.host_port = host_port
+            conn._conn_pool = pool
+            if sock is not None:
+                conn.sock = sock
+                conn._connected_time = time.time()
+        if query_string:
+            path += '?' + query_string
+            query_string = None
+        conn.path = path
+        try:
+            _send_request(conn, method, path, headers)
+        except socket.error:
+            if sock is None:
+                raise
+            # the server closed the pooled connection; use a new one
+            conn.close()
+            sock = None
+            continue
+        if sock is not None and method in ('GET', 'HEAD', 'DELETE'):
+            # set after the headers are sent, so that only sending a body
+            # (see BufferedHTTPConnection.send) stops the request being
+            # retried
+            conn._retry_request = (method, path, headers)
+        return conn
+
+
+def _send_request(conn, method, path, headers):
+    """
+    Send the request line and headers of a request on a connection.
+    """
+    conn.putrequest(method, path,
+                    skip_host=(headers and 'Host' in headers))
     if headers:
         for header, value in headers.items():
             conn.putheader(header, str(value))
     conn.endheaders()
-    return conn
@@ -20,22 +20,26 @@ import hashlib
 import json
 import logging
 import os
+import re
+import struct
 from uuid import uuid4
 import sys
 import time
 import errno
 import six
 import six.moves.cPickle as pickle
+import zlib
 from swift import gettext_ as _
 from tempfile import mkstemp
 
-from eventlet import sleep, Timeout
+from eventlet import sleep, spawn, Timeout
+from eventlet.event import Event
 import sqlite3
 
 from swift.common.constraints import MAX_META_COUNT, MAX_META_OVERALL_SIZE, \
     check_utf8
 from swift.common.utils import Timestamp, renamer, \
-    mkdirs, lock_parent_directory, fallocate
+    mkdirs, lock_parent_directory, fallocate, dump_recon_cache
 from swift.common.exceptions import LockTimeout
 from swift.common.swob import HTTPBadRequest
 
@@ -49,6 +53,109 @@ PICKLE_PROTOCOL = 2
 #: Max size of .pending file in bytes. When this is exceeded, the pending
 # records will be merged.
 PENDING_CAP = 131072
+#: Max number of pending records merged in one transaction.
+PENDING_COMMIT_BATCH = 1000
+#: Size of the reads of a .pending file when committing its records.
+PENDING_CHUNK_SIZE = 65536
+#: Marks the start of each record in a .pending file. Older versions wrote
+# a colon followed by the base64 encoded pickle instead; both may be found in
+# the same file, so the magic starts with a byte base64 never uses.
+PENDING_RECORD_MAGIC = '\x00PR1'
+# magic, length of the pickled record, CRC32 of the pickled record
+_PENDING_RECORD_HEADER = struct.Struct('!4sII')
+_PENDING_DELIMITER = re.compile(':|%s' % re.escape(PENDING_RECORD_MAGIC))
+
+
+def encode_pending_record(record_tuple):
+    """
+    Encode a record for appending to a .pending file.
+
+    :param record_tuple: the record, as returned by
+                         :func:`DatabaseBroker.make_tuple_for_pickle`
+    :returns: the encoded record, as a string
+    """
+    payload = pickle.dumps(record_tuple, protocol=PICKLE_PROTOCOL)
+    return _PENDING_RECORD_HEADER.pack(
+        PENDING_RECORD_MAGIC, len(payload),
+        zlib.crc32(payload) & 0xffffffff) + payload
+
+
+def decode_pending_records(fp, chunk_size=PENDING_CHUNK_SIZE):
+    """
+    Decode the records of a .pending file, reading it a chunk at a time.
+    Both the records written by :func:`encode_pending_record` and the base64
+    encoded records of older versions are decoded.
+
+    :param fp: the .pending file, open for reading
+    :param chunk_size: the number of bytes to read at a time
+    :returns: a generator of (record tuple, entry) tuples; the record tuple
+              is None if the entry could not be decoded, e.g. because a
+              crash left it half written
+    """
+    buf = ''
+    pos = 0
+    # the number of bytes needed in buf past pos to decode the next entry
+    want = 1
+    eof = False
+    while True:
+        if not eof and len(buf) - pos < want:
+            chunk = fp.read(max(chunk_size, want - len(buf) + pos))
+            if chunk:
+                buf = buf[pos:] + chunk
+                pos = 0
+            else:
+                eof = True
+            continue
+        if pos >= len(buf):
+            return
+        want = 1
+        end = None
+        if buf.startswith(PENDING_RECORD_MAGIC, pos):
+            if len(buf) - pos >= _PENDING_RECORD_HEADER.size:
+                magic, length, crc = _PENDING_RECORD_HEADER.unpack_from(
+                    buf, pos)
+                start = pos + _PENDING_RECORD_HEADER.size
+                if start + length > len(buf) and not eof:
+                    want = _PENDING_RECORD_HEADER.size + length
+                    continue
+                payload = buf[start:start + length]
+                if len(payload) == length and \
+                        zlib.crc32(payload) & 0xffffffff == crc:
+                    try:
+                        record_tuple = pickle.loads(payload)
+                    except Exception:
+                        pass
+                    else:
+                        pos = start + length
+                        yield record_tuple, payload
+                        continue
+            elif not eof:
+                want = _PENDING_RECORD_HEADER.size
+                continue
+        elif buf.startswith(':', pos):
+            # a record written by an older version
+            match = _PENDING_DELIMITER.search(buf, pos + 1)
+            if not match and not eof:
+                want = len(buf) - pos + chunk_size
+                continue
+            end = match.start() if match else len(buf)
+            entry = buf[pos + 1:end]
+            pos = end
+            if entry:
+                try:
+                    yield pickle.loads(entry.decode('base64')), entry
+                except Exception:
+                    yield None, entry
+            continue
+        # skip whatever is left of a torn or corrupt record
+        match = _PENDING_DELIMITER.search(buf, pos + 1)
+        if not match and not eof:
+            want = len(buf) - pos + chunk_size
+            continue
+        end = match.start() if match else len(buf)
+        entry = buf[pos:end]
+        pos = end
+        yield None, entry
 
 
 def utf8encode(*args):
@@ -196,14 +303,191 @@ def get_db_connection(path, timeout=30, okay_to_create=False):
     return conn
 
 
+class PendingCommitter(object):
+    """
+    Commits the .pending files of the DBs updated by a server's worker from
+    a background greenthread, so that the requests appending records to them
+    do not have to merge the records themselves.
+
+    Brokers created with a committer report each record they append to
+    :meth:`notify`. A DB is committed once its .pending file has grown to
+    the committer's batch size, or once its oldest record has waited
+    ``interval`` seconds. The batch size adapts to how long commits take: it
+    is halved after a commit that took longer than ``max_time`` and doubled
+    after one that took less than half of that, between
+    :attr:`min_batch_size` and ``pending_cap``. Writers only commit the
+    .pending file themselves once it is bigger than ``pending_cap``, and
+    readers still commit whatever the committer has not yet committed.
+
+    :param logger: a logger
+    :param interval: maximum seconds a record waits for the committer
+    :param max_time: seconds a single commit should take at most
+    :param pending_cap: size in bytes of .pending files past which writers
+                        commit them themselves
+    :param rcache: path of the recon cache file to write statistics to, or
+                   None
+    :param recon_key: the key of the statistics in the recon cache
+    :param stats_interval: minimum seconds between writing statistics
+    """
+    min_batch_size = 4096
+
+    def __init__(self, logger, interval=1.0, max_time=0.05,
+                 pending_cap=PENDING_CAP * 8, rcache=None,
+                 recon_key='db_committer', stats_interval=30):
+        self.logger = logger
+        self.interval = interval
+        self.max_time = max_time
+        self.pending_cap = pending_cap
+        self.rcache = rcache
+        self.recon_key = recon_key
+        self.stats_interval = stats_interval
+        self.batch_size = min(PENDING_CAP, pending_cap)
+        # db_file -> [broker, size of .pending, time of its oldest record]
+        self._waiting = {}
+        self._wakeup = Event()
+        self._thread = None
+        self._stats_dumped = time.time()
+        self.stats = {'commits': 0, 'commit_time': 0.0, 'failures': 0,
+                      'max_lag': 0.0, 'reads': 0, 'read_time': 0.0,
+                      'max_read_time': 0.0}
+
+    def notify(self, broker, pending_size):
+        """
+        Note that a record was appended to a DB's .pending file.
+
+        :param broker: the broker that appended the record
+        :param pending_size: the size of the .pending file after the append
+        """
+        waiting = self._waiting.get(broker.db_file)
+        if waiting is None:
+            waiting = self._waiting[broker.db_file] = [
+                broker, pending_size, time.time()]
+        else:
+            waiting[1] = pending_size
+        if pending_size >= self.batch_size and not self._wakeup.ready():
+            self._wakeup.send()
+        if self._thread is None:
+            self._thread = spawn(self._run)
+
+    def reader_committed(self, broker, elapsed):
+        """
+        Note that a reader committed a DB's .pending file.
+
+        :param broker: the broker of the reader
+        :param elapsed: seconds the reader spent committing
+        """
+        self._waiting.pop(broker.db_file, None)
+        self.stats['reads'] += 1
+        self.stats['read_time'] += elapsed
+        self.stats['max_read_time'] = max(self.stats['max_read_time'],
+                                          elapsed)
+
+    def _time_to_wait(self, now=None):
+        """
+        Return the seconds until the oldest waiting record is due, or until
+        ``interval`` has passed if that is sooner.
+
+        :param now: the current time; defaults to time.time()
+        """
+        if not self._waiting:
+            return self.interval
+        now = time.time() if now is None else now
+        oldest = min(waiting[2] for waiting in self._waiting.values())
+        return max(0, min(self.interval, oldest + self.interval - now))
+
+    def _run(self):
+        while True:
+            # Event.wait() does not take a timeout in older eventlets
+            with Timeout(self._time_to_wait(), False):
+                self._wakeup.wait()
+            self._wakeup = Event()
+            try:
+                self.commit_due()
+                self.dump_stats()
+            except Exception:
+                self.logger.exception(_('Error committing pending records'))
+
+    def commit_due(self, now=None):
+        """
+        Commit the .pending files that are due, either because they have
+        grown to the batch size or because they have waited long enough.
+
+        :param now: the current time; defaults to time.time()
+        """
+        now = time.time() if now is None else now
+        due = [(db_file, waiting) for db_file, waiting in
+               self._waiting.items() if waiting[1] >= self.batch_size or
+               now - waiting[2] >= self.interval]
+        for db_file, (broker, pending_size, since) in due:
+            if self._waiting.get(db_file, [None])[0] is not broker:
+                # committed by a reader in the meantime
+                continue
+            del self._waiting[db_file]
+            self._commit(broker, since)
+            sleep()
+
+    def _commit(self, broker, since):
+        if not os.path.exists(broker.pending_file):
+            # e.g. the DB was deleted in the meantime
+            return
+        start = time.time()
+        try:
+            with lock_parent_directory(broker.pending_file,
+                                       broker.pending_timeout):
+                broker._commit_puts()
+        except Exception:
+            self.stats['failures'] += 1
+            self.logger.exception(
+                _('Error committing pending records to %s'), broker.db_file)
+            return
+        elapsed = time.time() - start
+        self.stats['commits'] += 1
+        self.stats['commit_time'] += elapsed
+        self.stats['max_lag'] = max(self.stats['max_lag'],
+                                    start + elapsed - since)
+        if elapsed > self.max_time:
+            self.batch_size = max(self.batch_size // 2, self.min_batch_size)
+        elif elapsed < self.max_time / 2:
+            self.batch_size = min(self.batch_size * 2, self.pending_cap)
+
+    def get_stats(self):
+        """
+        Returns a dict of the committer's statistics.
+        """
+        stats = dict(self.stats)
+        stats['batch_size'] = self.batch_size
+        stats['waiting'] = len(self._waiting)
+        return stats
+
+    def dump_stats(self, force=False):
+        """
+        Write the committer's statistics to the recon cache, under this
+        worker's pid, if stats_interval has passed since they were last
+        written.
+
+        :param force: write the statistics regardless of when they were last
+                      written
+        """
+        now = time.time()
+        if not self.rcache or not (
+                force or now - self._stats_dumped >= self.stats_interval):
+            return
+        self._stats_dumped = now
+        stats = self.get_stats()
+        stats['updated'] = now
+        dump_recon_cache({self.recon_key: {str(os.getpid()): stats}},
+                         self.rcache, self.logger)
+
+
 class DatabaseBroker(object):
     """Encapsulates working with a database."""
 
     def __init__(self, db_file, timeout=BROKER_TIMEOUT, logger=None,
                  account=None, container=None, pending_timeout=None,
-                 stale_reads_ok=False):
+                 stale_reads_ok=False, committer=None):
         """Encapsulates working with a database."""
         self.conn = None
+        self.committer = committer
         self.db_file = db_file
         self.pending_file = self.db_file + '.pending'
         self.pending_timeout = pending_timeout or 10
@@ -575,23 +859,25 @@ class DatabaseBroker(object):
             except OSError as err:
                 if err.errno != errno.ENOENT:
                     raise
-            if pending_size > PENDING_CAP:
-                self._commit_puts([record])
+            if self.committer:
+                pending_cap = self.committer.pending_cap
             else:
-                with open(self.pending_file, 'a+b') as fp:
-                    # Colons aren't used in base64 encoding; so they are our
-                    # delimiter
-                    fp.write(':')
-                    fp.write(pickle.dumps(
-                        self.make_tuple_for_pickle(record),
-                        protocol=PICKLE_PROTOCOL).encode('base64'))
-                    fp.flush()
+                pending_cap = PENDING_CAP
+            if pending_size > pending_cap:
+                self._commit_puts([record])
+                return
+            data = encode_pending_record(self.make_tuple_for_pickle(record))
+            with open(self.pending_file, 'a+b') as fp:
+                fp.write(data)
+                fp.flush()
+        if self.committer:
+            self.committer.notify(self, pending_size + len(data))
 
     def _commit_puts(self, item_list=None):
         """
         Scan for .pending files and commit the found records by feeding them
-        to merge_items(). Assume that lock_parent_directory has already been
-        called.
+        to merge_items(), at most PENDING_COMMIT_BATCH of them at a time.
+        Assume that lock_parent_directory has already been called.
 
         :param item_list: A list of items to commit in addition to .pending
         """
@@ -605,14 +891,21 @@ class DatabaseBroker(object):
                 self.merge_items(item_list)
             return
         with open(self.pending_file, 'r+b') as fp:
-            for entry in fp.read().split(':'):
-                if entry:
-                    try:
-                        self._commit_puts_load(item_list, entry)
-                    except Exception:
-                        self.logger.exception(
-                            _('Invalid pending entry %(file)s: %(entry)s'),
-                            {'file': self.pending_file, 'entry': entry})
+            for record_tuple, entry in decode_pending_records(fp):
+                if record_tuple is None:
+                    self.logger.error(
+                        _('Invalid pending entry %(file)s: %(entry)r'),
+                        {'file': self.pending_file, 'entry': entry})
+                    continue
+                try:
+                    self._commit_puts_load(item_list, record_tuple)
+                except Exception:
+                    self.logger.exception(
+                        _('Invalid pending entry %(file)s: %(entry)r'),
+                        {'file': self.pending_file, 'entry': entry})
+                if len(item_list) >= PENDING_COMMIT_BATCH:
+                    self.merge_items(item_list)
+                    item_list = []
             if item_list:
                 self.merge_items(item_list)
             try:
@@ -628,6 +921,7 @@ class DatabaseBroker(object):
         """
         if self.db_file == ':memory:' or not os.path.exists(self.pending_file):
             return
+        start = time.time()
         try:
             with lock_parent_directory(self.pending_file,
                                        self.pending_timeout):
@@ -635,10 +929,14 @@ class DatabaseBroker(object):
         except (LockTimeout, sqlite3.OperationalError):
             if not self.stale_reads_ok:
                 raise
+        else:
+            if self.committer:
+                self.committer.reader_committed(self, time.time() - start)
 
     def _commit_puts_load(self, item_list, entry):
         """
-        Unmarshall the :param:entry and append it to :param:item_list.
+        Turn the :param:entry, a record tuple read from the .pending file, into
+        a record dict and append it to :param:item_list.
         This is implemented by a particular broker to be compatible
         with its :func:`merge_items`.
         """
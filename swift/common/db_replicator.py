@@ -703,6 +703,9 @@ class ReplicatorRpc(object):
             mkdirs(os.path.join(self.root, drive, 'tmp'))
             if not os.path.exists(db_file):
                 return HTTPNotFound()
+            if not hasattr(self, op):
+                # the op of a newer replicator, which carries on without it
+                return HTTPBadRequest(body='Unknown op %s' % op)
             return getattr(self, op)(self.broker_class(db_file), args)
 
     @contextmanager
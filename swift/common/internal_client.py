@@ -28,8 +28,9 @@ from zlib import compressobj
 
 from swift.common.exceptions import ClientException
 from swift.common.http import HTTP_NOT_FOUND, HTTP_MULTIPLE_CHOICES
+from swift.common.listing_formats import decode_json_listing
 from swift.common.swob import Request
-from swift.common.utils import quote
+from swift.common.utils import quote, closing_if_possible
 from swift.common.wsgi import loadapp, pipeline_property
 
 
@@ -259,7 +260,11 @@ class InternalClient(object):
                 if resp.status_int >= HTTP_MULTIPLE_CHOICES:
                     ''.join(resp.app_iter)
                 break
-            data = json.loads(resp.body)
+            # the page is decoded as it is read, but the response is closed
+            # before any of it is yielded, as the caller may take a while
+            # over each item
+            with closing_if_possible(resp.app_iter):
+                data = list(decode_json_listing(resp.app_iter))
             if not data:
                 break
             for item in data:
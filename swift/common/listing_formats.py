@@ -0,0 +1,263 @@
+# Copyright (c) 2010-2016 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Incremental encoding and decoding of account and container listings.
+
+The encoders take the records of a listing as dicts, as they appear in a
+JSON listing, and return iterators of chunks of the response body, so that a
+server can start sending a listing before all of it has been encoded. The
+output is byte for byte what encoding the whole listing at once would give.
+
+:func:`decode_json_listing` goes the other way, yielding the records of a
+JSON listing as the chunks of its body arrive.
+"""
+
+import json
+import re
+from xml.sax import saxutils
+
+import six
+
+# the encoders join the pieces of a listing into chunks of about this size
+LISTING_CHUNK_SIZE = 65536
+# the number of records encoded by each call to json.dumps
+JSON_BATCH_SIZE = 100
+
+# the fields of an object in an XML container listing that come first, in
+# this order; any others follow in name order
+XML_OBJECT_FIELDS = ('name', 'hash', 'bytes', 'content_type', 'last_modified')
+
+_XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>'
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_JSON_SEPARATOR = re.compile(r'[ \t\n\r]*,[ \t\n\r]*')
+
+
+def _join_chunks(pieces, chunk_size):
+    chunk = []
+    size = 0
+    for piece in pieces:
+        chunk.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _utf8(value):
+    if isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def _xml_text(value):
+    # as ElementTree escapes the text of an element
+    return saxutils.escape(_utf8(value))
+
+
+def _xml_attr(value):
+    # as ElementTree quotes an attribute
+    return '"%s"' % saxutils.escape(_utf8(value),
+                                    {'"': '&quot;', '\n': '&#10;'})
+
+
+def _xml_element(tag, value):
+    text = _xml_text(value)
+    if not text:
+        return '<%s />' % tag
+    return '<%s>%s</%s>' % (tag, text, tag)
+
+
+def encode_json_listing(records, chunk_size=LISTING_CHUNK_SIZE):
+    """
+    Encode a listing as a JSON array.
+
+    :param records: an iterable of the listing's dicts
+    :param chunk_size: the approximate size of the chunks to return
+    :returns: an iterator of chunks of the encoded listing
+    """
+    def pieces():
+        # records are encoded a batch at a time, as each call to json.dumps
+        # costs about as much as encoding a record
+        yield '['
+        separator = ''
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= JSON_BATCH_SIZE:
+                yield separator + json.dumps(batch)[1:-1]
+                separator = ', '
+                batch = []
+        if batch:
+            yield separator + json.dumps(batch)[1:-1]
+        yield ']'
+    return _join_chunks(pieces(), chunk_size)
+
+
+def encode_plain_listing(names, chunk_size=LISTING_CHUNK_SIZE):
+    """
+    Encode a listing as plain text, one name to a line.
+
+    :param names: an iterable of the names in the listing
+    :param chunk_size: the approximate size of the chunks to return
+    :returns: an iterator of chunks of the encoded listing
+    """
+    return _join_chunks((_utf8(name) + '\n' for name in names), chunk_size)
+
+
+def encode_xml_container_listing(container, records,
+                                 chunk_size=LISTING_CHUNK_SIZE):
+    """
+    Encode a container listing as XML.
+
+    :param container: the name of the container
+    :param records: an iterable of the listing's dicts, each of an object or
+                    of a subdir
+    :param chunk_size: the approximate size of the chunks to return
+    :returns: an iterator of chunks of the encoded listing
+    """
+    def pieces():
+        head = '%s\n<container name=%s' % (_XML_DECLARATION,
+                                           _xml_attr(container))
+        empty = True
+        for record in records:
+            if empty:
+                yield head + '>'
+                empty = False
+            if 'subdir' in record:
+                yield '<subdir name=%s>%s</subdir>' % (
+                    _xml_attr(record['subdir']),
+                    _xml_element('name', record['subdir']))
+                continue
+            yield '<object>'
+            for field in XML_OBJECT_FIELDS:
+                yield _xml_element(field, record[field])
+            for field in sorted(record):
+                if field not in XML_OBJECT_FIELDS:
+                    yield _xml_element(field, record[field])
+            yield '</object>'
+        yield head + ' />' if empty else '</container>'
+    return _join_chunks(pieces(), chunk_size)
+
+
+def encode_xml_account_listing(account, records,
+                               chunk_size=LISTING_CHUNK_SIZE):
+    """
+    Encode an account listing as XML.
+
+    :param account: the name of the account
+    :param records: an iterable of the listing's dicts, each of a container
+                    or of a subdir
+    :param chunk_size: the approximate size of the chunks to return
+    :returns: an iterator of chunks of the encoded listing
+    """
+    def pieces():
+        yield '%s\n<account name=%s>' % (_XML_DECLARATION,
+                                         saxutils.quoteattr(account))
+        for record in records:
+            if 'subdir' in record:
+                yield '\n<subdir name=%s />' % saxutils.quoteattr(
+                    record['subdir'])
+            else:
+                yield '\n<container><name>%s</name><count>%s</count>' \
+                      '<bytes>%s</bytes></container>' % (
+                          saxutils.escape(record['name']), record['count'],
+                          record['bytes'])
+        yield '\n</account>'
+    return _join_chunks(pieces(), chunk_size)
+
+
+def decode_json_listing(chunks):
+    """
+    Decode a JSON listing, yielding each of its records as soon as the
+    chunks of the body holding it have arrived.
+
+    :param chunks: an iterable of chunks of the body of the listing
+    :returns: an iterator of the listing's records, decoded as by json.loads
+    :raises ValueError: if the body is not a JSON array
+    """
+    scan_once = json.JSONDecoder().scan_once
+    chunks = iter(chunks)
+    buf = ''
+    pos = 0
+    # what may come next: '[', a record or ']', a record, ',' or ']'
+    expecting = '['
+    while True:
+        pos = _JSON_WHITESPACE.match(buf, pos).end()
+        if pos == len(buf):
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        if expecting == '[':
+            if buf[pos] != '[':
+                raise ValueError('Expecting a JSON array')
+            pos += 1
+            expecting = 'record or ]'
+        elif expecting == ', or ]':
+            if buf[pos] == ',':
+                expecting = 'record'
+            elif buf[pos] == ']':
+                expecting = None
+            else:
+                raise ValueError('Expecting , or ] in JSON array')
+            pos += 1
+        elif expecting == 'record or ]' and buf[pos] == ']':
+            pos += 1
+            expecting = None
+        elif expecting is None:
+            raise ValueError('Extra data after JSON array')
+        else:
+            try:
+                record, end = scan_once(buf, pos)
+            except (StopIteration, ValueError):
+                record = end = None
+            if end is None or end == len(buf):
+                # the record may not have arrived in full yet
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    buf = buf[pos:] + chunk
+                    pos = 0
+                    continue
+                if end is None:
+                    raise ValueError('Invalid JSON record in array')
+            yield record
+            pos = end
+            expecting = ', or ]'
+            # decode the records that have arrived without going round the
+            # loop for each separator
+            while True:
+                if buf.startswith(', ', pos):
+                    next_pos = pos + 2
+                else:
+                    match = _JSON_SEPARATOR.match(buf, pos)
+                    if not match:
+                        break
+                    next_pos = match.end()
+                try:
+                    record, end = scan_once(buf, next_pos)
+                except (StopIteration, ValueError):
+                    break
+                if end == len(buf):
+                    break
+                yield record
+                pos = end
+    if expecting is not None:
+        raise ValueError('Truncated JSON array')
@@ -47,24 +47,40 @@ http://github.com/memcached/memcached/blob/1.4.2/doc/protocol.txt
 import six.moves.cPickle as pickle
 import json
 import logging
+import struct
 import time
+import zlib
 from bisect import bisect
 from swift import gettext_ as _
 from hashlib import md5
 
+from eventlet.corolocal import local
+from eventlet.event import Event
 from eventlet.green import socket
 from eventlet.pools import Pool
-from eventlet import Timeout
+from eventlet.semaphore import Semaphore
+from eventlet import GreenPile, greenthread, Timeout
 from six.moves import range
 from swift.common import utils
 
+try:
+    import msgpack
+except ImportError:
+    # msgpack is only needed for the msgpack value codec
+    msgpack = None
+
 DEFAULT_MEMCACHED_PORT = 11211
 
 CONN_TIMEOUT = 0.3
 POOL_TIMEOUT = 1.0  # WAG
 IO_TIMEOUT = 2.0
+# the flags stored with each value say how it was encoded, so that values
+# encoded any way can be read whatever the value codec
 PICKLE_FLAG = 1
 JSON_FLAG = 2
+MSGPACK_FLAG = 4
+ZLIB_FLAG = 8
+VALUE_CODECS = ('json', 'compact_json', 'msgpack')
 NODE_WEIGHT = 50
 PICKLE_PROTOCOL = 2
 TRY_COUNT = 3
@@ -75,6 +91,30 @@ ERROR_LIMIT_COUNT = 10
 ERROR_LIMIT_TIME = 60
 ERROR_LIMIT_DURATION = 60
 
+# the binary protocol, see
+# https://github.com/memcached/memcached/wiki/BinaryProtocolRevamped
+BINARY_REQUEST_MAGIC = 0x80
+BINARY_RESPONSE_MAGIC = 0x81
+# magic, opcode, key length, extras length, data type, vbucket id (requests)
+# or status (responses), total body length, opaque, CAS
+BINARY_HEADER = struct.Struct('!BBHBBHIIQ')
+OP_GET = 0x00
+OP_SET = 0x01
+OP_DELETE = 0x04
+OP_INCREMENT = 0x05
+OP_DECREMENT = 0x06
+OP_NOOP = 0x0a
+OP_GETQ = 0x09
+OP_SETQ = 0x11
+STATUS_NO_ERROR = 0x00
+STATUS_KEY_NOT_FOUND = 0x01
+# flags, expiration
+SET_EXTRAS = struct.Struct('!II')
+# delta, initial value, expiration
+INCR_EXTRAS = struct.Struct('!QQI')
+GET_EXTRAS = struct.Struct('!I')
+INCR_VALUE = struct.Struct('!Q')
+
 
 def md5hash(key):
     return md5(key).hexdigest()
@@ -141,7 +181,8 @@ class MemcacheRing(object):
     def __init__(self, servers, connect_timeout=CONN_TIMEOUT,
                  io_timeout=IO_TIMEOUT, pool_timeout=POOL_TIMEOUT,
                  tries=TRY_COUNT, allow_pickle=False, allow_unpickle=False,
-                 max_conns=2):
+                 max_conns=2, value_codec='json', compress_threshold=0,
+                 logger=None):
         self._ring = {}
         self._errors = dict(((serv, []) for serv in servers))
         self._error_limited = dict(((serv, 0) for serv in servers))
@@ -159,6 +200,16 @@ class MemcacheRing(object):
         self._pool_timeout = pool_timeout
         self._allow_pickle = allow_pickle
         self._allow_unpickle = allow_unpickle or allow_pickle
+        if value_codec not in VALUE_CODECS:
+            raise ValueError('Invalid memcache value codec: %r' % value_codec)
+        if value_codec == 'msgpack' and msgpack is None:
+            raise ImportError('msgpack is required for the msgpack value '
+                              'codec')
+        self._value_codec = value_codec
+        self._compress_threshold = compress_threshold
+        self.logger = logger
+        # the stats of the request each greenthread is handling, if any
+        self._request_stats = local()
 
     def _exception_occurred(self, server, e, action='talking',
                             sock=None, fp=None, got_connection=True):
@@ -193,10 +244,26 @@ class MemcacheRing(object):
                 self._error_limited[server] = now + ERROR_LIMIT_DURATION
                 logging.error(_('Error limiting server %s'), server)
 
-    def _get_conns(self, key):
+    def start_request_stats(self):
         """
-        Retrieves a server conn from the pool, or connects a new one.
-        Chooses the server based on a consistent hash of "key".
+        Start counting the round trips to memcache made by the calling
+        greenthread, e.g. for the request it is handling.
+
+        :returns: a dict whose 'round_trips' item is the count
+        """
+        stats = {'round_trips': 0}
+        self._request_stats.stats = stats
+        return stats
+
+    def _count_round_trips(self, count=1):
+        stats = getattr(self._request_stats, 'stats', None)
+        if stats is not None:
+            stats['round_trips'] += count
+
+    def _iter_servers(self, key):
+        """
+        Yields the servers to try for "key", in order, skipping any that
+        are error limited.
         """
         pos = bisect(self._sorted, key)
         served = []
@@ -208,6 +275,14 @@ class MemcacheRing(object):
             served.append(server)
             if self._error_limited[server] > time.time():
                 continue
+            yield server
+
+    def _get_conns(self, key):
+        """
+        Retrieves a server conn from the pool, or connects a new one.
+        Chooses the server based on a consistent hash of "key".
+        """
+        for server in self._iter_servers(key):
             sock = None
             try:
                 with MemcachePoolTimeout(self._pool_timeout):
@@ -228,6 +303,58 @@ class MemcacheRing(object):
         """Returns a server connection to the pool."""
         self._client_cache[server].put((fp, sock))
 
+    def _serialize(self, value, serialize):
+        """
+        Returns a tuple of (value to store, flags to store it with).
+
+        Serialized values are encoded with the value codec, unless pickle
+        is allowed, and are compressed if they are at least
+        compress_threshold bytes long and compression makes them shorter.
+        """
+        flags = 0
+        if serialize and self._allow_pickle:
+            value = pickle.dumps(value, PICKLE_PROTOCOL)
+            flags |= PICKLE_FLAG
+        elif serialize and self._value_codec == 'msgpack':
+            value = msgpack.packb(value, use_bin_type=True)
+            flags |= MSGPACK_FLAG
+        elif serialize and self._value_codec == 'compact_json':
+            value = json.dumps(value, separators=(',', ':'))
+            flags |= JSON_FLAG
+        elif serialize:
+            value = json.dumps(value)
+            flags |= JSON_FLAG
+        if serialize and 0 < self._compress_threshold <= len(value):
+            compressed = zlib.compress(value)
+            if len(compressed) < len(value):
+                value = compressed
+                flags |= ZLIB_FLAG
+        if self.logger:
+            self.logger.timing('set.value_size', len(value))
+        return value, flags
+
+    def _deserialize(self, value, flags):
+        """
+        Returns a value read from memcache, unserialized according to the
+        flags it was stored with.
+        """
+        if self.logger:
+            self.logger.timing('get.value_size', len(value))
+        if flags & ZLIB_FLAG:
+            value = zlib.decompress(value)
+        if flags & PICKLE_FLAG:
+            if self._allow_unpickle:
+                return pickle.loads(value)
+            return None
+        elif flags & JSON_FLAG:
+            return json.loads(value)
+        elif flags & MSGPACK_FLAG:
+            if msgpack is None:
+                # as good as a miss
+                return None
+            return msgpack.unpackb(value, raw=False)
+        return value
+
     def set(self, key, value, serialize=True, time=0,
             min_compress_len=0):
         """
@@ -246,18 +373,13 @@ class MemcacheRing(object):
         """
         key = md5hash(key)
         timeout = sanitize_timeout(time)
-        flags = 0
-        if serialize and self._allow_pickle:
-            value = pickle.dumps(value, PICKLE_PROTOCOL)
-            flags |= PICKLE_FLAG
-        elif serialize:
-            value = json.dumps(value)
-            flags |= JSON_FLAG
+        value, flags = self._serialize(value, serialize)
         for (server, fp, sock) in self._get_conns(key):
             try:
                 with Timeout(self._io_timeout):
                     sock.sendall('set %s %d %d %s\r\n%s\r\n' %
                                  (key, flags, timeout, len(value), value))
+                    self._count_round_trips()
                     # Wait for the set to complete
                     fp.readline()
                     self._return_conn(server, fp, sock)
@@ -280,18 +402,13 @@ class MemcacheRing(object):
             try:
                 with Timeout(self._io_timeout):
                     sock.sendall('get %s\r\n' % key)
+                    self._count_round_trips()
                     line = fp.readline().strip().split()
                     while line[0].upper() != 'END':
                         if line[0].upper() == 'VALUE' and line[1] == key:
                             size = int(line[3])
-                            value = fp.read(size)
-                            if int(line[2]) & PICKLE_FLAG:
-                                if self._allow_unpickle:
-                                    value = pickle.loads(value)
-                                else:
-                                    value = None
-                            elif int(line[2]) & JSON_FLAG:
-                                value = json.loads(value)
+                            value = self._deserialize(fp.read(size),
+                                                      int(line[2]))
                             fp.readline()
                         line = fp.readline().strip().split()
                     self._return_conn(server, fp, sock)
@@ -326,6 +443,7 @@ class MemcacheRing(object):
             try:
                 with Timeout(self._io_timeout):
                     sock.sendall('%s %s %s\r\n' % (command, key, delta))
+                    self._count_round_trips()
                     line = fp.readline().strip().split()
                     if line[0].upper() == 'NOT_FOUND':
                         add_val = delta
@@ -333,10 +451,12 @@ class MemcacheRing(object):
                             add_val = '0'
                         sock.sendall('add %s %d %d %s\r\n%s\r\n' %
                                      (key, 0, timeout, len(add_val), add_val))
+                        self._count_round_trips()
                         line = fp.readline().strip().split()
                         if line[0].upper() == 'NOT_STORED':
                             sock.sendall('%s %s %s\r\n' % (command, key,
                                                            delta))
+                            self._count_round_trips()
                             line = fp.readline().strip().split()
                             ret = int(line[0].strip())
                         else:
@@ -375,6 +495,7 @@ class MemcacheRing(object):
             try:
                 with Timeout(self._io_timeout):
                     sock.sendall('delete %s\r\n' % key)
+                    self._count_round_trips()
                     # Wait for the delete to complete
                     fp.readline()
                     self._return_conn(server, fp, sock)
@@ -404,19 +525,14 @@ class MemcacheRing(object):
         msg = ''
         for key, value in mapping.items():
             key = md5hash(key)
-            flags = 0
-            if serialize and self._allow_pickle:
-                value = pickle.dumps(value, PICKLE_PROTOCOL)
-                flags |= PICKLE_FLAG
-            elif serialize:
-                value = json.dumps(value)
-                flags |= JSON_FLAG
+            value, flags = self._serialize(value, serialize)
             msg += ('set %s %d %d %s\r\n%s\r\n' %
                     (key, flags, timeout, len(value), value))
         for (server, fp, sock) in self._get_conns(server_key):
             try:
                 with Timeout(self._io_timeout):
                     sock.sendall(msg)
+                    self._count_round_trips()
                     # Wait for the set to complete
                     for line in range(len(mapping)):
                         fp.readline()
@@ -440,22 +556,8 @@ class MemcacheRing(object):
             try:
                 with Timeout(self._io_timeout):
                     sock.sendall('get %s\r\n' % ' '.join(keys))
-                    line = fp.readline().strip().split()
-                    responses = {}
-                    while line[0].upper() != 'END':
-                        if line[0].upper() == 'VALUE':
-                            size = int(line[3])
-                            value = fp.read(size)
-                            if int(line[2]) & PICKLE_FLAG:
-                                if self._allow_unpickle:
-                                    value = pickle.loads(value)
-                                else:
-                                    value = None
-                            elif int(line[2]) & JSON_FLAG:
-                                value = json.loads(value)
-                            responses[line[1]] = value
-                            fp.readline()
-                        line = fp.readline().strip().split()
+                    self._count_round_trips()
+                    responses = self._read_values(fp)
                     values = []
                     for key in keys:
                         if key in responses:
@@ -466,3 +568,358 @@ class MemcacheRing(object):
                     return values
             except (Exception, Timeout) as e:
                 self._exception_occurred(server, e, sock=sock, fp=fp)
+
+    def _read_values(self, fp):
+        """
+        Reads the response to a get of one or more keys.
+
+        :returns: a dict of the values found, by (hashed) key
+        """
+        line = fp.readline().strip().split()
+        responses = {}
+        while line[0].upper() != 'END':
+            if line[0].upper() == 'VALUE':
+                size = int(line[3])
+                responses[line[1]] = self._deserialize(fp.read(size),
+                                                       int(line[2]))
+                fp.readline()
+            line = fp.readline().strip().split()
+        return responses
+
+    def _get_many_from_server(self, hashed_keys):
+        # the first key picks the server, or the servers to fail over to
+        for (server, fp, sock) in self._get_conns(hashed_keys[0]):
+            try:
+                with Timeout(self._io_timeout):
+                    sock.sendall('get %s\r\n' % ' '.join(hashed_keys))
+                    responses = self._read_values(fp)
+                    self._return_conn(server, fp, sock)
+                    return responses
+            except (Exception, Timeout) as e:
+                self._exception_occurred(server, e, sock=sock, fp=fp)
+        return {}
+
+    def get_many(self, keys):
+        """
+        Gets the values of several keys, wherever in the ring they are. Each
+        server is asked for all of its keys in one get, and the servers are
+        asked concurrently.
+
+        Unlike :meth:`get_multi`, the keys need not have been set together
+        on one server with :meth:`set_multi`.
+
+        :param keys: keys for values to be retrieved from memcache
+        :returns: a dict of the values found, by key
+        """
+        keys_by_hash = dict((md5hash(key), key) for key in keys)
+        hashes_by_server = {}
+        for hashed_key in keys_by_hash:
+            for server in self._iter_servers(hashed_key):
+                hashes_by_server.setdefault(server, []).append(hashed_key)
+                break
+        if not hashes_by_server:
+            return {}
+        self._count_round_trips(len(hashes_by_server))
+        if len(hashes_by_server) == 1:
+            all_responses = [self._get_many_from_server(
+                list(hashes_by_server.values())[0])]
+        else:
+            pile = GreenPile(len(hashes_by_server))
+            for hashed_keys in hashes_by_server.values():
+                pile.spawn(self._get_many_from_server, hashed_keys)
+            all_responses = list(pile)
+        values = {}
+        for responses in all_responses:
+            for hashed_key, value in responses.items():
+                if hashed_key in keys_by_hash:
+                    values[keys_by_hash[hashed_key]] = value
+        return values
+
+
+def pack_binary_request(opcode, key='', extras='', value='', opaque=0):
+    """
+    Returns a request packet of the memcached binary protocol.
+    """
+    return BINARY_HEADER.pack(
+        BINARY_REQUEST_MAGIC, opcode, len(key), len(extras), 0, 0,
+        len(extras) + len(key) + len(value), opaque, 0) + \
+        extras + key + value
+
+
+class MemcacheBinaryConnection(object):
+    """
+    A connection to a memcached server speaking the binary protocol, shared
+    by any number of greenthreads.
+
+    Each greenthread sends its requests as soon as it has them, without
+    waiting for the responses to requests of other greenthreads, and a
+    reader greenthread hands each response to the request it answers by
+    the request's opaque. If the connection fails, every request waiting on
+    it fails too.
+
+    :param server: the server to connect to
+    :param connect_timeout: seconds to wait for the connection
+    :param on_error: called with the error if reading responses fails while
+                     requests are waiting for them
+    """
+
+    def __init__(self, server, connect_timeout, on_error=None):
+        self.server = server
+        self._on_error = on_error
+        host, port = utils.parse_socket_string(server, DEFAULT_MEMCACHED_PORT)
+        addrs = socket.getaddrinfo(host, port, socket.AF_UNSPEC,
+                                   socket.SOCK_STREAM)
+        family, socktype, proto, canonname, sockaddr = addrs[0]
+        self._sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with Timeout(connect_timeout):
+                self._sock.connect(sockaddr)
+        except BaseException:
+            self._sock.close()
+            raise
+        self._fp = self._sock.makefile('rb')
+        self._send_lock = Semaphore()
+        # opaque -> (list of responses, index, Event or None)
+        self._pending = {}
+        self._last_opaque = 0
+        self.closed = False
+        self._reader = greenthread.spawn(self._read_responses)
+
+    def _read_exact(self, size):
+        data = self._fp.read(size)
+        if len(data) != size:
+            raise MemcacheConnectionError(
+                'Connection closed by memcached: %s' % self.server)
+        return data
+
+    def _read_responses(self):
+        try:
+            while True:
+                (magic, opcode, key_len, extras_len, _data_type, status,
+                 body_len, opaque, _cas) = BINARY_HEADER.unpack(
+                    self._read_exact(BINARY_HEADER.size))
+                if magic != BINARY_RESPONSE_MAGIC:
+                    raise MemcacheConnectionError(
+                        'Bad response from memcached: %s' % self.server)
+                body = self._read_exact(body_len) if body_len else ''
+                pending = self._pending.pop(opaque, None)
+                if pending is None:
+                    # whoever sent the request has given up on it
+                    continue
+                responses, index, event = pending
+                responses[index] = (status, body[:extras_len],
+                                    body[extras_len + key_len:])
+                if event is not None:
+                    event.send(responses)
+        except Exception as err:
+            # only count the failure if it failed a request, not when the
+            # server closes an idle connection
+            failed_requests = bool(self._pending)
+            if self.close(err) and failed_requests and self._on_error:
+                self._on_error(err)
+
+    def call(self, requests):
+        """
+        Sends requests to the server and waits for the response to the
+        last one. Memcached answers requests in order, so by then it has
+        answered all of them; the others may be quiet requests that are
+        only answered when there is something to say.
+
+        :param requests: a list of (opcode, key, extras, value) tuples
+        :returns: a list of the (status, extras, value) of the response to
+                  each request, or None for those that got no response
+        :raises MemcacheConnectionError: if the connection fails
+        """
+        if self.closed:
+            raise MemcacheConnectionError(
+                'Connection to memcached closed: %s' % self.server)
+        responses = [None] * len(requests)
+        event = Event()
+        opaques = []
+        packets = []
+        for index, (opcode, key, extras, value) in enumerate(requests):
+            self._last_opaque = (self._last_opaque + 1) % 2 ** 32
+            opaque = self._last_opaque
+            opaques.append(opaque)
+            self._pending[opaque] = (
+                responses, index,
+                event if index == len(requests) - 1 else None)
+            packets.append(pack_binary_request(
+                opcode, key, extras, value, opaque))
+        try:
+            with self._send_lock:
+                self._sock.sendall(''.join(packets))
+            return event.wait()
+        finally:
+            for opaque in opaques:
+                self._pending.pop(opaque, None)
+
+    def close(self, err=None):
+        """
+        Closes the connection, failing any requests waiting on it.
+
+        :param err: the exception to fail the waiting requests with
+        :returns: True if the connection was open, False if something else
+                  closed it first
+        """
+        if self.closed:
+            return False
+        self.closed = True
+        if greenthread.getcurrent() is not self._reader:
+            self._reader.kill()
+        for fp_or_sock in (self._fp, self._sock):
+            try:
+                fp_or_sock.close()
+            except Exception:
+                pass
+        if err is None:
+            err = MemcacheConnectionError(
+                'Connection to memcached closed: %s' % self.server)
+        pending, self._pending = self._pending, {}
+        for responses, index, event in pending.values():
+            if event is not None and not event.ready():
+                event.send_exception(err)
+        return True
+
+
+class PipelinedMemcacheRing(MemcacheRing):
+    """
+    Consistent-hashed memcache client that speaks the memcached binary
+    protocol.
+
+    Rather than a pool of connections to each server, each used by one
+    greenthread at a time, it keeps one :class:`MemcacheBinaryConnection`
+    to each server and pipelines the requests of all greenthreads over it.
+    Servers are chosen and error limited just as by :class:`MemcacheRing`,
+    and the values it stores can be read by either client.
+    """
+
+    def __init__(self, servers, *args, **kwargs):
+        super(PipelinedMemcacheRing, self).__init__(servers, *args, **kwargs)
+        self._binary_conns = {}
+        self._connect_locks = dict((server, Semaphore()) for server in servers)
+
+    def _get_binary_conn(self, server):
+        with self._connect_locks[server]:
+            conn = self._binary_conns.get(server)
+            if conn is None or conn.closed:
+                conn = MemcacheBinaryConnection(
+                    server, self._connect_timeout,
+                    on_error=lambda err: self._exception_occurred(
+                        server, err, got_connection=False))
+                self._binary_conns[server] = conn
+        return conn
+
+    def _call(self, key, requests, count_round_trip=True):
+        """
+        Sends requests to the server chosen by a consistent hash of "key",
+        failing over to the next server if it fails.
+
+        :returns: the responses, as from
+                  :meth:`MemcacheBinaryConnection.call`, or None if no
+                  server could be reached
+        """
+        for server in self._iter_servers(key):
+            try:
+                conn = self._get_binary_conn(server)
+            except (Exception, Timeout) as e:
+                self._exception_occurred(server, e, action='connecting',
+                                         got_connection=False)
+                continue
+            try:
+                with Timeout(self._io_timeout):
+                    responses = conn.call(requests)
+                if count_round_trip:
+                    self._count_round_trips()
+                return responses
+            except (Exception, Timeout) as e:
+                # a timed out request may have been sent in part, so the
+                # connection cannot be trusted any more. The failure is
+                # counted against the server once, by whoever closes the
+                # connection; the other requests on it just fail over.
+                if conn.close(e):
+                    self._exception_occurred(server, e, got_connection=False)
+        return None
+
+    def set(self, key, value, serialize=True, time=0,
+            min_compress_len=0):
+        value, flags = self._serialize(value, serialize)
+        extras = SET_EXTRAS.pack(flags, int(sanitize_timeout(time)))
+        self._call(md5hash(key), [(OP_SET, md5hash(key), extras, value)])
+
+    def get(self, key):
+        key = md5hash(key)
+        responses = self._call(key, [(OP_GET, key, '', '')])
+        if not responses:
+            return None
+        status, extras, value = responses[0]
+        if status != STATUS_NO_ERROR:
+            return None
+        return self._deserialize(value, GET_EXTRAS.unpack(extras)[0])
+
+    def incr(self, key, delta=1, time=0):
+        key = md5hash(key)
+        opcode = OP_INCREMENT
+        initial = abs(int(delta))
+        if delta < 0:
+            opcode = OP_DECREMENT
+            initial = 0
+        # memcached sets the initial value if the key is not found, in the
+        # same round trip
+        extras = INCR_EXTRAS.pack(abs(int(delta)), initial,
+                                  int(sanitize_timeout(time)))
+        responses = self._call(key, [(opcode, key, extras, '')])
+        if responses:
+            status, extras, value = responses[0]
+            if status == STATUS_NO_ERROR:
+                return INCR_VALUE.unpack(value)[0]
+        raise MemcacheConnectionError("No Memcached connections succeeded.")
+
+    def delete(self, key):
+        key = md5hash(key)
+        self._call(key, [(OP_DELETE, key, '', '')])
+
+    def set_multi(self, mapping, server_key, serialize=True, time=0,
+                  min_compress_len=0):
+        timeout = int(sanitize_timeout(time))
+        requests = []
+        for key, value in mapping.items():
+            value, flags = self._serialize(value, serialize)
+            requests.append((OP_SETQ, md5hash(key),
+                             SET_EXTRAS.pack(flags, timeout), value))
+        requests.append((OP_NOOP, '', '', ''))
+        self._call(md5hash(server_key), requests)
+
+    def _getq(self, server_key, hashed_keys, count_round_trip=True):
+        """
+        Gets the values of several keys from one server, with a quiet get
+        of each key followed by a no-op.
+
+        :returns: a dict of the values found, by (hashed) key, or None if
+                  no server could be reached
+        """
+        requests = [(OP_GETQ, key, '', '') for key in hashed_keys]
+        requests.append((OP_NOOP, '', '', ''))
+        responses = self._call(server_key, requests, count_round_trip)
+        if responses is None:
+            return None
+        values = {}
+        for key, response in zip(hashed_keys, responses):
+            if response is not None and response[0] == STATUS_NO_ERROR:
+                status, extras, value = response
+                values[key] = self._deserialize(
+                    value, GET_EXTRAS.unpack(extras)[0])
+        return values
+
+    def get_multi(self, keys, server_key):
+        keys = [md5hash(key) for key in keys]
+        values = self._getq(md5hash(server_key), keys)
+        if values is None:
+            return None
+        return [values.get(key) for key in keys]
+
+    def _get_many_from_server(self, hashed_keys):
+        # get_many counts the round trips itself
+        return self._getq(hashed_keys[0], hashed_keys,
+                          count_round_trip=False) or {}
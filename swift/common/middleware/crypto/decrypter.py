@@ -14,7 +14,6 @@
 # limitations under the License.
 
 import base64
-import json
 import xml.etree.cElementTree as ElementTree
 
 from swift import gettext_ as _
@@ -22,6 +21,8 @@ from swift.common.http import is_success
 from swift.common.middleware.crypto.crypto_utils import CryptoWSGIContext, \
     load_crypto_meta, extract_crypto_meta, Crypto
 from swift.common.exceptions import EncryptionException
+from swift.common.listing_formats import decode_json_listing, \
+    encode_json_listing
 from swift.common.request_helpers import get_object_transient_sysmeta, \
     get_listing_content_type, get_sys_meta_prefix, get_user_meta_prefix
 from swift.common.swob import Request, HTTPException, HTTPInternalServerError
@@ -386,13 +387,15 @@ class DecrypterContContext(BaseDecrypterContext):
         Parses json body listing and decrypt encrypted entries. Updates
         Content-Length header with new body length and return a body iter.
         """
+        # every entry is decrypted before the response starts, so that a
+        # failure can still be sent as an error, but the listing is decoded
+        # and encoded a chunk at a time
         with closing_if_possible(resp_iter):
-            resp_body = ''.join(resp_iter)
-        body_json = json.loads(resp_body)
-        new_body = json.dumps([self.decrypt_obj_dict(obj_dict, key)
-                               for obj_dict in body_json])
-        self.update_content_length(len(new_body))
-        return [new_body]
+            listing = [self.decrypt_obj_dict(obj_dict, key)
+                       for obj_dict in decode_json_listing(resp_iter)]
+        new_body = list(encode_json_listing(listing))
+        self.update_content_length(sum(len(chunk) for chunk in new_body))
+        return new_body
 
     def decrypt_obj_dict(self, obj_dict, key):
         ciphertext = obj_dict['hash']
@@ -114,7 +114,6 @@ Here's an example using ``curl`` with tiny 1-byte segments::
         http://<storage_url>/container/myobject
 """
 
-import json
 import os
 
 import six
@@ -125,6 +124,7 @@ from hashlib import md5
 from swift.common import constraints
 from swift.common.exceptions import ListingIterError, SegmentError
 from swift.common.http import is_success
+from swift.common.listing_formats import decode_json_listing
 from swift.common.swob import Request, Response, \
     HTTPRequestedRangeNotSatisfiable, HTTPBadRequest, HTTPConflict
 from swift.common.utils import get_logger, \
@@ -155,7 +155,7 @@ class GetContext(WSGIContext):
         if not is_success(con_resp.status_int):
             return con_resp, None
         with closing_if_possible(con_resp.app_iter):
-            return None, json.loads(''.join(con_resp.app_iter))
+            return None, list(decode_json_listing(con_resp.app_iter))
 
     def _segment_listing_iterator(self, req, version, account, container,
                                   prefix, segments, first_byte=None,
@@ -17,8 +17,13 @@ import os
 
 from six.moves.configparser import ConfigParser, NoSectionError, NoOptionError
 
-from swift.common.memcached import (MemcacheRing, CONN_TIMEOUT, POOL_TIMEOUT,
-                                    IO_TIMEOUT, TRY_COUNT)
+from swift.common.memcached import (MemcacheRing, PipelinedMemcacheRing,
+                                    CONN_TIMEOUT, POOL_TIMEOUT, IO_TIMEOUT,
+                                    TRY_COUNT)
+from swift.common.constraints import valid_api_version
+from swift.common.utils import config_true_value, get_logger, split_path
+from swift.proxy.controllers.base import InfoCache, DEFAULT_INFO_CACHE_TTL, \
+    DEFAULT_INFO_CACHE_NEGATIVE_TTL, prefetch_info
 
 
 class MemcacheMiddleware(object):
@@ -84,6 +89,13 @@ class MemcacheMiddleware(object):
             'pool_timeout', POOL_TIMEOUT))
         tries = int(memcache_options.get('tries', TRY_COUNT))
         io_timeout = float(memcache_options.get('io_timeout', IO_TIMEOUT))
+        protocol = memcache_options.get('protocol', 'text').lower()
+        if protocol == 'text':
+            memcache_class = MemcacheRing
+        elif protocol == 'binary':
+            memcache_class = PipelinedMemcacheRing
+        else:
+            raise ValueError('Invalid memcache protocol: %r' % protocol)
 
         if not self.memcache_servers:
             self.memcache_servers = '127.0.0.1:11211'
@@ -94,7 +106,9 @@ class MemcacheMiddleware(object):
         else:
             serialization_format = int(serialization_format)
 
-        self.memcache = MemcacheRing(
+        logger = get_logger(conf, log_route='memcache')
+        logger.set_statsd_prefix('memcache')
+        self.memcache = memcache_class(
             [s.strip() for s in self.memcache_servers.split(',') if s.strip()],
             connect_timeout=connect_timeout,
             pool_timeout=pool_timeout,
@@ -102,10 +116,47 @@ class MemcacheMiddleware(object):
             io_timeout=io_timeout,
             allow_pickle=(serialization_format == 0),
             allow_unpickle=(serialization_format <= 1),
-            max_conns=max_conns)
+            max_conns=max_conns,
+            value_codec=memcache_options.get('value_codec', 'json').lower(),
+            compress_threshold=int(memcache_options.get(
+                'compress_threshold', 0)),
+            logger=logger)
+
+        # an optional in-process tier of account and container info in
+        # front of memcache, shared by the requests of this worker
+        self.info_cache = None
+        info_cache_size = int(conf.get('info_cache_size', 0))
+        if info_cache_size > 0:
+            logger = get_logger(conf, log_route='info_cache')
+            logger.set_statsd_prefix('info_cache')
+            self.info_cache = InfoCache(
+                info_cache_size,
+                ttl=float(conf.get('info_cache_ttl', DEFAULT_INFO_CACHE_TTL)),
+                negative_ttl=float(conf.get(
+                    'info_cache_negative_ttl',
+                    DEFAULT_INFO_CACHE_NEGATIVE_TTL)),
+                logger=logger)
+        self.prefetch_info = config_true_value(
+            conf.get('prefetch_info', 'true'))
+
+    def _prefetch_info(self, env):
+        try:
+            version, account, container, _junk = split_path(
+                env['PATH_INFO'], 1, 4, True)
+        except ValueError:
+            return
+        # object and container requests look up both the account and the
+        # container info, so fetch them together
+        if container and valid_api_version(version):
+            prefetch_info(env, account, container)
 
     def __call__(self, env, start_response):
         env['swift.cache'] = self.memcache
+        env['swift.memcache_stats'] = self.memcache.start_request_stats()
+        if self.info_cache is not None:
+            env['swift.worker_infocache'] = self.info_cache
+        if self.prefetch_info:
+            self._prefetch_info(env)
         return self.app(env, start_response)
 
 
@@ -173,6 +173,11 @@ class ProxyLoggingMiddleware(object):
         start_time_str = "%.9f" % start_time
         end_time_str = "%.9f" % end_time
         policy_index = get_policy_index(req.headers, resp_headers)
+        log_info = req.environ.get('swift.log_info') or []
+        memcache_stats = req.environ.get('swift.memcache_stats')
+        if memcache_stats and memcache_stats['round_trips']:
+            log_info = log_info + [
+                'memcache_round_trips=%d' % memcache_stats['round_trips']]
         self.access_logger.info(' '.join(
             quote(str(x) if x else '-', QUOTE_SAFE)
             for x in (
@@ -193,7 +198,7 @@ class ProxyLoggingMiddleware(object):
                 logged_headers,
                 duration_time_str,
                 req.environ.get('swift.source'),
-                ','.join(req.environ.get('swift.log_info') or ''),
+                ','.join(log_info),
                 start_time_str,
                 end_time_str,
                 policy_index
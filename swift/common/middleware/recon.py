@@ -127,8 +127,13 @@ class ReconMiddleware(object):
         return meminfo
 
     def get_async_info(self):
-        """get # of async pendings"""
-        return self._from_recon_cache(['async_pending'],
+        """get # of async pendings, and the backlog of each async spool"""
+        return self._from_recon_cache(['async_pending', 'async_spool'],
+                                      self.object_recon_cache)
+
+    def get_disk_read_info(self):
+        """get object server threaded read stats, per worker and device"""
+        return self._from_recon_cache(['object_threaded_reads'],
                                       self.object_recon_cache)
 
     def get_driveaudit_error(self):
@@ -181,6 +186,23 @@ class ReconMiddleware(object):
                                            'expired_last_pass'],
                                           self.object_recon_cache)
 
+    def get_sharding_info(self):
+        """get container sharder info"""
+        return self._from_recon_cache(['sharding_stats',
+                                       'sharding_pass_completed'],
+                                      self.container_recon_cache)
+
+    def get_committer_info(self, recon_type):
+        """get account or container server committer stats, per worker"""
+        if recon_type == 'account':
+            return self._from_recon_cache(['account_db_committer'],
+                                          self.account_recon_cache)
+        elif recon_type == 'container':
+            return self._from_recon_cache(['container_db_committer'],
+                                          self.container_recon_cache)
+        else:
+            return None
+
     def get_auditor_info(self, recon_type):
         """get auditor info"""
         if recon_type == 'account':
@@ -366,6 +388,10 @@ class ReconMiddleware(object):
             content = self.get_auditor_info(rtype)
         elif rcheck == "expirer" and rtype == 'object':
             content = self.get_expirer_info(rtype)
+        elif rcheck == "committer" and rtype in ['account', 'container']:
+            content = self.get_committer_info(rtype)
+        elif rcheck == "sharding":
+            content = self.get_sharding_info()
         elif rcheck == "mounted":
             content = self.get_mounted()
         elif rcheck == "unmounted":
@@ -384,6 +410,8 @@ class ReconMiddleware(object):
             content = self.get_version()
         elif rcheck == "driveaudit":
             content = self.get_driveaudit_error()
+        elif rcheck == "diskreads":
+            content = self.get_disk_read_info()
         elif rcheck == "time":
             content = self.get_time()
         else:
@@ -222,6 +222,7 @@ from swift.common.utils import get_logger, config_true_value, \
 from swift.common.request_helpers import SegmentedIterable
 from swift.common.constraints import check_utf8, MAX_BUFFERED_SLO_SEGMENTS
 from swift.common.http import HTTP_NOT_FOUND, HTTP_UNAUTHORIZED, is_success
+from swift.common.listing_formats import decode_json_listing
 from swift.common.wsgi import WSGIContext, make_subrequest
 from swift.common.middleware.bulk import get_response_body, \
     ACCEPTABLE_FORMATS, Bulk
@@ -411,7 +412,7 @@ class SloGetContext(WSGIContext):
 
         try:
             with closing_if_possible(sub_resp.app_iter):
-                return json.loads(''.join(sub_resp.app_iter))
+                return list(decode_json_listing(sub_resp.app_iter))
         except ValueError as err:
             raise ListingIterError(
                 'ERROR: while fetching %s, JSON-decoding of submanifest %s '
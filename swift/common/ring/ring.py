@@ -16,7 +16,7 @@
 import array
 import six.moves.cPickle as pickle
 import json
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from gzip import GzipFile
 from os.path import getmtime
 import struct
@@ -32,6 +32,9 @@ from six.moves import range
 from swift.common.utils import hash_path, validate_configuration
 from swift.common.ring.utils import tiers_for_dev
 
+# the number of partitions each ring keeps the handoff sequences of
+DEFAULT_HANDOFF_CACHE_SIZE = 4096
+
 
 class RingData(object):
     """Partitioned consistent hashing ring data (used for serialization)."""
@@ -150,15 +153,42 @@ class RingData(object):
                 'part_shift': self._part_shift}
 
 
+class HandoffSequence(object):
+    """
+    The ids of the handoff devices of a partition, worked out only as far
+    as anyone has needed them and kept for those that need them again.
+
+    :param dev_ids: an iterator of the handoff device ids
+    """
+
+    def __init__(self, dev_ids):
+        self._dev_ids = dev_ids
+        self.computed = []
+
+    def __iter__(self):
+        index = 0
+        while True:
+            if index == len(self.computed):
+                try:
+                    self.computed.append(next(self._dev_ids))
+                except StopIteration:
+                    return
+            yield self.computed[index]
+            index += 1
+
+
 class Ring(object):
     """
     Partitioned consistent hashing ring.
 
     :param serialized_path: path to serialized RingData instance
     :param reload_time: time interval in seconds to check for a ring change
+    :param handoff_cache_size: the number of partitions to keep the
+                               handoff sequences of
     """
 
-    def __init__(self, serialized_path, reload_time=15, ring_name=None):
+    def __init__(self, serialized_path, reload_time=15, ring_name=None,
+                 handoff_cache_size=DEFAULT_HANDOFF_CACHE_SIZE):
         # can't use the ring unless HASH_PATH_SUFFIX is set
         validate_configuration()
         if ring_name:
@@ -167,6 +197,7 @@ class Ring(object):
         else:
             self.serialized_path = os.path.join(serialized_path)
         self.reload_time = reload_time
+        self.handoff_cache_size = handoff_cache_size
         self._reload(force=True)
 
     def _reload(self, force=False):
@@ -219,6 +250,7 @@ class Ring(object):
             self._num_regions = len(regions)
             self._num_zones = len(zones)
             self._num_ips = len(ips)
+            self._handoff_cache = OrderedDict()
 
     def _rebuild_tier_data(self):
         self.tier2devs = defaultdict(list)
@@ -352,7 +384,34 @@ class Ring(object):
         """
         if time() > self._rtime:
             self._reload()
+        # the handoffs of a partition only change with the ring, so they
+        # are worked out once and replayed for later requests
+        handoffs = self._handoff_cache.pop(part, None)
+        if handoffs is None:
+            handoffs = HandoffSequence(self._iter_handoff_dev_ids(part))
+        if self.handoff_cache_size > 0:
+            while len(self._handoff_cache) >= self.handoff_cache_size:
+                self._handoff_cache.popitem(last=False)
+            self._handoff_cache[part] = handoffs
+        devs = self._devs
+        for dev_id in handoffs:
+            yield devs[dev_id]
+
+    def _iter_handoff_dev_ids(self, part):
+        """
+        Generator of the ids of the handoff devices of a partition, in the
+        order :meth:`get_more_nodes` yields them.
+        """
         primary_nodes = self._get_part_nodes(part)
+        # the ring may be reloaded while a sequence is still being worked
+        # out, which must carry on with the ring it started with
+        replica2part2dev_id = self._replica2part2dev_id
+        devs = self._devs
+        part_shift = self._part_shift
+        num_regions = self._num_regions
+        num_zones = self._num_zones
+        num_ips = self._num_ips
+        num_devs = self._num_devs
 
         used = set(d['id'] for d in primary_nodes)
         same_regions = set(d['region'] for d in primary_nodes)
@@ -360,13 +419,13 @@ class Ring(object):
         same_ips = set(
             (d['region'], d['zone'], d['ip']) for d in primary_nodes)
 
-        parts = len(self._replica2part2dev_id[0])
+        parts = len(replica2part2dev_id[0])
         start = struct.unpack_from(
-            '>I', md5(str(part)).digest())[0] >> self._part_shift
+            '>I', md5(str(part)).digest())[0] >> part_shift
         inc = int(parts / 65536) or 1
         # Multiple loops for execution speed; the checks and bookkeeping get
         # simpler as you go along
-        hit_all_regions = len(same_regions) == self._num_regions
+        hit_all_regions = len(same_regions) == num_regions
         for handoff_part in chain(range(start, parts, inc),
                                   range(inc - ((parts - start) % inc),
                                         start, inc)):
@@ -374,24 +433,24 @@ class Ring(object):
                 # At this point, there are no regions left untouched, so we
                 # can stop looking.
                 break
-            for part2dev_id in self._replica2part2dev_id:
+            for part2dev_id in replica2part2dev_id:
                 if handoff_part < len(part2dev_id):
                     dev_id = part2dev_id[handoff_part]
-                    dev = self._devs[dev_id]
+                    dev = devs[dev_id]
                     region = dev['region']
                     if dev_id not in used and region not in same_regions:
-                        yield dev
+                        yield dev_id
                         used.add(dev_id)
                         same_regions.add(region)
                         zone = dev['zone']
                         ip = (region, zone, dev['ip'])
                         same_zones.add((region, zone))
                         same_ips.add(ip)
-                        if len(same_regions) == self._num_regions:
+                        if len(same_regions) == num_regions:
                             hit_all_regions = True
                             break
 
-        hit_all_zones = len(same_zones) == self._num_zones
+        hit_all_zones = len(same_zones) == num_zones
         for handoff_part in chain(range(start, parts, inc),
                                   range(inc - ((parts - start) % inc),
                                         start, inc)):
@@ -399,22 +458,22 @@ class Ring(object):
                 # Much like we stopped looking for fresh regions before, we
                 # can now stop looking for fresh zones; there are no more.
                 break
-            for part2dev_id in self._replica2part2dev_id:
+            for part2dev_id in replica2part2dev_id:
                 if handoff_part < len(part2dev_id):
                     dev_id = part2dev_id[handoff_part]
-                    dev = self._devs[dev_id]
+                    dev = devs[dev_id]
                     zone = (dev['region'], dev['zone'])
                     if dev_id not in used and zone not in same_zones:
-                        yield dev
+                        yield dev_id
                         used.add(dev_id)
                         same_zones.add(zone)
                         ip = zone + (dev['ip'],)
                         same_ips.add(ip)
-                        if len(same_zones) == self._num_zones:
+                        if len(same_zones) == num_zones:
                             hit_all_zones = True
                             break
 
-        hit_all_ips = len(same_ips) == self._num_ips
+        hit_all_ips = len(same_ips) == num_ips
         for handoff_part in chain(range(start, parts, inc),
                                   range(inc - ((parts - start) % inc),
                                         start, inc)):
@@ -422,20 +481,20 @@ class Ring(object):
                 # We've exhausted the pool of unused backends, so stop
                 # looking.
                 break
-            for part2dev_id in self._replica2part2dev_id:
+            for part2dev_id in replica2part2dev_id:
                 if handoff_part < len(part2dev_id):
                     dev_id = part2dev_id[handoff_part]
-                    dev = self._devs[dev_id]
+                    dev = devs[dev_id]
                     ip = (dev['region'], dev['zone'], dev['ip'])
                     if dev_id not in used and ip not in same_ips:
-                        yield dev
+                        yield dev_id
                         used.add(dev_id)
                         same_ips.add(ip)
-                        if len(same_ips) == self._num_ips:
+                        if len(same_ips) == num_ips:
                             hit_all_ips = True
                             break
 
-        hit_all_devs = len(used) == self._num_devs
+        hit_all_devs = len(used) == num_devs
         for handoff_part in chain(range(start, parts, inc),
                                   range(inc - ((parts - start) % inc),
                                         start, inc)):
@@ -443,12 +502,12 @@ class Ring(object):
                 # We've used every device we have, so let's stop looking for
                 # unused devices now.
                 break
-            for part2dev_id in self._replica2part2dev_id:
+            for part2dev_id in replica2part2dev_id:
                 if handoff_part < len(part2dev_id):
                     dev_id = part2dev_id[handoff_part]
                     if dev_id not in used:
-                        yield self._devs[dev_id]
+                        yield dev_id
                         used.add(dev_id)
-                        if len(used) == self._num_devs:
+                        if len(used) == num_devs:
                             hit_all_devs = True
                             break
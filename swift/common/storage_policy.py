@@ -29,8 +29,14 @@ VALID_CHARS = '-' + string.ascii_letters + string.digits
 
 DEFAULT_POLICY_TYPE = REPL_POLICY = 'replication'
 EC_POLICY = 'erasure_coding'
+SLAB_POLICY = 'slab'
 
 DEFAULT_EC_OBJECT_SEGMENT_SIZE = 1048576
+# erasure codes whose data fragments hold the bytes of each segment as they
+# are, so that a segment can be read back from them without decoding
+SYSTEMATIC_EC_TYPES = ('liberasurecode_rs_vand', 'jerasure_rs_vand',
+                       'jerasure_rs_cauchy', 'isa_l_rs_vand',
+                       'isa_l_rs_cauchy', 'flat_xor_hd_3', 'flat_xor_hd_4')
 
 
 class BindPortsCache(object):
@@ -401,6 +407,20 @@ class StoragePolicy(BaseStoragePolicy):
         return quorum_size(self.object_ring.replica_count)
 
 
+@BaseStoragePolicy.register(SLAB_POLICY)
+class SlabStoragePolicy(StoragePolicy):
+    """
+    Represents a storage policy of type 'slab'.  Objects are replicated in
+    the same way as for a 'replication' policy, but the object servers pack
+    the files of all the objects in a partition into a few large volume
+    files rather than giving each object its own directory.
+
+    Not meant to be instantiated directly; use
+    :func:`~swift.common.storage_policy.reload_storage_policies` to load
+    POLICIES from ``swift.conf``.
+    """
+
+
 @BaseStoragePolicy.register(EC_POLICY)
 class ECStoragePolicy(BaseStoragePolicy):
     """
@@ -493,6 +513,15 @@ class ECStoragePolicy(BaseStoragePolicy):
     def ec_segment_size(self):
         return self._ec_segment_size
 
+    @property
+    def ec_systematic(self):
+        """
+        True if the data fragments of each segment hold the segment's bytes
+        as they are, so that the segment is the concatenation of their
+        payloads.
+        """
+        return self._ec_type in SYSTEMATIC_EC_TYPES
+
     @property
     def fragment_size(self):
         """
@@ -89,6 +89,7 @@ SysLogHandler.priority_map['NOTICE'] = 'notice'
 # These are lazily pulled from libc elsewhere
 _sys_fallocate = None
 _posix_fadvise = None
+_sys_syncfs = None
 _libc_socket = None
 _libc_bind = None
 _libc_accept = None
@@ -688,6 +689,25 @@ def fdatasync(fd):
         fsync(fd)
 
 
+def syncfs(fd):
+    """
+    Sync all modified file data and metadata on the filesystem containing the
+    given file descriptor to disk.
+
+    :param fd: file descriptor
+    :raises OSError: if syncfs() fails or is not available in libc
+    """
+    global _sys_syncfs
+    if _sys_syncfs is None:
+        _sys_syncfs = load_libc_function('syncfs', log_error=False)
+    if _sys_syncfs is noop_libc_function:
+        raise OSError(errno.ENOSYS, 'syncfs() is not available')
+    if _sys_syncfs(fd) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, 'Unable to syncfs(%s): %s' % (
+            fd, os.strerror(err)))
+
+
 def fsync_dir(dirpath):
     """
     Sync directory entries to disk.
@@ -730,6 +750,27 @@ def drop_buffer_cache(fd, offset, length):
                                        'length': length, 'ret': ret})
 
 
+def read_ahead_buffer_cache(fd, offset, length):
+    """
+    Ask the kernel to start reading the given range of the given file into
+    the buffer cache, without waiting for it.
+
+    :param fd: file descriptor
+    :param offset: start offset
+    :param length: length
+    """
+    global _posix_fadvise
+    if _posix_fadvise is None:
+        _posix_fadvise = load_libc_function('posix_fadvise64')
+    # 3 means "POSIX_FADV_WILLNEED"
+    ret = _posix_fadvise(fd, ctypes.c_uint64(offset),
+                         ctypes.c_uint64(length), 3)
+    if ret != 0:
+        logging.warning("posix_fadvise64(%(fd)s, %(offset)s, %(length)s, 3) "
+                        "-> %(ret)s", {'fd': fd, 'offset': offset,
+                                       'length': length, 'ret': ret})
+
+
 NORMAL_FORMAT = "%016.05f"
 INTERNAL_FORMAT = NORMAL_FORMAT + '_%016x'
 SHORT_FORMAT = NORMAL_FORMAT + '_%x'
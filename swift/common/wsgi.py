@@ -430,15 +430,19 @@ def run_server(conf, logger, sock, global_conf=None):
     app = loadapp(conf['__file__'], global_conf=global_conf)
     max_clients = int(conf.get('max_clients', '1024'))
     pool = RestrictedGreenPool(size=max_clients)
+    server_kwargs = {'custom_pool': pool}
+    argspec = inspect.getargspec(wsgi.server)
+    # Disable capitalizing headers in Eventlet if possible.  This is
+    # necessary for the AWS SDK to work with swift3 middleware.
+    if 'capitalize_response_headers' in argspec.args:
+        server_kwargs['capitalize_response_headers'] = False
+    # Close persistent connections left idle this long, rather than leaving
+    # them to hold on to a greenthread of the pool indefinitely.
+    keepalive_timeout = float(conf.get('keepalive_timeout') or 0)
+    if keepalive_timeout and 'socket_timeout' in argspec.args:
+        server_kwargs['socket_timeout'] = keepalive_timeout
     try:
-        # Disable capitalizing headers in Eventlet if possible.  This is
-        # necessary for the AWS SDK to work with swift3 middleware.
-        argspec = inspect.getargspec(wsgi.server)
-        if 'capitalize_response_headers' in argspec.args:
-            wsgi.server(sock, app, wsgi_logger, custom_pool=pool,
-                        capitalize_response_headers=False)
-        else:
-            wsgi.server(sock, app, wsgi_logger, custom_pool=pool)
+        wsgi.server(sock, app, wsgi_logger, **server_kwargs)
     except socket.error as err:
         if err[0] != errno.EINVAL:
             raise
@@ -1114,7 +1118,7 @@ def make_env(env, method=None, path=None, agent='Swift', query_string=None,
                  'swift.trans_id', 'swift.authorize_override',
                  'swift.authorize', 'HTTP_X_USER_ID', 'HTTP_X_PROJECT_ID',
                  'HTTP_REFERER', 'swift.orig_req_method', 'swift.log_info',
-                 'swift.infocache'):
+                 'swift.infocache', 'swift.worker_infocache'):
         if name in env:
             newenv[name] = env[name]
     if method:
@@ -21,19 +21,54 @@ from uuid import uuid4
 import time
 
 import six
-import six.moves.cPickle as pickle
 from six.moves import range
 import sqlite3
 
 from swift.common.utils import Timestamp, encode_timestamps, decode_timestamps, \
     extract_swift_bytes
-from swift.common.db import DatabaseBroker, utf8encode
+from swift.common.db import DatabaseBroker, utf8encode, dict_factory
 
 
 SQLITE_ARG_LIMIT = 999
 
 DATADIR = 'containers'
 
+# containers are sharded into containers of this account prefix followed by
+# the root container's account
+SHARDS_ACCOUNT_PREFIX = '.shards_'
+
+# the states of a shard range: created when the sharder plans it, cleaved
+# once its container has been filled with the root container's objects in
+# the range, and active once every range of the root has been cleaved and
+# the root's listings and object updates are served by the shards
+SHARD_CREATED = 1
+SHARD_CLEAVED = 2
+SHARD_ACTIVE = 3
+
+# the sharding states of a container
+UNSHARDED = 'unsharded'
+SHARDING = 'sharding'
+SHARDED = 'sharded'
+
+# while listing with a delimiter, up to this many rows of a pseudo-directory
+# are stepped over before seeking past the rest of it with a new query
+DELIMITER_SKIP_ROWS = 16
+
+SHARD_RANGE_TABLE_CREATE = '''
+    CREATE TABLE shard_range (
+        name TEXT PRIMARY KEY,
+        timestamp TEXT,
+        lower TEXT,
+        upper TEXT,
+        object_count INTEGER DEFAULT 0,
+        bytes_used INTEGER DEFAULT 0,
+        state INTEGER DEFAULT 0
+    );
+'''
+
+SHARD_RANGE_KEYS = ('name', 'timestamp', 'lower', 'upper', 'object_count',
+                    'bytes_used', 'state')
+
 POLICY_STAT_TABLE_CREATE = '''
     CREATE TABLE policy_stat (
         storage_policy_index INTEGER PRIMARY KEY,
@@ -251,6 +286,7 @@ class ContainerBroker(DatabaseBroker):
         self.create_policy_stat_table(conn, storage_policy_index)
         self.create_container_info_table(conn, put_timestamp,
                                          storage_policy_index)
+        self.create_shard_range_table(conn)
 
     def create_object_table(self, conn):
         """
@@ -273,6 +309,9 @@ class ContainerBroker(DatabaseBroker):
 
             CREATE INDEX ix_object_deleted_name ON object (deleted, name);
 
+            CREATE INDEX ix_object_deleted_policy_name
+            ON object (deleted, storage_policy_index, name);
+
             CREATE TRIGGER object_update BEFORE UPDATE ON object
             BEGIN
                 SELECT RAISE(FAIL, 'UPDATE not allowed; DELETE and INSERT');
@@ -332,6 +371,15 @@ class ContainerBroker(DatabaseBroker):
             VALUES (?)
         """, (storage_policy_index,))
 
+    def create_shard_range_table(self, conn):
+        """
+        Create the shard_range table, of the ranges of object names the
+        container is sharded into.
+
+        :param conn: DB connection object
+        """
+        conn.executescript(SHARD_RANGE_TABLE_CREATE)
+
     def get_db_version(self, conn):
         if self._db_version == -1:
             self._db_version = 0
@@ -363,17 +411,16 @@ class ContainerBroker(DatabaseBroker):
 
     def _commit_puts_load(self, item_list, entry):
         """See :func:`swift.common.db.DatabaseBroker._commit_puts_load`"""
-        data = pickle.loads(entry.decode('base64'))
-        (name, timestamp, size, content_type, etag, deleted) = data[:6]
-        if len(data) > 6:
-            storage_policy_index = data[6]
+        (name, timestamp, size, content_type, etag, deleted) = entry[:6]
+        if len(entry) > 6:
+            storage_policy_index = entry[6]
         else:
             storage_policy_index = 0
         content_type_timestamp = meta_timestamp = None
-        if len(data) > 7:
-            content_type_timestamp = data[7]
-        if len(data) > 8:
-            meta_timestamp = data[8]
+        if len(entry) > 7:
+            content_type_timestamp = entry[7]
+        if len(entry) > 8:
+            meta_timestamp = entry[8]
         item_list.append({'name': name,
                           'created_at': timestamp,
                           'size': size,
@@ -402,7 +449,10 @@ class ContainerBroker(DatabaseBroker):
                     raise
                 row = conn.execute(
                     'SELECT object_count from container_stat').fetchone()
-            return (row[0] == 0)
+            if row[0] != 0:
+                return False
+        # once sharded, the objects are in the shards
+        return not self.get_shard_usage()['object_count']
 
     def delete_object(self, name, timestamp, storage_policy_index=0):
         """
@@ -677,7 +727,6 @@ class ContainerBroker(DatabaseBroker):
         :returns: list of tuples of (name, created_at, size, content_type,
                   etag)
         """
-        delim_force_gte = False
         (marker, end_marker, prefix, delimiter, path) = utf8encode(
             marker, end_marker, prefix, delimiter, path)
         self._commit_puts_stale_ok()
@@ -691,59 +740,27 @@ class ContainerBroker(DatabaseBroker):
             delimiter = '/'
         elif delimiter and not prefix:
             prefix = ''
+        end_prefix = None
         if prefix:
             end_prefix = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        # The listing is read a page at a time from between a lower and an
+        # upper bound on the names, one of which is moved past each page and
+        # each pseudo-directory.
+        if end_marker and (not prefix or end_marker < end_prefix):
+            upper = end_marker
+        else:
+            upper = end_prefix
+        if marker and marker >= prefix:
+            lower, lower_inclusive = marker, False
+        else:
+            lower, lower_inclusive = prefix, True
         orig_marker = marker
+        results = []
         with self.get() as conn:
-            results = []
             while len(results) < limit:
-                query = '''SELECT name, created_at, size, content_type, etag
-                           FROM object WHERE'''
-                query_args = []
-                if end_marker and (not prefix or end_marker < end_prefix):
-                    query += ' name < ? AND'
-                    query_args.append(end_marker)
-                elif prefix:
-                    query += ' name < ? AND'
-                    query_args.append(end_prefix)
-
-                if delim_force_gte:
-                    query += ' name >= ? AND'
-                    query_args.append(marker)
-                    # Always set back to False
-                    delim_force_gte = False
-                elif marker and marker >= prefix:
-                    query += ' name > ? AND'
-                    query_args.append(marker)
-                elif prefix:
-                    query += ' name >= ? AND'
-                    query_args.append(prefix)
-                if self.get_db_version(conn) < 1:
-                    query += ' +deleted = 0'
-                else:
-                    query += ' deleted = 0'
-                orig_tail_query = '''
-                    ORDER BY name %s LIMIT ?
-                ''' % ('DESC' if reverse else '')
-                orig_tail_args = [limit - len(results)]
-                # storage policy filter
-                policy_tail_query = '''
-                    AND storage_policy_index = ?
-                ''' + orig_tail_query
-                policy_tail_args = [storage_policy_index] + orig_tail_args
-                tail_query, tail_args = \
-                    policy_tail_query, policy_tail_args
-                try:
-                    curs = conn.execute(query + tail_query,
-                                        tuple(query_args + tail_args))
-                except sqlite3.OperationalError as err:
-                    if 'no such column: storage_policy_index' not in str(err):
-                        raise
-                    tail_query, tail_args = \
-                        orig_tail_query, orig_tail_args
-                    curs = conn.execute(query + tail_query,
-                                        tuple(query_args + tail_args))
-                curs.row_factory = None
+                curs = self._list_objects_query(
+                    conn, lower, lower_inclusive, upper, storage_policy_index,
+                    reverse, limit - len(results))
 
                 # Delimiters without a prefix is ignored, further if there
                 # is no delimiter then we can simply return the result as
@@ -752,46 +769,88 @@ class ContainerBroker(DatabaseBroker):
                     return [self._transform_record(r) for r in curs]
 
                 # We have a delimiter and a prefix (possibly empty string) to
-                # handle
+                # handle. The rows of a pseudo-directory come one after the
+                # other, so a few of them are stepped over rather than
+                # starting a new page past them.
                 rowcount = 0
+                dir_name = None
+                skipped = 0
                 for row in curs:
                     rowcount += 1
                     name = row[0]
+                    if dir_name is not None:
+                        if name.startswith(dir_name):
+                            skipped += 1
+                            if skipped < DELIMITER_SKIP_ROWS:
+                                continue
+                            break
+                        dir_name = None
+                    if len(results) >= limit:
+                        break
                     if reverse:
-                        end_marker = name
+                        upper = name
                     else:
-                        marker = name
-
-                    if len(results) >= limit:
-                        curs.close()
-                        return results
+                        lower, lower_inclusive = name, False
+                    if path is not None and name == path:
+                        continue
                     end = name.find(delimiter, len(prefix))
-                    if path is not None:
-                        if name == path:
-                            continue
-                        if end >= 0 and len(name) > end + len(delimiter):
-                            if reverse:
-                                end_marker = name[:end + 1]
-                            else:
-                                marker = name[:end] + chr(ord(delimiter) + 1)
-                            curs.close()
-                            break
-                    elif end >= 0:
+                    if end >= 0 and (path is None or
+                                     len(name) > end + len(delimiter)):
+                        dir_name = name[:end + 1]
+                        skipped = 0
                         if reverse:
-                            end_marker = name[:end + 1]
+                            upper = dir_name
                         else:
-                            marker = name[:end] + chr(ord(delimiter) + 1)
-                            # we want result to be inclusive of delim+1
-                            delim_force_gte = True
-                        dir_name = name[:end + 1]
-                        if dir_name != orig_marker:
+                            lower = name[:end] + chr(ord(delimiter) + 1)
+                            lower_inclusive = True
+                        if path is None and dir_name != orig_marker:
                             results.append([dir_name, '0', 0, None, ''])
-                        curs.close()
-                        break
+                        continue
                     results.append(self._transform_record(row))
+                curs.close()
                 if not rowcount:
                     break
-            return results
+        return results
+
+    def _list_objects_query(self, conn, lower, lower_inclusive, upper,
+                            storage_policy_index, reverse, limit):
+        """
+        Query a page of the object rows of a listing, in name order.
+
+        :param conn: DB connection object
+        :param lower: the lower bound on the names, or None
+        :param lower_inclusive: True if the page includes a row named lower
+        :param upper: the (exclusive) upper bound on the names, or None
+        :param storage_policy_index: storage policy index for query
+        :param reverse: list the page in reverse name order
+        :param limit: the maximum number of rows in the page
+        :returns: a cursor of tuples of (name, created_at, size,
+                  content_type, etag)
+        """
+        query = '''SELECT name, created_at, size, content_type, etag
+                   FROM object WHERE'''
+        query_args = []
+        if upper:
+            query += ' name < ? AND'
+            query_args.append(upper)
+        if lower:
+            query += ' name >= ? AND' if lower_inclusive else ' name > ? AND'
+            query_args.append(lower)
+        if self.get_db_version(conn) < 1:
+            query += ' +deleted = 0'
+        else:
+            query += ' deleted = 0'
+        tail_query = ' ORDER BY name %s LIMIT ?' % ('DESC' if reverse else '')
+        try:
+            curs = conn.execute(
+                query + ' AND storage_policy_index = ?' + tail_query,
+                query_args + [storage_policy_index, limit])
+        except sqlite3.OperationalError as err:
+            if 'no such column: storage_policy_index' not in str(err):
+                raise
+            curs = conn.execute(query + tail_query, query_args + [limit])
+        curs.row_factory = None
+        return curs
 
     def _transform_record(self, record):
         """
@@ -1040,3 +1099,179 @@ class ContainerBroker(DatabaseBroker):
             ''' % (column_names, column_names) +
             CONTAINER_STAT_VIEW_SCRIPT +
             'COMMIT;')
+
+    def merge_shard_ranges(self, shard_ranges):
+        """
+        Merge shard ranges into the shard_range table; of two versions of a
+        shard range, the one with the newer timestamp wins.
+
+        :param shard_ranges: a list of shard range dicts, with the keys
+                             'name', 'timestamp', 'lower', 'upper',
+                             'object_count', 'bytes_used' and 'state'
+        """
+        shard_ranges = [
+            tuple(value.encode('utf-8')
+                  if isinstance(value, six.text_type) else value
+                  for value in (shard_range[key] for key in SHARD_RANGE_KEYS))
+            for shard_range in shard_ranges]
+
+        def _really_merge_shard_ranges(conn):
+            existing = dict(conn.execute(
+                'SELECT name, timestamp FROM shard_range'))
+            conn.executemany(
+                'INSERT OR REPLACE INTO shard_range (%s) VALUES (%s)' % (
+                    ', '.join(SHARD_RANGE_KEYS),
+                    ', '.join('?' * len(SHARD_RANGE_KEYS))),
+                (shard_range for shard_range in shard_ranges
+                 if shard_range[0] not in existing or
+                 Timestamp(shard_range[1]) > Timestamp(existing[
+                     shard_range[0]])))
+            conn.commit()
+
+        with self.get() as conn:
+            try:
+                return _really_merge_shard_ranges(conn)
+            except sqlite3.OperationalError as err:
+                if 'no such table: shard_range' not in str(err):
+                    raise
+                self.create_shard_range_table(conn)
+                return _really_merge_shard_ranges(conn)
+
+    def get_shard_ranges(self, states=None, includes=None, marker=None,
+                         end_marker=None):
+        """
+        Get the shard ranges of the container, in order. Each range holds
+        the object names above its lower bound up to and including its
+        upper bound; a lower bound of '' is below every name and an upper
+        bound of '' is above every name.
+
+        :param states: if given, only get shard ranges in these states
+        :param includes: if given, only get the shard range that includes
+                         this object name
+        :param marker: if given, only get shard ranges with names above the
+                       marker
+        :param end_marker: if given, only get shard ranges with names below
+                           the end marker
+        :returns: a list of shard range dicts
+        """
+        query = 'SELECT %s FROM shard_range WHERE 1' % ', '.join(
+            SHARD_RANGE_KEYS)
+        args = []
+        if states:
+            query += ' AND state IN (%s)' % ','.join('?' * len(states))
+            args.extend(states)
+        if includes:
+            query += " AND lower < ? AND (upper = '' OR upper >= ?)"
+            args.extend(utf8encode(includes, includes))
+        if marker:
+            query += " AND (upper = '' OR upper > ?)"
+            args.append(utf8encode(marker)[0])
+        if end_marker:
+            query += ' AND lower < ?'
+            args.append(utf8encode(end_marker)[0])
+        query += " ORDER BY upper = '', upper"
+        with self.get() as conn:
+            try:
+                return [dict(zip(SHARD_RANGE_KEYS, row))
+                        for row in conn.execute(query, args)]
+            except sqlite3.OperationalError as err:
+                if 'no such table: shard_range' not in str(err):
+                    raise
+                return []
+
+    def get_sharding_state(self):
+        """
+        Returns the sharding state of the container: UNSHARDED, SHARDING
+        while its shard ranges are being cleaved, or SHARDED once they are
+        all active.
+        """
+        shard_ranges = self.get_shard_ranges()
+        if not shard_ranges:
+            return UNSHARDED
+        if all(shard_range['state'] == SHARD_ACTIVE
+               for shard_range in shard_ranges):
+            return SHARDED
+        return SHARDING
+
+    def get_shard_usage(self):
+        """
+        Returns a dict of the total 'object_count' and 'bytes_used' of the
+        container's active shard ranges, as last reported by the sharder.
+        """
+        usage = {'object_count': 0, 'bytes_used': 0}
+        for shard_range in self.get_shard_ranges(states=[SHARD_ACTIVE]):
+            usage['object_count'] += shard_range['object_count']
+            usage['bytes_used'] += shard_range['bytes_used']
+        return usage
+
+    def find_shard_bounds(self, rows_per_shard):
+        """
+        Find the upper bounds of ranges of object names that each hold
+        ``rows_per_shard`` of the container's objects. The range above the
+        last bound holds the rest of them.
+
+        :param rows_per_shard: the number of objects in each range
+        :returns: a list of object names
+        """
+        bounds = []
+        self._commit_puts_stale_ok()
+        with self.get() as conn:
+            while True:
+                row = conn.execute('''
+                    SELECT name FROM object
+                    WHERE deleted = 0 AND name > ?
+                    ORDER BY name LIMIT 1 OFFSET ?
+                ''', (bounds[-1] if bounds else '',
+                      rows_per_shard - 1)).fetchone()
+                if not row:
+                    return bounds
+                bounds.append(row[0])
+
+    def get_objects(self, lower, upper, marker='', limit=1000):
+        """
+        Get the object rows, deleted or not and of any storage policy, with
+        names in a shard range.
+
+        :param lower: the lower bound of the range
+        :param upper: the upper bound of the range
+        :param marker: only get rows with names above the marker
+        :param limit: the maximum number of rows to get
+        :returns: a list of dicts of the rows, in name order
+        """
+        query = '''
+            SELECT ROWID, name, created_at, size, content_type, etag,
+                   deleted, storage_policy_index
+            FROM object WHERE name > ?
+        '''
+        lower, upper, marker = utf8encode(lower, upper, marker)
+        args = [max(lower, marker)]
+        if upper:
+            query += ' AND name <= ?'
+            args.append(upper)
+        query += ' ORDER BY name LIMIT ?'
+        args.append(limit)
+        self._commit_puts_stale_ok()
+        with self.get() as conn:
+            try:
+                curs = conn.execute(query, args)
+            except sqlite3.OperationalError as err:
+                if 'no such column: storage_policy_index' not in str(err):
+                    raise
+                curs = conn.execute(
+                    query.replace('storage_policy_index', '0'), args)
+            curs.row_factory = dict_factory
+            return list(curs)
+
+    def remove_objects(self, rowids):
+        """
+        Remove object rows for good, once they have been moved to the shard
+        containers.
+
+        :param rowids: the ROWIDs of the rows
+        """
+        with self.get() as conn:
+            for offset in range(0, len(rowids), SQLITE_ARG_LIMIT):
+                chunk = rowids[offset:offset + SQLITE_ARG_LIMIT]
+                conn.execute('DELETE FROM object WHERE ROWID IN (%s)' %
+                             ','.join('?' * len(chunk)), chunk)
+            conn.commit()
@@ -29,6 +29,7 @@ from swift.common import db_replicator
 from swift.common.storage_policy import POLICIES
 from swift.common.exceptions import DeviceUnavailable
 from swift.common.http import is_success
+from swift.common.swob import HTTPAccepted
 from swift.common.db import DatabaseAlreadyExists
 from swift.common.utils import (Timestamp, hash_path,
                                 storage_directory, majority_size)
@@ -76,6 +77,19 @@ class ContainerReplicator(db_replicator.Replicator):
             if any(info[key] != remote_info[key] for key in sync_timestamps):
                 broker.merge_timestamps(*(remote_info[key] for key in
                                           sync_timestamps))
+            shard_ranges = broker.get_shard_ranges()
+            if shard_ranges:
+                with Timeout(self.node_timeout):
+                    merge_response = http.replicate('merge_shard_ranges',
+                                                    shard_ranges)
+                if merge_response and not is_success(merge_response.status):
+                    # a peer not yet upgraded does not know the op (older
+                    # peers fail it with a 500); the DB is still synced, and
+                    # the shard ranges are sent again on the next pass
+                    self.logger.warning(
+                        'Bad response %(status)s from %(host)s merging '
+                        'shard ranges; is it not upgraded yet?',
+                        {'status': merge_response.status, 'host': http.host})
         rv = parent._handle_sync_response(
             node, response, info, broker, http, different_region)
         return rv
@@ -290,3 +304,7 @@ class ContainerReplicatorRpc(db_replicator.ReplicatorRpc):
                 timestamp=status_changed_at)
             info = broker.get_replication_info()
         return info
+
+    def merge_shard_ranges(self, broker, args):
+        broker.merge_shard_ranges(args[0])
+        return HTTPAccepted()
@@ -18,16 +18,18 @@ import os
 import time
 import traceback
 from swift import gettext_ as _
-from xml.etree.cElementTree import Element, SubElement, tostring
 
 from eventlet import Timeout
 
 import swift.common.db
 from swift.container.sync_store import ContainerSyncStore
-from swift.container.backend import ContainerBroker, DATADIR
+from swift.container.backend import ContainerBroker, DATADIR, \
+    SHARD_ACTIVE, SHARDED
 from swift.container.replicator import ContainerReplicatorRpc
-from swift.common.db import DatabaseAlreadyExists
+from swift.common.db import DatabaseAlreadyExists, PendingCommitter
 from swift.common.container_sync_realms import ContainerSyncRealms
+from swift.common.listing_formats import encode_json_listing, \
+    encode_plain_listing, encode_xml_container_listing
 from swift.common.request_helpers import get_param, get_listing_content_type, \
     split_and_validate_path, is_sys_or_user_meta
 from swift.common.utils import get_logger, hash_path, public, \
@@ -44,8 +46,8 @@ from swift.common.base_storage_server import BaseStorageServer
 from swift.common.header_key_dict import HeaderKeyDict
 from swift.common.swob import HTTPAccepted, HTTPBadRequest, HTTPConflict, \
     HTTPCreated, HTTPInternalServerError, HTTPNoContent, HTTPNotFound, \
-    HTTPPreconditionFailed, HTTPMethodNotAllowed, Request, Response, \
-    HTTPInsufficientStorage, HTTPException
+    HTTPOk, HTTPPreconditionFailed, HTTPMethodNotAllowed, Request, \
+    Response, HTTPInsufficientStorage, HTTPException
 
 
 def gen_resp_headers(info, is_deleted=False):
@@ -75,6 +77,22 @@ def gen_resp_headers(info, is_deleted=False):
     return headers
 
 
+def add_sharding_headers(broker, headers):
+    """
+    Add the sharding state of a container to its response headers; once the
+    container is sharded, its object count and bytes used are those of its
+    shards.
+    """
+    sharding_state = broker.get_sharding_state()
+    headers['X-Backend-Sharding-State'] = sharding_state
+    if sharding_state == SHARDED:
+        # any rows left in the container were cleaved to its shards, or are
+        # yet to be moved there, so they are not counted again
+        usage = broker.get_shard_usage()
+        headers['X-Container-Object-Count'] = usage['object_count']
+        headers['X-Container-Bytes-Used'] = usage['bytes_used']
+
+
 class ContainerController(BaseStorageServer):
     """WSGI Controller for the container server."""
 
@@ -112,6 +130,20 @@ class ContainerController(BaseStorageServer):
             self.save_headers.append('x-versions-location')
         swift.common.db.DB_PREALLOCATION = \
             config_true_value(conf.get('db_preallocation', 'f'))
+        self.committer = None
+        if config_true_value(conf.get('async_commits', 'false')):
+            self.committer = PendingCommitter(
+                self.logger,
+                interval=float(conf.get('async_commit_interval', 1)),
+                max_time=float(conf.get('async_commit_max_time', 0.05)),
+                pending_cap=int(conf.get('async_commit_pending_cap',
+                                         1048576)),
+                rcache=os.path.join(
+                    conf.get('recon_cache_path', '/var/cache/swift'),
+                    'container.recon'),
+                recon_key='container_db_committer',
+                stats_interval=float(
+                    conf.get('async_commit_stats_interval', 30)))
         self.sync_store = ContainerSyncStore(self.root,
                                              self.logger,
                                              self.mount_check)
@@ -132,6 +164,7 @@ class ContainerController(BaseStorageServer):
         kwargs.setdefault('account', account)
         kwargs.setdefault('container', container)
         kwargs.setdefault('logger', self.logger)
+        kwargs.setdefault('committer', self.committer)
         return ContainerBroker(db_path, **kwargs)
 
     def get_and_validate_policy_index(self, req):
@@ -427,6 +460,7 @@ class ContainerController(BaseStorageServer):
         headers = gen_resp_headers(info, is_deleted=is_deleted)
         if is_deleted:
             return HTTPNotFound(request=req, headers=headers)
+        add_sharding_headers(broker, headers)
         headers.update(
             (key, value)
             for key, (value, timestamp) in broker.metadata.items()
@@ -489,6 +523,15 @@ class ContainerController(BaseStorageServer):
         resp_headers = gen_resp_headers(info, is_deleted=is_deleted)
         if is_deleted:
             return HTTPNotFound(request=req, headers=resp_headers)
+        add_sharding_headers(broker, resp_headers)
+        if req.headers.get('X-Backend-Record-Type', '').lower() == 'shard':
+            shard_ranges = broker.get_shard_ranges(
+                states=[SHARD_ACTIVE], includes=get_param(req, 'includes'),
+                marker=marker, end_marker=end_marker)
+            resp_headers['X-Backend-Record-Type'] = 'shard'
+            return HTTPOk(request=req, headers=resp_headers,
+                          body=json.dumps(shard_ranges),
+                          content_type='application/json', charset='utf-8')
         container_list = broker.list_objects_iter(
             limit, marker, end_marker, prefix, delimiter, path,
             storage_policy_index=info['storage_policy_index'], reverse=reverse)
@@ -503,35 +546,61 @@ class ContainerController(BaseStorageServer):
                 resp_headers[key] = value
         ret = Response(request=req, headers=resp_headers,
                        content_type=out_content_type, charset='utf-8')
+        # the listing is encoded as it is sent, rather than all at once
+        records = (self.update_data_record(record)
+                   for record in container_list)
         if out_content_type == 'application/json':
-            ret.body = json.dumps([self.update_data_record(record)
-                                   for record in container_list])
+            ret.app_iter = encode_json_listing(records)
         elif out_content_type.endswith('/xml'):
-            doc = Element('container', name=container.decode('utf-8'))
-            for obj in container_list:
-                record = self.update_data_record(obj)
-                if 'subdir' in record:
-                    name = record['subdir'].decode('utf-8')
-                    sub = SubElement(doc, 'subdir', name=name)
-                    SubElement(sub, 'name').text = name
-                else:
-                    obj_element = SubElement(doc, 'object')
-                    for field in ["name", "hash", "bytes", "content_type",
-                                  "last_modified"]:
-                        SubElement(obj_element, field).text = str(
-                            record.pop(field)).decode('utf-8')
-                    for field in sorted(record):
-                        SubElement(obj_element, field).text = str(
-                            record[field]).decode('utf-8')
-            ret.body = tostring(doc, encoding='UTF-8').replace(
-                "<?xml version='1.0' encoding='UTF-8'?>",
-                '<?xml version="1.0" encoding="UTF-8"?>', 1)
+            ret.app_iter = encode_xml_container_listing(container, records)
         else:
             if not container_list:
                 return HTTPNoContent(request=req, headers=resp_headers)
-            ret.body = '\n'.join(rec[0] for rec in container_list) + '\n'
+            ret.app_iter = encode_plain_listing(
+                rec[0] for rec in container_list)
         return ret
 
+    @public
+    @timing_stats()
+    def UPDATE(self, req):
+        """
+        Handle HTTP UPDATE request (merge a json-encoded list of object
+        records, sent by the object updater in place of a PUT or DELETE
+        for each object.)
+        """
+        drive, part, account, container = split_and_validate_path(req, 4)
+        req_timestamp = valid_timestamp(req)
+        if self.mount_check and not check_mount(self.root, drive):
+            return HTTPInsufficientStorage(drive=drive, request=req)
+        obj_policy_index = self.get_and_validate_policy_index(req) or 0
+        try:
+            items = [{'name': item['name'],
+                      'created_at': Timestamp(item['created_at']).internal,
+                      'size': int(item['size']),
+                      'content_type': item['content_type'],
+                      'etag': item['etag'],
+                      'deleted': 1 if item.get('deleted') else 0,
+                      'storage_policy_index': int(item.get(
+                          'storage_policy_index', obj_policy_index)),
+                      'ctype_timestamp': item.get('ctype_timestamp'),
+                      'meta_timestamp': item.get('meta_timestamp')}
+                     for item in json.load(req.environ['wsgi.input'])]
+        except (ValueError, TypeError, KeyError) as err:
+            return HTTPBadRequest(body=str(err), content_type='text/plain',
+                                  request=req)
+        broker = self._get_container_broker(drive, part, account, container)
+        if account.startswith(self.auto_create_account_prefix) and \
+                not os.path.exists(broker.db_file):
+            try:
+                broker.initialize(req_timestamp.internal, obj_policy_index)
+            except DatabaseAlreadyExists:
+                pass
+        if not os.path.exists(broker.db_file):
+            return HTTPNotFound()
+        if items:
+            broker.merge_items(items)
+        return HTTPAccepted(request=req)
+
     @public
     @replication
     @timing_stats(sample_rate=0.01)
@@ -0,0 +1,356 @@
+# Copyright (c) 2010-2016 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The container sharder splits containers that have grown too big into shard
+containers, each holding the objects in one range of object names.
+
+Each container is sharded by the sharder on the node of its first primary
+(its leader) in three steps:
+
+#. The leader plans the shard ranges of a container once it holds at least
+   ``shard_container_threshold`` objects, splitting it into ranges of half
+   that many objects, and stores them in the container's DB in the
+   ``SHARD_CREATED`` state. The ranges are replicated to the other
+   replicas of the container along with its objects.
+#. The leader cleaves each range in turn, copying the container's rows in
+   the range to the shard container, and marks it ``SHARD_CLEAVED``. Shard
+   containers live in the root container's account prefixed with
+   :data:`~swift.container.backend.SHARDS_ACCOUNT_PREFIX`, placed by the
+   container ring like any other container.
+#. Once every range has been cleaved the leader marks them all
+   ``SHARD_ACTIVE``, and the container is sharded: the proxy sends object
+   updates to the shards and stitches listings together from them, merging
+   in any rows still left in the container.
+
+The sharders on every replica of a sharded container then move any rows
+left in it, or sent to it since, to their shards; the leader keeps the
+object counts and bytes used of the shard ranges up to date. From then on
+a sharded container reports the object counts and bytes used of its shards
+as its own, to its clients and to its account, without its own rows.
+"""
+
+import json
+import os
+import time
+from random import random
+
+from eventlet import GreenPile, Timeout
+
+from swift.container.backend import ContainerBroker, DATADIR, \
+    SHARDS_ACCOUNT_PREFIX, SHARD_CREATED, SHARD_CLEAVED, SHARD_ACTIVE, \
+    UNSHARDED, SHARDING
+from swift.common.bufferedhttp import http_connect
+from swift.common.daemon import Daemon
+from swift.common.direct_client import direct_head_container
+from swift.common.exceptions import ConnectionTimeout
+from swift.common.http import is_success
+from swift.common.ring import Ring
+from swift.common.ring.utils import is_local_device
+from swift.common.utils import get_logger, audit_location_generator, \
+    config_true_value, decode_timestamps, dump_recon_cache, quorum_size, \
+    whataremyips, Timestamp
+
+
+class ContainerSharder(Daemon):
+    """Shard containers that have grown too big."""
+
+    def __init__(self, conf, logger=None):
+        self.conf = conf
+        self.logger = logger or get_logger(conf, log_route='container-sharder')
+        self.devices = conf.get('devices', '/srv/node')
+        self.mount_check = config_true_value(conf.get('mount_check', 'true'))
+        self.swift_dir = conf.get('swift_dir', '/etc/swift')
+        self.interval = int(conf.get('interval', 1800))
+        self.bind_ip = conf.get('bind_ip', '0.0.0.0')
+        self.port = int(conf.get('bind_port', 6201))
+        self.shard_container_threshold = int(
+            conf.get('shard_container_threshold', 1000000))
+        self.cleave_batch_size = int(conf.get('cleave_batch_size', 1000))
+        self.conn_timeout = float(conf.get('conn_timeout', 5))
+        self.node_timeout = float(conf.get('node_timeout', 10))
+        self.recon_cache_path = conf.get('recon_cache_path',
+                                         '/var/cache/swift')
+        self.rcache = os.path.join(self.recon_cache_path, 'container.recon')
+        self.ring = Ring(self.swift_dir, ring_name='container')
+        self._local_device_ids = set()
+        self._zero_stats()
+
+    def _zero_stats(self):
+        self.stats = {'attempted': 0, 'planned': 0, 'cleaved': 0,
+                      'activated': 0, 'moved': 0, 'failures': 0,
+                      'sharding': 0, 'sharded': 0}
+
+    def _find_local_devices(self):
+        ips = whataremyips(self.bind_ip)
+        self._local_device_ids = set(
+            dev['id'] for dev in self.ring.devs
+            if dev and is_local_device(ips, self.port,
+                                       dev['replication_ip'],
+                                       dev['replication_port']))
+
+    def _is_leader(self, device, partition):
+        """
+        Returns True if the device is the container's first primary, whose
+        sharder plans and cleaves its shard ranges.
+        """
+        leader = self.ring.get_part_nodes(int(partition))[0]
+        return leader['id'] in self._local_device_ids and \
+            leader['device'] == device
+
+    def _one_shard_pass(self):
+        self._find_local_devices()
+        all_locs = audit_location_generator(self.devices, DATADIR, '.db',
+                                            mount_check=self.mount_check,
+                                            logger=self.logger)
+        for path, device, partition in all_locs:
+            try:
+                self.shard_container(path, device, partition)
+            except (Exception, Timeout):
+                self.stats['failures'] += 1
+                self.logger.increment('failures')
+                self.logger.exception('ERROR sharding %s', path)
+
+    def _report_stats(self, elapsed):
+        self.logger.info(
+            'Container sharding pass completed: %(elapsed).02fs, '
+            '%(attempted)d containers, %(planned)d planned, %(cleaved)d '
+            'ranges cleaved, %(activated)d activated, %(moved)d rows '
+            'moved, %(failures)d failures',
+            dict(self.stats, elapsed=elapsed))
+        dump_recon_cache({'sharding_stats': self.stats,
+                          'sharding_pass_completed': elapsed},
+                         self.rcache, self.logger)
+
+    def run_forever(self, *args, **kwargs):
+        """Run the container sharder until stopped."""
+        time.sleep(random() * self.interval)
+        while True:
+            self.logger.info('Begin container sharding pass.')
+            begin = time.time()
+            self._zero_stats()
+            try:
+                self._one_shard_pass()
+            except (Exception, Timeout):
+                self.logger.increment('errors')
+                self.logger.exception('ERROR sharding')
+            elapsed = time.time() - begin
+            self._report_stats(elapsed)
+            if elapsed < self.interval:
+                time.sleep(self.interval - elapsed)
+
+    def run_once(self, *args, **kwargs):
+        """Run the container sharder once."""
+        self.logger.info('Begin container sharding "once" mode')
+        begin = time.time()
+        self._zero_stats()
+        self._one_shard_pass()
+        self._report_stats(time.time() - begin)
+
+    def shard_container(self, path, device, partition):
+        """
+        Take the next sharding steps for a container DB.
+
+        :param path: the path to the container DB
+        :param device: the device the DB is on
+        :param partition: the partition the DB is in
+        """
+        broker = ContainerBroker(path, logger=self.logger)
+        if broker.is_deleted():
+            return
+        info = broker.get_info()
+        if info['account'].startswith(SHARDS_ACCOUNT_PREFIX):
+            # shard containers are not sharded again
+            return
+        self.stats['attempted'] += 1
+        is_leader = self._is_leader(device, partition)
+        state = broker.get_sharding_state()
+        if state == UNSHARDED:
+            if not is_leader or \
+                    info['object_count'] < self.shard_container_threshold:
+                return
+            self._plan_shard_ranges(broker, info)
+            state = SHARDING
+        if state == SHARDING:
+            self.stats['sharding'] += 1
+            if is_leader and self._cleave(broker, info):
+                self._activate(broker)
+            return
+        self.stats['sharded'] += 1
+        self._move_misplaced_objects(broker, info)
+        if is_leader:
+            self._update_shard_usage(broker)
+
+    def _plan_shard_ranges(self, broker, info):
+        bounds = broker.find_shard_bounds(
+            max(self.shard_container_threshold // 2, 1))
+        timestamp = Timestamp(time.time()).internal
+        broker.merge_shard_ranges([
+            {'name': '%s%s/%s-%s-%d' % (
+                SHARDS_ACCOUNT_PREFIX, info['account'], info['container'],
+                timestamp, index),
+             'timestamp': timestamp, 'lower': lower, 'upper': upper,
+             'object_count': 0, 'bytes_used': 0, 'state': SHARD_CREATED}
+            for index, (lower, upper) in enumerate(zip(
+                [''] + bounds, bounds + ['']))])
+        self.stats['planned'] += 1
+        self.logger.increment('planned')
+        self.logger.info('Planned %d shard ranges for %s',
+                         len(bounds) + 1, broker)
+
+    def _cleave(self, broker, info):
+        """
+        Copy the container's rows to the shard containers of the shard
+        ranges that have not been cleaved yet.
+
+        :returns: True if every shard range has been cleaved
+        """
+        for shard_range in broker.get_shard_ranges(states=[SHARD_CREATED]):
+            object_count = bytes_used = 0
+            marker = ''
+            while True:
+                rows = broker.get_objects(
+                    shard_range['lower'], shard_range['upper'],
+                    marker=marker, limit=self.cleave_batch_size)
+                # the shard container is created even if it gets no rows
+                if not self.send_objects(shard_range, rows,
+                                         info['storage_policy_index']):
+                    return False
+                for row in rows:
+                    if not row['deleted'] and row['storage_policy_index'] == \
+                            info['storage_policy_index']:
+                        object_count += 1
+                        bytes_used += row['size']
+                if len(rows) < self.cleave_batch_size:
+                    break
+                marker = rows[-1]['name']
+            broker.merge_shard_ranges([dict(
+                shard_range, state=SHARD_CLEAVED,
+                timestamp=Timestamp(time.time()).internal,
+                object_count=object_count, bytes_used=bytes_used)])
+            self.stats['cleaved'] += 1
+            self.logger.increment('cleaved')
+        return True
+
+    def _activate(self, broker):
+        timestamp = Timestamp(time.time()).internal
+        broker.merge_shard_ranges([
+            dict(shard_range, state=SHARD_ACTIVE, timestamp=timestamp)
+            for shard_range in broker.get_shard_ranges()])
+        self.stats['activated'] += 1
+        self.logger.increment('activated')
+        self.logger.info('Container %s is sharded', broker)
+
+    def _move_misplaced_objects(self, broker, info):
+        """
+        Move the rows left in a sharded container to its shards, and remove
+        them from the container.
+        """
+        for shard_range in broker.get_shard_ranges(states=[SHARD_ACTIVE]):
+            while True:
+                rows = broker.get_objects(
+                    shard_range['lower'], shard_range['upper'],
+                    limit=self.cleave_batch_size)
+                if not rows or not self.send_objects(
+                        shard_range, rows, info['storage_policy_index']):
+                    break
+                broker.remove_objects([row['ROWID'] for row in rows])
+                self.stats['moved'] += len(rows)
+                self.logger.update_stats('moved', len(rows))
+
+    def _update_shard_usage(self, broker):
+        """
+        Refresh the object counts and bytes used of a sharded container's
+        shard ranges from their shard containers.
+        """
+        updated = []
+        for shard_range in broker.get_shard_ranges(states=[SHARD_ACTIVE]):
+            account, container = shard_range['name'].split('/', 1)
+            part, nodes = self.ring.get_nodes(account, container)
+            for node in nodes:
+                try:
+                    headers = direct_head_container(
+                        node, part, account, container,
+                        conn_timeout=self.conn_timeout,
+                        response_timeout=self.node_timeout)
+                except (Exception, Timeout):
+                    self.logger.debug('Could not HEAD shard %s on %s',
+                                      shard_range['name'], node)
+                    continue
+                usage = {
+                    'object_count': int(headers['X-Container-Object-Count']),
+                    'bytes_used': int(headers['X-Container-Bytes-Used'])}
+                if any(shard_range[key] != value
+                       for key, value in usage.items()):
+                    updated.append(dict(
+                        shard_range, timestamp=Timestamp(
+                            time.time()).internal, **usage))
+                break
+        if updated:
+            broker.merge_shard_ranges(updated)
+
+    def _send_to_node(self, node, part, account, container, body,
+                      policy_index):
+        headers = {
+            'X-Timestamp': Timestamp(time.time()).internal,
+            'X-Backend-Storage-Policy-Index': str(policy_index),
+            'Content-Type': 'application/json',
+            'Content-Length': str(len(body)),
+            'user-agent': 'container-sharder %s' % os.getpid()}
+        try:
+            with ConnectionTimeout(self.conn_timeout):
+                conn = http_connect(node['ip'], node['port'], node['device'],
+                                    part, 'UPDATE',
+                                    '/%s/%s' % (account, container), headers)
+            with Timeout(self.node_timeout):
+                conn.send(body)
+                resp = conn.getresponse()
+                resp.read()
+        except (Exception, Timeout):
+            self.logger.exception('ERROR with remote server '
+                                  '%(ip)s:%(port)s/%(device)s', node)
+            return False
+        return is_success(resp.status)
+
+    def send_objects(self, shard_range, rows, policy_index):
+        """
+        Send object rows to the primaries of a shard container, creating it
+        if need be.
+
+        :param shard_range: the shard range dict
+        :param rows: a list of row dicts, as returned by
+                     ContainerBroker.get_objects
+        :param policy_index: the storage policy index of the root container
+        :returns: True if a quorum of the primaries got the rows
+        """
+        records = []
+        for row in rows:
+            t_data, t_ctype, t_meta = decode_timestamps(row['created_at'])
+            records.append({
+                'name': row['name'], 'created_at': t_data.internal,
+                'ctype_timestamp': t_ctype.internal,
+                'meta_timestamp': t_meta.internal, 'size': row['size'],
+                'content_type': row['content_type'], 'etag': row['etag'],
+                'deleted': row['deleted'],
+                'storage_policy_index': row['storage_policy_index']})
+        body = json.dumps(records)
+        account, container = shard_range['name'].split('/', 1)
+        part, nodes = self.ring.get_nodes(account, container)
+        pile = GreenPile(len(nodes))
+        for node in nodes:
+            pile.spawn(self._send_to_node, node, part, account, container,
+                       body, policy_index)
+        successes = len([success for success in pile if success])
+        return successes >= quorum_size(len(nodes))
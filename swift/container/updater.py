@@ -26,7 +26,7 @@ from tempfile import mkstemp
 from eventlet import spawn, patcher, Timeout
 
 import swift.common.db
-from swift.container.backend import ContainerBroker, DATADIR
+from swift.container.backend import ContainerBroker, DATADIR, SHARDED
 from swift.common.bufferedhttp import http_connect
 from swift.common.exceptions import ConnectionTimeout
 from swift.common.ring import Ring
@@ -217,6 +217,10 @@ class ContainerUpdater(Daemon):
         start_time = time.time()
         broker = ContainerBroker(dbfile, logger=self.logger)
         info = broker.get_info()
+        # once the container is sharded its objects are counted in its
+        # shards, including the rows not yet moved out of it
+        if broker.get_sharding_state() == SHARDED:
+            info.update(broker.get_shard_usage())
         # Don't send updates if the container was auto-created since it
         # definitely doesn't have up to date statistics.
         if Timestamp(info['put_timestamp']) <= 0:
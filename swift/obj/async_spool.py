@@ -0,0 +1,203 @@
+# Copyright (c) 2010-2016 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+An append-only spool of the container updates an object server could not
+send, kept per device and policy as an alternative to writing a pickle file
+to async_pending for each of them.
+
+The object servers append updates to the spool's ``current`` file, holding a
+lock on it for each append. The object updater seals ``current`` by renaming
+it to a segment file, and the object servers start a new ``current`` file;
+segments are also sealed by the object servers once ``current`` grows past
+:data:`SEGMENT_SIZE`. The updater sends the updates in each segment, appends
+any it could not send to ``current`` and only then unlinks the segment, so
+every update is sent at least once even if the updater dies part way.
+
+Each record in a spool file is a header of :data:`RECORD_MAGIC`, the length
+of the record's pickled update and its CRC32, followed by the pickle. A
+record left half written by a crash is skipped when the segment is read,
+along with any bytes up to the next intact record.
+"""
+
+import errno
+import os
+import struct
+import time
+import uuid
+import zlib
+
+import six.moves.cPickle as pickle
+
+from swift.common.utils import fdatasync, fsync_dir, lock_file, mkdirs, \
+    Timestamp
+
+PICKLE_PROTOCOL = 2
+CURRENT_FILE = 'current'
+SEGMENT_EXT = '.spool'
+# the object servers seal the current file once it is this big, so that the
+# updater need not hold too much of it in memory
+SEGMENT_SIZE = 64 * 1024 * 1024
+RECORD_MAGIC = 'ASR1'
+# magic, length of the pickled update, CRC32 of the pickled update
+_RECORD_HEADER = struct.Struct('!4sII')
+
+
+def encode_record(update):
+    """
+    Encode a container update as a spool record.
+
+    :param update: the update dict, as written to async_pending
+    :returns: the record, as a string
+    """
+    payload = pickle.dumps(update, PICKLE_PROTOCOL)
+    return _RECORD_HEADER.pack(RECORD_MAGIC, len(payload),
+                               zlib.crc32(payload) & 0xffffffff) + payload
+
+
+def decode_records(buf):
+    """
+    Decode the records in the contents of a spool file.
+
+    :param buf: the contents of a spool file
+    :returns: a tuple of (list of update dicts, number of bytes skipped
+              because they were not part of an intact record)
+    """
+    updates = []
+    skipped = 0
+    offset = 0
+    while offset < len(buf):
+        update = None
+        if len(buf) - offset >= _RECORD_HEADER.size:
+            magic, length, crc = _RECORD_HEADER.unpack_from(buf, offset)
+            start = offset + _RECORD_HEADER.size
+            payload = buf[start:start + length]
+            if magic == RECORD_MAGIC and len(payload) == length and \
+                    zlib.crc32(payload) & 0xffffffff == crc:
+                try:
+                    update = pickle.loads(payload)
+                except Exception:
+                    pass
+        if update is None:
+            # look for the next record
+            next_offset = buf.find(RECORD_MAGIC, offset + 1)
+            if next_offset < 0:
+                next_offset = len(buf)
+            skipped += next_offset - offset
+            offset = next_offset
+            continue
+        updates.append(update)
+        offset = start + length
+    return updates, skipped
+
+
+class AsyncSpool(object):
+    """
+    The spool of container updates of one device and policy.
+
+    :param path: the spool directory, e.g. /srv/node/sda/async_spool-1
+    :param lock_timeout: seconds to wait for the lock on the current file
+    """
+
+    def __init__(self, path, lock_timeout=10):
+        self.path = path
+        self.current_path = os.path.join(path, CURRENT_FILE)
+        self.lock_timeout = lock_timeout
+
+    def append(self, updates):
+        """
+        Append container updates to the spool, returning once they are on
+        disk.
+
+        :param updates: a list of update dicts
+        """
+        data = ''.join(encode_record(update) for update in updates)
+        mkdirs(self.path)
+        with lock_file(self.current_path, self.lock_timeout, append=True,
+                       unlink=False) as fp:
+            fp.write(data)
+            fp.flush()
+            fdatasync(fp.fileno())
+            if os.fstat(fp.fileno()).st_size >= SEGMENT_SIZE:
+                self._seal_locked()
+
+    def _seal_locked(self):
+        segment_path = os.path.join(self.path, '%s-%s%s' % (
+            Timestamp(time.time()).internal, uuid.uuid4().hex,
+            SEGMENT_EXT))
+        os.rename(self.current_path, segment_path)
+        fsync_dir(self.path)
+        return segment_path
+
+    def seal(self):
+        """
+        Seal the current file as a segment, so that later updates are
+        appended to a new current file.
+
+        :returns: the path of the new segment, or None if there were no
+                  updates to seal
+        """
+        if not os.path.exists(self.current_path):
+            return None
+        with lock_file(self.current_path, self.lock_timeout, append=True,
+                       unlink=False) as fp:
+            if not os.fstat(fp.fileno()).st_size:
+                return None
+            return self._seal_locked()
+
+    def segments(self):
+        """
+        Returns the paths of the sealed segments, oldest first.
+        """
+        try:
+            names = os.listdir(self.path)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return []
+        return [os.path.join(self.path, name) for name in sorted(names)
+                if name.endswith(SEGMENT_EXT)]
+
+    def read_segment(self, segment_path):
+        """
+        Read the updates in a sealed segment.
+
+        :param segment_path: the path of the segment
+        :returns: a tuple of (list of update dicts, number of bytes skipped)
+        """
+        with open(segment_path, 'rb') as fp:
+            return decode_records(fp.read())
+
+    def get_backlog(self):
+        """
+        Returns a dict of the number of updates waiting in the spool, and the
+        number of bytes and files they take up.
+        """
+        backlog = {'updates': 0, 'bytes': 0, 'files': 0}
+        paths = self.segments()
+        if os.path.exists(self.current_path):
+            paths.append(self.current_path)
+        for path in paths:
+            try:
+                with open(path, 'rb') as fp:
+                    buf = fp.read()
+            except IOError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                continue
+            backlog['updates'] += len(decode_records(buf)[0])
+            backlog['bytes'] += len(buf)
+            backlog['files'] += 1
+        return backlog
@@ -251,6 +251,8 @@ class AuditorWorker(object):
                             incr_by=chunk_len)
                         self.bytes_processed += chunk_len
                         self.total_bytes_processed += chunk_len
+            if df.migrate_metadata():
+                self.logger.increment('migrated_metadata')
         except DiskFileNotExist:
             pass
         except DiskFileQuarantined as err:
@@ -30,14 +30,18 @@ The remaining methods in this module are considered implementation specific and
 are also not considered part of the backend API.
 """
 
+import six
 import six.moves.cPickle as pickle
 import errno
 import fcntl
 import json
 import os
+import struct
+import sys
 import time
 import uuid
 import hashlib
+import itertools
 import logging
 import traceback
 import xattr
@@ -45,10 +49,12 @@ from os.path import basename, dirname, exists, getmtime, join, splitext
 from random import shuffle
 from tempfile import mkstemp
 from contextlib import contextmanager
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
-from eventlet import Timeout
+from eventlet import Timeout, spawn_n
+from eventlet.event import Event
 from eventlet.hubs import trampoline
+from eventlet.semaphore import Semaphore
 
 from swift import gettext_ as _
 from swift.common.constraints import check_mount, check_dir
@@ -58,16 +64,20 @@ from swift.common.utils import mkdirs, Timestamp, \
     fsync_dir, drop_buffer_cache, lock_path, write_pickle, \
     config_true_value, listdir, split_path, ismount, remove_file, \
     get_md5_socket, F_SETPIPE_SZ, decode_timestamps, encode_timestamps, \
-    tpool_reraise, MD5_OF_EMPTY_STRING
+    tpool_reraise, MD5_OF_EMPTY_STRING, syncfs, load_libc_function, \
+    noop_libc_function, stdlib_queue, stdlib_threading, dump_recon_cache, \
+    read_ahead_buffer_cache
 from swift.common.splice import splice, tee
 from swift.common.exceptions import DiskFileQuarantined, DiskFileNotExist, \
     DiskFileCollision, DiskFileNoSpace, DiskFileDeviceUnavailable, \
     DiskFileDeleted, DiskFileError, DiskFileNotOpen, PathNotDir, \
-    ReplicationLockTimeout, DiskFileExpired, DiskFileXattrNotSupported
+    ReplicationLockTimeout, DiskFileExpired, DiskFileXattrNotSupported, \
+    LockTimeout
 from swift.common.swob import multi_range_iterator
 from swift.common.storage_policy import (
     get_policy_string, split_policy_string, PolicyError, POLICIES,
-    REPL_POLICY, EC_POLICY)
+    REPL_POLICY, EC_POLICY, SLAB_POLICY)
+from swift.obj.async_spool import AsyncSpool
 from functools import partial
 
 
@@ -75,16 +85,42 @@ PICKLE_PROTOCOL = 2
 ONE_WEEK = 604800
 HASH_FILE = 'hashes.pkl'
 HASH_INVALIDATIONS_FILE = 'hashes.invalid'
+HASH_LOG_FILE = 'hashes.log'
+# hashes.log is compacted once it holds more than this many records, or
+# twice as many records as there are suffixes, whichever is larger
+HASH_LOG_COMPACT_RECORDS = 1024
+SLAB_INDEX_FILE = 'slab.index'
+SLAB_VOLUME_FILE = 'slab-%d.vol'
+SLAB_RECORD_HEADER = struct.Struct('!I')
+# a slab partition is compacted once its volumes hold more unreferenced bytes
+# than live ones and at least this many of them, or once its index holds
+# more than this many records and twice as many records as there are files
+SLAB_COMPACT_BYTES = 1024 * 1024
+SLAB_COMPACT_RECORDS = 1024
+# the number of partition indexes each slab manager keeps in memory
+SLAB_INDEX_CACHE_SIZE = 256
+# hash dirs modified less than this many seconds ago are not cached, because
+# a later change within the same mtime tick would go unnoticed
+ONDISK_CACHE_MIN_AGE = 1.0
+# read statistics in the recon cache not updated for this many stats
+# intervals are dropped, as left by workers that have since exited
+READ_STATS_STALE_INTERVALS = 3
 METADATA_KEY = 'user.swift.metadata'
+# Metadata written in the compact encoding starts with this, which no pickle
+# does, followed by the version of the encoding.
+COMPACT_METADATA_MAGIC = '\x00swm'
+COMPACT_METADATA_VERSION = 1
 DROP_CACHE_WINDOW = 1024 * 1024
 # These are system-set metadata keys that cannot be changed with a POST.
 # They should be lowercase.
 DATAFILE_SYSTEM_META = set('content-length deleted etag'.split())
 DATADIR_BASE = 'objects'
 ASYNCDIR_BASE = 'async_pending'
+ASYNC_SPOOL_BASE = 'async_spool'
 TMP_BASE = 'tmp'
 get_data_dir = partial(get_policy_string, DATADIR_BASE)
 get_async_dir = partial(get_policy_string, ASYNCDIR_BASE)
+get_async_spool_dir = partial(get_policy_string, ASYNC_SPOOL_BASE)
 get_tmp_dir = partial(get_policy_string, TMP_BASE)
 
 
@@ -104,20 +140,114 @@ def _get_filename(fd):
     return fd
 
 
-def read_metadata(fd):
+# magic, version, length of the whole encoding, number of items
+_COMPACT_METADATA_HEADER = struct.Struct('!4sBIH')
+_COMPACT_METADATA_CODES = {six.binary_type: 's', six.text_type: 'u'}
+_COMPACT_METADATA_CODES.update((t, 'i') for t in six.integer_types)
+
+
+def _encode_compact_metadata(metadata):
     """
-    Helper function to read the pickled metadata from an object file.
+    Encode metadata in the compact encoding, which is the header followed by
+    a type code for each key and value, then the keys and values themselves
+    separated by NULs, so that they can be decoded with a single split().
 
-    :param fd: file descriptor or filename to load the metadata from
+    :param metadata: dictionary of metadata
+    :returns: the encoded metadata, or None if the metadata has keys or
+              values which only pickle can encode
+    """
+    if len(metadata) > 0xffff:
+        return None
+    codes = []
+    strings = []
+    for item in metadata.items():
+        for value in item:
+            code = _COMPACT_METADATA_CODES.get(type(value))
+            if code is None:
+                return None
+            elif code == 'u':
+                value = value.encode('utf8')
+            elif code == 'i':
+                value = str(value)
+            if '\x00' in value:
+                return None
+            codes.append(code)
+            strings.append(value)
+    body = ''.join(codes) + '\x00'.join(strings)
+    return _COMPACT_METADATA_HEADER.pack(
+        COMPACT_METADATA_MAGIC, COMPACT_METADATA_VERSION,
+        _COMPACT_METADATA_HEADER.size + len(body), len(metadata)) + body
+
+
+def _compact_metadata_length(metastr):
+    """
+    Returns the length recorded in the header of compact metadata, or None if
+    metastr does not start with compact metadata.
+    """
+    if not metastr.startswith(COMPACT_METADATA_MAGIC):
+        return None
+    if len(metastr) < _COMPACT_METADATA_HEADER.size:
+        return _COMPACT_METADATA_HEADER.size
+    return _COMPACT_METADATA_HEADER.unpack_from(metastr)[2]
+
+
+def _decode_compact_metadata(metastr):
+    """
+    Decode metadata written in the compact encoding.
 
+    :param metastr: the encoded metadata
     :returns: dictionary of metadata
+    :raises ValueError: if the metadata is corrupt or of an unknown version
+    """
+    try:
+        _magic, version, length, count = \
+            _COMPACT_METADATA_HEADER.unpack_from(metastr)
+    except struct.error as err:
+        raise ValueError(str(err))
+    if version != COMPACT_METADATA_VERSION:
+        raise ValueError('unsupported version %d' % version)
+    if len(metastr) != length:
+        raise ValueError('expected %d bytes, got %d' % (length, len(metastr)))
+    if not count:
+        return {}
+    offset = _COMPACT_METADATA_HEADER.size + 2 * count
+    codes = metastr[_COMPACT_METADATA_HEADER.size:offset]
+    values = metastr[offset:].split('\x00')
+    if len(values) != 2 * count:
+        raise ValueError('expected %d keys and values, got %d' %
+                         (2 * count, len(values)))
+    if codes.count('s') != len(codes):
+        for i, code in enumerate(codes):
+            if code == 'u':
+                try:
+                    values[i] = values[i].decode('utf8')
+                except UnicodeDecodeError as err:
+                    raise ValueError(str(err))
+            elif code == 'i':
+                values[i] = int(values[i])
+            elif code != 's':
+                raise ValueError('unknown type code %r' % code)
+    return dict(zip(values[::2], values[1::2]))
+
+
+def _read_metadata_xattrs(fd):
+    """
+    Read the metadata xattrs of an object file.
+
+    :param fd: file descriptor or filename to load the metadata from
+    :returns: a tuple of (the metadata string, True if it is compact)
     """
     metadata = ''
     key = 0
+    length = None
     try:
-        while True:
+        while length is None or len(metadata) < length:
             metadata += xattr.getxattr(fd, '%s%s' % (METADATA_KEY,
                                                      (key or '')))
+            if not key:
+                # compact metadata records its length, so we know when we
+                # have read it all without looking for another xattr
+                length = _compact_metadata_length(metadata)
             key += 1
     except (IOError, OSError) as e:
         for err in 'ENOTSUP', 'EOPNOTSUPP':
@@ -130,17 +260,46 @@ def read_metadata(fd):
             raise DiskFileNotExist()
         # TODO: we might want to re-raise errors that don't denote a missing
         # xattr here.  Seems to be ENODATA on linux and ENOATTR on BSD/OSX.
-    return pickle.loads(metadata)
+    return metadata, length is not None
+
+
+def read_metadata(fd):
+    """
+    Helper function to read the metadata from an object file, whether it was
+    pickled or written in the compact encoding.
+
+    :param fd: file descriptor or filename to load the metadata from
+
+    :returns: dictionary of metadata
+    """
+    metadata, compact = _read_metadata_xattrs(fd)
+    if not compact:
+        try:
+            return pickle.loads(metadata)
+        except Exception:
+            # migrate_metadata() may have replaced the pickle between reads
+            # of its xattrs; if so, it is compact when read again
+            metadata, compact = _read_metadata_xattrs(fd)
+            if not compact:
+                return pickle.loads(metadata)
+    return _decode_compact_metadata(metadata)
 
 
-def write_metadata(fd, metadata, xattr_size=65536):
+def write_metadata(fd, metadata, xattr_size=65536, compact=False):
     """
-    Helper function to write pickled metadata for an object file.
+    Helper function to write metadata for an object file.
 
     :param fd: file descriptor or filename to write the metadata
     :param metadata: metadata to write
+    :param compact: if true, write the metadata in the compact encoding
+                    rather than pickled, unless it has keys or values that
+                    only pickle can encode
     """
-    metastr = pickle.dumps(metadata, PICKLE_PROTOCOL)
+    metastr = None
+    if compact:
+        metastr = _encode_compact_metadata(metadata)
+    if metastr is None:
+        metastr = pickle.dumps(metadata, PICKLE_PROTOCOL)
     key = 0
     while metastr:
         try:
@@ -162,6 +321,40 @@ def write_metadata(fd, metadata, xattr_size=65536):
             raise
 
 
+def migrate_metadata(fd, xattr_size=65536):
+    """
+    Rewrite the pickled metadata of an object file in the compact encoding.
+
+    The compact metadata replaces the first xattr in a single setxattr()
+    call, so metadata too big for one xattr is left pickled; otherwise a
+    failure part way through would leave the metadata unreadable. The rest
+    of the pickle's xattrs are only removed after that, so a concurrent
+    :func:`read_metadata` that fails to unpickle what it read finds the
+    compact metadata when it reads again.
+
+    :param fd: file descriptor or filename of the object file
+    :returns: True if the metadata was rewritten, False if it was already
+              compact or cannot be written compactly
+    """
+    metastr = xattr.getxattr(fd, METADATA_KEY)
+    if _compact_metadata_length(metastr) is not None:
+        return False
+    metastr = _encode_compact_metadata(read_metadata(fd))
+    if metastr is None or len(metastr) > xattr_size:
+        return False
+    xattr.setxattr(fd, METADATA_KEY, metastr)
+    # the rest of the pickle is ignored by read_metadata() now, but there is
+    # no reason to keep it around
+    key = 1
+    while True:
+        try:
+            xattr.removexattr(fd, '%s%s' % (METADATA_KEY, key))
+        except (IOError, OSError):
+            break
+        key += 1
+    return True
+
+
 def extract_policy(obj_path):
     """
     Extracts the policy for an object (based on the name of the objects
@@ -301,7 +494,8 @@ def invalidate_hash(suffix_dir):
     suffix = basename(suffix_dir)
     partition_dir = dirname(suffix_dir)
     hashes_file = join(partition_dir, HASH_FILE)
-    if not os.path.exists(hashes_file):
+    hashes_log_file = join(partition_dir, HASH_LOG_FILE)
+    if not (os.path.exists(hashes_file) or os.path.exists(hashes_log_file)):
         return
 
     invalidations_file = join(partition_dir, HASH_INVALIDATIONS_FILE)
@@ -310,6 +504,129 @@ def invalidate_hash(suffix_dir):
             inv_fh.write(suffix + "\n")
 
 
+def _encode_hashes_log_record(suffix, hash_=None, removed=False):
+    """
+    Serialize a single hashes.log record.
+
+    Each record is a line of JSON: ``[suffix]`` removes the suffix,
+    ``[suffix, null]`` marks it as needing to be rehashed and
+    ``[suffix, hash]`` records its current hash. EC suffix hashes are dicts
+    keyed by fragment index, so they are written as a list of pairs to
+    preserve the ``None`` and integer keys.
+    """
+    if removed:
+        return json.dumps([suffix]) + '\n'
+    if isinstance(hash_, dict):
+        hash_ = list(hash_.items())
+    return json.dumps([suffix, hash_]) + '\n'
+
+
+def read_hashes_log(hashes_log_file):
+    """
+    Replay a hashes.log file.
+
+    :param hashes_log_file: absolute path to a hashes.log file
+    :returns: a tuple of (hashes dict, number of records in the log)
+    :raises ValueError: if the log contains a malformed or torn record
+    :raises IOError: if the log cannot be read
+    """
+    hashes = {}
+    num_records = 0
+    with open(hashes_log_file, 'rb') as fp:
+        for line in fp:
+            if not line.endswith('\n'):
+                raise ValueError('Torn record in %s' % hashes_log_file)
+            record = json.loads(line)
+            suffix = str(record[0])
+            if len(record) == 1:
+                hashes.pop(suffix, None)
+            elif isinstance(record[1], list):
+                hashes[suffix] = dict(
+                    (fi, str(md5)) for fi, md5 in record[1])
+            elif record[1] is None:
+                hashes[suffix] = None
+            else:
+                hashes[suffix] = str(record[1])
+            num_records += 1
+    return hashes, num_records
+
+
+def write_hashes_log(hashes, partition_dir):
+    """
+    Atomically replace the hashes.log for a partition with one record per
+    suffix in hashes. The caller must hold the partition lock.
+
+    :param hashes: dict of suffix hashes
+    :param partition_dir: absolute path to the partition dir
+    """
+    fd, tmppath = mkstemp(dir=partition_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as fo:
+        fo.write(''.join(_encode_hashes_log_record(suffix, hash_)
+                         for suffix, hash_ in sorted(hashes.items())))
+        fo.flush()
+        os.fsync(fd)
+        renamer(tmppath, join(partition_dir, HASH_LOG_FILE))
+
+
+def consolidate_hashes_log(partition_dir):
+    """
+    Apply any invalidations in hashes.invalid to hashes.log by appending a
+    record for each newly invalidated suffix, then clear out hashes.invalid.
+
+    If there is no hashes.log yet but there is a legacy hashes.pkl then the
+    pickled hashes are converted into a new hashes.log and the hashes.pkl is
+    removed.
+
+    :param partition_dir: absolute path to partition dir containing
+                          hashes.log and hashes.invalid
+    :returns: a tuple of (hashes, size of hashes.log in bytes, number of
+              records in hashes.log), or None if there is no hashes.log or
+              hashes.pkl.
+    :raises ValueError: if the hashes.log is corrupt
+    """
+    hashes_log_file = join(partition_dir, HASH_LOG_FILE)
+    invalidations_file = join(partition_dir, HASH_INVALIDATIONS_FILE)
+
+    if not os.path.exists(hashes_log_file):
+        hashes = consolidate_hashes(partition_dir)
+        if hashes is None:
+            return None
+        with lock_path(partition_dir):
+            write_hashes_log(hashes, partition_dir)
+            remove_file(join(partition_dir, HASH_FILE))
+
+    with lock_path(partition_dir):
+        hashes, num_records = read_hashes_log(hashes_log_file)
+
+        records = []
+        try:
+            with open(invalidations_file, 'rb') as inv_fh:
+                for line in inv_fh:
+                    suffix = line.strip()
+                    if hashes.get(suffix) is not None:
+                        hashes[suffix] = None
+                        records.append(_encode_hashes_log_record(suffix))
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+        if records:
+            with open(hashes_log_file, 'ab') as log_fh:
+                log_fh.write(''.join(records))
+            num_records += len(records)
+
+        # Now that all the invalidations are reflected in hashes.log, it's
+        # safe to clear out the invalidations file.
+        try:
+            with open(invalidations_file, 'w') as inv_fh:
+                pass
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+        return hashes, os.path.getsize(hashes_log_file), num_records
+
+
 class AuditLocation(object):
     """
     Represents an object location to be audited.
@@ -395,6 +712,18 @@ def object_audit_location_generator(devices, mount_check=True, logger=None,
                     if e.errno != errno.ENOTDIR:
                         raise
                     continue
+                if SLAB_INDEX_FILE in suffixes:
+                    # objects in a slab partition have no hash dirs; the
+                    # paths they would have are found in its index instead
+                    index = SlabIndex(part_path)
+                    index.refresh()
+                    for asuffix in index.list_suffixes():
+                        suff_path = os.path.join(part_path, asuffix)
+                        for hsh in index.list_hashes(asuffix):
+                            hsh_path = os.path.join(suff_path, hsh)
+                            yield AuditLocation(hsh_path, device, partition,
+                                                policy)
+                    continue
                 for asuffix in suffixes:
                     suff_path = os.path.join(part_path, asuffix)
                     try:
@@ -466,6 +795,246 @@ def strip_self(f):
     return wrapper
 
 
+class GroupCommitter(object):
+    """
+    Makes object writes on a single device durable in batches.
+
+    Writers hand the file descriptor of a file they have written (and
+    renamed into place) to :meth:`commit`, which blocks until a dedicated
+    native thread has called syncfs() on the device's filesystem. Any
+    writers that arrive while a syncfs() is in progress are committed
+    together by the next one, so under concurrent load a single syncfs()
+    replaces the fsync() of each data file and of each directory it was
+    renamed into.
+
+    :meth:`commit` blocks the calling OS thread, so it must be called from
+    a tpool thread rather than from a greenthread.
+
+    :param max_batch: maximum number of writers committed by one syncfs()
+    """
+
+    def __init__(self, max_batch=64):
+        self.max_batch = max_batch
+        self._queue = stdlib_queue.Queue()
+        self._thread = stdlib_threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def commit(self, fd):
+        """
+        Wait until all data and metadata written to the filesystem holding
+        fd before this call have been synced to disk.
+
+        :param fd: file descriptor of a file on the device
+        :returns: a tuple of (number of writers in the batch that synced
+                  this write, True if this writer was the first in that
+                  batch, seconds spent waiting for the sync)
+        :raises OSError: if syncfs() failed
+        """
+        request = {'fd': fd, 'done': stdlib_threading.Event(),
+                   'start': time.time()}
+        self._queue.put(request)
+        request['done'].wait()
+        if request.get('error'):
+            raise request['error']
+        return (request['batch_size'], request['leader'],
+                time.time() - request['start'])
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except stdlib_queue.Empty:
+                    break
+            error = None
+            try:
+                syncfs(batch[0]['fd'])
+            except OSError as err:
+                error = err
+            for i, request in enumerate(batch):
+                request.update(batch_size=len(batch), leader=(i == 0),
+                               error=error)
+                request['done'].set()
+
+
+class _ReadRequest(object):
+    """
+    A call submitted to a :class:`DeviceReadPool`, which the submitter
+    waits on for its result.
+    """
+    __slots__ = ('func', 'args', 'event', 'submitted', 'started', 'finished',
+                 'result', 'exc_info')
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.event = Event()
+        self.submitted = time.time()
+        self.started = self.finished = None
+        self.result = self.exc_info = None
+
+    def wait(self):
+        """
+        Wait for the call to complete, without blocking other greenthreads.
+
+        :returns: the call's return value
+        :raises: whatever the call raised
+        """
+        self.event.wait()
+        if self.exc_info:
+            six.reraise(*self.exc_info)
+        return self.result
+
+
+class DeviceReadPool(object):
+    """
+    A pool of native threads that read from the files on one device, so that
+    a slow device only holds up the greenthreads that read from it, rather
+    than the whole eventlet hub.
+
+    Greenthreads hand the reads to :meth:`submit`, and at most
+    ``queue_depth`` of them may be queued or in progress at a time; any
+    more wait in :meth:`submit` for a slot. Completed reads are handed back
+    to the hub through a pipe watched by a dispatching greenthread.
+
+    :param threads: number of threads reading from the device
+    :param queue_depth: maximum number of reads queued or in progress
+    """
+
+    def __init__(self, threads=4, queue_depth=64):
+        self.queue_depth = queue_depth
+        self._slots = Semaphore(queue_depth)
+        self._requests = stdlib_queue.Queue()
+        self._completed = stdlib_queue.Queue()
+        self._rpipe, self._wpipe = os.pipe()
+        fcntl.fcntl(self._rpipe, fcntl.F_SETFL,
+                    fcntl.fcntl(self._rpipe, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self._dispatching = False
+        self._pending = 0
+        self._reset_stats()
+        for _junk in range(threads):
+            thread = stdlib_threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+
+    def _reset_stats(self):
+        self._max_pending = self._pending
+        self._reads = 0
+        self._queue_time = self._max_queue_time = 0.0
+        self._read_time = self._max_read_time = 0.0
+
+    def submit(self, func, *args):
+        """
+        Call func(*args) on one of the pool's threads, first waiting for a
+        slot in the queue if it is full.
+
+        :returns: a request whose wait() method returns the call's result
+        """
+        self._slots.acquire()
+        if not self._dispatching:
+            self._dispatching = True
+            spawn_n(self._dispatch)
+        request = _ReadRequest(func, args)
+        self._pending += 1
+        self._max_pending = max(self._max_pending, self._pending)
+        self._requests.put(request)
+        return request
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            request.started = time.time()
+            try:
+                request.result = request.func(*request.args)
+            except BaseException:
+                request.exc_info = sys.exc_info()
+            request.finished = time.time()
+            self._completed.put(request)
+            os.write(self._wpipe, b'.')
+
+    def _dispatch(self):
+        while True:
+            trampoline(self._rpipe, read=True)
+            try:
+                os.read(self._rpipe, 4096)
+            except OSError as err:
+                if err.errno != errno.EAGAIN:
+                    raise
+            while True:
+                try:
+                    request = self._completed.get_nowait()
+                except stdlib_queue.Empty:
+                    break
+                self._pending -= 1
+                self._reads += 1
+                queue_time = request.started - request.submitted
+                read_time = request.finished - request.started
+                self._queue_time += queue_time
+                self._max_queue_time = max(self._max_queue_time, queue_time)
+                self._read_time += read_time
+                self._max_read_time = max(self._max_read_time, read_time)
+                self._slots.release()
+                request.event.send()
+
+    def get_stats(self):
+        """
+        Return the pool's statistics since the last call, with times in
+        milliseconds.
+        """
+        reads = self._reads or 1
+        stats = {
+            'queue_depth': self._pending,
+            'max_queue_depth': self._max_pending,
+            'reads': self._reads,
+            'avg_queue_ms': self._queue_time * 1000 / reads,
+            'max_queue_ms': self._max_queue_time * 1000,
+            'avg_read_ms': self._read_time * 1000 / reads,
+            'max_read_ms': self._max_read_time * 1000,
+        }
+        self._reset_stats()
+        return stats
+
+
+def _read_chunks(fp, chunk_size, count):
+    """
+    Read up to count chunks from a file, stopping early at its end.
+
+    :returns: a tuple of (list of chunks read, True if the end of the file
+              was reached)
+    """
+    chunks = []
+    while len(chunks) < count:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            return chunks, True
+        chunks.append(chunk)
+    return chunks, False
+
+
+class OnDiskCacheEntry(object):
+    """
+    What a worker knows about the contents of one hash dir, valid for as long
+    as the hash dir's inode and mtime are unchanged. Entries are populated
+    lazily by :meth:`BaseDiskFile.open`.
+
+    :param stat_key: (st_ino, st_mtime) of the hash dir when it was listed
+    """
+    __slots__ = ('stat_key', 'files', 'ondisk_info', 'metadata')
+
+    def __init__(self, stat_key):
+        self.stat_key = stat_key
+        # the names of the files in the hash dir, or None if not yet listed
+        self.files = None
+        # the results of _get_ondisk_files, keyed by the diskfile's
+        # ondisk_cache_key (so EC diskfiles of different frag indexes
+        # each get their own)
+        self.ondisk_info = {}
+        # the metadata read from each file, keyed by absolute file path
+        self.metadata = {}
+
+
 class DiskFileRouter(object):
 
     policy_type_to_manager_cls = {}
@@ -523,6 +1092,7 @@ class BaseDiskFileManager(object):
 
     invalidate_hash = strip_self(invalidate_hash)
     consolidate_hashes = strip_self(consolidate_hashes)
+    consolidate_hashes_log = strip_self(consolidate_hashes_log)
     quarantine_renamer = strip_self(quarantine_renamer)
 
     def __init__(self, conf, logger):
@@ -537,6 +1107,41 @@ class BaseDiskFileManager(object):
             conf.get('replication_one_per_device', 'true'))
         self.replication_lock_timeout = int(conf.get(
             'replication_lock_timeout', 15))
+        self.hashes_log = config_true_value(conf.get('hashes_log', 'false'))
+        self.compact_metadata = config_true_value(
+            conf.get('compact_metadata', 'false'))
+        self.async_spool = config_true_value(
+            conf.get('async_spool', 'false'))
+        self.ondisk_cache_size = int(conf.get('ondisk_cache_size', 0))
+        self._ondisk_cache = OrderedDict()
+        self.threaded_reads = config_true_value(
+            conf.get('threaded_reads', 'no'))
+        self.threaded_read_threads = int(conf.get('threaded_read_threads', 4))
+        self.threaded_read_queue_depth = int(
+            conf.get('threaded_read_queue_depth', 64))
+        self.threaded_read_ahead = max(
+            1, int(conf.get('threaded_read_ahead', 1)))
+        self.threaded_read_stats_interval = float(
+            conf.get('threaded_read_stats_interval', 30))
+        self.rcache = os.path.join(
+            conf.get('recon_cache_path', '/var/cache/swift'), 'object.recon')
+        self._read_pools = {}
+        self._read_stats_dumped = time.time()
+
+        self.group_commit = False
+        self.group_commit_max_batch = int(
+            conf.get('group_commit_max_batch', 64))
+        self._group_committers = {}
+        conf_wants_group_commit = config_true_value(
+            conf.get('group_commit', 'no'))
+        if conf_wants_group_commit and load_libc_function(
+                'syncfs', log_error=False) is noop_libc_function:
+            self.logger.warning(
+                "Group commit requested (config says \"group_commit = %s\"), "
+                "but the system does not support syncfs(). "
+                "Group commit will not be used." % conf.get('group_commit'))
+        elif conf_wants_group_commit:
+            self.group_commit = True
 
         self.use_splice = False
         self.pipe_size = None
@@ -640,13 +1245,15 @@ class BaseDiskFileManager(object):
             'ctype_timestamp': ts_ctype
         }
 
-    def _process_ondisk_files(self, exts, results, **kwargs):
+    def _process_ondisk_files(self, exts, results, obsolete, **kwargs):
         """
         Called by get_ondisk_files(). Should be over-ridden to implement
         subclass specific handling of files.
 
-        :param exts: dict of lists of file info, keyed by extension
+        :param exts: dict of lists of (key, file info) records, keyed by
+                     extension, each in reverse chronological order
         :param results: a dict that may be updated with results
+        :param obsolete: a list that file infos of obsolete files are added to
         """
         raise NotImplementedError
 
@@ -689,31 +1296,29 @@ class BaseDiskFileManager(object):
                 return original_list[:i], original_list[i:]
         return original_list, []
 
-    def _split_gt_timestamp(self, file_info_list, timestamp):
+    def _split_gt_timestamp(self, records, key):
         """
-        Given a list of file info dicts, reverse sorted by timestamp, split the
-        list into two: items newer than timestamp, and items at same time or
-        older than timestamp.
+        Given a list of file records, reverse sorted by key, split the list
+        into two: records newer than key, and records at same time or older
+        than key.
 
-        :param file_info_list: a list of file_info dicts.
-        :param timestamp: a Timestamp.
+        :param records: a list of (key, file_info) tuples.
+        :param key: the internal form of a Timestamp.
         :return: a tuple of two lists.
         """
-        return self._split_list(
-            file_info_list, lambda x: x['timestamp'] > timestamp)
+        return self._split_list(records, lambda record: record[0] > key)
 
-    def _split_gte_timestamp(self, file_info_list, timestamp):
+    def _split_gte_timestamp(self, records, key):
         """
-        Given a list of file info dicts, reverse sorted by timestamp, split the
-        list into two: items newer than or at same time as the timestamp, and
-        items older than timestamp.
+        Given a list of file records, reverse sorted by key, split the list
+        into two: records newer than or at same time as key, and records older
+        than key.
 
-        :param file_info_list: a list of file_info dicts.
-        :param timestamp: a Timestamp.
+        :param records: a list of (key, file_info) tuples.
+        :param key: the internal form of a Timestamp.
         :return: a tuple of two lists.
         """
-        return self._split_list(
-            file_info_list, lambda x: x['timestamp'] >= timestamp)
+        return self._split_list(records, lambda record: record[0] >= key)
 
     def get_ondisk_files(self, files, datadir, verify=True, **kwargs):
         """
@@ -746,87 +1351,91 @@ class BaseDiskFileManager(object):
                     meta_info -> a file info dict for a .meta file
                     obsolete  -> a list of file info dicts for obsolete files
         """
-        # Build the exts data structure:
-        # exts is a dict that maps file extensions to a list of file_info
-        # dicts for the files having that extension. The file_info dicts are of
-        # the form returned by parse_on_disk_filename, with the filename added.
-        # Each list is sorted in reverse timestamp order.
+        # Each file is parsed once into a (key, file_info) record, where
+        # file_info is the dict returned by parse_on_disk_filename with the
+        # filename added and key is the internal form of its timestamp.
+        # Comparing keys is equivalent to comparing the Timestamps, but
+        # formats each timestamp once rather than on every comparison.
 
         # the results dict is used to collect results of file filtering
         results = {}
+        obsolete = []
 
-        # The exts dict will be modified during subsequent processing as files
-        # are removed to be discarded or ignored.
-        exts = defaultdict(list)
+        records = []
         for afile in files:
-            # Categorize files by extension
             try:
                 file_info = self.parse_on_disk_filename(afile)
-                file_info['filename'] = afile
-                exts[file_info['ext']].append(file_info)
             except DiskFileError as e:
                 file_path = os.path.join(datadir or '', afile)
                 self.logger.warning('Unexpected file %s: %s',
                                     file_path, e)
                 results.setdefault('unexpected', []).append(file_path)
-        for ext in exts:
-            # For each extension sort files into reverse chronological order.
-            exts[ext] = sorted(
-                exts[ext], key=lambda info: info['timestamp'], reverse=True)
+                continue
+            file_info['filename'] = afile
+            records.append((file_info['timestamp'].internal, file_info))
+        # A single stable sort into reverse chronological order, after which
+        # the records are categorized by extension in one pass: the exts dict
+        # maps each extension to a list of records, in that same order, and
+        # is modified during subsequent processing as files are discarded.
+        records.sort(key=lambda record: record[0], reverse=True)
+
+        ts_key = None
+        for key, file_info in records:
+            if file_info['ext'] == '.ts':
+                ts_key = key
+                break
 
-        if exts.get('.ts'):
-            # non-tombstones older than or equal to latest tombstone are
-            # obsolete
-            for ext in filter(lambda ext: ext != '.ts', exts.keys()):
-                exts[ext], older = self._split_gt_timestamp(
-                    exts[ext], exts['.ts'][0]['timestamp'])
-                results.setdefault('obsolete', []).extend(older)
-            # all but most recent .ts are obsolete
-            results.setdefault('obsolete', []).extend(exts['.ts'][1:])
-            exts['.ts'] = exts['.ts'][:1]
+        exts = defaultdict(list)
+        for record in records:
+            ext = record[1]['ext']
+            if ext == '.ts':
+                # all but most recent .ts are obsolete
+                if exts[ext]:
+                    obsolete.append(record[1])
+                    continue
+            elif ts_key is not None and record[0] <= ts_key:
+                # non-tombstones older than or equal to latest tombstone are
+                # obsolete
+                obsolete.append(record[1])
+                continue
+            exts[ext].append(record)
 
         if exts.get('.meta'):
-            # retain the newest meta file
-            retain = 1
-            if exts['.meta'][1:]:
-                # there are other meta files so find the one with newest
-                # ctype_timestamp...
-                exts['.meta'][1:] = sorted(
-                    exts['.meta'][1:],
-                    key=lambda info: info['ctype_timestamp'],
-                    reverse=True)
-                # ...and retain this IFF its ctype_timestamp is greater than
-                # newest meta file
-                if (exts['.meta'][1]['ctype_timestamp'] >
-                        exts['.meta'][0]['ctype_timestamp']):
-                    if (exts['.meta'][1]['timestamp'] ==
-                            exts['.meta'][0]['timestamp']):
-                        # both at same timestamp so retain only the one with
-                        # newest ctype
-                        exts['.meta'][:2] = [exts['.meta'][1],
-                                             exts['.meta'][0]]
-                        retain = 1
-                    else:
-                        # retain both - first has newest metadata, second has
-                        # newest ctype
-                        retain = 2
-            # discard all meta files not being retained...
-            results.setdefault('obsolete', []).extend(exts['.meta'][retain:])
-            exts['.meta'] = exts['.meta'][:retain]
+            # retain the newest meta file...
+            metas = exts['.meta']
+            retain = metas[:1]
+            # ...and the first of the others having the newest
+            # ctype_timestamp, IFF its ctype_timestamp is greater than that
+            # of the newest meta file
+            ctype_key = self._ctype_key(metas[0])
+            for record in metas[1:]:
+                if self._ctype_key(record) > ctype_key:
+                    ctype_key = self._ctype_key(record)
+                    retain = [metas[0], record]
+            if len(retain) > 1 and retain[1][0] == metas[0][0]:
+                # both at same timestamp so retain only the one with newest
+                # ctype
+                retain = retain[1:]
+            # discard all meta files not being retained
+            obsolete.extend(record[1] for record in metas
+                            if not any(record is r for r in retain))
+            exts['.meta'] = retain
 
         # delegate to subclass handler
-        self._process_ondisk_files(exts, results, **kwargs)
+        self._process_ondisk_files(exts, results, obsolete, **kwargs)
 
         # set final choice of files
         if exts.get('.ts'):
-            results['ts_info'] = exts['.ts'][0]
+            results['ts_info'] = exts['.ts'][0][1]
         if 'data_info' in results and exts.get('.meta'):
             # only report a meta file if a data file has been chosen
-            results['meta_info'] = exts['.meta'][0]
-            ctype_info = exts['.meta'].pop()
+            results['meta_info'] = exts['.meta'][0][1]
+            ctype_info = exts['.meta'].pop()[1]
             if (ctype_info['ctype_timestamp']
                     > results['data_info']['timestamp']):
                 results['ctype_info'] = ctype_info
+        if obsolete:
+            results['obsolete'] = obsolete
 
         # set ts_file, data_file, meta_file and ctype_file with path to
         # chosen file or None
@@ -843,6 +1452,19 @@ class BaseDiskFileManager(object):
 
         return results
 
+    @staticmethod
+    def _ctype_key(record):
+        """
+        Return a key that orders file records by content-type timestamp,
+        records without one ordering before all others.
+
+        :param record: a (key, file_info) tuple.
+        """
+        ctype_timestamp = record[1]['ctype_timestamp']
+        if ctype_timestamp is None:
+            return ''
+        return ctype_timestamp.internal
+
     def cleanup_ondisk_files(self, hsh_path, reclaim_age=ONE_WEEK, **kwargs):
         """
         Clean up on-disk files that are obsolete and gather the set of valid
@@ -864,17 +1486,20 @@ class BaseDiskFileManager(object):
         files.sort(reverse=True)
         results = self.get_ondisk_files(
             files, hsh_path, verify=False, **kwargs)
+        removed = set()
         if 'ts_info' in results and is_reclaimable(
                 results['ts_info']['timestamp']):
             remove_file(join(hsh_path, results['ts_info']['filename']))
-            files.remove(results.pop('ts_info')['filename'])
+            removed.add(results.pop('ts_info')['filename'])
         for file_info in results.get('possible_reclaim', []):
             # stray files are not deleted until reclaim-age
             if is_reclaimable(file_info['timestamp']):
                 results.setdefault('obsolete', []).append(file_info)
         for file_info in results.get('obsolete', []):
             remove_file(join(hsh_path, file_info['filename']))
-            files.remove(file_info['filename'])
+            removed.add(file_info['filename'])
+        if removed:
+            files = [f for f in files if f not in removed]
         results['files'] = files
         return results
 
@@ -889,6 +1514,41 @@ class BaseDiskFileManager(object):
         """
         raise NotImplementedError
 
+    def _hash_ondisk_info(self, hashes, ondisk_info):
+        """
+        Update the given dict of md5 hashes with the state of one object.
+
+        :param hashes: a dict of md5 hashes to be updated
+        :param ondisk_info: a dict describing the state of ondisk files, as
+                            returned by get_ondisk_files
+        """
+        # ondisk_info has info dicts containing timestamps for those
+        # files that could determine the state of the diskfile if it were
+        # to be opened. We update the suffix hash with the concatenation of
+        # each file's timestamp and extension. The extension is added to
+        # guarantee distinct hash values from two object dirs that have
+        # different file types at the same timestamp(s).
+        #
+        # Files that may be in the object dir but would have no effect on
+        # the state of the diskfile are not used to update the hash.
+        for key in (k for k in ('meta_info', 'ts_info')
+                    if k in ondisk_info):
+            info = ondisk_info[key]
+            hashes[None].update(info['timestamp'].internal + info['ext'])
+
+        # delegate to subclass for data file related updates...
+        self._update_suffix_hashes(hashes, ondisk_info)
+
+        if 'ctype_info' in ondisk_info:
+            # We have a distinct content-type timestamp so update the
+            # hash. As a precaution, append '_ctype' to differentiate this
+            # value from any other timestamp value that might included in
+            # the hash in future. There is no .ctype file so use _ctype to
+            # avoid any confusion.
+            info = ondisk_info['ctype_info']
+            hashes[None].update(info['ctype_timestamp'].internal
+                                + '_ctype')
+
     def _hash_suffix_dir(self, path, reclaim_age):
         """
 
@@ -924,33 +1584,7 @@ class BaseDiskFileManager(object):
                 except OSError:
                     pass
                 continue
-
-            # ondisk_info has info dicts containing timestamps for those
-            # files that could determine the state of the diskfile if it were
-            # to be opened. We update the suffix hash with the concatenation of
-            # each file's timestamp and extension. The extension is added to
-            # guarantee distinct hash values from two object dirs that have
-            # different file types at the same timestamp(s).
-            #
-            # Files that may be in the object dir but would have no effect on
-            # the state of the diskfile are not used to update the hash.
-            for key in (k for k in ('meta_info', 'ts_info')
-                        if k in ondisk_info):
-                info = ondisk_info[key]
-                hashes[None].update(info['timestamp'].internal + info['ext'])
-
-            # delegate to subclass for data file related updates...
-            self._update_suffix_hashes(hashes, ondisk_info)
-
-            if 'ctype_info' in ondisk_info:
-                # We have a distinct content-type timestamp so update the
-                # hash. As a precaution, append '_ctype' to differentiate this
-                # value from any other timestamp value that might included in
-                # the hash in future. There is no .ctype file so use _ctype to
-                # avoid any confusion.
-                info = ondisk_info['ctype_info']
-                hashes[None].update(info['ctype_timestamp'].internal
-                                    + '_ctype')
+            self._hash_ondisk_info(hashes, ondisk_info)
 
         try:
             os.rmdir(path)
@@ -974,6 +1608,15 @@ class BaseDiskFileManager(object):
         """
         raise NotImplementedError
 
+    def _list_suffixes(self, partition_path):
+        """
+        List the suffixes stored in a partition.
+
+        :param partition_path: absolute path of partition
+        :returns: a list of suffixes
+        """
+        return [suff for suff in os.listdir(partition_path) if len(suff) == 3]
+
     def _get_hashes(self, partition_path, recalculate=None, do_listdir=False,
                     reclaim_age=None):
         """
@@ -990,6 +1633,9 @@ class BaseDiskFileManager(object):
 
         :returns: tuple of (number of suffix dirs hashed, dictionary of hashes)
         """
+        if self.hashes_log:
+            return self._get_hashes_from_log(
+                partition_path, recalculate, do_listdir, reclaim_age)
         reclaim_age = reclaim_age or self.reclaim_age
         hashed = 0
         hashes_file = join(partition_path, HASH_FILE)
@@ -1019,9 +1665,8 @@ class BaseDiskFileManager(object):
                 hashes = {}
 
         if do_listdir:
-            for suff in os.listdir(partition_path):
-                if len(suff) == 3:
-                    hashes.setdefault(suff, None)
+            for suff in self._list_suffixes(partition_path):
+                hashes.setdefault(suff, None)
             modified = True
         hashes.update((suffix, None) for suffix in recalculate)
         for suffix, hash_ in hashes.items():
@@ -1041,12 +1686,206 @@ class BaseDiskFileManager(object):
                         getmtime(hashes_file) == mtime:
                     write_pickle(
                         hashes, hashes_file, partition_path, PICKLE_PROTOCOL)
+                    if force_rewrite:
+                        # a hashes.log left behind by hashes_log = true no
+                        # longer tracks invalidations, so must not be trusted
+                        remove_file(join(partition_path, HASH_LOG_FILE))
                     return hashed, hashes
             return self._get_hashes(partition_path, recalculate, do_listdir,
                                     reclaim_age)
         else:
             return hashed, hashes
 
+    def _get_hashes_from_log(self, partition_path, recalculate=None,
+                             do_listdir=False, reclaim_age=None):
+        """
+        Variant of :meth:`_get_hashes` used when the ``hashes_log`` option
+        is enabled. Rather than rewriting a pickle of every suffix hash
+        whenever any of them changes, only the suffixes that were
+        (re)hashed or removed are appended to the partition's hashes.log,
+        which is compacted once it grows too large.
+
+        :param partition_path: absolute path of partition to get hashes for
+        :param recalculate: list of suffixes which should be recalculated when
+                            got
+        :param do_listdir: force existence check for all hashes in the
+                           partition
+        :param reclaim_age: age at which to remove tombstones
+
+        :returns: tuple of (number of suffix dirs hashed, dictionary of hashes)
+        """
+        reclaim_age = reclaim_age or self.reclaim_age
+        hashed = 0
+        hashes_log_file = join(partition_path, HASH_LOG_FILE)
+        force_rewrite = False
+        hashes = {}
+        log_size = num_records = 0
+
+        if recalculate is None:
+            recalculate = []
+
+        try:
+            consolidated = self.consolidate_hashes_log(partition_path)
+        except Exception:
+            consolidated = None
+        if consolidated is None:
+            # no (valid) hashes.log or hashes.pkl file; let's build it
+            do_listdir = True
+            force_rewrite = True
+        else:
+            hashes, log_size, num_records = consolidated
+
+        if do_listdir:
+            for suff in self._list_suffixes(partition_path):
+                hashes.setdefault(suff, None)
+        hashes.update((suffix, None) for suffix in recalculate)
+        records = []
+        for suffix, hash_ in hashes.items():
+            if not hash_:
+                suffix_dir = join(partition_path, suffix)
+                try:
+                    hashes[suffix] = self._hash_suffix(suffix_dir, reclaim_age)
+                    hashed += 1
+                except PathNotDir:
+                    del hashes[suffix]
+                    records.append(
+                        _encode_hashes_log_record(suffix, removed=True))
+                    continue
+                except OSError:
+                    logging.exception(_('Error hashing suffix'))
+                records.append(
+                    _encode_hashes_log_record(suffix, hashes[suffix]))
+        if not (records or force_rewrite):
+            return hashed, hashes
+        with lock_path(partition_path):
+            try:
+                unmodified = os.path.getsize(hashes_log_file) == log_size
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                unmodified = False
+            if force_rewrite or (unmodified and num_records + len(records) >
+                                 max(HASH_LOG_COMPACT_RECORDS,
+                                     2 * len(hashes))):
+                write_hashes_log(hashes, partition_path)
+                if force_rewrite:
+                    remove_file(join(partition_path, HASH_FILE))
+                return hashed, hashes
+            elif unmodified:
+                with open(hashes_log_file, 'ab') as log_fh:
+                    log_fh.write(''.join(records))
+                return hashed, hashes
+        # hashes.log was modified while we were hashing; start over
+        return self._get_hashes_from_log(
+            partition_path, recalculate, do_listdir, reclaim_age)
+
+    def get_group_committer(self, device_path):
+        """
+        Return the :class:`GroupCommitter` for a device, creating it if
+        necessary, or None if group commit is not enabled.
+
+        :param device_path: full path to the device
+        """
+        if not self.group_commit:
+            return None
+        committer = self._group_committers.get(device_path)
+        if committer is None:
+            committer = self._group_committers[device_path] = \
+                GroupCommitter(self.group_commit_max_batch)
+        return committer
+
+    def get_read_pool(self, device_path):
+        """
+        Return the :class:`DeviceReadPool` for a device, creating it if
+        necessary, or None if threaded reads are not enabled.
+
+        :param device_path: full path to the device
+        """
+        if not self.threaded_reads:
+            return None
+        pool = self._read_pools.get(device_path)
+        if pool is None:
+            pool = self._read_pools[device_path] = DeviceReadPool(
+                self.threaded_read_threads, self.threaded_read_queue_depth)
+        return pool
+
+    def dump_read_stats(self, force=False):
+        """
+        Write the statistics of this worker's read pools to the recon cache,
+        under this worker's pid, if threaded_read_stats_interval has passed
+        since they were last written. The statistics of other workers that
+        have not been written for ``READ_STATS_STALE_INTERVALS`` intervals
+        are removed.
+
+        :param force: write the statistics regardless of when they were last
+                      written
+        """
+        now = time.time()
+        if not self._read_pools or not (
+                force or now - self._read_stats_dumped >=
+                self.threaded_read_stats_interval):
+            return
+        self._read_stats_dumped = now
+        devices = dict((os.path.basename(device_path), pool.get_stats())
+                       for device_path, pool in self._read_pools.items())
+        read_stats = {str(os.getpid()): {'devices': devices, 'updated': now}}
+        try:
+            with open(self.rcache) as f:
+                cached = json.load(f).get('object_threaded_reads') or {}
+        except (IOError, ValueError):
+            cached = {}
+        stale = now - READ_STATS_STALE_INTERVALS * \
+            self.threaded_read_stats_interval
+        for pid, stats in cached.items():
+            if stats.get('updated', 0) < stale:
+                # an empty entry removes the pid from the cache
+                read_stats.setdefault(pid, {})
+        dump_recon_cache({'object_threaded_reads': read_stats},
+                         self.rcache, self.logger)
+
+    def get_ondisk_cache_entry(self, datadir):
+        """
+        Return the :class:`OnDiskCacheEntry` of a hash dir, or None if the
+        on-disk file cache is disabled or the hash dir does not exist.
+
+        The entry is looked up by the hash dir's path and is only returned
+        if the hash dir's inode and mtime still match those it was cached
+        with; otherwise a new, empty entry is returned in its place. Hash
+        dirs modified within the last ``ONDISK_CACHE_MIN_AGE`` seconds get an
+        entry that is not kept in the cache.
+
+        :param datadir: absolute path of the hash dir
+        """
+        if self.ondisk_cache_size <= 0:
+            return None
+        try:
+            st = os.stat(datadir)
+        except OSError:
+            self._ondisk_cache.pop(datadir, None)
+            return None
+        stat_key = (st.st_ino, st.st_mtime)
+        entry = self._ondisk_cache.pop(datadir, None)
+        if entry is not None and entry.stat_key == stat_key:
+            self.logger.increment('ondisk_cache.hits')
+        else:
+            self.logger.increment('ondisk_cache.misses')
+            entry = OnDiskCacheEntry(stat_key)
+            if time.time() - st.st_mtime < ONDISK_CACHE_MIN_AGE:
+                return entry
+            while len(self._ondisk_cache) >= self.ondisk_cache_size:
+                self._ondisk_cache.popitem(last=False)
+        self._ondisk_cache[datadir] = entry
+        return entry
+
+    def invalidate_ondisk_cache(self, datadir):
+        """
+        Forget the cached contents of a hash dir, after this worker changed
+        them.
+
+        :param datadir: absolute path of the hash dir
+        """
+        self._ondisk_cache.pop(datadir, None)
+
     def construct_dev_path(self, device):
         """
         Construct the path to a device without checking if it is mounted.
@@ -1102,7 +1941,8 @@ class BaseDiskFileManager(object):
                             timestamp, policy):
         """
         Write data describing a container update notification to a pickle file
-        in the async_pending directory.
+        in the async_pending directory, or append it to the device's async
+        spool if ``async_spool`` is enabled.
 
         :param device: name of target device
         :param account: account name for the object
@@ -1113,6 +1953,11 @@ class BaseDiskFileManager(object):
         :param policy: the StoragePolicy instance
         """
         device_path = self.construct_dev_path(device)
+        if self.async_spool:
+            AsyncSpool(os.path.join(
+                device_path, get_async_spool_dir(policy))).append([data])
+            self.logger.increment('async_pendings')
+            return
         async_dir = os.path.join(device_path, get_async_dir(policy))
         tmp_dir = os.path.join(device_path, get_tmp_dir(policy))
         mkdirs(tmp_dir)
@@ -1386,6 +2231,7 @@ class BaseDiskFileWriter(object):
         self._last_sync = 0
         self._extension = '.data'
         self._put_succeeded = False
+        self._group_commit_stats = None
 
     @property
     def manager(self):
@@ -1421,26 +2267,34 @@ class BaseDiskFileWriter(object):
 
         return self._upload_size
 
-    def _finalize_put(self, metadata, target_path, cleanup):
+    def _finalize_put(self, metadata, target_path, cleanup, committer=None):
         # Write the metadata before calling fsync() so that both data and
         # metadata are flushed to disk.
-        write_metadata(self._fd, metadata)
-        # We call fsync() before calling drop_cache() to lower the amount of
-        # redundant work the drop cache code will perform on the pages (now
-        # that after fsync the pages will be all clean).
-        fsync(self._fd)
-        # From the Department of the Redundancy Department, make sure we call
-        # drop_cache() after fsync() to avoid redundant work (pages all
-        # clean).
-        drop_buffer_cache(self._fd, 0, self._upload_size)
+        write_metadata(self._fd, metadata,
+                       compact=self.manager.compact_metadata)
+        if committer is None:
+            # We call fsync() before calling drop_cache() to lower the amount
+            # of redundant work the drop cache code will perform on the pages
+            # (now that after fsync the pages will be all clean).
+            fsync(self._fd)
+            # From the Department of the Redundancy Department, make sure we
+            # call drop_cache() after fsync() to avoid redundant work (pages
+            # all clean).
+            drop_buffer_cache(self._fd, 0, self._upload_size)
         self.manager.invalidate_hash(dirname(self._datadir))
         # After the rename completes, this object will be available for other
         # requests to reference.
-        renamer(self._tmppath, target_path)
+        renamer(self._tmppath, target_path, fsync=committer is None)
         # If rename is successful, flag put as succeeded. This is done to avoid
         # unnecessary os.unlink() of tempfile later. As renamer() has
         # succeeded, the tempfile would no longer exist at its original path.
         self._put_succeeded = True
+        if committer is not None:
+            # The group commit syncs the data, metadata and rename of this
+            # file along with those of any concurrent writes to the device.
+            # Obsolete files must not be cleaned up before that is done.
+            self._group_commit_stats = committer.commit(self._fd)
+            drop_buffer_cache(self._fd, 0, self._upload_size)
         if cleanup:
             try:
                 self.manager.cleanup_ondisk_files(self._datadir)['files']
@@ -1472,7 +2326,29 @@ class BaseDiskFileWriter(object):
         metadata['name'] = self._name
         target_path = join(self._datadir, filename)
 
-        tpool_reraise(self._finalize_put, metadata, target_path, cleanup)
+        tpool_reraise(self._finalize_put, metadata, target_path, cleanup,
+                      self._group_committer())
+        self.manager.invalidate_ondisk_cache(self._datadir)
+        self._log_group_commit()
+
+    def _group_committer(self):
+        return self.manager.get_group_committer(self._diskfile._device_path)
+
+    def _log_group_commit(self):
+        """
+        Emit metrics for the group commit of the last write, if any. Each
+        batch is counted once, by its first writer, so that the average
+        batch size is ``group_commit.writes / group_commit.batches``.
+        """
+        if not self._group_commit_stats:
+            return
+        batch_size, leader, wait = self._group_commit_stats
+        self._group_commit_stats = None
+        logger = self.manager.logger
+        if leader:
+            logger.increment('group_commit.batches')
+            logger.update_stats('group_commit.writes', batch_size)
+        logger.timing('group_commit.timing', wait * 1000)
 
     def put(self, metadata):
         """
@@ -1494,6 +2370,47 @@ class BaseDiskFileWriter(object):
         pass
 
 
+class ZeroCopyRangeIter(object):
+    """
+    The iterator returned by a zero-copy capable
+    :class:`BaseDiskFileReader` for ranged GETs. It iterates over the
+    requested ranges like any other response body, but also remembers them
+    so that the object server may instead send them with
+    :func:`BaseDiskFileReader.zero_copy_send_ranges`.
+
+    :param reader: the :class:`BaseDiskFileReader` the ranges are read from
+    :param app_iter: the iterator used when the ranges are not zero-copied
+    :param ranges: a list of (start, stop) byte ranges
+    :param content_type: the content type of each part of a
+                         multipart/byteranges response
+    :param boundary: the MIME boundary of a multipart/byteranges response,
+                     or None if a single range is sent as the whole body
+    :param size: the size of the object, for the Content-Range of each part
+    """
+    def __init__(self, reader, app_iter, ranges, content_type=None,
+                 boundary=None, size=None):
+        self._reader = reader
+        self._app_iter = app_iter
+        self._ranges = ranges
+        self._content_type = content_type
+        self._boundary = boundary
+        self._size = size
+
+    def __iter__(self):
+        return iter(self._app_iter)
+
+    def close(self):
+        self._app_iter.close()
+
+    def can_zero_copy_send(self):
+        return True
+
+    def zero_copy_send(self, wsockfd):
+        self._reader.zero_copy_send_ranges(
+            wsockfd, self._ranges, self._content_type, self._boundary,
+            self._size)
+
+
 class BaseDiskFileReader(object):
     """
     Encapsulation of the WSGI read context for servicing GET REST API
@@ -1571,9 +2488,9 @@ class BaseDiskFileReader(object):
             if self._fp.tell() == 0:
                 self._started_at_0 = True
                 self._iter_etag = hashlib.md5()
-            while True:
-                chunk = self._fp.read(self._disk_chunk_size)
-                if chunk:
+            chunks = self._iter_chunks()
+            try:
+                for chunk in chunks:
                     if self._iter_etag:
                         self._iter_etag.update(chunk)
                     self._bytes_read += len(chunk)
@@ -1582,15 +2499,50 @@ class BaseDiskFileReader(object):
                                          self._bytes_read - dropped_cache)
                         dropped_cache = self._bytes_read
                     yield chunk
-                else:
-                    self._read_to_eof = True
-                    self._drop_cache(self._fp.fileno(), dropped_cache,
-                                     self._bytes_read - dropped_cache)
-                    break
+            finally:
+                chunks.close()
+            self._read_to_eof = True
+            self._drop_cache(self._fp.fileno(), dropped_cache,
+                             self._bytes_read - dropped_cache)
         finally:
             if not self._suppress_file_closing:
                 self.close()
 
+    def _iter_chunks(self):
+        """
+        Yield the chunks of the data file from its current position to its
+        end. With threaded reads, the chunks are read by the device's read
+        pool, which reads the next threaded_read_ahead chunks while the
+        previous ones are being sent.
+        """
+        pool = self.manager.get_read_pool(self._device_path)
+        if pool is None:
+            while True:
+                chunk = self._fp.read(self._disk_chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        read_ahead = self.manager.threaded_read_ahead
+        pending = pool.submit(
+            _read_chunks, self._fp, self._disk_chunk_size, read_ahead)
+        try:
+            while pending is not None:
+                chunks, eof = pending.wait()
+                pending = None
+                if not eof:
+                    pending = pool.submit(_read_chunks, self._fp,
+                                          self._disk_chunk_size, read_ahead)
+                for chunk in chunks:
+                    yield chunk
+        finally:
+            if pending is not None:
+                # the file must not be closed while it is being read
+                try:
+                    pending.wait()
+                except Exception:
+                    pass
+            self.manager.dump_read_stats()
+
     def can_zero_copy_send(self):
         return self._use_splice
 
@@ -1602,8 +2554,6 @@ class BaseDiskFileReader(object):
         :param wsockfd: file descriptor (integer) of the socket out which to
                         send data
         """
-        # Note: if we ever add support for zero-copy ranged GET responses,
-        # we'll have to make this conditional.
         self._started_at_0 = True
 
         rfd = self._fp.fileno()
@@ -1664,16 +2614,7 @@ class BaseDiskFileReader(object):
                                     "(tried to write %d, but wrote %d)" %
                                     (bytes_in_pipe, hashed))
 
-                while bytes_in_pipe > 0:
-                    try:
-                        res = splice(client_rpipe, None, wsockfd, None,
-                                     bytes_in_pipe, 0)
-                        bytes_in_pipe -= res[0]
-                    except IOError as exc:
-                        if exc.errno == errno.EWOULDBLOCK:
-                            trampoline(wsockfd, write=True)
-                        else:
-                            raise
+                self._splice_to_socket(client_rpipe, wsockfd, bytes_in_pipe)
 
                 if self._bytes_read - dropped_cache > DROP_CACHE_WINDOW:
                     self._drop_cache(rfd, dropped_cache,
@@ -1697,11 +2638,106 @@ class BaseDiskFileReader(object):
             os.close(md5_sockfd)
             self.close()
 
-    def app_iter_range(self, start, stop):
+    def _splice_to_socket(self, rpipe, wsockfd, bytes_in_pipe):
         """
-        Returns an iterator over the data file for range (start, stop)
+        Moves bytes_in_pipe bytes from the pipe to the client socket, waiting
+        for the socket to become writable whenever its buffer is full.
+        """
+        while bytes_in_pipe > 0:
+            try:
+                res = splice(rpipe, None, wsockfd, None, bytes_in_pipe, 0)
+                bytes_in_pipe -= res[0]
+            except IOError as exc:
+                if exc.errno == errno.EWOULDBLOCK:
+                    trampoline(wsockfd, write=True)
+                else:
+                    raise
+
+    def _write_to_socket(self, wsockfd, data):
+        """
+        Writes data to the client socket, waiting for the socket to become
+        writable whenever its buffer is full.
+        """
+        while data:
+            try:
+                data = data[os.write(wsockfd, data):]
+            except OSError as exc:
+                if exc.errno == errno.EWOULDBLOCK:
+                    trampoline(wsockfd, write=True)
+                else:
+                    raise
+
+    def zero_copy_send_ranges(self, wsockfd, ranges, content_type=None,
+                              boundary=None, size=None):
+        """
+        Sends byte ranges of the object with splice(), straight from disk to
+        the network. If a boundary is given, the ranges are sent as the parts
+        of a multipart/byteranges body, with the MIME boundaries and part
+        headers written from userspace between them.
+
+        Unlike :func:`zero_copy_send`, the data sent is not checked against
+        the object's ETag, just as it is not when ranges are read through
+        :func:`app_iter_range`.
+
+        :param wsockfd: file descriptor (integer) of the socket out which to
+                        send data
+        :param ranges: a list of (start, stop) byte ranges
+        :param content_type: the content type of each part
+        :param boundary: the MIME boundary, or None to send a single range as
+                         the whole body
+        :param size: the size of the object, for the Content-Range of each
+                     part
+        """
+        rfd = self._fp.fileno()
+        # Ask for every range up front, so that the disk reads of the later
+        # parts overlap with sending the earlier ones.
+        for start, stop in ranges:
+            read_ahead_buffer_cache(rfd, start, stop - start)
+
+        client_rpipe, client_wpipe = os.pipe()
+        pipe_size = fcntl.fcntl(client_rpipe, F_SETPIPE_SZ, self._pipe_size)
+
+        def splice_range(start, stop):
+            offset = start
+            while offset < stop:
+                (bytes_in_pipe, _1, _2) = splice(
+                    rfd, offset, client_wpipe, None,
+                    min(pipe_size, stop - offset), 0)
+                if bytes_in_pipe == 0:
+                    # the file is shorter than its metadata says; send what
+                    # there is, as app_iter_range() would
+                    break
+                offset += bytes_in_pipe
+                self._bytes_read += bytes_in_pipe
+                self._splice_to_socket(client_rpipe, wsockfd, bytes_in_pipe)
+            self._drop_cache(rfd, start, offset - start)
+            return []
+
+        self._bytes_read = 0
+        try:
+            if boundary is None:
+                for start, stop in ranges:
+                    splice_range(start, stop)
+            else:
+                for chunk in multi_range_iterator(
+                        ranges, content_type, boundary, size, splice_range):
+                    self._write_to_socket(wsockfd, chunk)
+        finally:
+            os.close(client_rpipe)
+            os.close(client_wpipe)
+            self.close()
+
+    def app_iter_range(self, start, stop):
+        """
+        Returns an iterator over the data file for range (start, stop)
 
         """
+        app_iter = self._app_iter_range(start, stop)
+        if self.can_zero_copy_send():
+            return ZeroCopyRangeIter(self, app_iter, [(start, stop)])
+        return app_iter
+
+    def _app_iter_range(self, start, stop):
         if start or start == 0:
             self._fp.seek(start)
         if stop is not None:
@@ -1726,6 +2762,13 @@ class BaseDiskFileReader(object):
         Returns an iterator over the data file for a set of ranges
 
         """
+        app_iter = self._app_iter_ranges(ranges, content_type, boundary, size)
+        if ranges and self.can_zero_copy_send():
+            return ZeroCopyRangeIter(self, app_iter, ranges, content_type,
+                                     boundary, size)
+        return app_iter
+
+    def _app_iter_ranges(self, ranges, content_type, boundary, size):
         if not ranges:
             yield ''
         else:
@@ -1733,7 +2776,7 @@ class BaseDiskFileReader(object):
                 self._suppress_file_closing = True
                 for chunk in multi_range_iterator(
                         ranges, content_type, boundary, size,
-                        self.app_iter_range):
+                        self._app_iter_range):
                     yield chunk
             finally:
                 self._suppress_file_closing = False
@@ -1855,6 +2898,7 @@ class BaseDiskFile(object):
             self._datadir = None
         self._tmpdir = join(device_path, get_tmp_dir(policy))
         self._ondisk_info = None
+        self._ondisk_cache_entry = None
         self._metadata = None
         self._datafile_metadata = None
         self._metafile_metadata = None
@@ -1938,6 +2982,15 @@ class BaseDiskFile(object):
                                self._datafile_metadata.get('X-Timestamp'))
         return Timestamp(t)
 
+    @property
+    def _ondisk_cache_key(self):
+        """
+        The key under which the results of :meth:`_get_ondisk_files` are
+        cached; diskfiles that would get different results from the same
+        files must have different keys.
+        """
+        return None
+
     @classmethod
     def from_hash_dir(cls, mgr, hash_dir_path, device_path, partition, policy):
         return cls(mgr, device_path, None, partition, _datadir=hash_dir_path,
@@ -1964,7 +3017,40 @@ class BaseDiskFile(object):
                                      some data did pass cross checks
         :returns: itself for use as a context manager
         """
-        # First figure out if the data directory exists
+        # gather info about the valid files to use to open the DiskFile,
+        # reusing what this worker already knows about the hash dir if it
+        # has not changed since
+        entry = self._ondisk_cache_entry = \
+            self.manager.get_ondisk_cache_entry(self._datadir)
+        if entry is None:
+            file_info = self._get_ondisk_files(self._list_datadir())
+        else:
+            if entry.files is None:
+                entry.files = self._list_datadir()
+            key = self._ondisk_cache_key
+            file_info = entry.ondisk_info.get(key)
+            if file_info is None:
+                file_info = entry.ondisk_info[key] = \
+                    self._get_ondisk_files(entry.files)
+            else:
+                self._ondisk_info = file_info
+
+        self._data_file = file_info.get('data_file')
+        if not self._data_file:
+            raise self._construct_exception_from_ts_file(**file_info)
+        self._fp = self._construct_from_data_file(**file_info)
+        # This method must populate the internal _metadata attribute.
+        self._metadata = self._metadata or {}
+        return self
+
+    def _list_datadir(self):
+        """
+        List the files in the object's hash dir.
+
+        :returns: a list of file names, empty if the hash dir does not exist
+        :raises DiskFileQuarantined: if there is a file instead of a hash dir
+        :raises DiskFileError: if the hash dir could not be listed
+        """
         try:
             files = os.listdir(self._datadir)
         except OSError as err:
@@ -1982,17 +3068,7 @@ class BaseDiskFile(object):
                     "Error listing directory %s: %s" % (self._datadir, err))
             # The data directory does not exist, so the object cannot exist.
             files = []
-
-        # gather info about the valid files to use to open the DiskFile
-        file_info = self._get_ondisk_files(files)
-
-        self._data_file = file_info.get('data_file')
-        if not self._data_file:
-            raise self._construct_exception_from_ts_file(**file_info)
-        self._fp = self._construct_from_data_file(**file_info)
-        # This method must populate the internal _metadata attribute.
-        self._metadata = self._metadata or {}
-        return self
+        return files
 
     def __enter__(self):
         """
@@ -2031,6 +3107,7 @@ class BaseDiskFile(object):
         :param msg: reason for quarantining to be included in the exception
         :returns: DiskFileQuarantined exception object
         """
+        self.manager.invalidate_ondisk_cache(self._datadir)
         self._quarantined_dir = self.manager.quarantine_renamer(
             self._device_path, data_file)
         self._logger.warning("Quarantined object %s: %s" % (
@@ -2140,22 +3217,32 @@ class BaseDiskFile(object):
             raise self._quarantine(
                 data_file, "bad metadata content-length value %s" % (
                     self._metadata['Content-Length']))
-        fd = fp.fileno()
-        try:
-            statbuf = os.fstat(fd)
-        except OSError as err:
-            # Quarantine, we can't successfully stat the file.
-            raise self._quarantine(data_file, "not stat-able: %s" % err)
-        else:
-            obj_size = statbuf.st_size
+        obj_size = self._get_data_file_size(data_file, fp)
         if obj_size != metadata_size:
             raise self._quarantine(
                 data_file, "metadata content-length %s does"
                 " not match actual object size %s" % (
-                    metadata_size, statbuf.st_size))
+                    metadata_size, obj_size))
         self._content_length = obj_size
         return obj_size
 
+    def _get_data_file_size(self, data_file, fp):
+        """
+        Find the size of the data on disk.
+
+        :param data_file: data file name, used when quarantines occur
+        :param fp: open file pointer so that we can `fstat()` the file
+        :raises DiskFileQuarantined: if the file could not be stat'ed
+        :returns: size of the data in bytes
+        """
+        fd = fp.fileno()
+        try:
+            statbuf = os.fstat(fd)
+        except OSError as err:
+            # Quarantine, we can't successfully stat the file.
+            raise self._quarantine(data_file, "not stat-able: %s" % err)
+        return statbuf.st_size
+
     def _failsafe_read_metadata(self, source, quarantine_filename=None):
         """
         Read metadata from source object file. In case of failure, quarantine
@@ -2167,14 +3254,20 @@ class BaseDiskFile(object):
         :param source: file descriptor or filename to load the metadata from
         :param quarantine_filename: full path of file to load the metadata from
         """
+        entry = self._ondisk_cache_entry
+        if entry is not None and quarantine_filename in entry.metadata:
+            return dict(entry.metadata[quarantine_filename])
         try:
-            return read_metadata(source)
+            metadata = read_metadata(source)
         except (DiskFileXattrNotSupported, DiskFileNotExist):
             raise
         except Exception as err:
             raise self._quarantine(
                 quarantine_filename,
                 "Exception reading metadata: %s" % err)
+        if entry is not None and quarantine_filename:
+            entry.metadata[quarantine_filename] = dict(metadata)
+        return metadata
 
     def _merge_content_type_metadata(self, ctype_file):
         """
@@ -2195,6 +3288,15 @@ class BaseDiskFile(object):
             self._metafile_metadata['Content-Type-Timestamp'] = \
                 ctypefile_metadata.get('Content-Type-Timestamp')
 
+    def _open_data_file(self, data_file):
+        """
+        Open the `.data` file for reading.
+
+        :param data_file: on-disk `.data` file being considered
+        :returns: an opened data file pointer
+        """
+        return open(data_file, 'rb')
+
     def _construct_from_data_file(self, data_file, meta_file, ctype_file,
                                   **kwargs):
         """
@@ -2210,7 +3312,7 @@ class BaseDiskFile(object):
         :raises DiskFileError: various exceptions from
                     :func:`swift.obj.diskfile.DiskFile._verify_data_file`
         """
-        fp = open(data_file, 'rb')
+        fp = self._open_data_file(data_file)
         self._datafile_metadata = self._failsafe_read_metadata(fp, data_file)
         self._metadata = {}
         if meta_file:
@@ -2398,6 +3500,38 @@ class BaseDiskFile(object):
             writer._extension = '.meta'
             writer.put(metadata)
 
+    def migrate_metadata(self):
+        """
+        Rewrite the pickled metadata of the files of an opened object in the
+        compact encoding, if the manager is configured to write compact
+        metadata.
+
+        :returns: the number of files whose metadata was rewritten
+        """
+        if not self.manager.compact_metadata:
+            return 0
+        ondisk_info = self._ondisk_info or {}
+        migrated = 0
+        try:
+            # hash dirs have no lock of their own; the partition's keeps a
+            # migration from racing another on the same files
+            with lock_path(dirname(dirname(self._datadir))):
+                for path in (self._data_file, ondisk_info.get('meta_file')):
+                    if not path:
+                        continue
+                    try:
+                        if migrate_metadata(path):
+                            migrated += 1
+                    except DiskFileNotExist:
+                        pass
+                    except (IOError, OSError) as err:
+                        if err.errno != errno.ENOENT:
+                            raise
+        except LockTimeout:
+            # the metadata is migrated on a later audit instead
+            pass
+        return migrated
+
     def delete(self, timestamp):
         """
         Delete the object.
@@ -2450,33 +3584,36 @@ class DiskFile(BaseDiskFile):
 class DiskFileManager(BaseDiskFileManager):
     diskfile_cls = DiskFile
 
-    def _process_ondisk_files(self, exts, results, **kwargs):
+    def _process_ondisk_files(self, exts, results, obsolete, **kwargs):
         """
         Implement replication policy specific handling of .data files.
 
-        :param exts: dict of lists of file info, keyed by extension
+        :param exts: dict of lists of (key, file info) records, keyed by
+                     extension, each in reverse chronological order
         :param results: a dict that may be updated with results
+        :param obsolete: a list that file infos of obsolete files are added to
         """
         if exts.get('.data'):
-            for ext in exts.keys():
+            data_key = exts['.data'][0][0]
+            for ext in exts:
                 if ext == '.data':
                     # older .data's are obsolete
-                    exts[ext], obsolete = self._split_gte_timestamp(
-                        exts[ext], exts['.data'][0]['timestamp'])
+                    exts[ext], older = self._split_gte_timestamp(
+                        exts[ext], data_key)
                 else:
                     # other files at same or older timestamp as most recent
                     # data are obsolete
-                    exts[ext], obsolete = self._split_gt_timestamp(
-                        exts[ext], exts['.data'][0]['timestamp'])
-                results.setdefault('obsolete', []).extend(obsolete)
+                    exts[ext], older = self._split_gt_timestamp(
+                        exts[ext], data_key)
+                obsolete.extend(record[1] for record in older)
 
             # set results
-            results['data_info'] = exts['.data'][0]
+            results['data_info'] = exts['.data'][0][1]
 
         # .meta files *may* be ready for reclaim if there is no data
         if exts.get('.meta') and not exts.get('.data'):
             results.setdefault('possible_reclaim', []).extend(
-                exts.get('.meta'))
+                record[1] for record in exts['.meta'])
 
     def _update_suffix_hashes(self, hashes, ondisk_info):
         """
@@ -2512,13 +3649,18 @@ class ECDiskFileReader(BaseDiskFileReader):
 
 class ECDiskFileWriter(BaseDiskFileWriter):
 
-    def _finalize_durable(self, durable_file_path):
+    def _finalize_durable(self, durable_file_path, committer=None):
         exc = None
         try:
             try:
                 with open(durable_file_path, 'w') as _fp:
-                    fsync(_fp.fileno())
-                fsync_dir(self._datadir)
+                    if committer is None:
+                        fsync(_fp.fileno())
+                    else:
+                        self._group_commit_stats = committer.commit(
+                            _fp.fileno())
+                if committer is None:
+                    fsync_dir(self._datadir)
             except (OSError, IOError) as err:
                 if err.errno not in (errno.ENOSPC, errno.EDQUOT):
                     # re-raise to catch all handler
@@ -2553,7 +3695,10 @@ class ECDiskFileWriter(BaseDiskFileWriter):
         """
         durable_file_path = os.path.join(
             self._datadir, timestamp.internal + '.durable')
-        tpool_reraise(self._finalize_durable, durable_file_path)
+        tpool_reraise(self._finalize_durable, durable_file_path,
+                      self._group_committer())
+        self.manager.invalidate_ondisk_cache(self._datadir)
+        self._log_group_commit()
 
     def put(self, metadata):
         """
@@ -2632,6 +3777,10 @@ class ECDiskFile(BaseDiskFile):
             files, self._datadir, frag_index=self._frag_index)
         return self._ondisk_info
 
+    @property
+    def _ondisk_cache_key(self):
+        return self._frag_index
+
     def purge(self, timestamp, frag_index):
         """
         Remove a tombstone file matching the specified timestamp or
@@ -2658,6 +3807,7 @@ class ECDiskFile(BaseDiskFile):
             purge_file = self.manager.make_on_disk_filename(
                 timestamp, ext=ext, frag_index=frag_index)
             remove_file(os.path.join(self._datadir, purge_file))
+        self.manager.invalidate_ondisk_cache(self._datadir)
         self.manager.invalidate_hash(dirname(self._datadir))
 
 
@@ -2756,41 +3906,42 @@ class ECDiskFileManager(BaseDiskFileManager):
         rv['frag_index'] = None
         return rv
 
-    def _process_ondisk_files(self, exts, results, frag_index=None, **kwargs):
+    def _process_ondisk_files(self, exts, results, obsolete, frag_index=None,
+                              **kwargs):
         """
         Implement EC policy specific handling of .data and .durable files.
 
-        :param exts: dict of lists of file info, keyed by extension
+        :param exts: dict of lists of (key, file info) records, keyed by
+                     extension, each in reverse chronological order
         :param results: a dict that may be updated with results
+        :param obsolete: a list that file infos of obsolete files are added to
         :param frag_index: if set, search for a specific fragment index .data
                            file, otherwise accept the first valid .data file.
         """
-        durable_info = None
+        durable_key = None
         if exts.get('.durable'):
-            durable_info = exts['.durable'][0]
+            durable_key = exts['.durable'][0][0]
             # Mark everything older than most recent .durable as obsolete
             # and remove from the exts dict.
-            for ext in exts.keys():
+            for ext in exts:
                 exts[ext], older = self._split_gte_timestamp(
-                    exts[ext], durable_info['timestamp'])
-                results.setdefault('obsolete', []).extend(older)
+                    exts[ext], durable_key)
+                obsolete.extend(record[1] for record in older)
 
         # Split the list of .data files into sets of frags having the same
-        # timestamp, identifying the durable and newest sets (if any) as we go.
-        # To do this we can take advantage of the list of .data files being
-        # reverse-time ordered. Keep the resulting per-timestamp frag sets in
-        # a frag_sets dict mapping a Timestamp instance -> frag_set.
-        all_frags = exts.get('.data')
+        # timestamp, identifying the durable set (if any) as we go. The list
+        # of .data files is reverse-time ordered, so each frag set is a run
+        # of records with the same key. Keep the resulting per-timestamp frag
+        # sets in a frag_sets dict mapping a Timestamp instance -> frag_set.
         frag_sets = {}
         durable_frag_set = None
-        while all_frags:
-            frag_set, all_frags = self._split_gte_timestamp(
-                all_frags, all_frags[0]['timestamp'])
+        for key, group in itertools.groupby(exts.get('.data', []),
+                                            key=lambda record: record[0]):
             # sort the frag set into ascending frag_index order
-            frag_set.sort(key=lambda info: info['frag_index'])
-            timestamp = frag_set[0]['timestamp']
-            frag_sets[timestamp] = frag_set
-            if durable_info and durable_info['timestamp'] == timestamp:
+            frag_set = sorted((record[1] for record in group),
+                              key=lambda info: info['frag_index'])
+            frag_sets[frag_set[0]['timestamp']] = frag_set
+            if key == durable_key:
                 durable_frag_set = frag_set
 
         # Select a single chosen frag from the chosen frag_set, by either
@@ -2814,19 +3965,18 @@ class ECDiskFileManager(BaseDiskFileManager):
 
         # Mark any isolated .durable as obsolete
         if exts.get('.durable') and not durable_frag_set:
-            results.setdefault('obsolete', []).extend(exts['.durable'])
-            exts.pop('.durable')
+            obsolete.extend(record[1] for record in exts.pop('.durable'))
 
         # Fragments *may* be ready for reclaim, unless they are durable
         for frag_set in frag_sets.values():
-            if frag_set == durable_frag_set:
+            if frag_set is durable_frag_set:
                 continue
             results.setdefault('possible_reclaim', []).extend(frag_set)
 
         # .meta files *may* be ready for reclaim if there is no durable data
         if exts.get('.meta') and not durable_frag_set:
             results.setdefault('possible_reclaim', []).extend(
-                exts.get('.meta'))
+                record[1] for record in exts['.meta'])
 
     def _verify_ondisk_files(self, results, frag_index=None, **kwargs):
         """
@@ -2882,3 +4032,642 @@ class ECDiskFileManager(BaseDiskFileManager):
 
         hash_per_fi = self._hash_suffix_dir(path, reclaim_age)
         return dict((fi, md5.hexdigest()) for fi, md5 in hash_per_fi.items())
+
+
+def _encode_slab_record(record):
+    """
+    Encode a record for a slab partition's index.
+
+    :param record: a tuple of (object hash, filename, volume, offset, length,
+                   metadata) adding a file to the partition, or of
+                   (object hash, filename) removing one
+    :returns: the encoded record
+    """
+    data = pickle.dumps(record, PICKLE_PROTOCOL)
+    return SLAB_RECORD_HEADER.pack(len(data)) + data
+
+
+class SlabIndex(object):
+    """
+    In-memory copy of the index of a slab partition, mapping the files of
+    each object in the partition to where their data is in the partition's
+    volume files.
+
+    The index file is a sequence of length-prefixed pickled records, as
+    encoded by :func:`_encode_slab_record`. Records are only ever appended,
+    with the partition locked, so :meth:`refresh` only reads the records
+    that were appended since it was last called. An incomplete record at the
+    end of the file is not read; it is either still being written or was
+    torn by a crash, in which case the next writer truncates it.
+
+    :param partition_path: absolute path of the partition
+    """
+
+    def __init__(self, partition_path):
+        self.partition_path = partition_path
+        self.index_file = join(partition_path, SLAB_INDEX_FILE)
+        self._lock = stdlib_threading.Lock()
+        self._reset()
+
+    def _reset(self, inode=None):
+        self.inode = inode
+        # size of the complete records that have been read from the file
+        self.size = 0
+        self.num_records = 0
+        self.num_files = 0
+        self.live_bytes = 0
+        # the volume that new data is appended to
+        self.volume = 0
+        # suffix -> object hash -> filename -> (volume, offset, length,
+        # metadata)
+        self._suffixes = {}
+
+    def _apply(self, record):
+        object_hash, filename = record[:2]
+        suffix = object_hash[-3:]
+        files = self._suffixes.setdefault(suffix, {}).setdefault(
+            object_hash, {})
+        old_entry = files.pop(filename, None)
+        if old_entry:
+            self.num_files -= 1
+            self.live_bytes -= old_entry[2]
+        if len(record) > 2:
+            files[filename] = entry = tuple(record[2:])
+            self.num_files += 1
+            self.live_bytes += entry[2]
+            self.volume = max(self.volume, entry[0])
+        elif not files:
+            del self._suffixes[suffix][object_hash]
+            if not self._suffixes[suffix]:
+                del self._suffixes[suffix]
+        self.num_records += 1
+
+    def _load(self, data):
+        offset = 0
+        while len(data) - offset >= SLAB_RECORD_HEADER.size:
+            length, = SLAB_RECORD_HEADER.unpack_from(data, offset)
+            start = offset + SLAB_RECORD_HEADER.size
+            if start + length > len(data):
+                break
+            try:
+                record = pickle.loads(data[start:start + length])
+            except Exception:
+                break
+            self._apply(record)
+            offset = start + length
+        self.size += offset
+
+    def refresh(self):
+        """
+        Bring the in-memory index up to date with the index file.
+        """
+        with self._lock:
+            try:
+                fp = open(self.index_file, 'rb')
+            except IOError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                self._reset()
+                return
+            with fp:
+                statbuf = os.fstat(fp.fileno())
+                if statbuf.st_ino != self.inode or \
+                        statbuf.st_size < self.size:
+                    # the index was rewritten by a compaction
+                    self._reset(statbuf.st_ino)
+                if statbuf.st_size > self.size:
+                    fp.seek(self.size)
+                    self._load(fp.read())
+
+    def list_suffixes(self):
+        with self._lock:
+            return list(self._suffixes)
+
+    def list_hashes(self, suffix):
+        with self._lock:
+            return list(self._suffixes.get(suffix, ()))
+
+    def get(self, object_hash):
+        """
+        :param object_hash: the hash of an object path
+        :returns: a dict mapping the names of the object's files to tuples of
+                  (volume, offset, length, metadata)
+        """
+        with self._lock:
+            return dict(self._suffixes.get(object_hash[-3:], {}).get(
+                object_hash, {}))
+
+    def items(self):
+        """
+        :returns: a list of tuples of (object hash, filename, volume, offset,
+                  length, metadata) for every file in the partition
+        """
+        with self._lock:
+            return [(object_hash, filename) + entry
+                    for hashes in self._suffixes.values()
+                    for object_hash, files in hashes.items()
+                    for filename, entry in files.items()]
+
+
+class SlabFile(object):
+    """
+    File-like object for reading the data of a file from a slab volume.
+
+    :param fp: the volume file, which is closed along with this object
+    :param offset: position of the data in the volume
+    :param length: length of the data
+    :param metadata: the file's metadata
+    """
+
+    def __init__(self, fp, offset, length, metadata):
+        self._fp = fp
+        self.offset = offset
+        self.length = length
+        self.metadata = metadata
+        self._pos = 0
+
+    def fileno(self):
+        return self._fp.fileno()
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos):
+        self._pos = pos
+
+    def read(self, size=-1):
+        remaining = self.length - self._pos
+        if size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return ''
+        self._fp.seek(self.offset + self._pos)
+        data = self._fp.read(size)
+        self._pos += len(data)
+        return data
+
+    def close(self):
+        self._fp.close()
+
+
+class SlabDiskFileReader(DiskFileReader):
+
+    def can_zero_copy_send(self):
+        # splice() would send the rest of the volume, not just this file
+        return False
+
+    def _drop_cache(self, fd, offset, length):
+        super(SlabDiskFileReader, self)._drop_cache(
+            fd, self._fp.offset + offset, length)
+
+
+class SlabDiskFileWriter(DiskFileWriter):
+
+    def _finalize_put(self, metadata, target_path, cleanup, committer=None):
+        self.manager.invalidate_hash(dirname(self._datadir))
+        # The data and metadata are copied into the partition's slab volume
+        # and index, which are synced before this returns, so the temporary
+        # file is not needed any more.
+        self.manager.slab_put(
+            target_path, self._fd, self._upload_size, metadata)
+        self._put_succeeded = True
+        remove_file(self._tmppath)
+        if cleanup:
+            try:
+                self.manager.cleanup_ondisk_files(self._datadir)
+            except OSError:
+                logging.exception(_('Problem cleaning up %s'), self._datadir)
+
+    def _group_committer(self):
+        # slab_put() syncs the volume and index itself
+        return None
+
+
+class SlabDiskFile(DiskFile):
+    """
+    A DiskFile whose files are stored in its partition's slab volumes.
+
+    The object's "hash dir" and the files in it do not exist on disk; their
+    paths are only used to look the files up in the partition's
+    :class:`SlabIndex`.
+    """
+    reader_cls = SlabDiskFileReader
+    writer_cls = SlabDiskFileWriter
+
+    def open(self):
+        """
+        Open the object.
+
+        See :meth:`BaseDiskFile.open`.
+        """
+        partition_path = dirname(dirname(self._datadir))
+        self._slab_files = self.manager.get_slab_index(partition_path).get(
+            basename(self._datadir))
+
+        # gather info about the valid files to use to open the DiskFile
+        file_info = self._get_ondisk_files(list(self._slab_files))
+
+        self._data_file = file_info.get('data_file')
+        if not self._data_file:
+            raise self._construct_exception_from_ts_file(**file_info)
+        self._fp = self._construct_from_data_file(**file_info)
+        # This method must populate the internal _metadata attribute.
+        self._metadata = self._metadata or {}
+        return self
+
+    def _open_data_file(self, data_file):
+        return self.manager.open_slab_file(data_file)
+
+    def migrate_metadata(self):
+        # metadata is kept in the slab index, not in xattrs
+        return 0
+
+    def _get_data_file_size(self, data_file, fp):
+        return fp.length
+
+    def _failsafe_read_metadata(self, source, quarantine_filename=None):
+        if isinstance(source, SlabFile):
+            return dict(source.metadata)
+        try:
+            return dict(self._slab_files[basename(source)][3])
+        except KeyError:
+            raise DiskFileNotExist()
+
+
+@DiskFileRouter.register(SLAB_POLICY)
+class SlabDiskFileManager(DiskFileManager):
+    """
+    Manager for slab policies, which replicate objects like replication
+    policies but pack the files of all the objects in a partition into
+    append-only volume files, so that small objects do not each cost an
+    inode, a hash dir and a suffix dir.
+
+    Each partition dir holds volume files named ``slab-<N>.vol`` and an index
+    file, ``slab.index``, recording where the data and metadata of each file
+    is. The volumes and index are appended to while holding the partition
+    lock, and compacted by the replicator once much of their contents are
+    obsolete.
+    """
+    diskfile_cls = SlabDiskFile
+
+    def __init__(self, conf, logger):
+        super(SlabDiskFileManager, self).__init__(conf, logger)
+        self._slab_indexes = OrderedDict()
+
+    def get_slab_index(self, partition_path):
+        """
+        Return the up to date :class:`SlabIndex` of a partition.
+
+        :param partition_path: absolute path of the partition
+        """
+        index = self._slab_indexes.pop(partition_path, None)
+        if index is None:
+            index = SlabIndex(partition_path)
+            while len(self._slab_indexes) >= SLAB_INDEX_CACHE_SIZE:
+                self._slab_indexes.popitem(last=False)
+        self._slab_indexes[partition_path] = index
+        index.refresh()
+        return index
+
+    def _get_locked_slab_index(self, partition_path):
+        """
+        Return the up to date :class:`SlabIndex` of a partition, truncating
+        any torn record from the end of its index file. The caller must hold
+        the partition lock.
+
+        :param partition_path: absolute path of the partition
+        """
+        index = self.get_slab_index(partition_path)
+        try:
+            if os.path.getsize(index.index_file) > index.size:
+                with open(index.index_file, 'r+b') as fp:
+                    fp.truncate(index.size)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+        return index
+
+    def _append_slab_records(self, index, records, sync=False):
+        """
+        Append records to a partition's index. The caller must hold the
+        partition lock.
+
+        :param index: the partition's :class:`SlabIndex`
+        :param records: a list of records, as taken by
+                        :func:`_encode_slab_record`
+        :param sync: if True, the records are synced to disk
+        """
+        created = index.inode is None
+        with open(index.index_file, 'ab') as fp:
+            fp.write(''.join(_encode_slab_record(r) for r in records))
+            fp.flush()
+            if sync:
+                fsync(fp.fileno())
+        if sync and created:
+            fsync_dir(index.partition_path)
+        index.refresh()
+
+    def slab_put(self, file_path, fd, size, metadata):
+        """
+        Copy a file's data into its partition's current volume and add it
+        to the partition's index.
+
+        :param file_path: the path the file would have in its hash dir
+        :param fd: file descriptor of a file holding the data
+        :param size: length of the data
+        :param metadata: the file's metadata
+        """
+        hsh_path, filename = os.path.split(file_path)
+        partition_path = dirname(dirname(hsh_path))
+        with lock_path(partition_path):
+            index = self._get_locked_slab_index(partition_path)
+            volume_file = join(partition_path, SLAB_VOLUME_FILE % index.volume)
+            created = not exists(volume_file)
+            with open(volume_file, 'ab') as volume_fp:
+                # whatever follows the data of the last file in the index
+                # was torn by a crash, and is never read
+                offset = os.fstat(volume_fp.fileno()).st_size
+                os.lseek(fd, 0, os.SEEK_SET)
+                length = 0
+                while length < size:
+                    chunk = os.read(
+                        fd, min(self.disk_chunk_size, size - length))
+                    if not chunk:
+                        break
+                    volume_fp.write(chunk)
+                    length += len(chunk)
+                volume_fp.flush()
+                if length:
+                    fdatasync(volume_fp.fileno())
+                    drop_buffer_cache(volume_fp.fileno(), offset, length)
+            if created:
+                fsync_dir(partition_path)
+            self._append_slab_records(index, [(
+                basename(hsh_path), filename, index.volume, offset, length,
+                metadata)], sync=True)
+
+    def remove_slab_files(self, partition_path, object_hash, filenames):
+        """
+        Remove files of an object from a partition's index.
+
+        :param partition_path: absolute path of the partition
+        :param object_hash: the hash of an object path
+        :param filenames: names of the object's files to remove
+        """
+        with lock_path(partition_path):
+            index = self._get_locked_slab_index(partition_path)
+            self._append_slab_records(
+                index, [(object_hash, filename) for filename in filenames])
+
+    def open_slab_file(self, file_path):
+        """
+        Open a file stored in a slab volume.
+
+        :param file_path: the path the file would have in its hash dir
+        :returns: a :class:`SlabFile`
+        :raises DiskFileNotExist: if the file is not in the index
+        """
+        hsh_path, filename = os.path.split(file_path)
+        partition_path = dirname(dirname(hsh_path))
+        for attempt in range(2):
+            entry = self.get_slab_index(partition_path).get(
+                basename(hsh_path)).get(filename)
+            if entry is None:
+                raise DiskFileNotExist()
+            volume, offset, length, metadata = entry
+            try:
+                fp = open(join(partition_path, SLAB_VOLUME_FILE % volume),
+                          'rb')
+            except IOError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                # the partition was compacted after its index was read, so
+                # read it again to find where the data was moved to
+                continue
+            return SlabFile(fp, offset, length, metadata)
+        raise DiskFileError('Volume for %s not found' % file_path)
+
+    def quarantine_renamer(self, device_path, corrupted_file_path):
+        """
+        Move all the files of an object out of its slab partition into an
+        ordinary hash dir in the quarantined area.
+
+        :params device_path: The path to the device the corrupted file is on.
+        :params corrupted_file_path: The path the file would have in its
+                                     hash dir.
+        :returns: path (str) of directory the files were moved to
+        """
+        policy = extract_policy(corrupted_file_path)
+        if policy is None:
+            policy = POLICIES.legacy
+        hsh_path = dirname(corrupted_file_path)
+        partition_path = dirname(dirname(hsh_path))
+        object_hash = basename(hsh_path)
+        to_dir = join(device_path, 'quarantined', get_data_dir(policy),
+                      object_hash)
+        if exists(to_dir):
+            to_dir = "%s-%s" % (to_dir, uuid.uuid4().hex)
+        mkdirs(to_dir)
+        self.invalidate_hash(dirname(hsh_path))
+        filenames = list(self.get_slab_index(partition_path).get(object_hash))
+        for filename in filenames:
+            try:
+                src = self.open_slab_file(join(hsh_path, filename))
+            except DiskFileNotExist:
+                continue
+            try:
+                with open(join(to_dir, filename), 'wb') as dst:
+                    while True:
+                        chunk = src.read(self.disk_chunk_size)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                    dst.flush()
+                    write_metadata(dst.fileno(), src.metadata)
+            finally:
+                src.close()
+        self.remove_slab_files(partition_path, object_hash, filenames)
+        return to_dir
+
+    def compact_slab(self, partition_path):
+        """
+        Rewrite a partition's index and volumes if much of their contents
+        are obsolete, copying the data of the partition's files into a new
+        volume.
+
+        :param partition_path: absolute path of the partition
+        :returns: True if the partition was compacted
+        """
+        with lock_path(partition_path):
+            index = self._get_locked_slab_index(partition_path)
+            volumes = {}
+            for name in os.listdir(partition_path):
+                if name.startswith('slab-') and name.endswith('.vol'):
+                    try:
+                        volumes[int(name[5:-4])] = name
+                    except ValueError:
+                        pass
+            volume_bytes = sum(os.path.getsize(join(partition_path, name))
+                               for name in volumes.values())
+            garbage = volume_bytes - index.live_bytes
+            if not (garbage >= SLAB_COMPACT_BYTES and
+                    garbage > index.live_bytes) and \
+                    index.num_records <= max(SLAB_COMPACT_RECORDS,
+                                             2 * index.num_files):
+                return False
+            new_volume = max([index.volume] + list(volumes)) + 1
+            volume_file = join(partition_path, SLAB_VOLUME_FILE % new_volume)
+            records = []
+            sources = {}
+            try:
+                with open(volume_file, 'wb') as volume_fp:
+                    offset = 0
+                    for (object_hash, filename, volume, old_offset, length,
+                         metadata) in index.items():
+                        if length:
+                            if volume not in sources:
+                                sources[volume] = open(join(
+                                    partition_path,
+                                    SLAB_VOLUME_FILE % volume), 'rb')
+                            src = SlabFile(sources[volume], old_offset,
+                                           length, metadata)
+                            while True:
+                                chunk = src.read(self.disk_chunk_size)
+                                if not chunk:
+                                    break
+                                volume_fp.write(chunk)
+                        records.append((object_hash, filename, new_volume,
+                                        offset, length, metadata))
+                        offset += length
+                    volume_fp.flush()
+                    fsync(volume_fp.fileno())
+            finally:
+                for fp in sources.values():
+                    fp.close()
+            tmp_fd, tmp_path = mkstemp(dir=partition_path)
+            with os.fdopen(tmp_fd, 'wb') as fp:
+                fp.write(''.join(_encode_slab_record(r) for r in records))
+                fp.flush()
+                fsync(fp.fileno())
+            renamer(tmp_path, index.index_file)
+            for name in volumes.values():
+                remove_file(join(partition_path, name))
+            index.refresh()
+        return True
+
+    def cleanup_ondisk_files(self, hsh_path, reclaim_age=ONE_WEEK, **kwargs):
+        """
+        Clean up the files of an object that are obsolete and gather the set
+        of valid files.
+
+        See :meth:`BaseDiskFileManager.cleanup_ondisk_files`.
+        """
+        def is_reclaimable(timestamp):
+            return (time.time() - float(timestamp)) > reclaim_age
+
+        partition_path = dirname(dirname(hsh_path))
+        object_hash = basename(hsh_path)
+        files = list(self.get_slab_index(partition_path).get(object_hash))
+        files.sort(reverse=True)
+        results = self.get_ondisk_files(
+            files, hsh_path, verify=False, **kwargs)
+        remove = []
+        if 'ts_info' in results and is_reclaimable(
+                results['ts_info']['timestamp']):
+            remove.append(results.pop('ts_info')['filename'])
+        for file_info in results.get('possible_reclaim', []):
+            # stray files are not deleted until reclaim-age
+            if is_reclaimable(file_info['timestamp']):
+                results.setdefault('obsolete', []).append(file_info)
+        for file_info in results.get('obsolete', []):
+            remove.append(file_info['filename'])
+        if remove:
+            self.remove_slab_files(partition_path, object_hash, remove)
+            removed = set(remove)
+            files = [f for f in files if f not in removed]
+        results['files'] = files
+        return results
+
+    def _hash_suffix_dir(self, path, reclaim_age):
+        """
+
+        :param path: full path the suffix dir would have
+        :param reclaim_age: age in seconds at which to remove tombstones
+        :raises PathNotDir: if there are no objects in the suffix
+        """
+        hashes = defaultdict(hashlib.md5)
+        partition_path, suffix = os.path.split(path)
+        found = False
+        for hsh in sorted(
+                self.get_slab_index(partition_path).list_hashes(suffix)):
+            ondisk_info = self.cleanup_ondisk_files(join(path, hsh),
+                                                    reclaim_age)
+            if ondisk_info['files']:
+                found = True
+                self._hash_ondisk_info(hashes, ondisk_info)
+        if not found:
+            raise PathNotDir()
+        return hashes
+
+    def _list_suffixes(self, partition_path):
+        return self.get_slab_index(partition_path).list_suffixes()
+
+    def _get_hashes(self, partition_path, recalculate=None, do_listdir=False,
+                    reclaim_age=None):
+        """
+        See :meth:`BaseDiskFileManager._get_hashes`.
+
+        The replicator's periodic passes with do_listdir also compact the
+        partition's slab volumes and index if they need it.
+        """
+        result = super(SlabDiskFileManager, self)._get_hashes(
+            partition_path, recalculate, do_listdir, reclaim_age)
+        if do_listdir and exists(join(partition_path, SLAB_INDEX_FILE)):
+            self.compact_slab(partition_path)
+        return result
+
+    def _listdir(self, path):
+        """
+        :param path: full path the suffix dir would have
+        """
+        partition_path, suffix = os.path.split(path)
+        return self.get_slab_index(partition_path).list_hashes(suffix)
+
+    def yield_suffixes(self, device, partition, policy):
+        """
+        See :meth:`BaseDiskFileManager.yield_suffixes`.
+        """
+        dev_path = self.get_dev_path(device)
+        if not dev_path:
+            raise DiskFileDeviceUnavailable()
+        partition_path = os.path.join(dev_path, get_data_dir(policy),
+                                      partition)
+        for suffix in self._list_suffixes(partition_path):
+            yield (os.path.join(partition_path, suffix), suffix)
+
+    def get_diskfile_from_hash(self, device, partition, object_hash,
+                               policy, **kwargs):
+        """
+        See :meth:`BaseDiskFileManager.get_diskfile_from_hash`.
+        """
+        dev_path = self.get_dev_path(device)
+        if not dev_path:
+            raise DiskFileDeviceUnavailable()
+        partition_path = os.path.join(dev_path, get_data_dir(policy),
+                                      str(partition))
+        object_path = os.path.join(partition_path, object_hash[-3:],
+                                   object_hash)
+        filenames = self.cleanup_ondisk_files(object_path,
+                                              self.reclaim_age)['files']
+        entry = self.get_slab_index(partition_path).get(object_hash).get(
+            filenames[-1] if filenames else None)
+        if entry is None:
+            raise DiskFileNotExist()
+        try:
+            account, container, obj = split_path(
+                entry[3].get('name', ''), 3, 3, True)
+        except ValueError:
+            raise DiskFileNotExist()
+        return self.diskfile_cls(self, dev_path,
+                                 partition, account, container, obj,
+                                 policy=policy, **kwargs)
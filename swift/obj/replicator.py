@@ -38,8 +38,9 @@ from swift.common.bufferedhttp import http_connect
 from swift.common.daemon import Daemon
 from swift.common.http import HTTP_OK, HTTP_INSUFFICIENT_STORAGE
 from swift.obj import ssync_sender
-from swift.obj.diskfile import DiskFileManager, get_data_dir, get_tmp_dir
-from swift.common.storage_policy import POLICIES, REPL_POLICY
+from swift.obj.diskfile import DiskFileManager, DiskFileRouter, \
+    get_data_dir, get_tmp_dir
+from swift.common.storage_policy import POLICIES, REPL_POLICY, SLAB_POLICY
 
 DEFAULT_RSYNC_TIMEOUT = 900
 
@@ -117,6 +118,7 @@ class ObjectReplicator(Daemon):
                                 'handoff_delete before the next '
                                 'normal rebalance')
         self._diskfile_mgr = DiskFileManager(conf, self.logger)
+        self._df_router = DiskFileRouter(conf, self.logger)
 
     def _zero_stats(self):
         """Zero out the stats."""
@@ -156,6 +158,10 @@ class ObjectReplicator(Daemon):
         """
         return self.sync_method(node, job, suffixes, *args, **kwargs)
 
+    def _uses_ssync(self, job):
+        return self.conf.get('sync_method', 'rsync') == 'ssync' or \
+            job['policy'].policy_type == SLAB_POLICY
+
     def load_object_ring(self, policy):
         """
         Make sure the policy's rings are loaded.
@@ -216,6 +222,9 @@ class ObjectReplicator(Daemon):
         Uses rsync to implement the sync method. This was the first
         sync method in Swift.
         """
+        if job['policy'].policy_type == SLAB_POLICY:
+            # slab partitions have no suffix dirs for rsync to copy
+            return self.ssync(node, job, suffixes)
         if not os.path.exists(job['path']):
             return False, {}
         args = [
@@ -252,7 +261,8 @@ class ObjectReplicator(Daemon):
 
     def ssync(self, node, job, suffixes, remote_check_objs=None):
         return ssync_sender.Sender(
-            self, node, job, suffixes, remote_check_objs)()
+            self, node, job, suffixes, remote_check_objs,
+            df_mgr=self._df_router[job['policy']])()
 
     def check_ring(self, object_ring):
         """
@@ -287,7 +297,12 @@ class ObjectReplicator(Daemon):
         handoff_partition_deleted = False
         try:
             responses = []
-            suffixes = tpool.execute(tpool_get_suffixes, job['path'])
+            if job['policy'].policy_type == SLAB_POLICY:
+                suffixes = tpool.execute(
+                    self._df_router[job['policy']]._list_suffixes,
+                    job['path'])
+            else:
+                suffixes = tpool.execute(tpool_get_suffixes, job['path'])
             synced_remote_regions = {}
             delete_objs = None
             if suffixes:
@@ -295,7 +310,7 @@ class ObjectReplicator(Daemon):
                     self.stats['rsync'] += 1
                     kwargs = {}
                     if node['region'] in synced_remote_regions and \
-                            self.conf.get('sync_method', 'rsync') == 'ssync':
+                            self._uses_ssync(job):
                         kwargs['remote_check_objs'] = \
                             synced_remote_regions[node['region']]
                     # candidates is a dict(hash=>timestamp) of objects
@@ -333,8 +348,7 @@ class ObjectReplicator(Daemon):
                     all(responses)
             if delete_handoff:
                 self.stats['remove'] += 1
-                if (self.conf.get('sync_method', 'rsync') == 'ssync' and
-                        delete_objs is not None):
+                if self._uses_ssync(job) and delete_objs is not None:
                     self.logger.info(_("Removing %s objects"),
                                      len(delete_objs))
                     _junk, error_paths = self.delete_handoff_objs(
@@ -375,6 +389,22 @@ class ObjectReplicator(Daemon):
     def delete_handoff_objs(self, job, delete_objs):
         success_paths = []
         error_paths = []
+        if job['policy'].policy_type == SLAB_POLICY:
+            df_mgr = self._df_router[job['policy']]
+            for object_hash in delete_objs:
+                object_path = storage_directory(
+                    job['obj_path'], job['partition'], object_hash)
+                try:
+                    df_mgr.remove_slab_files(
+                        job['path'], object_hash,
+                        list(df_mgr.get_slab_index(job['path']).get(
+                            object_hash)))
+                    success_paths.append(object_path)
+                except (Exception, Timeout):
+                    error_paths.append(object_path)
+                    self.logger.exception(
+                        "Unexpected error trying to remove %r", object_path)
+            return success_paths, error_paths
         for object_hash in delete_objs:
             object_path = storage_directory(job['obj_path'], job['partition'],
                                             object_hash)
@@ -404,9 +434,10 @@ class ObjectReplicator(Daemon):
         target_devs_info = set()
         failure_devs_info = set()
         begin = time.time()
+        df_mgr = self._df_router[job['policy']]
         try:
             hashed, local_hash = tpool_reraise(
-                self._diskfile_mgr._get_hashes, job['path'],
+                df_mgr._get_hashes, job['path'],
                 do_listdir=(self.replication_count % 10) == 0,
                 reclaim_age=self.reclaim_age)
             self.suffix_hash += hashed
@@ -458,7 +489,7 @@ class ObjectReplicator(Daemon):
                         self.stats['hashmatch'] += 1
                         continue
                     hashed, recalc_hash = tpool_reraise(
-                        self._diskfile_mgr._get_hashes,
+                        df_mgr._get_hashes,
                         job['path'], recalculate=suffixes,
                         reclaim_age=self.reclaim_age)
                     self.logger.update_stats('suffix.hashes', hashed)
@@ -665,7 +696,7 @@ class ObjectReplicator(Daemon):
         jobs = []
         ips = whataremyips(self.bind_ip)
         for policy in POLICIES:
-            if policy.policy_type == REPL_POLICY:
+            if policy.policy_type in (REPL_POLICY, SLAB_POLICY):
                 if (override_policies is not None and
                         str(policy.idx) not in override_policies):
                     continue
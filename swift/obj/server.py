@@ -33,7 +33,7 @@ from swift.common.utils import public, get_logger, \
     config_true_value, timing_stats, replication, \
     normalize_delete_at_timestamp, get_log_line, Timestamp, \
     get_expirer_container, parse_mime_headers, \
-    iter_multipart_mime_documents, extract_swift_bytes
+    iter_multipart_mime_documents, extract_swift_bytes, split_path
 from swift.common.bufferedhttp import http_connect
 from swift.common.constraints import check_object_creation, \
     valid_timestamp, check_utf8
@@ -295,6 +295,19 @@ class ObjectController(BaseStorageServer):
         else:
             updates = []
 
+        container_path = headers_in.get('X-Backend-Container-Path')
+        if container_path:
+            # the container is sharded; update the shard container that
+            # holds the object instead
+            try:
+                account, container = split_path(
+                    '/' + container_path, 2, 2)
+            except ValueError:
+                self.logger.error(
+                    'ERROR Container update failed: invalid '
+                    'X-Backend-Container-Path %r', container_path)
+                return
+
         headers_out['x-trans-id'] = headers_in.get('x-trans-id', '-')
         headers_out['referer'] = request.as_referer()
         headers_out['X-Backend-Storage-Policy-Index'] = int(policy)
@@ -1084,10 +1097,10 @@ class ObjectController(BaseStorageServer):
         # socket file descriptor from the WSGI input object. Third, the
         # diskfile has to support zero-copy send.
         #
-        # There's a good chance that this could work for 206 responses too,
-        # but the common case is sending the whole object, so we'll start
-        # there.
-        if req.method == 'GET' and res.status_int == 200 and \
+        # For a 206, the response's app_iter is whatever the diskfile reader
+        # returned from app_iter_range() or app_iter_ranges(), which knows
+        # the ranges to send if it supports zero-copy send.
+        if req.method == 'GET' and res.status_int in (200, 206) and \
            isinstance(env['wsgi.input'], wsgi.Input):
             app_iter = getattr(res, 'app_iter', None)
             checker = getattr(app_iter, 'can_zero_copy_send', None)
@@ -1110,7 +1123,8 @@ class ObjectController(BaseStorageServer):
                     # since the only known zero-copy-capable diskfile uses
                     # Linux-specific syscalls, we'll defer that work until
                     # someone needs it.
-                    if hasattr(socket, 'TCP_CORK'):
+                    corked = hasattr(socket, 'TCP_CORK')
+                    if corked:
                         wsock.setsockopt(socket.IPPROTO_TCP,
                                          socket.TCP_CORK, 1)
                     yield EventletPlungerString()
@@ -1119,6 +1133,13 @@ class ObjectController(BaseStorageServer):
                     except Exception:
                         self.logger.exception("zero_copy_send() blew up")
                         raise
+                    finally:
+                        # The connection may be kept alive for the next
+                        # request, so pull the cork to send the tail of the
+                        # response now rather than when it is closed.
+                        if corked:
+                            wsock.setsockopt(socket.IPPROTO_TCP,
+                                             socket.TCP_CORK, 0)
                     yield ''
 
                 # Get headers ready to go out
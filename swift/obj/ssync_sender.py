@@ -78,9 +78,10 @@ class Sender(object):
     process is there.
     """
 
-    def __init__(self, daemon, node, job, suffixes, remote_check_objs=None):
+    def __init__(self, daemon, node, job, suffixes, remote_check_objs=None,
+                 df_mgr=None):
         self.daemon = daemon
-        self.df_mgr = self.daemon._diskfile_mgr
+        self.df_mgr = df_mgr or self.daemon._diskfile_mgr
         self.node = node
         self.job = job
         self.suffixes = suffixes
@@ -14,25 +14,31 @@
 # limitations under the License.
 
 import six.moves.cPickle as pickle
+import errno
+import json
 import os
 import signal
 import sys
 import time
+from collections import OrderedDict
 from swift import gettext_ as _
 from random import random
 
-from eventlet import spawn, patcher, Timeout
+import eventlet
+from eventlet import spawn, patcher, GreenPool, Timeout
 
 from swift.common.bufferedhttp import http_connect
-from swift.common.exceptions import ConnectionTimeout
+from swift.common.exceptions import ConnectionTimeout, LockTimeout
+from swift.common.header_key_dict import HeaderKeyDict
 from swift.common.ring import Ring
 from swift.common.utils import get_logger, renamer, write_pickle, \
-    dump_recon_cache, config_true_value, ismount
+    dump_recon_cache, config_true_value, ismount, Timestamp
 from swift.common.daemon import Daemon
 from swift.common.storage_policy import split_policy_string, PolicyError
-from swift.obj.diskfile import get_tmp_dir, ASYNCDIR_BASE
+from swift.obj.async_spool import AsyncSpool
+from swift.obj.diskfile import get_tmp_dir, ASYNCDIR_BASE, ASYNC_SPOOL_BASE
 from swift.common.http import is_success, HTTP_NOT_FOUND, \
-    HTTP_INTERNAL_SERVER_ERROR
+    HTTP_INTERNAL_SERVER_ERROR, HTTP_METHOD_NOT_ALLOWED
 
 
 class ObjectUpdater(Daemon):
@@ -50,6 +56,10 @@ class ObjectUpdater(Daemon):
         self.slowdown = float(conf.get('slowdown', 0.01))
         self.node_timeout = float(conf.get('node_timeout', 10))
         self.conn_timeout = float(conf.get('conn_timeout', 0.5))
+        self.spool_batch_size = int(conf.get('spool_batch_size', 1000))
+        self.update_concurrency = int(conf.get('update_concurrency', 1))
+        self.container_backoff = float(conf.get('container_backoff', 10))
+        self._container_backoffs = {}
         self.successes = 0
         self.failures = 0
         self.recon_cache_path = conf.get('recon_cache_path',
@@ -144,17 +154,24 @@ class ObjectUpdater(Daemon):
     def object_sweep(self, device):
         """
         If there are async pendings on the device, walk each one and update.
+        Only the newest async pending for each object is sent, newest first
+        within each prefix dir, by up to update_concurrency greenthreads;
+        updates to a container which is failing are deferred to a later
+        sweep.
 
         :param device: path to device
         """
         start_time = time.time()
+        start_successes = self.successes
+        self._container_backoffs = {}
+        pool = GreenPool(self.update_concurrency)
         # loop through async pending dirs for all policies
         for asyncdir in self._listdir(device):
             # we only care about directories
             async_pending = os.path.join(device, asyncdir)
             if not os.path.isdir(async_pending):
                 continue
-            if not asyncdir.startswith(ASYNCDIR_BASE):
+            if not asyncdir.startswith((ASYNCDIR_BASE, ASYNC_SPOOL_BASE)):
                 # skip stuff like "accounts", "containers", etc.
                 continue
             try:
@@ -164,37 +181,267 @@ class ObjectUpdater(Daemon):
                                       'to a valid policy (%(error)s)') % {
                                     'directory': asyncdir, 'error': e})
                 continue
+            if base == ASYNC_SPOOL_BASE:
+                self.spool_sweep(async_pending, policy)
+                self.logger.timing_since('timing', start_time)
+                continue
+            prefix_paths = []
             for prefix in self._listdir(async_pending):
                 prefix_path = os.path.join(async_pending, prefix)
                 if not os.path.isdir(prefix_path):
                     continue
-                last_obj_hash = None
-                for update in sorted(self._listdir(prefix_path), reverse=True):
-                    update_path = os.path.join(prefix_path, update)
-                    if not os.path.isfile(update_path):
-                        continue
-                    try:
-                        obj_hash, timestamp = update.split('-')
-                    except ValueError:
-                        self.logger.increment('errors')
-                        self.logger.error(
-                            _('ERROR async pending file with unexpected '
-                              'name %s')
-                            % (update_path))
-                        continue
-                    if obj_hash == last_obj_hash:
-                        self.logger.increment("unlinks")
-                        os.unlink(update_path)
-                    else:
-                        self.process_object_update(update_path, device,
-                                                   policy)
-                        last_obj_hash = obj_hash
-                    time.sleep(self.slowdown)
+                prefix_paths.append(prefix_path)
+                # spawn_n waits for a free worker, so only one prefix dir's
+                # updates are held at a time and sending starts at once
+                for timestamp, update_path in sorted(
+                        self._coalesce_updates(prefix_path), reverse=True):
+                    pool.spawn_n(self._process_object_update, update_path,
+                                 device, policy)
+            pool.waitall()
+            for prefix_path in prefix_paths:
                 try:
                     os.rmdir(prefix_path)
                 except OSError:
                     pass
             self.logger.timing_since('timing', start_time)
+        elapsed = time.time() - start_time
+        if elapsed:
+            # sent as a timer so that statsd reports its distribution
+            self.logger.timing(
+                'drain_rate', (self.successes - start_successes) / elapsed)
+
+    def _coalesce_updates(self, prefix_path):
+        """
+        Unlink all but the newest async pending for each object in a
+        prefix dir.
+
+        :param prefix_path: path to the prefix dir
+        :returns: a list of (timestamp, path) of the remaining async pendings
+        """
+        updates = []
+        last_obj_hash = None
+        for update in sorted(self._listdir(prefix_path), reverse=True):
+            update_path = os.path.join(prefix_path, update)
+            try:
+                obj_hash, timestamp = update.split('-')
+            except ValueError:
+                self.logger.increment('errors')
+                self.logger.error(
+                    _('ERROR async pending file with unexpected name %s')
+                    % (update_path))
+                continue
+            if obj_hash == last_obj_hash:
+                self.logger.increment("unlinks")
+                try:
+                    os.unlink(update_path)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+            else:
+                updates.append((timestamp, update_path))
+                last_obj_hash = obj_hash
+        return updates
+
+    def _process_object_update(self, update_path, device, policy):
+        try:
+            self.process_object_update(update_path, device, policy)
+        except Exception:
+            self.logger.exception(_('ERROR processing %s'), update_path)
+        eventlet.sleep(self.slowdown)
+
+    def _container_backed_off(self, account, container):
+        """
+        Returns True if updates to the container should be deferred because
+        updates to it have failed recently.
+        """
+        backoff = self._container_backoffs.get((account, container))
+        return backoff is not None and backoff[1] > time.time()
+
+    def _container_update_result(self, account, container, success):
+        """
+        Record the result of an update to a container, backing off the
+        container for twice as long as before each time an update fails,
+        up to the updater's interval.
+        """
+        key = (account, container)
+        if success:
+            self._container_backoffs.pop(key, None)
+        elif self.container_backoff:
+            failures = self._container_backoffs.get(key, (0, 0))[0] + 1
+            self._container_backoffs[key] = (failures, time.time() + min(
+                self.container_backoff * 2 ** (failures - 1), self.interval))
+
+    def spool_sweep(self, spool_path, policy):
+        """
+        Seal the current file of an async spool and send the updates in each
+        of its segments.
+
+        :param spool_path: path to the spool directory
+        :param policy: storage policy of the spooled updates
+        """
+        spool = AsyncSpool(spool_path)
+        try:
+            spool.seal()
+        except LockTimeout:
+            # the object servers are busy appending; send what was sealed
+            self.logger.warning(_('Unable to seal async spool %s'),
+                                spool_path)
+        for segment_path in spool.segments():
+            self.process_spool_segment(spool, segment_path, policy)
+
+    def process_spool_segment(self, spool, segment_path, policy):
+        """
+        Send the updates in a segment of an async spool, in batches of up to
+        spool_batch_size updates.  Any updates that could not be sent are
+        appended to the spool before the segment is unlinked, so that they
+        are retried on a later sweep.
+
+        :param spool: the AsyncSpool the segment belongs to
+        :param segment_path: path to the segment
+        :param policy: storage policy of the spooled updates
+        """
+        updates, skipped = spool.read_segment(segment_path)
+        if skipped:
+            self.logger.increment('errors')
+            self.logger.error(
+                _('ERROR Skipped %(bytes)d bytes of corrupt async spool '
+                  'segment %(path)s'),
+                {'bytes': skipped, 'path': segment_path})
+        failed = []
+        for i in range(0, len(updates), self.spool_batch_size):
+            failed.extend(self.process_spool_batch(
+                updates[i:i + self.spool_batch_size], policy))
+        if failed:
+            spool.append(failed)
+        self.logger.increment('unlinks')
+        os.unlink(segment_path)
+
+    def process_spool_batch(self, updates, policy):
+        """
+        Send a batch of spooled updates, merging the updates for each
+        container into one request to each of its nodes.
+
+        :param updates: a list of update dicts
+        :param policy: storage policy of the updates
+        :returns: a list of the updates which could not be sent to all of
+                  their container's nodes, with their successes updated
+        """
+        by_container = OrderedDict()
+        for update in updates:
+            by_container.setdefault(
+                (update['account'], update['container']), []).append(update)
+        failed = []
+        for (account, container), container_updates in by_container.items():
+            if self._container_backed_off(account, container):
+                self.logger.update_stats('deferrals', len(container_updates))
+                failed.extend(container_updates)
+                continue
+            num_failed = len(failed)
+            part, nodes = self.get_container_ring().get_nodes(
+                account, container)
+            events = []
+            for node in nodes:
+                node_updates = [update for update in container_updates
+                                if node['id'] not in
+                                update.get('successes', [])]
+                if node_updates:
+                    events.append(spawn(
+                        self.container_batch_update, node, part, account,
+                        container, node_updates, policy))
+            for event in events:
+                node_id, sent = event.wait()
+                for update in sent:
+                    update.setdefault('successes', []).append(node_id)
+            node_ids = set(node['id'] for node in nodes)
+            for update in container_updates:
+                if node_ids.issubset(update.get('successes', [])):
+                    self.successes += 1
+                    self.logger.increment('successes')
+                    self._report_lag(update)
+                else:
+                    self.failures += 1
+                    self.logger.increment('failures')
+                    failed.append(update)
+            self._container_update_result(
+                account, container, len(failed) == num_failed)
+            eventlet.sleep(self.slowdown)
+        return failed
+
+    def container_batch_update(self, node, part, account, container,
+                               updates, policy):
+        """
+        Send updates for objects in one container to one of its nodes with
+        a single UPDATE request, falling back to a request per object if the
+        container server does not support UPDATE.
+
+        :param node: node dictionary from the container ring
+        :param part: partition that holds the container
+        :param account: account name of the container
+        :param container: container name
+        :param updates: a list of update dicts
+        :param policy: storage policy of the updates
+        :returns: a tuple of (node id, list of the updates that were sent)
+        """
+        body = json.dumps([self._update_record(update, policy)
+                           for update in updates])
+        headers_out = {
+            'X-Timestamp': Timestamp(time.time()).internal,
+            'X-Backend-Storage-Policy-Index': str(int(policy)),
+            'Content-Type': 'application/json',
+            'Content-Length': str(len(body)),
+            'user-agent': 'object-updater %s' % os.getpid()}
+        try:
+            with ConnectionTimeout(self.conn_timeout):
+                conn = http_connect(node['ip'], node['port'], node['device'],
+                                    part, 'UPDATE',
+                                    '/%s/%s' % (account, container),
+                                    headers_out)
+            with Timeout(self.node_timeout):
+                conn.send(body)
+                resp = conn.getresponse()
+                resp.read()
+        except (Exception, Timeout):
+            self.logger.exception(_('ERROR with remote server '
+                                    '%(ip)s:%(port)s/%(device)s'), node)
+            return node['id'], []
+        if is_success(resp.status) or resp.status == HTTP_NOT_FOUND:
+            return node['id'], updates
+        if resp.status != HTTP_METHOD_NOT_ALLOWED:
+            return node['id'], []
+        sent = []
+        for update in updates:
+            headers_out = update['headers'].copy()
+            headers_out['user-agent'] = 'object-updater %s' % os.getpid()
+            headers_out.setdefault('X-Backend-Storage-Policy-Index',
+                                   str(int(policy)))
+            success, node_id = self.object_update(
+                node, part, update['op'], '/%s/%s/%s' % (
+                    account, container, update['obj']), headers_out)
+            if success is True:
+                sent.append(update)
+        return node['id'], sent
+
+    def _update_record(self, update, policy):
+        """
+        Returns the object record to send in an UPDATE request for an
+        update.
+        """
+        headers = HeaderKeyDict(update['headers'])
+        record = {
+            'name': update['obj'],
+            'created_at': headers['x-timestamp'],
+            'storage_policy_index': int(headers.get(
+                'x-backend-storage-policy-index', policy)),
+            'ctype_timestamp': headers.get('x-content-type-timestamp'),
+            'meta_timestamp': headers.get('x-meta-timestamp')}
+        if update['op'] == 'DELETE':
+            record.update(size=0, content_type='application/deleted',
+                          etag='noetag', deleted=1)
+        else:
+            record.update(size=int(headers['x-size']),
+                          content_type=headers['x-content-type'],
+                          etag=headers['x-etag'], deleted=0)
+        return record
 
     def process_object_update(self, update_path, device, policy):
         """
@@ -206,7 +453,10 @@ class ObjectUpdater(Daemon):
         """
         try:
             update = pickle.load(open(update_path, 'rb'))
-        except Exception:
+        except Exception as e:
+            if getattr(e, 'errno', None) == errno.ENOENT:
+                # unlinked since its prefix dir was listed
+                return
             self.logger.exception(
                 _('ERROR Pickle problem, quarantining %s'), update_path)
             self.logger.increment('quarantines')
@@ -214,6 +464,10 @@ class ObjectUpdater(Daemon):
                                        os.path.basename(update_path))
             renamer(update_path, target_path, fsync=False)
             return
+        if self._container_backed_off(update['account'],
+                                      update['container']):
+            self.logger.increment('deferrals')
+            return
         successes = update.get('successes', [])
         part, nodes = self.get_container_ring().get_nodes(
             update['account'], update['container'])
@@ -235,9 +489,12 @@ class ObjectUpdater(Daemon):
                 new_successes = True
             else:
                 success = False
+        self._container_update_result(update['account'],
+                                      update['container'], success)
         if success:
             self.successes += 1
             self.logger.increment('successes')
+            self._report_lag(update)
             self.logger.debug('Update sent for %(obj)s %(path)s',
                               {'obj': obj, 'path': update_path})
             self.logger.increment("unlinks")
@@ -252,6 +509,17 @@ class ObjectUpdater(Daemon):
                 write_pickle(update, update_path, os.path.join(
                     device, get_tmp_dir(policy)))
 
+    def _report_lag(self, update):
+        """
+        Report the time between an object being changed and its container
+        being sent the update.
+        """
+        headers = HeaderKeyDict(update['headers'])
+        timestamp = headers.get('x-meta-timestamp',
+                                headers.get('x-timestamp'))
+        if timestamp:
+            self.logger.timing_since('lag', float(Timestamp(timestamp)))
+
     def object_update(self, node, part, op, obj, headers_out):
         """
         Perform the object update to the container
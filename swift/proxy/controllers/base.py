@@ -32,11 +32,13 @@ import functools
 import inspect
 import itertools
 import operator
+from collections import OrderedDict
 from copy import deepcopy
 from sys import exc_info
 from swift import gettext_ as _
 
-from eventlet import sleep
+from eventlet import GreenPool, greenthread, hubs, sleep, spawn
+from eventlet.event import Event
 from eventlet.timeout import Timeout
 import six
 
@@ -44,11 +46,12 @@ from swift.common.wsgi import make_pre_authed_env
 from swift.common.utils import Timestamp, config_true_value, \
     public, split_path, list_from_csv, GreenthreadSafeIterator, \
     GreenAsyncPile, quorum_size, parse_content_type, \
-    document_iters_to_http_response_body
+    document_iters_to_http_response_body, closing_if_possible
 from swift.common.bufferedhttp import http_connect
 from swift.common.exceptions import ChunkReadTimeout, ChunkWriteTimeout, \
     ConnectionTimeout, RangeAlreadyComplete
 from swift.common.header_key_dict import HeaderKeyDict
+from swift.common.listing_formats import decode_json_listing
 from swift.common.http import is_informational, is_success, is_redirection, \
     is_server_error, HTTP_OK, HTTP_PARTIAL_CONTENT, HTTP_MULTIPLE_CHOICES, \
     HTTP_BAD_REQUEST, HTTP_NOT_FOUND, HTTP_SERVICE_UNAVAILABLE, \
@@ -65,6 +68,9 @@ from swift.common.storage_policy import POLICIES
 
 DEFAULT_RECHECK_ACCOUNT_EXISTENCE = 60  # seconds
 DEFAULT_RECHECK_CONTAINER_EXISTENCE = 60  # seconds
+DEFAULT_RECHECK_UPDATING_SHARD_RANGES = 3600  # seconds
+DEFAULT_INFO_CACHE_TTL = 5  # seconds
+DEFAULT_INFO_CACHE_NEGATIVE_TTL = 1  # seconds
 
 
 def update_headers(response, headers):
@@ -166,6 +172,8 @@ def headers_to_container_info(headers, status_int=HTTP_OK):
         'bytes': headers.get('x-container-bytes-used'),
         'versions': headers.get('x-versions-location'),
         'storage_policy': headers.get('x-backend-storage-policy-index', '0'),
+        'sharding_state': headers.get('x-backend-sharding-state',
+                                      'unsharded'),
         'cors': {
             'allow_origin': meta.get('access-control-allow-origin'),
             'expose_headers': meta.get('access-control-expose-headers'),
@@ -330,17 +338,21 @@ def get_container_info(env, app, swift_source=None):
             if not account_info or not is_success(account_info['status']):
                 return headers_to_container_info({}, 0)
 
-        req = _prepare_pre_auth_info_request(
-            env, ("/%s/%s/%s" % (version, account, container)),
-            (swift_source or 'GET_CONTAINER_INFO'))
-        resp = req.get_response(app)
-        # Check in infocache to see if the proxy (or anyone else) already
-        # populated the cache for us. If they did, just use what's there.
-        #
-        # See similar comment in get_account_info() for justification.
-        info = _get_info_from_infocache(env, account, container)
-        if info is None:
-            info = set_info_cache(app, env, account, container, resp)
+        def fetch():
+            req = _prepare_pre_auth_info_request(
+                env, ("/%s/%s/%s" % (version, account, container)),
+                (swift_source or 'GET_CONTAINER_INFO'))
+            resp = req.get_response(app)
+            # Check in infocache to see if the proxy (or anyone else) already
+            # populated the cache for us. If they did, just use what's there.
+            #
+            # See similar comment in get_account_info() for justification.
+            info = _get_info_from_infocache(env, account, container)
+            if info is None:
+                info = set_info_cache(app, env, account, container, resp)
+            return info
+
+        info = _fetch_info_once(env, account, container, fetch)
 
     if info:
         info = deepcopy(info)  # avoid mutating what's in swift.infocache
@@ -383,27 +395,32 @@ def get_account_info(env, app, swift_source=None):
     # Cache miss; go HEAD the account and populate the caches
     if not info:
         env.setdefault('swift.infocache', {})
-        req = _prepare_pre_auth_info_request(
-            env, "/%s/%s" % (version, account),
-            (swift_source or 'GET_ACCOUNT_INFO'))
-        resp = req.get_response(app)
-        # Check in infocache to see if the proxy (or anyone else) already
-        # populated the cache for us. If they did, just use what's there.
-        #
-        # The point of this is to avoid setting the value in memcached
-        # twice. Otherwise, we're needlessly sending requests across the
-        # network.
-        #
-        # If the info didn't make it into the cache, we'll compute it from
-        # the response and populate the cache ourselves.
-        #
-        # Note that this is taking "exists in infocache" to imply "exists in
-        # memcache". That's because we're trying to avoid superfluous
-        # network traffic, and checking in memcache prior to setting in
-        # memcache would defeat the purpose.
-        info = _get_info_from_infocache(env, account)
-        if info is None:
-            info = set_info_cache(app, env, account, None, resp)
+
+        def fetch():
+            req = _prepare_pre_auth_info_request(
+                env, "/%s/%s" % (version, account),
+                (swift_source or 'GET_ACCOUNT_INFO'))
+            resp = req.get_response(app)
+            # Check in infocache to see if the proxy (or anyone else) already
+            # populated the cache for us. If they did, just use what's there.
+            #
+            # The point of this is to avoid setting the value in memcached
+            # twice. Otherwise, we're needlessly sending requests across the
+            # network.
+            #
+            # If the info didn't make it into the cache, we'll compute it
+            # from the response and populate the cache ourselves.
+            #
+            # Note that this is taking "exists in infocache" to imply "exists
+            # in memcache". That's because we're trying to avoid superfluous
+            # network traffic, and checking in memcache prior to setting in
+            # memcache would defeat the purpose.
+            info = _get_info_from_infocache(env, account)
+            if info is None:
+                info = set_info_cache(app, env, account, None, resp)
+            return info
+
+        info = _fetch_info_once(env, account, None, fetch)
 
     if info:
         info = info.copy()  # avoid mutating what's in swift.infocache
@@ -478,10 +495,13 @@ def set_info_cache(app, env, account, container, resp):
         elif not is_success(resp.status_int):
             cache_time = None
 
-    # Next actually set both memcache and the env cache
+    # Next actually set memcache, the worker's cache and the env cache
     memcache = getattr(app, 'memcache', None) or env.get('swift.cache')
+    worker_infocache = env.get('swift.worker_infocache')
     if not cache_time:
         infocache.pop(cache_key, None)
+        if worker_infocache is not None:
+            worker_infocache.delete(cache_key)
         if memcache:
             memcache.delete(cache_key)
         return
@@ -492,6 +512,8 @@ def set_info_cache(app, env, account, container, resp):
         info = headers_to_account_info(resp.headers, resp.status_int)
     if memcache:
         memcache.set(cache_key, info, time=cache_time)
+    if worker_infocache is not None:
+        worker_infocache.set(cache_key, info, max_ttl=cache_time)
     infocache[cache_key] = info
     return info
 
@@ -565,26 +587,101 @@ def _get_info_from_memcache(app, env, account, container=None):
       returns None if memcache is not in use.
     """
     cache_key = get_cache_key(account, container)
+    if cache_key in env.get('swift.infocache_prefetch_misses', ()):
+        # we already asked memcache for it, just now
+        return None
     memcache = getattr(app, 'memcache', None) or env.get('swift.cache')
     if memcache:
         info = memcache.get(cache_key)
         if info:
-            for key in info:
-                if isinstance(info[key], six.text_type):
-                    info[key] = info[key].encode("utf-8")
-                elif isinstance(info[key], dict):
-                    for subkey, value in info[key].items():
-                        if isinstance(value, six.text_type):
-                            info[key][subkey] = value.encode("utf-8")
+            _utf8_encode_info(info)
             env.setdefault('swift.infocache', {})[cache_key] = info
         return info
     return None
 
 
+def _utf8_encode_info(info):
+    for key in info:
+        if isinstance(info[key], six.text_type):
+            info[key] = info[key].encode("utf-8")
+        elif isinstance(info[key], dict):
+            for subkey, value in info[key].items():
+                if isinstance(value, six.text_type):
+                    info[key][subkey] = value.encode("utf-8")
+
+
+def prefetch_info(env, account, container=None):
+    """
+    Get the account and container info a request is going to need from
+    memcache in one go, rather than one round trip for each as they are
+    looked up, and put it in the request's env cache (swift.infocache).
+
+    Info that is already in the env cache or the worker's cache is not
+    fetched. Info that memcache does not have is noted so that the lookups
+    that follow go straight to the backend.
+
+    :param  env: the environment used by the current request
+    :param  account: the account name
+    :param  container: the container name, or None
+    """
+    memcache = env.get('swift.cache')
+    if not memcache:
+        return
+    cache_keys = [get_cache_key(account)]
+    if container:
+        cache_keys.append(get_cache_key(account, container))
+    infocache = env.setdefault('swift.infocache', {})
+    worker_infocache = env.get('swift.worker_infocache')
+    wanted = []
+    for cache_key in cache_keys:
+        if cache_key in infocache:
+            continue
+        if worker_infocache is not None:
+            info = worker_infocache.get(cache_key)
+            if info is not None:
+                infocache[cache_key] = info
+                continue
+        wanted.append(cache_key)
+    if not wanted:
+        return
+    found = memcache.get_many(wanted)
+    misses = env.setdefault('swift.infocache_prefetch_misses', set())
+    for cache_key in wanted:
+        info = found.get(cache_key)
+        if not info:
+            misses.add(cache_key)
+            continue
+        _utf8_encode_info(info)
+        infocache[cache_key] = info
+        if worker_infocache is not None:
+            worker_infocache.set(cache_key, info)
+
+
+def _get_info_from_worker_infocache(env, account, container=None):
+    """
+    Get cached account or container information from the worker's
+    in-process cache (swift.worker_infocache), if there is one.
+
+    :param  env: the environment used by the current request
+    :param  account: the account name
+    :param  container: the container name
+
+    :returns: a dictionary of cached info on cache hit, None on miss
+    """
+    worker_infocache = env.get('swift.worker_infocache')
+    if worker_infocache is None:
+        return None
+    cache_key = get_cache_key(account, container)
+    info = worker_infocache.get(cache_key)
+    if info is not None:
+        env.setdefault('swift.infocache', {})[cache_key] = info
+    return info
+
+
 def _get_info_from_caches(app, env, account, container=None):
     """
-    Get the cached info from env or memcache (if used) in that order.
-    Used for both account and container info.
+    Get the cached info from env, the worker's cache or memcache (if used) in
+    that order. Used for both account and container info.
 
     :param  app: the application object
     :param  env: the environment used by the current request
@@ -592,11 +689,137 @@ def _get_info_from_caches(app, env, account, container=None):
     """
 
     info = _get_info_from_infocache(env, account, container)
+    if info is None:
+        info = _get_info_from_worker_infocache(env, account, container)
     if info is None:
         info = _get_info_from_memcache(app, env, account, container)
+        worker_infocache = env.get('swift.worker_infocache')
+        if info and worker_infocache is not None:
+            worker_infocache.set(get_cache_key(account, container), info)
+    return info
+
+
+def _fetch_info_once(env, account, container, fetch):
+    """
+    Get account or container info from the backend with fetch, unless
+    another request in this worker is already doing so, in which case wait
+    for its info instead.
+
+    :param  env: the environment used by the current request
+    :param  account: the account name
+    :param  container: the container name
+    :param  fetch: a callable taking no arguments that gets the info from the
+                   backend and caches it
+    :returns: the info, or None if it could not be had
+    """
+    worker_infocache = env.get('swift.worker_infocache')
+    if worker_infocache is None:
+        return fetch()
+    cache_key = get_cache_key(account, container)
+    info = worker_infocache.fetch_once(cache_key, fetch)
+    if info is not None:
+        env.setdefault('swift.infocache', {}).setdefault(cache_key, info)
     return info
 
 
+class InfoCache(object):
+    """
+    A per-worker, in-process cache of account and container info in front of
+    memcache, so that a busy worker need not ask memcache for the same info
+    on every request.
+
+    Info is only kept for a few seconds, and info for an account or container
+    that was not found for even less, since a change made through another
+    worker is not seen here until the info expires. Concurrent misses for
+    the same account or container are coalesced so that only one of them
+    goes to the backend; the others wait for its info.
+
+    :param max_size: the most entries to keep, evicting the least recently
+                     used
+    :param ttl: seconds to keep info
+    :param negative_ttl: seconds to keep info with a 404 or 410 status
+    :param logger: a logger for hit, miss and coalesced counts
+    """
+
+    def __init__(self, max_size, ttl=DEFAULT_INFO_CACHE_TTL,
+                 negative_ttl=DEFAULT_INFO_CACHE_NEGATIVE_TTL, logger=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.logger = logger
+        # cache_key -> (expiry time, info), least recently used first
+        self._entries = OrderedDict()
+        # cache_key -> Event sent the info once the fetch is done
+        self._fetching = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _increment(self, metric):
+        if self.logger:
+            self.logger.increment(metric)
+
+    def get(self, cache_key):
+        """
+        Returns the cached info for cache_key, or None if there is none or
+        it has expired.
+        """
+        entry = self._entries.pop(cache_key, None)
+        if entry is None or entry[0] <= time.time():
+            self._increment('miss')
+            return None
+        self._entries[cache_key] = entry
+        self._increment('hit')
+        return entry[1]
+
+    def set(self, cache_key, info, max_ttl=None):
+        """
+        Cache info for cache_key.
+
+        :param max_ttl: optional limit on the seconds to keep the info, e.g.
+                        the time it was cached in memcache for
+        """
+        if info.get('status') in (HTTP_NOT_FOUND, HTTP_GONE):
+            ttl = self.negative_ttl
+        else:
+            ttl = self.ttl
+        if max_ttl is not None:
+            ttl = min(ttl, max_ttl)
+        self._entries.pop(cache_key, None)
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        self._entries[cache_key] = (time.time() + ttl, info)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def delete(self, cache_key):
+        self._entries.pop(cache_key, None)
+
+    def fetch_once(self, cache_key, fetch):
+        """
+        Call fetch to get the info for cache_key, or if a fetch for it is
+        already in progress wait for that one's info. Should that turn out
+        to be None, call fetch anyway.
+
+        :returns: the info
+        """
+        event = self._fetching.get(cache_key)
+        if event is not None:
+            self._increment('coalesced')
+            info = event.wait()
+            if info is not None:
+                return info
+            return fetch()
+        event = self._fetching[cache_key] = Event()
+        info = None
+        try:
+            info = fetch()
+            return info
+        finally:
+            del self._fetching[cache_key]
+            event.send(info)
+
+
 def _prepare_pre_auth_info_request(env, path, swift_source):
     """
     Prepares a pre authed request to obtain info using a HEAD.
@@ -696,7 +919,9 @@ def close_swift_conn(src):
         # headers, the response object (src) is solely responsible for the
         # socket. The connection object (src.swift_conn) has no references
         # to the socket, so calling its close() method does nothing, and
-        # therefore we don't do it.
+        # therefore we don't do it. With backend_keepalive, a response that
+        # was read to the end has already given its socket back to the
+        # connection pool, and this does nothing.
         #
         # Also, since calling the response's close() method might not
         # close the underlying socket but only decrement some
@@ -726,10 +951,22 @@ def bytes_to_skip(record_size, range_start):
     return (record_size - (range_start % record_size)) % record_size
 
 
+class HedgeWon(BaseException):
+    """
+    Raised in a stalled chunk read when another node has answered a hedged
+    request for the rest of the response first. Like a Timeout, it is not an
+    Exception so that it is not swallowed by the read.
+    """
+    def __init__(self, source, node):
+        super(HedgeWon, self).__init__()
+        self.source = source
+        self.node = node
+
+
 class ResumingGetter(object):
     def __init__(self, app, req, server_type, node_iter, partition, path,
                  backend_headers, concurrency=1, client_chunk_size=None,
-                 newest=None):
+                 newest=None, hedge=False):
         self.app = app
         self.node_iter = node_iter
         self.server_type = server_type
@@ -750,6 +987,12 @@ class ResumingGetter(object):
             self.newest = config_true_value(req.headers.get('x-newest', 'f'))
         else:
             self.newest = newest
+        self.hedge = hedge and not self.newest
+        self.policy_index = backend_headers.get(
+            'X-Backend-Storage-Policy-Index')
+        # the node a hedged request overtook, and when
+        self.hedged_node = None
+        self.hedge_won_at = None
 
         # populated when finding source
         self.statuses = []
@@ -934,12 +1177,44 @@ class ResumingGetter(object):
                 nchunks = 0
                 buf = ''
                 bytes_used_from_backend = 0
+                stall_node = stall_timeout = None
                 while True:
                     try:
-                        with ChunkReadTimeout(node_timeout):
-                            chunk = part_file.read(self.app.object_chunk_size)
+                        if self.hedge:
+                            if node[0] is not stall_node:
+                                stall_node = node[0]
+                                stall_timeout = self.app.get_hedge_timeout(
+                                    self.policy_index, stall_node,
+                                    chunk_read=True)
+                            chunk, new_source, new_node = self._hedged_read(
+                                part_file, node_timeout, stall_timeout,
+                                node[0], bytes_used_from_backend)
+                            if new_source:
+                                # another node answered while this one
+                                # stalled; carry on from that one instead
+                                buf = ''
+                                if getattr(source[0], 'swift_conn', None):
+                                    close_swift_conn(source[0])
+                                source[0] = new_source
+                                node[0] = new_node
+                                parts_iter[0] = \
+                                    http_response_to_document_iters(
+                                        new_source, read_chunk_size=self.app.
+                                        object_chunk_size)
+                                try:
+                                    _junk, _junk, _junk, _junk, part_file = \
+                                        get_next_doc_part()
+                                except StopIteration:
+                                    return
+                                continue
                             nchunks += 1
                             buf += chunk
+                        else:
+                            with ChunkReadTimeout(node_timeout):
+                                chunk = part_file.read(
+                                    self.app.object_chunk_size)
+                                nchunks += 1
+                                buf += chunk
                     except ChunkReadTimeout:
                         exc_type, exc_value, exc_traceback = exc_info()
                         if self.newest or self.server_type != 'Object':
@@ -1083,6 +1358,115 @@ class ResumingGetter(object):
         else:
             return None
 
+    def _read_chunk(self, part_file, node_timeout):
+        with ChunkReadTimeout(node_timeout):
+            return part_file.read(self.app.object_chunk_size)
+
+    def _hedged_read(self, part_file, node_timeout, stall_timeout, node,
+                     bytes_used):
+        """
+        Reads a chunk from part_file, as a read with a ChunkReadTimeout of
+        node_timeout would. If the read stalls for longer than stall_timeout
+        and the hedge budget allows, another node is asked for the rest of
+        the response while the read carries on; whichever answers first is
+        kept and the other is let go.
+
+        :param part_file: the file-like response part being read
+        :param node_timeout: the timeout for the whole read
+        :param stall_timeout: seconds the read may take before another node
+                              is asked too, or None to never ask
+        :param node: the node being read from
+        :param bytes_used: bytes of the response already sent on
+        :returns: a tuple of (chunk, None, None) if the read finished first,
+                  or (None, new source, new node) if another node answered
+                  first
+        """
+        hedge = {}
+        stall_timer = None
+        if stall_timeout is not None:
+            reader = greenthread.getcurrent()
+
+            def start_hedge():
+                hedge['thread'] = spawn(
+                    self._hedge, hedge, reader, bytes_used)
+
+            # a timer rather than a greenthread per read; the hedge is only
+            # spawned once the read has stalled
+            stall_timer = hubs.get_hub().schedule_call_global(
+                stall_timeout, start_hedge)
+        start = time.time()
+        won = False
+        try:
+            chunk = self._read_chunk(part_file, node_timeout)
+        except HedgeWon as err:
+            won = True
+            self.app.logger.increment('hedge.won')
+            return None, err.source, err.node
+        finally:
+            if stall_timer is not None:
+                stall_timer.cancel()
+            self.app.record_response_time(
+                self.policy_index, node, time.time() - start,
+                chunk_read=True)
+            if hedge and not won:
+                self._abandon_hedge(hedge)
+        return chunk, None, None
+
+    def _hedge(self, hedge, reader, bytes_used):
+        """
+        Asks another node for the rest of the response of a stalled read,
+        and interrupts the read with :class:`HedgeWon` if one answers.
+
+        :param hedge: dict of the hedge's state, shared with the read
+        :param reader: the greenthread doing the stalled read
+        :param bytes_used: bytes of the response already sent on
+        """
+        if not self.app.take_hedge():
+            return
+        hedge['range'] = self.backend_headers.get('Range')
+        try:
+            self.fast_forward(bytes_used)
+        except (HTTPException, ValueError, RangeAlreadyComplete):
+            return
+        hedge['pool'] = GreenPool(self.concurrency + 1)
+        new_source, new_node = self._get_source_and_node(hedge['pool'])
+        if new_source:
+            hedge['source'] = new_source
+            hedge['throw'] = hubs.get_hub().schedule_call_global(
+                0, reader.throw, HedgeWon(new_source, new_node))
+
+    def _abandon_hedge(self, hedge):
+        """
+        Lets go of the hedge of a stalled read that finished after all, so
+        that the next resume starts from where the read got to.
+
+        :param hedge: dict of the hedge's state, shared with the read
+        """
+        if 'throw' in hedge:
+            hedge['throw'].cancel()
+        hedge['thread'].kill()
+        if 'pool' in hedge:
+            # its requests must not turn up as the source of a later resume
+            for coro in list(hedge['pool'].coroutines_running):
+                coro.kill()
+        if 'source' in hedge:
+            close_swift_conn(hedge['source'])
+        if 'range' in hedge:
+            if hedge['range'] is None:
+                self.backend_headers.pop('Range', None)
+            else:
+                self.backend_headers['Range'] = hedge['range']
+
+    def _node_responded(self, node, start_node_timing):
+        if not self.hedge:
+            return
+        self.app.record_response_time(
+            self.policy_index, node, time.time() - start_node_timing)
+        if node is self.hedged_node:
+            # the node that was overtaken by a hedged request has caught up
+            self.app.logger.timing_since('hedge.saved', self.hedge_won_at)
+            self.hedged_node = self.hedge_won_at = None
+
     def _make_node_request(self, node, node_timeout, logger_thread_locals):
         self.app.logger.thread_locals = logger_thread_locals
         if node in self.used_nodes:
@@ -1102,11 +1486,13 @@ class ResumingGetter(object):
                 # See NOTE: swift_conn at top of file about this.
                 possible_source.swift_conn = conn
         except (Exception, Timeout):
+            self._node_responded(node, start_node_timing)
             self.app.exception_occurred(
                 node, self.server_type,
                 _('Trying to %(method)s %(path)s') %
                 {'method': self.req_method, 'path': self.req_path})
             return False
+        self._node_responded(node, start_node_timing)
         if self.is_good_source(possible_source):
             # 404 if we know we don't have a synced copy
             if not float(possible_source.getheader('X-PUT-Timestamp', 1)):
@@ -1153,7 +1539,14 @@ class ResumingGetter(object):
                      'type': self.server_type})
         return False
 
-    def _get_source_and_node(self):
+    def _get_source_and_node(self, pool=None):
+        """
+        Finds a node with a good response to the request.
+
+        :param pool: a GreenPool to make the requests in, so that they can be
+                     killed along with the caller; by default a new one
+        :returns: a tuple of (source, node), or (None, None)
+        """
         self.statuses = []
         self.reasons = []
         self.bodies = []
@@ -1166,15 +1559,36 @@ class ResumingGetter(object):
         if self.server_type == 'Object' and not self.newest:
             node_timeout = self.app.recoverable_node_timeout
 
-        pile = GreenAsyncPile(self.concurrency)
+        if pool is not None:
+            pile = GreenAsyncPile(pool)
+        elif self.hedge:
+            # leave room for one hedged request
+            pile = GreenAsyncPile(self.concurrency + 1)
+        else:
+            pile = GreenAsyncPile(self.concurrency)
+        if self.hedge:
+            self.app.add_hedge_budget()
+        hedged_node = None
 
         for node in nodes:
             pile.spawn(self._make_node_request, node, node_timeout,
                        self.app.logger.thread_locals)
-            _timeout = self.app.concurrency_timeout \
-                if pile.inflight < self.concurrency else None
-            if pile.waitfirst(_timeout):
+            if self.hedge:
+                _timeout = self.app.get_hedge_timeout(
+                    self.policy_index, node) if pile.inflight == 1 else None
+            else:
+                _timeout = self.app.concurrency_timeout \
+                    if pile.inflight < self.concurrency else None
+            result = pile.waitfirst(_timeout)
+            if result:
                 break
+            if result is None and self.hedge and _timeout is not None:
+                # the node is slower than usual; ask the next one too, if
+                # the budget allows
+                if self.app.take_hedge():
+                    hedged_node = node
+                elif pile.waitfirst(None):
+                    break
         else:
             # ran out of nodes, see if any stragglers will finish
             any(pile)
@@ -1185,6 +1599,10 @@ class ResumingGetter(object):
             for src, _junk in self.sources:
                 close_swift_conn(src)
             self.used_nodes.append(node)
+            if hedged_node is not None and node is not hedged_node:
+                self.app.logger.increment('hedge.won')
+                self.hedged_node = hedged_node
+                self.hedge_won_at = time.time()
             src_headers = dict(
                 (k.lower(), v) for k, v in
                 source.getheaders())
@@ -1434,11 +1852,83 @@ class Controller(object):
         else:
             referer = ''
         headers['x-trans-id'] = self.trans_id
-        headers['connection'] = 'close'
+        headers['connection'] = \
+            'keep-alive' if self.app.backend_keepalive else 'close'
         headers['user-agent'] = 'proxy-server %s' % os.getpid()
         headers['referer'] = referer
         return headers
 
+    def _get_container_listing(self, req, account, container, headers=None,
+                               params=None):
+        """
+        Get a JSON listing straight from the container servers of a
+        container.
+
+        :param req: the original request
+        :param account: the account of the container
+        :param container: the container
+        :param headers: headers to send to the container servers
+        :param params: query parameters to send to the container servers
+        :returns: a tuple of (the container servers' response, the decoded
+                  listing or None if the request failed)
+        """
+        subreq = Request(make_pre_authed_env(
+            req.environ, 'GET', '/v1/%s/%s' % (account, container),
+            swift_source='SH'))
+        subreq.headers.update(headers or {})
+        subreq.params = dict(params or {}, format='json')
+        part = self.app.container_ring.get_part(account, container)
+        node_iter = self.app.iter_nodes(self.app.container_ring, part)
+        resp = self.GETorHEAD_base(subreq, _('Container'), node_iter, part,
+                                   subreq.swift_entity_path)
+        if not is_success(resp.status_int):
+            return resp, None
+        return resp, self._decode_container_listing(resp)
+
+    def _decode_container_listing(self, resp):
+        """
+        Decode the JSON listing in a response of the container servers.
+
+        :param resp: a successful response to a JSON listing request
+        :returns: the decoded listing, or None if it is not valid JSON
+        """
+        try:
+            # decode the listing as it is read, rather than joining its body
+            if resp.app_iter is None:
+                return list(decode_json_listing([resp.body]))
+            with closing_if_possible(resp.app_iter):
+                return list(decode_json_listing(resp.app_iter))
+        except ValueError:
+            return None
+
+    def _get_shard_ranges(self, req, account, container, includes=None,
+                          marker=None, end_marker=None):
+        """
+        Get the active shard ranges of a sharded container from its container
+        servers.
+
+        :param req: the original request
+        :param account: the account of the container
+        :param container: the container
+        :param includes: if given, only get the shard range that includes
+                         this object name
+        :param marker: if given, only get shard ranges with names above the
+                       marker
+        :param end_marker: if given, only get shard ranges with names below
+                           the end marker
+        :returns: a list of shard range dicts, or None if they could not be
+                  got
+        """
+        params = dict((key, value) for key, value in (
+            ('includes', includes), ('marker', marker),
+            ('end_marker', end_marker)) if value)
+        resp, shard_ranges = self._get_container_listing(
+            req, account, container,
+            headers={'X-Backend-Record-Type': 'shard'}, params=params)
+        if resp.headers.get('X-Backend-Record-Type', '').lower() != 'shard':
+            return None
+        return shard_ranges
+
     def account_info(self, account, req=None):
         """
         Get account information, and also verify that the account exists.
@@ -1737,7 +2227,8 @@ class Controller(object):
         path = '/%s' % account
         headers = {'X-Timestamp': Timestamp(time.time()).internal,
                    'X-Trans-Id': self.trans_id,
-                   'Connection': 'close'}
+                   'Connection': 'keep-alive' if self.app.backend_keepalive
+                   else 'close'}
         # transfer any x-account-sysmeta headers from original request
         # to the autocreate PUT
         headers.update((k, v)
@@ -1753,7 +2244,7 @@ class Controller(object):
             self.app.logger.warning('Could not autocreate account %r' % path)
 
     def GETorHEAD_base(self, req, server_type, node_iter, partition, path,
-                       concurrency=1, client_chunk_size=None):
+                       concurrency=1, client_chunk_size=None, hedge=False):
         """
         Base handler for HTTP GET or HEAD requests.
 
@@ -1764,6 +2255,8 @@ class Controller(object):
         :param path: path for the request
         :param concurrency: number of requests to run concurrently
         :param client_chunk_size: chunk size for response body iterator
+        :param hedge: if True, ask another node too when one is slow to
+                      respond; see :class:`ResumingGetter`
         :returns: swob.Response object
         """
         backend_headers = self.generate_request_headers(
@@ -1772,7 +2265,8 @@ class Controller(object):
         handler = GetOrHeadHandler(self.app, req, self.server_type, node_iter,
                                    partition, path, backend_headers,
                                    concurrency,
-                                   client_chunk_size=client_chunk_size)
+                                   client_chunk_size=client_chunk_size,
+                                   hedge=hedge)
         res = handler.get_working_response(req)
 
         if not res:
@@ -17,15 +17,38 @@ from swift import gettext_ as _
 import time
 
 from six.moves.urllib.parse import unquote
-from swift.common.utils import public, csv_append, Timestamp
+from swift.common.utils import public, csv_append, Timestamp, \
+    config_true_value
 from swift.common.constraints import check_metadata
 from swift.common import constraints
-from swift.common.http import HTTP_ACCEPTED, is_success
+from swift.common.http import HTTP_ACCEPTED, HTTP_NOT_FOUND, is_success
+from swift.common.listing_formats import encode_json_listing, \
+    encode_plain_listing, encode_xml_container_listing
+from swift.common.request_helpers import get_listing_content_type
 from swift.proxy.controllers.base import Controller, delay_denial, \
     cors_validation, set_info_cache, clear_info_cache
 from swift.common.storage_policy import POLICIES
 from swift.common.swob import HTTPBadRequest, HTTPForbidden, \
-    HTTPNotFound
+    HTTPNotFound, HTTPNoContent, HTTPServiceUnavailable, Response
+
+
+def merge_listings(listing, other_listing, reverse=False):
+    """
+    Merge two container listings in the same order, keeping the newer record
+    of an object listed in both.
+
+    :param listing: a list of object and subdir records
+    :param other_listing: another list of object and subdir records
+    :param reverse: True if the listings are in reverse order
+    :returns: the merged list of records
+    """
+    records = {}
+    for record in listing + other_listing:
+        key = record.get('name', record.get('subdir')).encode('utf-8')
+        if key not in records or record.get('last_modified', '') > \
+                records[key].get('last_modified', ''):
+            records[key] = record
+    return [records[key] for key in sorted(records, reverse=reverse)]
 
 
 class ContainerController(Controller):
@@ -117,12 +140,97 @@ class ContainerController(Controller):
                 # Don't cache this. It doesn't reflect the state of the
                 # container, just that the user can't access it.
                 return aresp
+        if req.method == 'GET' and is_success(resp.status_int) and \
+                resp.headers.get('X-Backend-Sharding-State') == 'sharded' \
+                and resp.headers.get('X-Backend-Record-Type') != 'shard':
+            resp = self._get_sharded_listing(req, resp)
         if not req.environ.get('swift_owner', False):
             for key in self.app.swift_owner_headers:
                 if key in resp.headers:
                     del resp.headers[key]
         return resp
 
+    def _get_sharded_listing(self, req, resp):
+        """
+        Build the listing of a sharded container from the listings of its
+        shard containers, in the format the client asked for. The rows left
+        in the container itself are merged in too: those the sharder has not
+        moved to its shards yet, and those sent to it since by proxies that
+        had not yet learnt of its shard ranges.
+
+        :param req: the client's request
+        :param resp: the response of the root container's servers
+        :returns: a swob.Response
+        """
+        params = req.params
+        reverse = config_true_value(params.get('reverse'))
+        limit = constraints.CONTAINER_LISTING_LIMIT
+        if params.get('limit', '').isdigit():
+            limit = min(int(params['limit']), limit)
+        marker = params.get('marker')
+        end_marker = params.get('end_marker')
+        if reverse:
+            # a reverse listing holds the names below the marker and above
+            # the end marker
+            marker, end_marker = end_marker, marker
+        out_content_type = get_listing_content_type(req)
+        if out_content_type == 'application/json':
+            root_listing = self._decode_container_listing(resp)
+        else:
+            _junk, root_listing = self._get_container_listing(
+                req, self.account_name, self.container_name, params=params)
+        if root_listing is None:
+            return HTTPServiceUnavailable(request=req)
+        shard_ranges = self._get_shard_ranges(
+            req, self.account_name, self.container_name, marker=marker,
+            end_marker=end_marker)
+        if shard_ranges is None:
+            return HTTPServiceUnavailable(request=req)
+        if reverse:
+            shard_ranges.reverse()
+
+        objects = []
+        shard_params = dict(params)
+        for shard_range in shard_ranges:
+            if len(objects) >= limit:
+                break
+            shard_params['limit'] = str(limit - len(objects))
+            if objects:
+                # carry on from the last name listed
+                last = objects[-1]
+                shard_params['marker'] = last.get(
+                    'name', last.get('subdir')).encode('utf-8')
+            account, container = shard_range['name'].split('/', 1)
+            shard_resp, listing = self._get_container_listing(
+                req, account, container, params=shard_params)
+            if listing is None:
+                if shard_resp.status_int == HTTP_NOT_FOUND:
+                    # the shard has not been created yet, so it is empty
+                    continue
+                return HTTPServiceUnavailable(request=req)
+            if objects and listing and \
+                    listing[0].get('subdir') is not None and \
+                    listing[0].get('subdir') == objects[-1].get('subdir'):
+                # a subdir spanning the shards' boundary
+                listing = listing[1:]
+            objects.extend(listing)
+        objects = merge_listings(objects, root_listing, reverse)[:limit]
+
+        headers = dict((key, value) for key, value in resp.headers.items()
+                       if key.lower() not in ('content-length',
+                                              'content-type', 'etag'))
+        if out_content_type == 'application/json':
+            body = encode_json_listing(objects)
+        elif out_content_type.endswith('/xml'):
+            body = encode_xml_container_listing(self.container_name, objects)
+        else:
+            if not objects:
+                return HTTPNoContent(request=req, headers=headers)
+            body = encode_plain_listing(
+                record.get('name', record.get('subdir')) for record in objects)
+        return Response(request=req, headers=headers, app_iter=body,
+                        content_type=out_content_type, charset='utf-8')
+
     @public
     @delay_denial
     @cors_validation
@@ -38,7 +38,7 @@ from hashlib import md5
 from swift import gettext_ as _
 
 from greenlet import GreenletExit
-from eventlet import GreenPile
+from eventlet import GreenPile, spawn, tpool
 from eventlet.queue import Queue
 from eventlet.timeout import Timeout
 
@@ -63,7 +63,8 @@ from swift.common.http import (
     HTTP_PRECONDITION_FAILED, HTTP_CONFLICT, HTTP_UNPROCESSABLE_ENTITY,
     HTTP_REQUESTED_RANGE_NOT_SATISFIABLE)
 from swift.common.storage_policy import (POLICIES, REPL_POLICY, EC_POLICY,
-                                         ECDriverError, PolicyError)
+                                         SLAB_POLICY, ECDriverError,
+                                         PolicyError)
 from swift.proxy.controllers.base import Controller, delay_denial, \
     cors_validation, ResumingGetter
 from swift.common.swob import HTTPAccepted, HTTPBadRequest, HTTPNotFound, \
@@ -240,11 +241,65 @@ class BaseObjectController(Controller):
 
         req.headers['X-Timestamp'] = Timestamp(time.time()).internal
 
+        container_partition, containers = self._get_update_target(
+            req, container_info)
         headers = self._backend_requests(
             req, len(nodes), container_partition, containers,
             delete_at_container, delete_at_part, delete_at_nodes)
         return self._post_object(req, obj_ring, partition, headers)
 
+    def _get_update_shard_range(self, req):
+        """
+        Find the shard range of the object in its sharded container. The
+        container's shard ranges are cached in memcache, as they change
+        rarely once it is sharded.
+
+        :param req: the request
+        :returns: a shard range dict, or None if it could not be found
+        """
+        memcache = getattr(self.app, 'memcache', None) or \
+            req.environ.get('swift.cache')
+        cache_key = 'shard-updating/%s/%s' % (
+            self.account_name, self.container_name)
+        shard_ranges = memcache.get(cache_key) if memcache else None
+        if not shard_ranges:
+            shard_ranges = self._get_shard_ranges(
+                req, self.account_name, self.container_name)
+            if shard_ranges and memcache:
+                memcache.set(cache_key, shard_ranges,
+                             time=self.app.recheck_updating_shard_ranges)
+        obj = self.object_name
+        if isinstance(obj, six.text_type):
+            obj = obj.encode('utf-8')
+        for shard_range in shard_ranges or []:
+            lower = shard_range['lower'].encode('utf-8')
+            upper = shard_range['upper'].encode('utf-8')
+            if lower < obj and (not upper or obj <= upper):
+                return shard_range
+        return None
+
+    def _get_update_target(self, req, container_info):
+        """
+        Returns the partition and nodes of the container that the object
+        servers should send their container updates to. Once the container
+        is sharded that is the shard container whose range holds the object,
+        whose path is passed on to the object servers in the
+        X-Backend-Container-Path header.
+
+        :param req: the request
+        :param container_info: the container info of the object's container
+        :returns: a tuple of (partition, list of node dicts)
+        """
+        if container_info.get('sharding_state') == 'sharded':
+            shard_range = self._get_update_shard_range(req)
+            if shard_range:
+                req.headers['X-Backend-Container-Path'] = shard_range['name']
+                account, container = shard_range['name'].split('/', 1)
+                return self.app.container_ring.get_nodes(account, container)
+        # if the shard range is not known, the sharder moves the update on
+        # from the root container
+        return container_info['partition'], container_info['nodes']
+
     def _backend_requests(self, req, n_outgoing,
                           container_partition, containers,
                           delete_at_container=None, delete_at_partition=None,
@@ -679,6 +734,8 @@ class BaseObjectController(Controller):
             delete_at_nodes = self._config_obj_expiration(req)
 
         # add special headers to be handled by storage nodes
+        container_partition, container_nodes = self._get_update_target(
+            req, container_info)
         outgoing_headers = self._backend_requests(
             req, len(nodes), container_partition, container_nodes,
             delete_at_container, delete_at_part, delete_at_nodes)
@@ -726,6 +783,8 @@ class BaseObjectController(Controller):
         else:
             req.headers['X-Timestamp'] = Timestamp(time.time()).internal
 
+        container_partition, containers = self._get_update_target(
+            req, container_info)
         headers = self._backend_requests(
             req, len(nodes), container_partition, containers)
         return self._delete_object(req, obj_ring, partition, headers)
@@ -739,7 +798,8 @@ class ReplicatedObjectController(BaseObjectController):
             if self.app.concurrent_gets else 1
         resp = self.GETorHEAD_base(
             req, _('Object'), node_iter, partition,
-            req.swift_entity_path, concurrency)
+            req.swift_entity_path, concurrency,
+            hedge=self.app.hedged_gets and concurrency == 1)
         return resp
 
     def _make_putter(self, node, part, req, headers):
@@ -890,6 +950,14 @@ class ReplicatedObjectController(BaseObjectController):
         return resp
 
 
+@ObjectControllerRouter.register(SLAB_POLICY)
+class SlabObjectController(ReplicatedObjectController):
+    """
+    Slab policies only differ from replication policies in how the object
+    servers lay out objects on disk, so requests are handled the same way.
+    """
+
+
 class ECAppIter(object):
     """
     WSGI iterable that decodes EC fragment archives (or portions thereof)
@@ -915,9 +983,13 @@ class ECAppIter(object):
         headers in the GET response from the object server.
 
     :param logger: a logger
+
+    :param coding_depth: the number of segments to decode at a time on
+        native threads, or 0 to decode them inline; see
+        :class:`ECCodingPipeline`
     """
     def __init__(self, path, policy, internal_parts_iters, range_specs,
-                 fa_length, obj_length, logger):
+                 fa_length, obj_length, logger, coding_depth=0):
         self.path = path
         self.policy = policy
         self.internal_parts_iters = internal_parts_iters
@@ -926,6 +998,7 @@ class ECAppIter(object):
         self.obj_length = obj_length if obj_length is not None else 0
         self.boundary = ''
         self.logger = logger
+        self.coding_depth = coding_depth
 
         self.mime_boundary = None
         self.learned_content_type = None
@@ -1242,6 +1315,49 @@ class ECAppIter(object):
 
             yield next_seg
 
+    def _concat_data_fragments(self, fragments):
+        """
+        Read a segment back from the data fragments of a systematic erasure
+        code by concatenating their payloads.
+
+        :param fragments: a list of ec_ndata fragments of one segment
+        :returns: the segment, or None if the fragments are not exactly the
+                  segment's data fragments and it has to be decoded
+        """
+        driver = self.policy.pyeclib_driver
+        payloads = [None] * self.policy.ec_ndata
+        orig_data_size = None
+        for fragment in fragments:
+            metadata = driver.get_metadata(fragment, formatted=True)
+            index = metadata['index']
+            if not 0 <= index < len(payloads) or payloads[index] is not None:
+                return None
+            if metadata.get('frag_backend_metadata_size'):
+                return None
+            if orig_data_size is None:
+                orig_data_size = metadata['orig_data_size']
+            elif metadata['orig_data_size'] != orig_data_size:
+                return None
+            size = metadata['size']
+            payloads[index] = fragment[len(fragment) - size:] if size else ''
+        if None in payloads:
+            return None
+        segment = ''.join(payloads)
+        if len(segment) < orig_data_size:
+            return None
+        return segment[:orig_data_size]
+
+    def _decode_fragments(self, fragments):
+        if self.policy.ec_systematic:
+            try:
+                segment = self._concat_data_fragments(fragments)
+            except ECDriverError:
+                # let decode have its say about the bad fragment
+                segment = None
+            if segment is not None:
+                return segment
+        return self.policy.pyeclib_driver.decode(fragments)
+
     def _decode_segments_from_fragments(self, fragment_iters):
         # Decodes the fragments from the object servers and yields one
         # segment at a time.
@@ -1268,6 +1384,9 @@ class ECAppIter(object):
                 queue.put(None)
                 frag_iter.close()
 
+        pipeline = ECCodingPipeline(self.coding_depth)
+        decode = self._decode_fragments
+
         with ContextPool(len(fragment_iters)) as pool:
             for frag_iter, queue in zip(fragment_iters, queues):
                 pool.spawn(put_fragments_in_queue, frag_iter, queue)
@@ -1288,12 +1407,22 @@ class ECAppIter(object):
                 if not all(fragments):
                     break
                 try:
-                    segment = self.policy.pyeclib_driver.decode(fragments)
+                    segments = pipeline.submit(decode, fragments)
                 except ECDriverError:
                     self.logger.exception("Error decoding fragments for %r" %
                                           self.path)
                     raise
 
+                for segment in segments:
+                    yield segment
+
+            try:
+                segments = pipeline.drain()
+            except ECDriverError:
+                self.logger.exception("Error decoding fragments for %r" %
+                                      self.path)
+                raise
+            for segment in segments:
                 yield segment
 
     def app_iter_range(self, start, end):
@@ -1747,8 +1876,110 @@ class MIMEPutter(Putter):
                    mime_boundary, multiphase=need_multiphase)
 
 
-def chunk_transformer(policy, nstreams):
+def _call_catching(func, *args):
+    # run on a tpool thread; the exception, if any, is raised again by the
+    # greenthread waiting for the result rather than escaping from the one
+    # that made the call
+    try:
+        return func(*args), None
+    except BaseException as err:
+        return None, err
+
+
+class ECCodingPipeline(object):
+    """
+    Runs the erasure code encode or decode calls of one request and hands
+    back their results in the order the calls were made. With a non-zero
+    depth the calls run on native threads (eventlet's tpool, sized by the
+    proxy's ec_coding_threads), so that coding a large object does not hold
+    up the other greenthreads in the worker.
+
+    At most depth calls are in progress at a time. Submitting another first
+    waits for the oldest to finish, so a request gets no more than depth
+    segments ahead of its client or of the object servers.
+
+    :param depth: the most calls in progress at a time, or 0 to make each
+                  call inline as it is submitted
+    """
+
+    def __init__(self, depth=0):
+        self.depth = depth
+        self._pending = collections.deque()
+
+    def submit(self, func, *args):
+        """
+        Start a call of func(*args).
+
+        :returns: a list of the results of the calls that have finished and
+                  are next in order, possibly empty
+        """
+        if not self.depth:
+            return [func(*args)]
+        results = []
+        while len(self._pending) >= self.depth:
+            results.append(self._wait_oldest())
+        self._pending.append(spawn(tpool.execute, _call_catching, func, *args))
+        while self._pending and self._pending[0].dead:
+            results.append(self._wait_oldest())
+        return results
+
+    def _wait_oldest(self):
+        result, err = self._pending.popleft().wait()
+        if err is not None:
+            raise err
+        return result
+
+    def drain(self):
+        """
+        Wait for the calls in progress.
+
+        :returns: a list of their results, in order
+        """
+        results = []
+        while self._pending:
+            results.append(self._wait_oldest())
+        return results
+
+
+def encode_segments(policy, segments):
+    """
+    Erasure code segments of an object.
+
+    :param policy: the EC storage policy of the object
+    :param segments: a list of consecutive segments
+    :returns: a list of the data for each fragment archive
+    """
+    frags_by_byte_order = []
+    for segment in segments:
+        frags_by_byte_order.append(policy.pyeclib_driver.encode(segment))
+    # Sequential calls to encode() have given us a list that
+    # looks like this:
+    #
+    # [[frag_A1, frag_B1, frag_C1, ...],
+    #  [frag_A2, frag_B2, frag_C2, ...], ...]
+    #
+    # What we need is a list like this:
+    #
+    # [(frag_A1 + frag_A2 + ...),  # destined for node A
+    #  (frag_B1 + frag_B2 + ...),  # destined for node B
+    #  (frag_C1 + frag_C2 + ...),  # destined for node C
+    #  ...]
+    return [''.join(frags) for frags in zip(*frags_by_byte_order)]
+
+
+def chunk_transformer(policy, nstreams, coding_depth=0):
+    """
+    A coroutine that is sent the chunks of an object as they arrive from the
+    client, and an empty chunk at the end, and erasure codes them a segment
+    at a time.
+
+    For each chunk it yields a list of the data for each fragment archive
+    that is ready to send, one entry per batch of segments coded; see
+    :class:`ECCodingPipeline`. For the empty chunk it yields whatever is
+    left.
+    """
     segment_size = policy.ec_segment_size
+    pipeline = ECCodingPipeline(coding_depth)
 
     buf = collections.deque()
     total_buf_len = 0
@@ -1773,37 +2004,20 @@ def chunk_transformer(policy, nstreams):
                     total_buf_len -= len(piece)
                 chunks_to_encode.append(''.join(pieces))
 
-            frags_by_byte_order = []
-            for chunk_to_encode in chunks_to_encode:
-                frags_by_byte_order.append(
-                    policy.pyeclib_driver.encode(chunk_to_encode))
-            # Sequential calls to encode() have given us a list that
-            # looks like this:
-            #
-            # [[frag_A1, frag_B1, frag_C1, ...],
-            #  [frag_A2, frag_B2, frag_C2, ...], ...]
-            #
-            # What we need is a list like this:
-            #
-            # [(frag_A1 + frag_A2 + ...),  # destined for node A
-            #  (frag_B1 + frag_B2 + ...),  # destined for node B
-            #  (frag_C1 + frag_C2 + ...),  # destined for node C
-            #  ...]
-            obj_data = [''.join(frags)
-                        for frags in zip(*frags_by_byte_order)]
-            chunk = yield obj_data
+            chunk = yield pipeline.submit(
+                encode_segments, policy, chunks_to_encode)
         else:
             # didn't have enough data to encode
-            chunk = yield None
+            chunk = yield []
 
     # Now we've gotten an empty chunk, which indicates end-of-input.
     # Take any leftover bytes and encode them.
     last_bytes = ''.join(buf)
+    obj_data = []
     if last_bytes:
-        last_frags = policy.pyeclib_driver.encode(last_bytes)
-        yield last_frags
-    else:
-        yield [''] * nstreams
+        obj_data = pipeline.submit(encode_segments, policy, [last_bytes])
+    obj_data.extend(pipeline.drain())
+    yield obj_data or [[''] * nstreams]
 
 
 def trailing_metadata(policy, client_obj_hasher,
@@ -1921,6 +2135,11 @@ class ECObjectController(BaseObjectController):
                 orig_range = req.range
                 range_specs = self._convert_range(req, policy)
 
+            if policy.ec_systematic:
+                # ask the primaries that hold data fragments first; if they
+                # all answer, the segments need no decoding
+                self._prefer_data_fragments(node_iter, policy)
+
             safe_iter = GreenthreadSafeIterator(node_iter)
             # Sending the request concurrently to all nodes, and responding
             # with the first response isn't something useful for EC as all
@@ -1976,7 +2195,7 @@ class ECObjectController(BaseObjectController):
                     policy,
                     [iterator for getter, iterator in etag_buckets[best_etag]],
                     range_specs, fa_length, obj_length,
-                    self.app.logger)
+                    self.app.logger, coding_depth=self.app.ec_pipeline_depth)
                 resp = Response(
                     request=req,
                     headers=resp_headers,
@@ -2004,6 +2223,17 @@ class ECObjectController(BaseObjectController):
         self._fix_response(req, resp)
         return resp
 
+    def _prefer_data_fragments(self, node_iter, policy):
+        """
+        Move the primary nodes that hold data fragments ahead of those that
+        hold parity fragments, keeping the order of each.
+        """
+        primary_nodes = getattr(node_iter, 'primary_nodes', None)
+        if not primary_nodes:
+            return
+        primary_nodes.sort(
+            key=lambda node: node.get('index', 0) >= policy.ec_ndata)
+
     def _fix_response(self, req, resp):
         # EC fragment archives each have different bytes, hence different
         # etags. However, they all have the original object's etag stored in
@@ -2073,7 +2303,8 @@ class ECObjectController(BaseObjectController):
         This method was added in the PUT method extraction change
         """
         bytes_transferred = 0
-        chunk_transform = chunk_transformer(policy, len(nodes))
+        chunk_transform = chunk_transformer(
+            policy, len(nodes), coding_depth=self.app.ec_pipeline_depth)
         chunk_transform.send(None)
         chunk_hashers = collections.defaultdict(md5)
 
@@ -2087,21 +2318,23 @@ class ECObjectController(BaseObjectController):
             # object server.
             if etag_hasher:
                 etag_hasher.update(chunk)
-            backend_chunks = chunk_transform.send(chunk)
-            if backend_chunks is None:
+            ready_chunks = chunk_transform.send(chunk)
+            if not ready_chunks:
                 # If there's not enough bytes buffered for erasure-encoding
-                # or whatever we're doing, the transform will give us None.
+                # or whatever we're doing, the transform will give us
+                # nothing.
                 return
 
-            for putter in list(putters):
-                ci = chunk_index[putter]
-                backend_chunk = backend_chunks[ci]
-                if not putter.failed:
-                    chunk_hashers[ci].update(backend_chunk)
-                    putter.send_chunk(backend_chunk)
-                else:
-                    putter.close()
-                    putters.remove(putter)
+            for backend_chunks in ready_chunks:
+                for putter in list(putters):
+                    ci = chunk_index[putter]
+                    backend_chunk = backend_chunks[ci]
+                    if not putter.failed:
+                        chunk_hashers[ci].update(backend_chunk)
+                        putter.send_chunk(backend_chunk)
+                    else:
+                        putter.close()
+                        putters.remove(putter)
             self._check_min_conn(
                 req, putters, min_conns,
                 msg=_('Object PUT exceptions during send, '
@@ -14,19 +14,20 @@
 # limitations under the License.
 
 import mimetypes
+from collections import deque
 import os
 import socket
 from swift import gettext_ as _
-from random import shuffle
+from random import sample, shuffle
 from time import time
 import functools
 import sys
 
-from eventlet import Timeout
+from eventlet import Timeout, tpool
 import six
 
 from swift import __canonical_version__ as swift_version
-from swift.common import constraints
+from swift.common import bufferedhttp, constraints
 from swift.common.storage_policy import POLICIES
 from swift.common.ring import Ring
 from swift.common.utils import cache_from_env, get_logger, \
@@ -37,13 +38,21 @@ from swift.common.constraints import check_utf8, valid_api_version
 from swift.proxy.controllers import AccountController, ContainerController, \
     ObjectControllerRouter, InfoController
 from swift.proxy.controllers.base import get_container_info, NodeIter, \
-    DEFAULT_RECHECK_CONTAINER_EXISTENCE, DEFAULT_RECHECK_ACCOUNT_EXISTENCE
+    DEFAULT_RECHECK_CONTAINER_EXISTENCE, DEFAULT_RECHECK_ACCOUNT_EXISTENCE, \
+    DEFAULT_RECHECK_UPDATING_SHARD_RANGES
 from swift.common.swob import HTTPBadRequest, HTTPForbidden, \
     HTTPMethodNotAllowed, HTTPNotFound, HTTPPreconditionFailed, \
     HTTPServerError, HTTPException, Request, HTTPServiceUnavailable
 from swift.common.exceptions import APIVersionError
 
 
+# Number of recent response times kept per policy and device for hedged
+# GETs, and the number needed before a hedge timeout is worked out from them.
+HEDGE_SAMPLES = 100
+HEDGE_MIN_SAMPLES = 10
+# Most hedges that can be saved up from the hedge budget.
+HEDGE_BURST = 10
+
 # List of entry points for mandatory middlewares.
 #
 # Fields:
@@ -112,6 +121,9 @@ class Application(object):
         self.recheck_account_existence = \
             int(conf.get('recheck_account_existence',
                          DEFAULT_RECHECK_ACCOUNT_EXISTENCE))
+        self.recheck_updating_shard_ranges = \
+            int(conf.get('recheck_updating_shard_ranges',
+                         DEFAULT_RECHECK_UPDATING_SHARD_RANGES))
         self.allow_account_management = \
             config_true_value(conf.get('allow_account_management', 'no'))
         self.container_ring = container_ring or Ring(swift_dir,
@@ -152,10 +164,31 @@ class Application(object):
         self.node_timings = {}
         self.timing_expiry = int(conf.get('timing_expiry', 300))
         self.sorting_method = conf.get('sorting_method', 'shuffle').lower()
+        self.node_latency = {}
+        self.latency_decay = float(conf.get('latency_decay', 0.3))
         self.concurrent_gets = \
             config_true_value(conf.get('concurrent_gets'))
         self.concurrency_timeout = float(conf.get('concurrency_timeout',
                                                   self.conn_timeout))
+        self.ec_coding_threads = int(conf.get('ec_coding_threads', 0))
+        if self.ec_coding_threads > 0:
+            tpool.set_num_threads(self.ec_coding_threads)
+            self.ec_pipeline_depth = int(conf.get('ec_pipeline_depth', 2))
+        else:
+            self.ec_pipeline_depth = 0
+        self.hedged_gets = config_true_value(conf.get('hedged_gets'))
+        self.hedge_percentile = float(conf.get('hedge_percentile', 95))
+        self.hedge_budget = float(conf.get('hedge_budget', 0.05))
+        self._hedge_response_times = {}
+        self._hedge_tokens = 0.0
+        self.backend_keepalive = config_true_value(
+            conf.get('backend_keepalive', 'false'))
+        if self.backend_keepalive:
+            bufferedhttp.set_connection_pool(bufferedhttp.ConnectionPool(
+                max_idle_per_node=int(
+                    conf.get('backend_max_idle_per_node', 8)),
+                idle_timeout=float(conf.get('backend_idle_timeout', 10)),
+                logger=self.logger))
         value = conf.get('request_node_count', '2 * replicas').lower().split()
         if len(value) == 1:
             rnc_value = int(value[0])
@@ -426,7 +459,9 @@ class Application(object):
         Sorts nodes in-place (and returns the sorted list) according to
         the configured strategy. The default "sorting" is to randomly
         shuffle the nodes. If the "timing" strategy is chosen, the nodes
-        are sorted according to the stored timing data.
+        are sorted according to the stored timing data. If the "latency"
+        strategy is chosen, each node in turn is the better scoring of two
+        randomly chosen from those remaining; see :func:`node_latency_score`.
         '''
         # In the case of timing sorting, shuffling ensures that close timings
         # (ie within the rounding resolution) won't prefer one over another.
@@ -441,15 +476,150 @@ class Application(object):
             nodes.sort(key=key_func)
         elif self.sorting_method == 'affinity':
             nodes.sort(key=self.read_affinity_sort_key)
+        elif self.sorting_method == 'latency':
+            now = time()
+            scored = [(self.node_latency_score(node, now), node)
+                      for node in nodes]
+            sorted_nodes = []
+            while len(scored) > 1:
+                # power of two choices: the best of two random nodes goes
+                # next, so the fastest node is not sent every request
+                i, j = sample(range(len(scored)), 2)
+                sorted_nodes.append(scored.pop(
+                    i if scored[i][0] <= scored[j][0] else j)[1])
+            sorted_nodes.extend(node for _junk, node in scored)
+            nodes[:] = sorted_nodes
         return nodes
 
+    def node_latency_score(self, node, now=None):
+        """
+        Returns the score of a node for the "latency" sorting_method; lower
+        is better. The score is the node's moving average response time plus
+        its moving average error rate times node_timeout, so that a node that
+        fails half its requests scores as if it took node_timeout / 2 longer
+        to respond. Nodes with no measurements newer than timing_expiry score
+        0 so that they are tried again.
+
+        :param node: dictionary of node to score
+        :param now: the current time, defaults to time()
+        """
+        stats = self.node_latency.get(self._error_limit_node_key(node))
+        if now is None:
+            now = time()
+        if stats is None or stats['updated'] + self.timing_expiry <= now:
+            return 0.0
+        return stats['latency'] + stats['error_rate'] * self.node_timeout
+
+    def _update_node_latency(self, node, timing=None):
+        """
+        Fold a response time, or an error if timing is None, into the moving
+        averages kept for the "latency" sorting_method.
+        """
+        if self.sorting_method != 'latency':
+            return
+        node_key = self._error_limit_node_key(node)
+        stats = self.node_latency.get(node_key)
+        error = 0.0 if timing is not None else 1.0
+        if stats is None:
+            stats = self.node_latency[node_key] = {
+                'latency': timing or 0.0, 'error_rate': error}
+        else:
+            decay = self.latency_decay
+            if timing is not None:
+                stats['latency'] += decay * (timing - stats['latency'])
+            stats['error_rate'] += decay * (error - stats['error_rate'])
+        stats['updated'] = time()
+
+    def get_node_latency_info(self):
+        """
+        Returns the moving averages and score of each node with current
+        measurements for the "latency" sorting_method, keyed by
+        ip:port/device. The measurements are those of this worker only.
+        """
+        now = time()
+        info = {}
+        for node_key, stats in self.node_latency.items():
+            if stats['updated'] + self.timing_expiry <= now:
+                continue
+            info[node_key] = {
+                'latency': round(stats['latency'], 6),
+                'error_rate': round(stats['error_rate'], 6),
+                'score': round(stats['latency'] + stats['error_rate'] *
+                               self.node_timeout, 6),
+                'age': round(now - stats['updated'], 3)}
+        return info
+
     def set_node_timing(self, node, timing):
+        if self.sorting_method == 'latency':
+            self._update_node_latency(node, timing)
+            return
         if self.sorting_method != 'timing':
             return
         now = time()
         timing = round(timing, 3)  # sort timings to the millisecond
         self.node_timings[node['ip']] = (timing, now + self.timing_expiry)
 
+    def record_response_time(self, policy_index, node, timing,
+                             chunk_read=False):
+        """
+        Record how long a node took to respond to a request made for a
+        hedged GET, or to a chunk read of its response, for working out its
+        hedge timeouts.
+
+        :param policy_index: the storage policy index of the request
+        :param node: dictionary of the node
+        :param timing: seconds from sending the request to getting the
+                       response headers, or from starting a chunk read to
+                       finishing it, or to giving up on it
+        :param chunk_read: True if timing is of a chunk read
+        """
+        key = (policy_index, self._error_limit_node_key(node), chunk_read)
+        samples = self._hedge_response_times.get(key)
+        if samples is None:
+            samples = self._hedge_response_times[key] = deque(
+                maxlen=HEDGE_SAMPLES)
+        samples.append(timing)
+
+    def get_hedge_timeout(self, policy_index, node, chunk_read=False):
+        """
+        Returns the hedge_percentile of a node's recent response times, or
+        chunk read times, for a storage policy; a hedged GET asks another
+        node too if this one has not answered, or finished a chunk read, in
+        that time. Returns None if too few times have been recorded yet.
+
+        :param policy_index: the storage policy index of the request
+        :param node: dictionary of the node
+        :param chunk_read: True for the timeout of a chunk read
+        """
+        samples = self._hedge_response_times.get(
+            (policy_index, self._error_limit_node_key(node), chunk_read))
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        samples = sorted(samples)
+        index = int(len(samples) * self.hedge_percentile / 100.0)
+        return samples[min(index, len(samples) - 1)]
+
+    def add_hedge_budget(self):
+        """
+        Called for each hedged GET, adding hedge_budget extra requests to the
+        budget that :func:`take_hedge` draws from.
+        """
+        self._hedge_tokens = min(self._hedge_tokens + self.hedge_budget,
+                                 HEDGE_BURST)
+
+    def take_hedge(self):
+        """
+        Take one extra request from the hedge budget.
+
+        :returns: True if the budget allows another request, False otherwise
+        """
+        if self._hedge_tokens < 1:
+            self.logger.increment('hedge.budget_exhausted')
+            return False
+        self._hedge_tokens -= 1
+        self.logger.increment('hedge.sent')
+        return True
+
     def _error_limit_node_key(self, node):
         return "{ip}:{port}/{device}".format(**node)
 
@@ -495,6 +665,7 @@ class Application(object):
                           'port': node['port'], 'device': node['device']})
 
     def _incr_node_errors(self, node):
+        self._update_node_latency(node)
         node_key = self._error_limit_node_key(node)
         error_stats = self._error_limiting.setdefault(node_key, {})
         error_stats['errors'] = error_stats.get('errors', 0) + 1
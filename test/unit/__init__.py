@@ -367,6 +367,24 @@ def readuntil2crlfs(fd):
     return rv
 
 
+def read_chunked_body(fd):
+    """
+    Read the rest of a response body sent with chunked transfer-encoding,
+    as account and container listings are.
+    """
+    body = ''
+    while True:
+        line = fd.readline()
+        if not line:
+            # there was no body
+            return body
+        size = int(line.split(';')[0], 16)
+        if not size:
+            return body
+        body += fd.read(size)
+        fd.readline()
+
+
 def connect_tcp(hostport):
     rv = socket.socket()
     rv.connect(hostport)
@@ -409,9 +427,18 @@ def _getxattr(fd, k):
         raise IOError(errno.ENODATA, "Fake IOError")
     return data
 
+
+def _removexattr(fd, k):
+    inode = _get_inode(fd)
+    data = xattr_data.get(inode, {})
+    if k not in data:
+        raise IOError(errno.ENODATA, "Fake IOError")
+    del data[k]
+
 import xattr
 xattr.setxattr = _setxattr
 xattr.getxattr = _getxattr
+xattr.removexattr = _removexattr
 
 
 @contextmanager
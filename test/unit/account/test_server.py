@@ -329,6 +329,37 @@ class TestAccountController(unittest.TestCase):
         resp = req.get_response(self.controller)
         self.assertEqual(resp.status_int, 202)
 
+    def test_async_commits(self):
+        self.assertIsNone(self.controller.committer)
+        self.controller = AccountController(
+            {'devices': self.testdir, 'mount_check': 'false',
+             'async_commits': 'true', 'async_commit_interval': '0',
+             'recon_cache_path': self.testdir})
+        committer = self.controller.committer
+        self.assertEqual(os.path.join(self.testdir, 'account.recon'),
+                         committer.rcache)
+        self.assertEqual('account_db_committer', committer.recon_key)
+        req = Request.blank('/sda1/p/a', method='PUT',
+                            headers={'X-Timestamp': '1'})
+        self.assertEqual(201, req.get_response(self.controller).status_int)
+        with mock.patch('swift.common.db.spawn'):
+            req = Request.blank(
+                '/sda1/p/a/c', method='PUT', headers={
+                    'X-Put-Timestamp': '2', 'X-Delete-Timestamp': '0',
+                    'X-Object-Count': '3', 'X-Bytes-Used': '4'})
+            self.assertEqual(201,
+                             req.get_response(self.controller).status_int)
+        broker = self.controller._get_account_broker('sda1', 'p', 'a')
+        self.assertIs(committer, broker.committer)
+        self.assertEqual([broker.db_file], list(committer._waiting))
+        committer.commit_due()
+        self.assertEqual({}, committer._waiting)
+        self.assertEqual(1, committer.get_stats()['commits'])
+        req = Request.blank('/sda1/p/a', method='HEAD')
+        resp = req.get_response(self.controller)
+        self.assertEqual('1', resp.headers['X-Account-Container-Count'])
+        self.assertEqual('3', resp.headers['X-Account-Object-Count'])
+
     def test_PUT_simulated_create_race(self):
         state = ['initial']
 
@@ -807,6 +838,28 @@ class TestAccountController(unittest.TestCase):
         self.assertEqual(resp.content_type, 'text/plain')
         self.assertEqual(resp.charset, 'utf-8')
 
+    def test_GET_listing_is_encoded_as_it_is_sent(self):
+        req = Request.blank('/sda1/p/a', environ={'REQUEST_METHOD': 'PUT',
+                                                  'HTTP_X_TIMESTAMP': '0'})
+        req.get_response(self.controller)
+        for i in range(3):
+            req = Request.blank(
+                '/sda1/p/a/c%d' % i, environ={'REQUEST_METHOD': 'PUT'},
+                headers={'X-Put-Timestamp': '1',
+                         'X-Delete-Timestamp': '0',
+                         'X-Object-Count': '0',
+                         'X-Bytes-Used': '0',
+                         'X-Timestamp': normalize_timestamp(0)})
+            req.get_response(self.controller)
+        for format in ('json', 'xml', 'plain'):
+            req = Request.blank('/sda1/p/a?format=%s' % format,
+                                environ={'REQUEST_METHOD': 'GET'})
+            resp = req.get_response(self.controller)
+            self.assertEqual(resp.status_int, 200)
+            self.assertNotIsInstance(resp.app_iter, list)
+            self.assertNotIn('Content-Length', resp.headers)
+            self.assertIn('c2', resp.body)
+
     def test_GET_with_containers_json(self):
         req = Request.blank('/sda1/p/a', environ={'REQUEST_METHOD': 'PUT',
                                                   'HTTP_X_TIMESTAMP': '0'})
@@ -21,7 +21,7 @@ import mock
 from six.moves.configparser import NoSectionError, NoOptionError
 
 from swift.common.middleware import memcache
-from swift.common.memcached import MemcacheRing
+from swift.common.memcached import MemcacheRing, PipelinedMemcacheRing
 from swift.common.swob import Request
 from swift.common.wsgi import loadapp
 
@@ -107,6 +107,56 @@ class TestCacheMiddleware(unittest.TestCase):
         self.assertTrue('swift.cache' in resp)
         self.assertTrue(isinstance(resp['swift.cache'], MemcacheRing))
 
+    def test_info_cache(self):
+        req = Request.blank('/something', environ={'REQUEST_METHOD': 'GET'})
+        resp = self.app(req.environ, start_response)
+        self.assertNotIn('swift.worker_infocache', resp)
+
+        app = memcache.MemcacheMiddleware(FakeApp(), {
+            'info_cache_size': '100', 'info_cache_ttl': '2.5',
+            'info_cache_negative_ttl': '0.5'})
+        info_cache = app.info_cache
+        self.assertEqual(100, info_cache.max_size)
+        self.assertEqual(2.5, info_cache.ttl)
+        self.assertEqual(0.5, info_cache.negative_ttl)
+        # shared by every request
+        for _junk in range(2):
+            req = Request.blank('/something')
+            resp = app(req.environ, start_response)
+            self.assertIs(info_cache, resp['swift.worker_infocache'])
+
+    def test_prefetch_info(self):
+        app = memcache.MemcacheMiddleware(FakeApp(), {})
+        fake_memcache = mock.MagicMock()
+        fake_memcache.get_many.return_value = {
+            'account/a': {'status': 200}}
+        app.memcache = fake_memcache
+
+        req = Request.blank('/v1/a/c/o')
+        env = app(req.environ, start_response)
+        fake_memcache.get_many.assert_called_once_with(
+            ['account/a', 'container/a/c'])
+        self.assertEqual({'account/a': {'status': 200}},
+                         env['swift.infocache'])
+        self.assertEqual(set(['container/a/c']),
+                         env['swift.infocache_prefetch_misses'])
+        self.assertIs(fake_memcache.start_request_stats.return_value,
+                      env['swift.memcache_stats'])
+
+        # nothing to prefetch for accounts or requests outside the API
+        fake_memcache.reset_mock()
+        for path in ('/v1/a', '/info', '/auth/v1.0/c/o', '/v2/a/c'):
+            req = Request.blank(path)
+            app(req.environ, start_response)
+        self.assertFalse(fake_memcache.get_many.called)
+
+        app = memcache.MemcacheMiddleware(FakeApp(), {
+            'prefetch_info': 'false'})
+        app.memcache = fake_memcache
+        req = Request.blank('/v1/a/c/o')
+        app(req.environ, start_response)
+        self.assertFalse(fake_memcache.get_many.called)
+
     def test_conf_default_read(self):
         orig_parser = memcache.ConfigParser
         memcache.ConfigParser = ExcConfigParser
@@ -179,6 +229,41 @@ class TestCacheMiddleware(unittest.TestCase):
         self.assertEqual(
             app.memcache._client_cache['6.7.8.9:10'].max_size, 5)
 
+    def test_conf_protocol(self):
+        orig_parser = memcache.ConfigParser
+        memcache.ConfigParser = get_config_parser()
+        try:
+            app = memcache.MemcacheMiddleware(FakeApp(), {})
+            self.assertIs(type(app.memcache), MemcacheRing)
+            app = memcache.MemcacheMiddleware(
+                FakeApp(), {'memcache_servers': '6.7.8.9:10',
+                            'protocol': 'Binary'})
+            self.assertIs(type(app.memcache), PipelinedMemcacheRing)
+            self.assertEqual(list(app.memcache._connect_locks),
+                             ['6.7.8.9:10'])
+            with self.assertRaises(ValueError):
+                memcache.MemcacheMiddleware(FakeApp(), {'protocol': 'meta'})
+        finally:
+            memcache.ConfigParser = orig_parser
+
+    def test_conf_value_codec(self):
+        orig_parser = memcache.ConfigParser
+        memcache.ConfigParser = get_config_parser()
+        try:
+            app = memcache.MemcacheMiddleware(FakeApp(), {})
+            self.assertEqual(app.memcache._value_codec, 'json')
+            self.assertEqual(app.memcache._compress_threshold, 0)
+            self.assertIsNotNone(app.memcache.logger)
+            app = memcache.MemcacheMiddleware(
+                FakeApp(), {'value_codec': 'compact_json',
+                            'compress_threshold': '1024'})
+            self.assertEqual(app.memcache._value_codec, 'compact_json')
+            self.assertEqual(app.memcache._compress_threshold, 1024)
+            with self.assertRaises(ValueError):
+                memcache.MemcacheMiddleware(FakeApp(), {'value_codec': 'xml'})
+        finally:
+            memcache.ConfigParser = orig_parser
+
     def test_conf_extra_no_section(self):
         orig_parser = memcache.ConfigParser
         memcache.ConfigParser = get_config_parser(section='foobar')
@@ -803,6 +803,26 @@ class TestProxyLogging(unittest.TestCase):
         log_parts = self._log_parts(app)
         self.assertEqual(log_parts[17], 'one%2Cand%20two')
 
+    def test_log_info_memcache_round_trips(self):
+        app = proxy_logging.ProxyLoggingMiddleware(FakeApp(), {})
+        app.access_logger = FakeLogger()
+        req = Request.blank('/', environ={'REQUEST_METHOD': 'GET'})
+        req.environ['swift.log_info'] = ['one']
+        req.environ['swift.memcache_stats'] = {'round_trips': 3}
+        list(app(req.environ, start_response))
+        log_parts = self._log_parts(app)
+        self.assertEqual(log_parts[17], 'one%2Cmemcache_round_trips%3D3')
+        # without disturbing anyone else's log info
+        self.assertEqual(['one'], req.environ['swift.log_info'])
+
+        app = proxy_logging.ProxyLoggingMiddleware(FakeApp(), {})
+        app.access_logger = FakeLogger()
+        req = Request.blank('/', environ={'REQUEST_METHOD': 'GET'})
+        req.environ['swift.memcache_stats'] = {'round_trips': 0}
+        list(app(req.environ, start_response))
+        log_parts = self._log_parts(app)
+        self.assertEqual(log_parts[17], '-')
+
     def test_log_auth_token(self):
         auth_token = 'b05bf940-0464-4c0e-8c70-87717d2d73e8'
 
@@ -192,6 +192,16 @@ class FakeRecon(object):
     def fake_driveaudit(self):
         return {'driveaudittest': "1"}
 
+    def fake_diskreads(self):
+        return {'diskreadstest': "1"}
+
+    def fake_sharding(self):
+        return {'shardingtest': "1"}
+
+    def fake_committer(self, recon_type):
+        self.fake_committer_rtype = recon_type
+        return {'committertest': "1"}
+
     def fake_time(self):
         return {'timetest': "1"}
 
@@ -645,13 +655,26 @@ class TestReconSuccess(TestCase):
         self.assertEqual(rv, meminfo_resp)
 
     def test_get_async_info(self):
-        from_cache_response = {'async_pending': 5}
+        from_cache_response = {
+            'async_pending': 5,
+            'async_spool': {'sda1': {'async_spool-1': {
+                'updates': 3, 'bytes': 1024, 'files': 2}}}}
         self.fakecache.fakeout = from_cache_response
         rv = self.app.get_async_info()
         self.assertEqual(self.fakecache.fakeout_calls,
-                         [((['async_pending'],
+                         [((['async_pending', 'async_spool'],
+                             '/var/cache/swift/object.recon'), {})])
+        self.assertEqual(rv, from_cache_response)
+
+    def test_get_disk_read_info(self):
+        from_cache_response = {'object_threaded_reads': {
+            '1234': {'updated': 1.0, 'devices': {'sda1': {'reads': 3}}}}}
+        self.fakecache.fakeout = from_cache_response
+        rv = self.app.get_disk_read_info()
+        self.assertEqual(self.fakecache.fakeout_calls,
+                         [((['object_threaded_reads'],
                              '/var/cache/swift/object.recon'), {})])
-        self.assertEqual(rv, {'async_pending': 5})
+        self.assertEqual(rv, from_cache_response)
 
     def test_get_replication_info_account(self):
         from_cache_response = {
@@ -801,6 +824,34 @@ class TestReconSuccess(TestCase):
                             '/var/cache/swift/object.recon'), {})])
         self.assertEqual(rv, from_cache_response)
 
+    def test_get_committer_info(self):
+        from_cache_response = {'container_db_committer': {
+            '1234': {'commits': 3, 'max_lag': 0.5}}}
+        self.fakecache.fakeout_calls = []
+        self.fakecache.fakeout = from_cache_response
+        rv = self.app.get_committer_info('container')
+        self.assertEqual(self.fakecache.fakeout_calls,
+                         [((['container_db_committer'],
+                            '/var/cache/swift/container.recon'), {})])
+        self.assertEqual(rv, from_cache_response)
+        self.fakecache.fakeout_calls = []
+        self.app.get_committer_info('account')
+        self.assertEqual(self.fakecache.fakeout_calls,
+                         [((['account_db_committer'],
+                            '/var/cache/swift/account.recon'), {})])
+        self.assertIsNone(self.app.get_committer_info('object'))
+
+    def test_get_sharding_info(self):
+        from_cache_response = {'sharding_stats': {'planned': 1, 'moved': 9},
+                               'sharding_pass_completed': 0.5}
+        self.fakecache.fakeout_calls = []
+        self.fakecache.fakeout = from_cache_response
+        rv = self.app.get_sharding_info()
+        self.assertEqual(self.fakecache.fakeout_calls,
+                         [((['sharding_stats', 'sharding_pass_completed'],
+                            '/var/cache/swift/container.recon'), {})])
+        self.assertEqual(rv, from_cache_response)
+
     def test_get_auditor_info_account(self):
         from_cache_response = {"account_auditor_pass_completed": 0.24,
                                "account_audits_failed": 0,
@@ -1140,6 +1191,9 @@ class TestReconMiddleware(unittest.TestCase):
         self.app.get_quarantine_count = self.frecon.fake_quarantined
         self.app.get_socket_info = self.frecon.fake_sockstat
         self.app.get_driveaudit_error = self.frecon.fake_driveaudit
+        self.app.get_disk_read_info = self.frecon.fake_diskreads
+        self.app.get_sharding_info = self.frecon.fake_sharding
+        self.app.get_committer_info = self.frecon.fake_committer
         self.app.get_time = self.frecon.fake_time
 
     def test_recon_get_mem(self):
@@ -1375,6 +1429,33 @@ class TestReconMiddleware(unittest.TestCase):
         resp = self.app(req.environ, start_response)
         self.assertEqual(resp, get_driveaudit_resp)
 
+    def test_recon_get_diskreads(self):
+        get_diskreads_resp = ['{"diskreadstest": "1"}']
+        req = Request.blank('/recon/diskreads',
+                            environ={'REQUEST_METHOD': 'GET'})
+        resp = self.app(req.environ, start_response)
+        self.assertEqual(resp, get_diskreads_resp)
+
+    def test_recon_get_committer(self):
+        get_committer_resp = ['{"committertest": "1"}']
+        for recon_type in ('account', 'container'):
+            req = Request.blank('/recon/committer/%s' % recon_type,
+                                environ={'REQUEST_METHOD': 'GET'})
+            resp = self.app(req.environ, start_response)
+            self.assertEqual(resp, get_committer_resp)
+            self.assertEqual(self.frecon.fake_committer_rtype, recon_type)
+        req = Request.blank('/recon/committer/object',
+                            environ={'REQUEST_METHOD': 'GET'})
+        resp = self.app(req.environ, start_response)
+        self.assertEqual(resp, ['Invalid path: /recon/committer/object'])
+
+    def test_recon_get_sharding(self):
+        get_sharding_resp = ['{"shardingtest": "1"}']
+        req = Request.blank('/recon/sharding',
+                            environ={'REQUEST_METHOD': 'GET'})
+        resp = self.app(req.environ, start_response)
+        self.assertEqual(resp, get_sharding_resp)
+
     def test_recon_get_time(self):
         get_time_resp = ['{"timetest": "1"}']
         req = Request.blank('/recon/time',
@@ -882,6 +882,83 @@ class TestRing(TestRingBase):
         self.assertEqual(1, r._num_regions)
         self.assertEqual(2, r._num_zones)
 
+    def _save_ring_for_handoff_cache(self):
+        rb = ring.RingBuilder(8, 3, 1)
+        for region in (1, 2):
+            for zone in (1, 2):
+                for dev in range(4):
+                    dev = ring_utils.parse_add_value(
+                        'r%dz%d-127.0.%d.%d:%d/d%d' % (
+                            region, zone, region, zone, 6200 + dev, dev))
+                    dev['weight'] = 1.0
+                    rb.add_dev(dev)
+        rb.rebalance(seed=1)
+        rb.get_ring().save(self.testgz)
+
+    def test_get_more_nodes_cached(self):
+        self._save_ring_for_handoff_cache()
+        uncached = ring.Ring(self.testdir, ring_name='whatever',
+                             handoff_cache_size=0)
+        r = ring.Ring(self.testdir, ring_name='whatever')
+        for part in range(0, r.partition_count, 17):
+            expected = list(uncached.get_more_nodes(part))
+            self.assertEqual(13, len(expected))
+            # a request only needing a couple of handoffs
+            node_iter = r.get_more_nodes(part)
+            self.assertEqual(expected[:2], [next(node_iter),
+                                            next(node_iter)])
+            # others need more, at the same time
+            iter1 = r.get_more_nodes(part)
+            iter2 = r.get_more_nodes(part)
+            got1 = []
+            got2 = []
+            for i in range(len(expected)):
+                got1.append(next(iter1))
+                got2.append(next(iter2))
+            self.assertRaises(StopIteration, next, iter1)
+            self.assertEqual(expected, got1)
+            self.assertEqual(expected, got2)
+        self.assertFalse(uncached._handoff_cache)
+
+        # once worked out, the handoffs are not looked for again
+        class ExplodingRingTable(object):
+            def __iter__(self):
+                raise Exception('kaboom')
+
+        r._replica2part2dev_id = ExplodingRingTable()
+        self.assertEqual(list(uncached.get_more_nodes(17)),
+                         list(r.get_more_nodes(17)))
+
+    def test_get_more_nodes_ring_reloaded(self):
+        self._save_ring_for_handoff_cache()
+        expected = list(ring.Ring(self.testdir, ring_name='whatever',
+                                  handoff_cache_size=0).get_more_nodes(1))
+        r = ring.Ring(self.testdir, ring_name='whatever',
+                      handoff_cache_size=0)
+        node_iter = r.get_more_nodes(1)
+        got = [next(node_iter), next(node_iter)]
+        # a smaller ring is loaded while the handoffs are still being
+        # worked out from the old one
+        r._num_regions = r._num_zones = r._num_ips = r._num_devs = 6
+        r._part_shift = 0
+        got.extend(node_iter)
+        self.assertEqual(expected, got)
+
+    def test_handoff_cache_size(self):
+        self._save_ring_for_handoff_cache()
+        r = ring.Ring(self.testdir, ring_name='whatever',
+                      handoff_cache_size=2)
+        for part in (0, 1, 2):
+            next(r.get_more_nodes(part))
+        self.assertEqual([1, 2], list(r._handoff_cache))
+        next(r.get_more_nodes(1))
+        next(r.get_more_nodes(3))
+        self.assertEqual([1, 3], list(r._handoff_cache))
+
+        # the handoffs are worked out again for a new ring
+        r._reload(force=True)
+        self.assertFalse(r._handoff_cache)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -19,9 +19,10 @@ import unittest
 
 import socket
 
-from eventlet import spawn, Timeout, listen
+from eventlet import sleep, spawn, Timeout, listen, wsgi
 
 from swift.common import bufferedhttp
+from test.unit import debug_logger
 
 
 class MockHTTPSConnection(object):
@@ -128,5 +129,218 @@ class TestBufferedHTTP(unittest.TestCase):
                                 % (e, dev, path, header))
 
 
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.bindsock = listen(('127.0.0.1', 0))
+        self.port = self.bindsock.getsockname()[1]
+        self.host_port = '127.0.0.1:%s' % self.port
+        self.client_ports = []
+
+        def app(env, start_response):
+            self.client_ports.append(env['REMOTE_PORT'])
+            body = 'x' * int(env.get('HTTP_X_SIZE', 8))
+            start_response('200 OK', [('Content-Length', str(len(body)))])
+            return [body]
+
+        self.app = app
+        self.server = spawn(wsgi.server, self.bindsock, app,
+                            log=debug_logger(), log_output=False)
+        self.logger = debug_logger()
+        self.pool = bufferedhttp.ConnectionPool(
+            max_idle_per_node=2, idle_timeout=10, logger=self.logger)
+        bufferedhttp.set_connection_pool(self.pool)
+
+    def tearDown(self):
+        bufferedhttp.set_connection_pool(None)
+        self.server.kill()
+        self.bindsock.close()
+
+    def _request(self, method='GET', headers=None, read=True):
+        with Timeout(3):
+            conn = bufferedhttp.http_connect(
+                '127.0.0.1', self.port, 'dev', 1, method, '/a',
+                headers or {})
+            resp = conn.getresponse()
+            if read:
+                body = resp.read()
+                self.assertEqual(body, '' if method == 'HEAD' else
+                                 'x' * int((headers or {}).get('X-Size', 8)))
+            return conn, resp
+
+    def _counts(self):
+        return self.logger.get_increment_counts()
+
+    def test_connections_reused(self):
+        for method in ('GET', 'HEAD', 'PUT', 'GET'):
+            conn, resp = self._request(method)
+            self.assertEqual(resp.status, 200)
+            # the caller closing the connection does not close the socket
+            conn.close()
+        self.assertEqual(len(set(self.client_ports)), 1)
+        self.assertEqual(self._counts(), {'backend_pool.misses': 1,
+                                          'backend_pool.hits': 3})
+
+    def test_partly_read_response_not_reused(self):
+        conn, resp = self._request(headers={'X-Size': 100}, read=False)
+        self.assertEqual(resp.read(10), 'x' * 10)
+        resp.close()
+        self._request()
+        self._request()
+        self.assertEqual(len(set(self.client_ports)), 2)
+        self.assertEqual(self._counts(), {'backend_pool.misses': 2,
+                                          'backend_pool.hits': 1})
+
+    def test_connection_close_not_reused(self):
+        self._request(headers={'Connection': 'close'})
+        self._request()
+        self.assertEqual(len(set(self.client_ports)), 2)
+        self.assertEqual(self._counts(), {'backend_pool.misses': 2})
+
+    def test_closed_by_server_not_reused(self):
+        # the server closes connections idle for longer than its
+        # socket_timeout (see keepalive_timeout in swift.common.wsgi)
+        self.server.kill()
+        self.server = spawn(wsgi.server, self.bindsock, self.app,
+                            log=debug_logger(), log_output=False,
+                            socket_timeout=0.01)
+        self._request()
+        sock = self.pool._idle[self.host_port][0][0]
+        sleep(0.1)
+        self.assertFalse(self.pool._usable(sock))
+        self._request()
+        self.assertEqual(len(set(self.client_ports)), 2)
+        self.assertEqual(self._counts(), {'backend_pool.misses': 2,
+                                          'backend_pool.evictions': 1})
+
+    def test_stale_connection_retried(self):
+        self._request()
+        idle = self.pool._idle[self.host_port]
+        sock = idle[0][0]
+        with mock.patch.object(self.pool, '_usable', return_value=True):
+            # the socket looks fine, but fails to send
+            sock.fd.shutdown(socket.SHUT_RDWR)
+            self._request()
+        self.assertEqual(len(set(self.client_ports)), 2)
+
+    def _closing_server(self):
+        # answers the first request on each connection, then closes it as
+        # the next request arrives, like a server timing out an idle
+        # connection just as it is reused
+        bindsock = listen(('127.0.0.1', 0))
+        requests = []
+
+        def handle(sock):
+            fp = sock.makefile('rb')
+            for answer in (True, False):
+                lines = [fp.readline()]
+                while lines[-1] not in ('\r\n', ''):
+                    lines.append(fp.readline())
+                if not lines[0]:
+                    break
+                requests.append((sock.getpeername()[1], lines[0].split()[0]))
+                for line in lines:
+                    if line.lower().startswith('content-length:'):
+                        fp.read(int(line.split(':')[1]))
+                if answer:
+                    sock.sendall('HTTP/1.1 200 OK\r\n'
+                                 'Content-Length: 0\r\n\r\n')
+            fp.close()
+            sock.close()
+
+        def serve():
+            while True:
+                sock, addr = bindsock.accept()
+                spawn(handle, sock)
+
+        server = spawn(serve)
+        self.addCleanup(server.kill)
+        self.addCleanup(bindsock.close)
+        return bindsock.getsockname()[1], requests
+
+    def test_closed_before_response_retried(self):
+        for method in ('GET', 'HEAD', 'DELETE'):
+            port, requests = self._closing_server()
+            for i in range(2):
+                with Timeout(3):
+                    conn = bufferedhttp.http_connect_raw(
+                        '127.0.0.1', port, method, '/a')
+                    resp = conn.getresponse()
+                    self.assertEqual(resp.status, 200)
+                    resp.read()
+            # the second request was sent on the pooled connection, then
+            # again on a new one
+            self.assertEqual([method] * 3, [m for p, m in requests])
+            self.assertEqual(2, len(set(p for p, m in requests)))
+
+    def test_closed_before_response_with_body_not_retried(self):
+        port, requests = self._closing_server()
+        with Timeout(3):
+            conn = bufferedhttp.http_connect_raw('127.0.0.1', port, 'GET',
+                                                 '/a')
+            conn.getresponse().read()
+            for method in ('POST', 'DELETE'):
+                conn = bufferedhttp.http_connect_raw(
+                    '127.0.0.1', port, method, '/a',
+                    {'Content-Length': '4'})
+                conn.send('body')
+                self.assertRaises(bufferedhttp.BadStatusLine,
+                                  conn.getresponse)
+                conn.close()
+                # the next request does not get a pooled connection
+                conn = bufferedhttp.http_connect_raw('127.0.0.1', port,
+                                                     'GET', '/a')
+                conn.getresponse().read()
+        self.assertEqual(['GET', 'POST', 'GET', 'DELETE', 'GET'],
+                         [m for p, m in requests])
+        self.assertEqual(3, len(set(p for p, m in requests)))
+
+    def test_max_idle_per_node(self):
+        responses = [self._request(read=False) for i in range(3)]
+        for conn, resp in responses:
+            resp.read()
+        self.assertEqual(2, len(self.pool._idle[self.host_port]))
+        self.assertEqual(self._counts(), {'backend_pool.misses': 3,
+                                          'backend_pool.discards': 1})
+
+    def test_idle_timeout(self):
+        now = [1000.0]
+        with mock.patch('swift.common.bufferedhttp.time.time',
+                        lambda: now[0]):
+            self.pool._last_evict = now[0]
+            self._request()
+            self._request()
+            now[0] += 5
+            self._request()
+            now[0] += 11
+            # the connection is too old to use
+            self._request()
+            self.assertEqual(len(set(self.client_ports)), 2)
+            self.assertEqual(self._counts(), {'backend_pool.misses': 2,
+                                              'backend_pool.hits': 2,
+                                              'backend_pool.evictions': 1})
+            # idle connections to other servers are closed too
+            self.pool.put('127.0.0.1:1', mock.MagicMock())
+            now[0] += 11
+            self.assertIsNone(self.pool.get('127.0.0.1:2'))
+            self.assertEqual({}, dict(self.pool._idle))
+
+    def test_ssl_not_pooled(self):
+        with mock.patch('swift.common.bufferedhttp.HTTPSConnection',
+                        MockHTTPSConnection):
+            bufferedhttp.http_connect_raw('127.0.0.1', self.port, 'GET', '/',
+                                          ssl=True)
+        self.assertEqual(self._counts(), {})
+
+    def test_set_connection_pool_closes_old_pool(self):
+        self._request()
+        sock = self.pool._idle[self.host_port][0][0]
+        bufferedhttp.set_connection_pool(None)
+        self.assertFalse(self.pool._idle)
+        self.assertFalse(self.pool._usable(sock))
+        self._request()
+        self.assertEqual(self._counts(), {'backend_pool.misses': 1})
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -21,6 +21,7 @@ import unittest
 from tempfile import mkdtemp
 from shutil import rmtree, copy
 from uuid import uuid4
+from six import BytesIO
 import six.moves.cPickle as pickle
 
 import json
@@ -30,6 +31,7 @@ import time
 import random
 from mock import patch, MagicMock
 
+from eventlet import sleep
 from eventlet.timeout import Timeout
 from six.moves import range
 
@@ -38,12 +40,13 @@ from swift.common.constraints import \
     MAX_META_VALUE_LENGTH, MAX_META_COUNT, MAX_META_OVERALL_SIZE
 from swift.common.db import chexor, dict_factory, get_db_connection, \
     DatabaseBroker, DatabaseConnectionError, DatabaseAlreadyExists, \
-    GreenDBConnection, PICKLE_PROTOCOL
+    GreenDBConnection, PICKLE_PROTOCOL, encode_pending_record, \
+    decode_pending_records, PendingCommitter
 from swift.common.utils import normalize_timestamp, mkdirs, Timestamp
 from swift.common.exceptions import LockTimeout
 from swift.common.swob import HTTPException
 
-from test.unit import with_tempdir
+from test.unit import with_tempdir, debug_logger
 
 
 class TestDatabaseConnectionError(unittest.TestCase):
@@ -118,6 +121,65 @@ class TestChexor(unittest.TestCase):
         self.assertEqual(hash_, other_hash)
 
 
+def legacy_pending_record(record_tuple):
+    return ':' + pickle.dumps(record_tuple,
+                              protocol=PICKLE_PROTOCOL).encode('base64')
+
+
+class TestPendingRecords(unittest.TestCase):
+
+    def _decode(self, buf, chunk_size=65536):
+        return list(decode_pending_records(BytesIO(buf), chunk_size))
+
+    def test_encode_decode(self):
+        records = [('o%d' % i, '0000000001.00000', i) for i in range(50)]
+        buf = ''.join(encode_pending_record(r) for r in records)
+        # however the file is split into chunks
+        for chunk_size in (1, 7, 64, 65536):
+            self.assertEqual(records, [
+                record for record, entry in self._decode(buf, chunk_size)])
+        self.assertEqual([], self._decode(''))
+
+    def test_decode_legacy_records(self):
+        records = [('o%d' % i, '0000000001.00000', i) for i in range(6)]
+        # as written by older versions, possibly interleaved with new ones
+        buf = legacy_pending_record(records[0]) + \
+            encode_pending_record(records[1]) + \
+            legacy_pending_record(records[2]) + \
+            legacy_pending_record(records[3]) + \
+            encode_pending_record(records[4]) + \
+            encode_pending_record(records[5])
+        for chunk_size in (1, 5, 65536):
+            self.assertEqual(records, [
+                record for record, entry in self._decode(buf, chunk_size)])
+        self.assertEqual([(None, 'garbage')],
+                         self._decode(':garbage' + ':'))
+
+    def test_decode_torn_record(self):
+        records = [('o1', '0000000001.00000'), ('o2', '0000000002.00000')]
+        torn = encode_pending_record(('o3', '0000000003.00000'))[:-3]
+        buf = encode_pending_record(records[0]) + torn + \
+            encode_pending_record(records[1])
+        for chunk_size in (1, 65536):
+            decoded = self._decode(buf, chunk_size)
+            self.assertEqual([records[0], None, records[1]],
+                             [record for record, entry in decoded])
+            self.assertEqual(torn, decoded[1][1])
+        # at the end of the file, even within the header
+        for tail in (torn, torn[:3], torn[:6]):
+            decoded = self._decode(encode_pending_record(records[0]) + tail)
+            self.assertEqual([(None, tail)], decoded[1:])
+
+    def test_decode_corrupt_record(self):
+        records = [encode_pending_record(('o%d' % i, '0000000001.00000'))
+                   for i in range(3)]
+        corrupt = records[1].replace('o1', 'x1')
+        decoded = self._decode(records[0] + corrupt + records[2])
+        self.assertEqual([('o0', '0000000001.00000'), None,
+                          ('o2', '0000000001.00000')],
+                         [record for record, entry in decoded])
+
+
 class TestGreenDBConnection(unittest.TestCase):
 
     def test_execute_when_locked(self):
@@ -246,8 +308,11 @@ class ExampleBroker(DatabaseBroker):
                         rec['name'], rec['created_at'], rec['deleted']))
             conn.commit()
 
+    def make_tuple_for_pickle(self, record):
+        return (record['name'], record['created_at'], record['deleted'])
+
     def _commit_puts_load(self, item_list, entry):
-        (name, timestamp, deleted) = pickle.loads(entry.decode('base64'))
+        (name, timestamp, deleted) = entry
         item_list.append({
             'name': name,
             'created_at': timestamp,
@@ -580,6 +645,235 @@ class TestExampleBroker(unittest.TestCase):
         broker.get_info()
         self.assertEqual(1, broker.get_info()[count_key])
 
+    @with_tempdir
+    def test_commit_pending_in_batches(self, tempdir):
+        broker = self.broker_class(os.path.join(tempdir, 'test.db'),
+                                   account='a', container='c')
+        broker.initialize(next(self.ts),
+                          storage_policy_index=int(self.policy))
+        for i in range(5):
+            self.put_item(broker, next(self.ts))
+        batches = []
+        merge_items = broker.merge_items
+
+        def capture_merge_items(item_list, *args):
+            batches.append(len(item_list))
+            return merge_items(item_list, *args)
+
+        with patch.object(swift.common.db, 'PENDING_COMMIT_BATCH', 2), \
+                patch.object(broker, 'merge_items', capture_merge_items):
+            broker.get_info()
+        self.assertEqual([2, 2, 1], batches)
+        self.assertEqual(0, os.path.getsize(broker.pending_file))
+
+
+class TestPendingCommitter(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.logger = debug_logger()
+        self.ts = (Timestamp(t).internal for t in itertools.count(1))
+        self.committer = PendingCommitter(
+            self.logger, interval=10, max_time=0.05, pending_cap=65536,
+            rcache=os.path.join(self.testdir, 'container.recon'),
+            recon_key='container_db_committer')
+        # the tests drive the committer themselves
+        self.committer._thread = MagicMock()
+
+    def tearDown(self):
+        rmtree(self.testdir, ignore_errors=True)
+
+    def _make_broker(self, name='test'):
+        broker = ExampleBroker(
+            os.path.join(self.testdir, name, 'test.db'), account='a',
+            committer=self.committer)
+        broker.initialize(next(self.ts))
+        return broker
+
+    def _put(self, broker, name):
+        broker.put_record({'name': name, 'created_at': next(self.ts),
+                           'deleted': 0})
+
+    def _count(self, broker):
+        with broker.get() as conn:
+            return conn.execute(
+                'SELECT test_count FROM test_stat').fetchone()[0]
+
+    def test_writers_do_not_commit(self):
+        broker = self._make_broker()
+        for i in range(200):
+            self._put(broker, 'o%d' % i)
+        # the .pending file is well past PENDING_CAP
+        with patch.object(swift.common.db, 'PENDING_CAP', 1024):
+            self._put(broker, 'o200')
+        self.assertEqual(0, self._count(broker))
+        pending_size = os.path.getsize(broker.pending_file)
+        self.assertEqual(
+            {broker.db_file: [broker, pending_size, self.committer._waiting[
+                broker.db_file][2]]}, self.committer._waiting)
+
+        # until it grows past the committer's pending_cap
+        self.committer.pending_cap = pending_size - 1
+        self._put(broker, 'o201')
+        self.assertEqual(202, self._count(broker))
+        self.assertEqual(0, os.path.getsize(broker.pending_file))
+
+    def test_commit_due(self):
+        self.committer.batch_size = 1024
+        small = self._make_broker('small')
+        big = self._make_broker('big')
+        self._put(small, 'o')
+        for i in range(30):
+            self._put(big, 'o%d' % i)
+        self.committer.commit_due()
+        self.assertEqual(0, self._count(small))
+        self.assertEqual(30, self._count(big))
+        self.assertEqual([small.db_file], list(self.committer._waiting))
+
+        # the small one is committed once it has waited long enough
+        self.committer.commit_due(now=time.time() + 10)
+        self.assertEqual(1, self._count(small))
+        self.assertEqual({}, self.committer._waiting)
+        stats = self.committer.get_stats()
+        self.assertEqual(2, stats['commits'])
+        self.assertEqual(0, stats['failures'])
+        self.assertGreater(stats['max_lag'], 0)
+        self.assertEqual(0, stats['waiting'])
+
+    def test_commit_failure(self):
+        broker = self._make_broker()
+        self._put(broker, 'o')
+        with patch.object(broker, 'merge_items',
+                          side_effect=sqlite3.OperationalError('locked')):
+            self.committer.commit_due(now=time.time() + 10)
+        self.assertEqual(1, self.committer.get_stats()['failures'])
+        self.assertIn('Error committing pending records to %s' %
+                      broker.db_file, self.logger.get_lines_for_level(
+                          'error')[0])
+        # the record is committed by the next writer or reader
+        self.assertGreater(os.path.getsize(broker.pending_file), 0)
+        broker.get_info()
+        self.assertEqual(1, self._count(broker))
+
+    def test_adaptive_batch_size(self):
+        broker = self._make_broker()
+        self._put(broker, 'o')
+        self.committer.batch_size = 8192
+        elapsed = [0.5]
+
+        def timed_commit():
+            # the time the commit took is what matters
+            fake_time[0] += elapsed[0]
+
+        fake_time = [1000.0]
+        with patch('swift.common.db.time.time', lambda: fake_time[0]), \
+                patch.object(broker, '_commit_puts', timed_commit):
+            for expected in (4096, 4096):
+                self.committer._commit(broker, fake_time[0])
+                self.assertEqual(expected, self.committer.batch_size)
+            elapsed[0] = 0.001
+            for expected in (8192, 16384, 32768, 65536, 65536):
+                self.committer._commit(broker, fake_time[0])
+                self.assertEqual(expected, self.committer.batch_size)
+            elapsed[0] = 0.04
+            self.committer._commit(broker, fake_time[0])
+            self.assertEqual(65536, self.committer.batch_size)
+
+    def test_readers_commit(self):
+        broker = self._make_broker()
+        self._put(broker, 'o')
+        self.assertEqual(1, broker.get_info()['test_count'])
+        self.assertEqual({}, self.committer._waiting)
+        stats = self.committer.get_stats()
+        self.assertEqual(1, stats['reads'])
+        self.assertEqual(stats['read_time'], stats['max_read_time'])
+        self.assertEqual(0, stats['commits'])
+
+    def test_background_commits(self):
+        self.committer._thread = None
+        self.committer.batch_size = 1
+        broker = self._make_broker()
+        self._put(broker, 'o')
+        self.assertIsNotNone(self.committer._thread)
+        # the committer is woken as soon as the batch size is reached
+        sleep(0.01)
+        self.assertEqual(1, self._count(broker))
+        self.committer._thread.kill()
+
+    def test_time_to_wait(self):
+        self.assertEqual(10, self.committer._time_to_wait())
+        broker = self._make_broker()
+        self._put(broker, 'o')
+        since = self.committer._waiting[broker.db_file][2]
+        self.assertEqual(10, self.committer._time_to_wait(now=since))
+        self.assertAlmostEqual(
+            6, self.committer._time_to_wait(now=since + 4))
+        self.assertEqual(0, self.committer._time_to_wait(now=since + 11))
+        # the oldest record decides
+        other = self._make_broker('other')
+        self._put(other, 'o')
+        self.committer._waiting[other.db_file][2] = since - 3
+        self.assertAlmostEqual(
+            3, self.committer._time_to_wait(now=since + 4))
+
+    def test_background_commits_on_time(self):
+        now = [1000.0]
+        waits = []
+        broker = self._make_broker()
+
+        class StopRunning(Exception):
+            pass
+
+        class FakeEvent(object):
+            def ready(self):
+                return False
+
+            def wait(self):
+                pass
+
+        test = self
+
+        class FakeTimeout(object):
+            # as if nothing wakes the committer before each wait times out
+            def __init__(self, seconds, exception):
+                if len(waits) == 2:
+                    raise StopRunning()
+                waits.append(seconds)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                if len(waits) == 1:
+                    now[0] += 4
+                    test._put(broker, 'o')
+                    now[0] += 6
+                else:
+                    now[0] += waits[-1]
+
+        with patch('swift.common.db.time.time', lambda: now[0]), \
+                patch.object(swift.common.db, 'Event', FakeEvent), \
+                patch.object(swift.common.db, 'Timeout', FakeTimeout):
+            self.committer._wakeup = FakeEvent()
+            self.assertRaises(StopRunning, self.committer._run)
+        # the record put 4 seconds into the first wait is committed once it
+        # has waited interval, not when the committer next wakes up after
+        # that
+        self.assertEqual([10, 4], waits)
+        self.assertEqual(1, self._count(broker))
+        self.assertEqual(1014, now[0])
+
+    def test_dump_stats(self):
+        self.committer.dump_stats()
+        self.assertFalse(os.path.exists(self.committer.rcache))
+        self.committer.dump_stats(force=True)
+        with open(self.committer.rcache) as f:
+            recon = json.load(f)
+        stats = recon['container_db_committer'][str(os.getpid())]
+        self.assertEqual(self.committer.batch_size, stats['batch_size'])
+        self.assertEqual(0, stats['commits'])
+        self.assertIn('updated', stats)
+
 
 class TestDatabaseBroker(unittest.TestCase):
 
@@ -830,6 +830,20 @@ class TestDBReplicator(unittest.TestCase):
 
         self.assertEqual('unexpected-called', response)
 
+    def test_dispatch_operation_unknown(self):
+        rpc = db_replicator.ReplicatorRpc('/', '/', FakeBroker, False)
+
+        self._patch(patch.object, db_replicator, 'mkdirs', lambda *args: True)
+
+        with patch('swift.common.db_replicator.os',
+                   new=mock.MagicMock(wraps=os)) as mock_os:
+            mock_os.path.exists.return_value = True
+            response = rpc.dispatch(('drive', 'part', 'hash'),
+                                    ['unknown', 'arg1'])
+
+        self.assertEqual(400, response.status_int)
+        self.assertEqual('Unknown op unknown', response.body)
+
     def test_dispatch_operation_rsync_then_merge(self):
         rpc = db_replicator.ReplicatorRpc('/', '/', FakeBroker, False)
 
@@ -583,6 +583,7 @@ class TestInternalClient(unittest.TestCase):
             def __init__(self, status_int, body):
                 self.status_int = status_int
                 self.body = body
+                self.app_iter = [body]
 
         class InternalClient(internal_client.InternalClient):
             def __init__(self, test, responses):
@@ -625,6 +626,7 @@ class TestInternalClient(unittest.TestCase):
             def __init__(self, status_int, body):
                 self.status_int = status_int
                 self.body = body
+                self.app_iter = [body]
 
         class InternalClient(internal_client.InternalClient):
             def __init__(self, test, paths, responses):
@@ -0,0 +1,155 @@
+# Copyright (c) 2010-2016 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+from xml.etree.cElementTree import Element, SubElement, tostring
+
+import mock
+import six
+
+from swift.common import listing_formats
+from swift.common.listing_formats import decode_json_listing, \
+    encode_json_listing, encode_plain_listing, encode_xml_account_listing, \
+    encode_xml_container_listing
+
+
+RECORDS = [
+    {'subdir': u'd\xe9/'},
+    {'name': 'o<&>"\'\n\xc3\xa9', 'hash': '', 'bytes': 0,
+     'content_type': 'text/plain; a="b"',
+     'last_modified': '1970-01-01T00:00:01.000000', 'swift_bytes': 7},
+    {'name': u'p', 'hash': u'x', 'bytes': 1, 'content_type': u'',
+     'last_modified': u'1970-01-01T00:00:02.000000'},
+]
+
+
+def xml_container_listing(container, records):
+    # the listing as ElementTree encodes it
+    doc = Element('container', name=container.decode('utf-8'))
+    for record in records:
+        record = dict((key, value.decode('utf-8')
+                       if isinstance(value, str) else value)
+                      for key, value in record.items())
+        if 'subdir' in record:
+            sub = SubElement(doc, 'subdir', name=record['subdir'])
+            SubElement(sub, 'name').text = record['subdir']
+            continue
+        obj_element = SubElement(doc, 'object')
+        for field in ['name', 'hash', 'bytes', 'content_type',
+                      'last_modified']:
+            SubElement(obj_element, field).text = \
+                six.text_type(record.pop(field))
+        for field in sorted(record):
+            SubElement(obj_element, field).text = six.text_type(record[field])
+    return tostring(doc, encoding='UTF-8').replace(
+        "<?xml version='1.0' encoding='UTF-8'?>",
+        '<?xml version="1.0" encoding="UTF-8"?>', 1)
+
+
+class TestEncodeListings(unittest.TestCase):
+
+    def test_encode_json_listing(self):
+        self.assertEqual(['[]'], list(encode_json_listing([])))
+        self.assertEqual([json.dumps(RECORDS)],
+                         list(encode_json_listing(RECORDS)))
+        chunks = list(encode_json_listing(iter(RECORDS), chunk_size=10))
+        self.assertEqual([json.dumps(RECORDS)[:-1], ']'], chunks)
+        # however the records are batched
+        for batch_size in (1, 2):
+            with mock.patch.object(listing_formats, 'JSON_BATCH_SIZE',
+                                   batch_size):
+                chunks = list(encode_json_listing(iter(RECORDS),
+                                                  chunk_size=10))
+            self.assertEqual(json.dumps(RECORDS), ''.join(chunks))
+            batches = (len(RECORDS) + batch_size - 1) // batch_size
+            self.assertEqual(batches + 1, len(chunks))
+            self.assertTrue(all(len(chunk) >= 10 for chunk in chunks[:-1]))
+
+    def test_encode_plain_listing(self):
+        self.assertEqual([], list(encode_plain_listing([])))
+        names = ['a', u'\xe9', 'c\xc3\xa9']
+        self.assertEqual(['a\n\xc3\xa9\nc\xc3\xa9\n'],
+                         list(encode_plain_listing(names)))
+        self.assertEqual(['a\n\xc3\xa9\n', 'c\xc3\xa9\n'],
+                         list(encode_plain_listing(names, chunk_size=4)))
+
+    def test_encode_xml_container_listing(self):
+        for container in ('c', 'c<&>"\'\n\xc3\xa9'):
+            for records in ([], RECORDS[:1], RECORDS):
+                self.assertEqual(
+                    xml_container_listing(container, records),
+                    ''.join(encode_xml_container_listing(container, records,
+                                                         chunk_size=1)))
+
+    def test_encode_xml_account_listing(self):
+        records = [{'subdir': 'a"/'},
+                   {'name': 'b<&>', 'count': 1, 'bytes': 2}]
+        self.assertEqual(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<account name=\'a"\'>\n'
+            '<subdir name=\'a"/\' />\n'
+            '<container><name>b&lt;&amp;&gt;</name><count>1</count>'
+            '<bytes>2</bytes></container>\n'
+            '</account>',
+            ''.join(encode_xml_account_listing('a"', records)))
+        self.assertEqual(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<account name="a">\n</account>',
+            ''.join(encode_xml_account_listing('a', [])))
+
+
+class TestDecodeJsonListing(unittest.TestCase):
+
+    def test_decode(self):
+        for body in (json.dumps(RECORDS), json.dumps(RECORDS, indent=2),
+                     ' [ ] ', '[]', '[1, "two", [3], {"4": null}]\n'):
+            expected = json.loads(body)
+            self.assertEqual(expected, list(decode_json_listing([body])))
+            # however the body is split into chunks
+            for size in (1, 2, 7):
+                chunks = [body[i:i + size]
+                          for i in range(0, len(body), size)]
+                self.assertEqual(expected,
+                                 list(decode_json_listing(chunks)))
+
+    def test_decode_yields_records_as_they_arrive(self):
+        chunks = ['[{"name": "a"}, {"na', 'me": "b"}, {', '"name": "c"}]']
+        read = []
+
+        def chunk_iter():
+            for chunk in chunks:
+                read.append(chunk)
+                yield chunk
+
+        listing = decode_json_listing(chunk_iter())
+        self.assertEqual({'name': 'a'}, next(listing))
+        self.assertEqual(chunks[:1], read)
+        self.assertEqual({'name': 'b'}, next(listing))
+        self.assertEqual(chunks[:2], read)
+        self.assertEqual({'name': 'c'}, next(listing))
+        self.assertEqual([], list(listing))
+
+    def test_decode_invalid(self):
+        for body in ('', '{}', '"a"', '[', '[1', '[1,', '[1,]', '[,1]',
+                     '[1 2]', '[1]]', '[1] x', '[{"a": 1]', '["\xff]'):
+            with self.assertRaises(ValueError):
+                list(decode_json_listing([body]))
+            with self.assertRaises(ValueError):
+                list(decode_json_listing(list(body)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,18 +18,21 @@
 
 from collections import defaultdict
 from hashlib import md5
+import json
 import logging
 import socket
 import time
 import unittest
+import zlib
 from uuid import uuid4
 
-from eventlet import GreenPool, sleep, Queue
+import eventlet
+from eventlet import GreenPool, sleep, spawn, Queue
 from eventlet.pools import Pool
 
 from swift.common import memcached
 from mock import patch, MagicMock
-from test.unit import NullLoggingHandler
+from test.unit import NullLoggingHandler, debug_logger
 
 
 class MockedMemcachePool(memcached.MemcacheConnPool):
@@ -166,6 +169,117 @@ class MockMemcached(object):
         pass
 
 
+class FakeBinaryMemcached(object):
+    """
+    A local stand-in for memcached that speaks enough of the binary protocol
+    for the PipelinedMemcacheRing. It answers requests in order, each after
+    ``delay`` seconds, and records how many were ever waiting for an answer
+    on one connection at once.
+    """
+
+    def __init__(self):
+        self.store = {}
+        self.connections = 0
+        self.max_in_flight = 0
+        self.delay = 0
+        self.drop_on_request = False
+        self.listen_sock = eventlet.listen(('127.0.0.1', 0))
+        self.server = '%s:%s' % self.listen_sock.getsockname()
+        self.socks = []
+        self.threads = [spawn(self._accept)]
+
+    def stop(self):
+        for thread in self.threads:
+            thread.kill()
+        self.drop_connections()
+        self.listen_sock.close()
+
+    def drop_connections(self):
+        for sock in self.socks:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            sock.close()
+        self.socks = []
+
+    def _accept(self):
+        while True:
+            sock, _addr = self.listen_sock.accept()
+            self.connections += 1
+            self.socks.append(sock)
+            requests = Queue()
+            self.threads.append(spawn(self._read_requests, sock, requests))
+            self.threads.append(spawn(self._respond, sock, requests))
+
+    def _read_requests(self, sock, requests):
+        fp = sock.makefile('rb')
+        in_flight = [0]
+        while True:
+            header = fp.read(memcached.BINARY_HEADER.size)
+            if len(header) < memcached.BINARY_HEADER.size:
+                return
+            (magic, opcode, key_len, extras_len, _data_type, _vbucket,
+             body_len, opaque, _cas) = memcached.BINARY_HEADER.unpack(header)
+            body = fp.read(body_len)
+            if self.drop_on_request:
+                sock.close()
+                return
+            in_flight[0] += 1
+            self.max_in_flight = max(self.max_in_flight, in_flight[0])
+            requests.put((in_flight, opcode, opaque, body[:extras_len],
+                          body[extras_len:extras_len + key_len],
+                          body[extras_len + key_len:]))
+
+    def _respond(self, sock, requests):
+        while True:
+            in_flight, opcode, opaque, extras, key, value = requests.get()
+            sleep(self.delay)
+            response = self._handle(opcode, extras, key, value)
+            in_flight[0] -= 1
+            if response is not None:
+                status, extras, value = response
+                try:
+                    sock.sendall(memcached.BINARY_HEADER.pack(
+                        memcached.BINARY_RESPONSE_MAGIC, opcode, 0,
+                        len(extras), 0, status, len(extras) + len(value),
+                        opaque, 0) + extras + value)
+                except socket.error:
+                    return
+
+    def _handle(self, opcode, extras, key, value):
+        if opcode in (memcached.OP_GET, memcached.OP_GETQ):
+            if key in self.store:
+                flags, value = self.store[key]
+                return 0, memcached.GET_EXTRAS.pack(flags), value
+            if opcode == memcached.OP_GET:
+                return 1, '', 'Not found'
+        elif opcode in (memcached.OP_SET, memcached.OP_SETQ):
+            flags, _expiration = memcached.SET_EXTRAS.unpack(extras)
+            self.store[key] = (flags, value)
+            if opcode == memcached.OP_SET:
+                return 0, '', ''
+        elif opcode == memcached.OP_DELETE:
+            if self.store.pop(key, None) is None:
+                return 1, '', 'Not found'
+            return 0, '', ''
+        elif opcode in (memcached.OP_INCREMENT, memcached.OP_DECREMENT):
+            delta, initial, _expiration = memcached.INCR_EXTRAS.unpack(
+                extras)
+            if key in self.store:
+                current = int(self.store[key][1])
+                if opcode == memcached.OP_INCREMENT:
+                    current += delta
+                else:
+                    current = max(0, current - delta)
+            else:
+                current = initial
+            self.store[key] = (0, str(current))
+            return 0, '', memcached.INCR_VALUE.pack(current)
+        elif opcode == memcached.OP_NOOP:
+            return 0, '', ''
+
+
 class TestMemcached(unittest.TestCase):
     """Tests for swift.common.memcached"""
 
@@ -458,6 +572,77 @@ class TestMemcached(unittest.TestCase):
             ('some_key2', 'some_key1', 'not_exists'), 'multi_key'),
             [[4, 5, 6], [1, 2, 3], None])
 
+    def test_get_many(self):
+        memcache_client = memcached.MemcacheRing(
+            ['1.2.3.4:11211', '1.2.3.5:11211'])
+        mock1 = MockMemcached()
+        mock2 = MockMemcached()
+        memcache_client._client_cache['1.2.3.4:11211'] = MockedMemcachePool(
+            [(mock1, mock1)] * 2)
+        memcache_client._client_cache['1.2.3.5:11211'] = MockedMemcachePool(
+            [(mock2, mock2)] * 2)
+        keys = ['some_key%d' % i for i in range(20)]
+        for i, key in enumerate(keys):
+            memcache_client.set(key, [i])
+        # sanity, the keys are spread over both servers
+        self.assertTrue(mock1.cache)
+        self.assertTrue(mock2.cache)
+
+        stats = memcache_client.start_request_stats()
+        self.assertEqual(
+            dict((key, [i]) for i, key in enumerate(keys)),
+            memcache_client.get_many(keys + ['not_exists']))
+        # one get to each server
+        self.assertEqual({'round_trips': 2}, stats)
+        self.assertEqual({}, memcache_client.get_many([]))
+        self.assertEqual({'round_trips': 2}, stats)
+
+    def test_get_many_server_down(self):
+        logging.getLogger().addHandler(NullLoggingHandler())
+        memcache_client = memcached.MemcacheRing(
+            ['1.2.3.4:11211', '1.2.3.5:11211'])
+        mock1 = MockMemcached()
+        mock2 = MockMemcached()
+        memcache_client._client_cache['1.2.3.4:11211'] = MockedMemcachePool(
+            [(mock1, mock1)] * 2)
+        memcache_client._client_cache['1.2.3.5:11211'] = MockedMemcachePool(
+            [(mock2, mock2)] * 2)
+        keys = ['some_key%d' % i for i in range(20)]
+        for i, key in enumerate(keys):
+            memcache_client.set(key, [i])
+        mock2.down = True
+        # the keys on the server that is down are missed
+        expected = dict((key, [i]) for i, key in enumerate(keys)
+                        if md5(key).hexdigest() in mock1.cache)
+        self.assertEqual(expected, memcache_client.get_many(keys))
+
+    def test_round_trips(self):
+        memcache_client = memcached.MemcacheRing(['1.2.3.4:11211'])
+        mock = MockMemcached()
+        memcache_client._client_cache['1.2.3.4:11211'] = MockedMemcachePool(
+            [(mock, mock)] * 2)
+        # not counted until asked to
+        memcache_client.set('some_key', [1, 2, 3])
+        stats = memcache_client.start_request_stats()
+        memcache_client.set('some_key', [1, 2, 3])
+        memcache_client.get('some_key')
+        memcache_client.delete('some_key')
+        self.assertEqual({'round_trips': 3}, stats)
+        # incr of a missing key adds it, too
+        memcache_client.incr('counter')
+        self.assertEqual({'round_trips': 5}, stats)
+
+        # counted for each greenthread apart
+        other_stats = []
+
+        def other_request():
+            other_stats.append(memcache_client.start_request_stats())
+            memcache_client.get('some_key')
+
+        spawn(other_request).wait()
+        self.assertEqual([{'round_trips': 1}], other_stats)
+        self.assertEqual({'round_trips': 5}, stats)
+
     def test_serialization(self):
         memcache_client = memcached.MemcacheRing(['1.2.3.4:11211'],
                                                  allow_pickle=True)
@@ -478,6 +663,98 @@ class TestMemcached(unittest.TestCase):
         memcache_client._allow_pickle = True
         self.assertEqual(memcache_client.get('some_key'), [1, 2, 3])
 
+    def _ring_with_mock(self, mock, **kwargs):
+        memcache_client = memcached.MemcacheRing(['1.2.3.4:11211'], **kwargs)
+        memcache_client._client_cache['1.2.3.4:11211'] = MockedMemcachePool(
+            [(mock, mock)] * 2)
+        return memcache_client
+
+    def test_value_codecs(self):
+        mock = MockMemcached()
+        info = {'status': 200, 'meta': {'color': 'blue' * 100}}
+        default_client = self._ring_with_mock(mock)
+        default_client.set('key', info)
+        self.assertEqual(mock.cache[md5('key').hexdigest()][0],
+                         str(memcached.JSON_FLAG))
+
+        compact_client = self._ring_with_mock(mock, value_codec='compact_json')
+        compact_client.set('compact', info)
+        flags, _exptime, value = mock.cache[md5('compact').hexdigest()]
+        self.assertEqual(flags, str(memcached.JSON_FLAG))
+        self.assertEqual(value, json.dumps(info, separators=(',', ':')))
+        self.assertLess(len(value), len(json.dumps(info)))
+
+        compress_client = self._ring_with_mock(
+            mock, value_codec='compact_json', compress_threshold=100)
+        compress_client.set('compressed', info)
+        compress_client.set('short', {'status': 404})
+        compress_client.set('raw', 'x' * 200, serialize=False)
+        flags, _exptime, value = mock.cache[md5('compressed').hexdigest()]
+        self.assertEqual(flags, str(memcached.JSON_FLAG |
+                                    memcached.ZLIB_FLAG))
+        self.assertEqual(zlib.decompress(value),
+                         json.dumps(info, separators=(',', ':')))
+        self.assertEqual(mock.cache[md5('short').hexdigest()][0],
+                         str(memcached.JSON_FLAG))
+        self.assertEqual(mock.cache[md5('raw').hexdigest()][:3:2],
+                         ('0', 'x' * 200))
+
+        # whatever the codec, values stored any of these ways can be read,
+        # as they may be in a rolling upgrade
+        for client in (default_client, compact_client, compress_client):
+            self.assertEqual(client.get('key'), info)
+            self.assertEqual(client.get('compact'), info)
+            self.assertEqual(client.get('compressed'), info)
+            self.assertEqual(client.get('short'), {'status': 404})
+            self.assertEqual(client.get('raw'), 'x' * 200)
+            self.assertEqual(
+                client.get_multi(['compressed', 'short', 'nope'], 'key'),
+                [info, {'status': 404}, None])
+
+        with self.assertRaises(ValueError):
+            memcached.MemcacheRing(['1.2.3.4:11211'], value_codec='xml')
+
+    @unittest.skipIf(memcached.msgpack is None, 'msgpack is not installed')
+    def test_msgpack_codec(self):
+        mock = MockMemcached()
+        memcache_client = self._ring_with_mock(mock, value_codec='msgpack')
+        info = {'status': 200, 'meta': {u'\u2603': 'snowman'}}
+        memcache_client.set('key', info)
+        flags, _exptime, value = mock.cache[md5('key').hexdigest()]
+        self.assertEqual(flags, str(memcached.MSGPACK_FLAG))
+        self.assertEqual(memcache_client.get('key'), info)
+        self.assertEqual(self._ring_with_mock(mock).get('key'), info)
+
+    def test_msgpack_codec_not_installed(self):
+        mock = MockMemcached()
+        mock.cache[md5('key').hexdigest()] = (
+            str(memcached.MSGPACK_FLAG), '0', '\x80')
+        with patch.object(memcached, 'msgpack', None):
+            with self.assertRaises(ImportError):
+                memcached.MemcacheRing(['1.2.3.4:11211'],
+                                       value_codec='msgpack')
+            # a value only msgpack can read is as good as a miss
+            self.assertIsNone(self._ring_with_mock(mock).get('key'))
+
+    def test_value_size_metrics(self):
+        logger = debug_logger()
+        mock = MockMemcached()
+        memcache_client = self._ring_with_mock(
+            mock, compress_threshold=100, logger=logger)
+        memcache_client.set('key', {'status': 200})
+        memcache_client.set('big', {'meta': 'blue' * 100})
+        memcache_client.get('key')
+        memcache_client.get('big')
+        memcache_client.get('missing')
+        big_size = len(mock.cache[md5('big').hexdigest()][2])
+        self.assertLess(big_size, 100)
+        self.assertEqual(logger.log_dict['timing'], [
+            (('set.value_size', len('{"status": 200}')), {}),
+            (('set.value_size', big_size), {}),
+            (('get.value_size', len('{"status": 200}')), {}),
+            (('get.value_size', big_size), {}),
+        ])
+
     def test_connection_pooling(self):
         with patch('swift.common.memcached.socket') as mock_module:
             def mock_getaddrinfo(host, port, family=socket.AF_INET,
@@ -600,5 +877,193 @@ class TestMemcached(unittest.TestCase):
         finally:
             memcached.MemcacheConnPool = orig_conn_pool
 
+
+class TestPipelinedMemcacheRing(unittest.TestCase):
+    """Tests for swift.common.memcached.PipelinedMemcacheRing"""
+
+    def setUp(self):
+        self.stand_ins = [FakeBinaryMemcached(), FakeBinaryMemcached()]
+        self.servers = [stand_in.server for stand_in in self.stand_ins]
+
+    def tearDown(self):
+        for stand_in in self.stand_ins:
+            stand_in.stop()
+
+    def test_set_get_delete(self):
+        memcache_client = memcached.PipelinedMemcacheRing(self.servers)
+        memcache_client.set('some_key', [1, 2, 3])
+        self.assertEqual(memcache_client.get('some_key'), [1, 2, 3])
+        memcache_client.set('some_key', 'raw', serialize=False)
+        self.assertEqual(memcache_client.get('some_key'), 'raw')
+        memcache_client.delete('some_key')
+        self.assertIsNone(memcache_client.get('some_key'))
+        # deleting a missing key is fine
+        memcache_client.delete('some_key')
+        self.assertIsNone(memcache_client.get('other_key'))
+
+        # values are stored as by the text protocol client
+        stored = {}
+        for stand_in in self.stand_ins:
+            stored.update(stand_in.store)
+        memcache_client.set('some_key', {'a': 'b'})
+        for stand_in in self.stand_ins:
+            stored.update(stand_in.store)
+        self.assertEqual(stored[md5('some_key').hexdigest()],
+                         (memcached.JSON_FLAG, '{"a": "b"}'))
+
+    def test_serialization(self):
+        memcache_client = memcached.PipelinedMemcacheRing(
+            self.servers, allow_pickle=True)
+        memcache_client.set('some_key', [1, 2, 3])
+        self.assertEqual(memcache_client.get('some_key'), [1, 2, 3])
+        memcache_client._allow_pickle = False
+        memcache_client._allow_unpickle = False
+        self.assertIsNone(memcache_client.get('some_key'))
+
+    def test_incr_decr(self):
+        memcache_client = memcached.PipelinedMemcacheRing(self.servers)
+        # a missing key is set to delta, or 0 for a decr
+        self.assertEqual(memcache_client.incr('some_key', delta=5), 5)
+        self.assertEqual(memcache_client.incr('some_key', delta=5), 10)
+        self.assertEqual(memcache_client.decr('some_key', delta=4), 6)
+        self.assertEqual(memcache_client.decr('some_key', delta=10), 0)
+        self.assertEqual(memcache_client.decr('other_key', delta=3), 0)
+        self.assertEqual(memcache_client.incr('other_key', delta=-3), 0)
+        self.assertEqual(memcache_client.get('some_key'), '0')
+
+    def test_multi(self):
+        memcache_client = memcached.PipelinedMemcacheRing(self.servers)
+        memcache_client.set_multi(
+            {'some_key1': [1, 2, 3], 'some_key2': [4, 5, 6]}, 'multi_key')
+        self.assertEqual(
+            memcache_client.get_multi(('some_key2', 'some_key1', 'nope'),
+                                      'multi_key'),
+            [[4, 5, 6], [1, 2, 3], None])
+        # all on one server
+        self.assertEqual(
+            sorted(len(stand_in.store) for stand_in in self.stand_ins),
+            [0, 2])
+
+    def test_get_many(self):
+        memcache_client = memcached.PipelinedMemcacheRing(self.servers)
+        keys = ['key%d' % i for i in range(20)]
+        for i, key in enumerate(keys):
+            memcache_client.set(key, i)
+        # the keys are spread over both servers
+        for stand_in in self.stand_ins:
+            self.assertTrue(stand_in.store)
+        stats = memcache_client.start_request_stats()
+        self.assertEqual(memcache_client.get_many(keys + ['nope']),
+                         dict((key, i) for i, key in enumerate(keys)))
+        self.assertEqual(stats, {'round_trips': 2})
+        self.assertEqual(memcache_client.get_many([]), {})
+
+    def test_pipelining(self):
+        stand_in = self.stand_ins[0]
+        stand_in.delay = 0.01
+        memcache_client = memcached.PipelinedMemcacheRing([stand_in.server])
+        for i in range(20):
+            memcache_client.set('key%d' % i, i)
+
+        pool = GreenPool()
+        results = list(pool.imap(
+            lambda i: (memcache_client.get('key%d' % i),
+                       memcache_client.incr('count')),
+            range(20)))
+        self.assertEqual([value for value, count in results], list(range(20)))
+        self.assertEqual(sorted(count for value, count in results),
+                         list(range(1, 21)))
+        # every request went over the one connection, without waiting for
+        # the others to be answered
+        self.assertEqual(stand_in.connections, 1)
+        self.assertGreater(stand_in.max_in_flight, 10)
+
+    def test_connection_closed(self):
+        stand_in = self.stand_ins[0]
+        memcache_client = memcached.PipelinedMemcacheRing([stand_in.server])
+        memcache_client.set('some_key', 'value')
+        stand_in.drop_on_request = True
+        with patch('swift.common.memcached.logging') as mock_logging:
+            self.assertIsNone(memcache_client.get('some_key'))
+            with self.assertRaises(memcached.MemcacheConnectionError):
+                memcache_client.incr('some_key')
+        self.assertEqual(mock_logging.exception.call_count, 2)
+        self.assertEqual(len(memcache_client._errors[stand_in.server]), 2)
+
+        # a new connection is made for the next request
+        stand_in.drop_on_request = False
+        self.assertEqual(memcache_client.get('some_key'), 'value')
+        self.assertEqual(stand_in.connections, 3)
+
+        # and when the server drops the connection between requests
+        stand_in.drop_connections()
+        sleep(0)
+        self.assertEqual(memcache_client.get('some_key'), 'value')
+        self.assertEqual(stand_in.connections, 4)
+        self.assertEqual(len(memcache_client._errors[stand_in.server]), 2)
+
+    def test_timeout(self):
+        stand_in = self.stand_ins[0]
+        memcache_client = memcached.PipelinedMemcacheRing(
+            [stand_in.server], io_timeout=0.05)
+        memcache_client.set('some_key', 'value')
+        stand_in.delay = 0.1
+        pool = GreenPool()
+        with patch('swift.common.memcached.logging') as mock_logging:
+            results = list(pool.imap(memcache_client.get, ['some_key'] * 3))
+        self.assertEqual(results, [None] * 3)
+        # the requests failed together, when the first of them timed out
+        # and closed the connection, so the server has only one error
+        self.assertEqual(len(memcache_client._errors[stand_in.server]), 1)
+        self.assertEqual(mock_logging.error.call_count, 1)
+        stand_in.delay = 0
+        self.assertEqual(memcache_client.get('some_key'), 'value')
+
+    def test_timeout_fails_over(self):
+        slow, fast = self.stand_ins
+        memcache_client = memcached.PipelinedMemcacheRing(
+            self.servers, io_timeout=0.05)
+        keys = [key for key in ('key%d' % i for i in range(100))
+                if next(memcache_client._iter_servers(
+                    md5(key).hexdigest())) == slow.server][:5]
+        for key in keys:
+            memcache_client.set(key, key)
+            fast.store[md5(key).hexdigest()] = slow.store[
+                md5(key).hexdigest()]
+        slow.delay = 0.1
+        pool = GreenPool()
+        with patch('swift.common.memcached.logging') as mock_logging:
+            results = list(pool.imap(memcache_client.get, keys))
+        # every request was answered by the other server, but only the one
+        # that timed out counted an error against the slow one
+        self.assertEqual(results, keys)
+        self.assertEqual(len(memcache_client._errors[slow.server]), 1)
+        self.assertEqual(mock_logging.error.call_count, 1)
+        self.assertEqual([], memcache_client._errors[fast.server])
+
+    def test_failover_and_error_limiting(self):
+        down = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        down.bind(('127.0.0.1', 0))
+        down_server = '%s:%s' % down.getsockname()
+        down.close()
+        memcache_client = memcached.PipelinedMemcacheRing(
+            [down_server, self.stand_ins[0].server])
+        with patch('swift.common.memcached.logging'):
+            for i in range(30):
+                memcache_client.set('key%d' % i, i)
+                self.assertEqual(memcache_client.get('key%d' % i), i)
+        self.assertEqual(len(self.stand_ins[0].store), 30)
+        self.assertGreater(memcache_client._error_limited[down_server],
+                           time.time())
+
+        memcache_client = memcached.PipelinedMemcacheRing([down_server])
+        with patch('swift.common.memcached.logging'):
+            self.assertIsNone(memcache_client.get('some_key'))
+            self.assertIsNone(memcache_client.get_multi(['some_key'], 'x'))
+            self.assertEqual(memcache_client.get_many(['some_key']), {})
+            with self.assertRaises(memcached.MemcacheConnectionError):
+                memcache_client.incr('some_key')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -23,8 +23,9 @@ from test.unit import patch_policies, FakeRing, temptree, DEFAULT_TEST_EC_TYPE
 from swift.common.storage_policy import (
     StoragePolicyCollection, POLICIES, PolicyError, parse_storage_policies,
     reload_storage_policies, get_policy_string, split_policy_string,
-    BaseStoragePolicy, StoragePolicy, ECStoragePolicy, REPL_POLICY, EC_POLICY,
-    VALID_EC_TYPES, DEFAULT_EC_OBJECT_SEGMENT_SIZE, BindPortsCache)
+    BaseStoragePolicy, StoragePolicy, ECStoragePolicy, SlabStoragePolicy,
+    REPL_POLICY, EC_POLICY, SLAB_POLICY, VALID_EC_TYPES,
+    DEFAULT_EC_OBJECT_SEGMENT_SIZE, BindPortsCache)
 from swift.common.ring import RingData
 from swift.common.exceptions import RingValidationError
 from pyeclib.ec_iface import ECDriver
@@ -312,6 +313,24 @@ class TestStoragePolicies(unittest.TestCase):
         self.assertEqual(policies.get_by_index(10).policy_type,
                          EC_POLICY)
 
+    def test_parse_slab_policy(self):
+        conf = self._conf("""
+        [storage-policy:0]
+        name = zero
+        default = yes
+
+        [storage-policy:1]
+        name = small
+        policy_type = slab
+        """)
+        policies = parse_storage_policies(conf)
+        policy = policies.get_by_index(1)
+        self.assertIsInstance(policy, SlabStoragePolicy)
+        self.assertEqual(SLAB_POLICY, policy.policy_type)
+        self.assertEqual(REPL_POLICY, policies.get_by_index(0).policy_type)
+        policy.object_ring = FakeRing(replicas=3)
+        self.assertEqual(2, policy.quorum)
+
     def test_names_are_normalized(self):
         test_policies = [StoragePolicy(0, 'zero', True),
                          StoragePolicy(1, 'ZERO', False)]
@@ -1142,6 +1161,25 @@ class TestStoragePolicies(unittest.TestCase):
                 k + ec_policy.pyeclib_driver.min_parity_fragments_needed()
             self.assertEqual(expected_size, ec_policy.quorum)
 
+    def test_ec_systematic(self):
+        policy = ECStoragePolicy(10, 'ec4-2', ec_type=DEFAULT_TEST_EC_TYPE,
+                                 ec_ndata=4, ec_nparity=2)
+        self.assertTrue(policy.ec_systematic)
+        # the data fragments' payloads hold the segment as it is
+        data = ''.join(chr(i % 251) for i in range(1001))
+        payloads = []
+        for fragment in policy.pyeclib_driver.encode(data)[:4]:
+            metadata = policy.pyeclib_driver.get_metadata(
+                fragment, formatted=True)
+            payloads.append(fragment[-metadata['size']:])
+        self.assertEqual(data, ''.join(payloads)[:len(data)])
+
+        policy = ECStoragePolicy(11, 'df10-6', ec_type='flat_xor_hd_4',
+                                 ec_ndata=10, ec_nparity=6)
+        self.assertTrue(policy.ec_systematic)
+        with mock.patch.object(policy, '_ec_type', 'shss'):
+            self.assertFalse(policy.ec_systematic)
+
     def test_validate_ring(self):
         test_policies = [
             ECStoragePolicy(0, 'ec8-2', ec_type=DEFAULT_TEST_EC_TYPE,
@@ -4871,6 +4871,35 @@ class TestStatsdLoggingDelegation(unittest.TestCase):
                 utils.fsync(12345)
                 self.assertEqual(called, [12345])
 
+    def test_syncfs(self):
+        called = []
+
+        def fake_syncfs(fd):
+            called.append(fd)
+            return 0
+
+        with patch('swift.common.utils._sys_syncfs', fake_syncfs):
+            utils.syncfs(12345)
+        self.assertEqual(called, [12345])
+
+    def test_syncfs_error(self):
+
+        def fake_syncfs(fd):
+            return -1
+
+        with patch('swift.common.utils._sys_syncfs', fake_syncfs), \
+                patch('ctypes.get_errno', return_value=errno.EBADF):
+            with self.assertRaises(OSError) as cm:
+                utils.syncfs(12345)
+        self.assertEqual(errno.EBADF, cm.exception.errno)
+
+    def test_syncfs_not_available(self):
+        with patch('swift.common.utils._sys_syncfs',
+                   utils.noop_libc_function):
+            with self.assertRaises(OSError) as cm:
+                utils.syncfs(12345)
+        self.assertEqual(errno.ENOSYS, cm.exception.errno)
+
 
 class TestAuditLocationGenerator(unittest.TestCase):
 
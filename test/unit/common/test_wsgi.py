@@ -433,6 +433,46 @@ class TestWSGI(unittest.TestCase):
         args, kwargs = _wsgi.server.call_args
         self.assertEqual(kwargs.get('capitalize_response_headers'), False)
 
+    def test_run_server_keepalive_timeout(self):
+        config = """
+        [DEFAULT]
+        swift_dir = TEMPDIR
+        keepalive_timeout = 30
+
+        [pipeline:main]
+        pipeline = proxy-server
+
+        [app:proxy-server]
+        use = egg:swift#proxy
+        """
+
+        def argspec_stub(server):
+            return mock.MagicMock(args=['socket_timeout'])
+
+        contents = dedent(config)
+        for argspec, expected in ((argspec_stub, 30.0),
+                                  (lambda server: mock.MagicMock(args=[]),
+                                   None)):
+            with temptree(['proxy-server.conf']) as t:
+                conf_file = os.path.join(t, 'proxy-server.conf')
+                with open(conf_file, 'w') as f:
+                    f.write(contents.replace('TEMPDIR', t))
+                _fake_rings(t)
+                with mock.patch('swift.proxy.server.Application.'
+                                'modify_wsgi_pipeline'), \
+                        mock.patch('swift.common.wsgi.wsgi') as _wsgi, \
+                        mock.patch('swift.common.wsgi.eventlet'), \
+                        mock.patch('swift.common.wsgi.inspect',
+                                   getargspec=argspec):
+                    conf = wsgi.appconfig(conf_file)
+                    logger = logging.getLogger('test')
+                    sock = listen(('localhost', 0))
+                    wsgi.run_server(conf, logger, sock)
+
+            self.assertTrue(_wsgi.server.called)
+            args, kwargs = _wsgi.server.call_args
+            self.assertEqual(kwargs.get('socket_timeout'), expected)
+
     def test_run_server_conf_dir(self):
         config_dir = {
             'proxy-server.conf.d/pipeline.conf': """
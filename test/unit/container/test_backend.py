@@ -29,7 +29,8 @@ import pickle
 import json
 
 from swift.container.backend import ContainerBroker, \
-    update_new_item_from_existing
+    update_new_item_from_existing, SHARD_CREATED, SHARD_CLEAVED, \
+    SHARD_ACTIVE, UNSHARDED, SHARDING, SHARDED
 from swift.common.utils import Timestamp, encode_timestamps
 from swift.common.storage_policy import POLICIES
 
@@ -104,6 +105,136 @@ class TestContainerBroker(unittest.TestCase):
         broker.delete_object('o', Timestamp(time()).internal)
         self.assertTrue(broker.empty())
 
+    def _make_shard_range(self, name, lower, upper, timestamp,
+                          state=SHARD_CREATED, object_count=0,
+                          bytes_used=0):
+        return {'name': '.shards_a/' + name, 'lower': lower,
+                'upper': upper, 'timestamp': timestamp.internal,
+                'state': state, 'object_count': object_count,
+                'bytes_used': bytes_used}
+
+    def test_empty_sharded(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(Timestamp('1').internal, 0)
+        ts = Timestamp(time())
+        broker.merge_shard_ranges([
+            self._make_shard_range('c-1', '', 'm', ts),
+            self._make_shard_range('c-2', 'm', '', ts)])
+        self.assertTrue(broker.empty())
+        # the root's objects have moved to the shards
+        broker.merge_shard_ranges([
+            self._make_shard_range('c-1', '', 'm', Timestamp(time() + 1),
+                                   state=SHARD_ACTIVE, object_count=2,
+                                   bytes_used=4)])
+        self.assertFalse(broker.empty())
+
+    def test_merge_shard_ranges(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(Timestamp('1').internal, 0)
+        ts_iter = make_timestamp_iter()
+        ts_old, ts_new = next(ts_iter), next(ts_iter)
+        self.assertEqual([], broker.get_shard_ranges())
+        self.assertEqual(UNSHARDED, broker.get_sharding_state())
+        ranges = [self._make_shard_range('c-2', 'm', '', ts_old),
+                  self._make_shard_range('c-1', '', 'm', ts_old)]
+        broker.merge_shard_ranges(ranges)
+        self.assertEqual(ranges[::-1], broker.get_shard_ranges())
+        self.assertEqual(SHARDING, broker.get_sharding_state())
+
+        # newer versions win, older ones are ignored
+        newer = self._make_shard_range('c-1', '', 'm', ts_new,
+                                       state=SHARD_CLEAVED, object_count=3,
+                                       bytes_used=30)
+        older = self._make_shard_range(u'c-2', u'm', u'', ts_old,
+                                       state=SHARD_ACTIVE)
+        broker.merge_shard_ranges([newer, older])
+        self.assertEqual([newer, ranges[0]], broker.get_shard_ranges())
+        self.assertEqual([newer], broker.get_shard_ranges(
+            states=[SHARD_CLEAVED]))
+        self.assertEqual({'object_count': 0, 'bytes_used': 0},
+                         broker.get_shard_usage())
+
+        ts_active = next(ts_iter)
+        active = [dict(shard_range, state=SHARD_ACTIVE,
+                       timestamp=ts_active.internal)
+                  for shard_range in broker.get_shard_ranges()]
+        broker.merge_shard_ranges(active)
+        self.assertEqual(SHARDED, broker.get_sharding_state())
+        self.assertEqual({'object_count': 3, 'bytes_used': 30},
+                         broker.get_shard_usage())
+
+    def test_get_shard_ranges_filters(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(Timestamp('1').internal, 0)
+        ts = Timestamp(time())
+        ranges = [self._make_shard_range('c-0', '', 'f', ts),
+                  self._make_shard_range('c-1', 'f', 'm', ts),
+                  self._make_shard_range('c-2', 'm', '', ts)]
+        broker.merge_shard_ranges(ranges)
+
+        def names(**kwargs):
+            return [shard_range['name'][-3:]
+                    for shard_range in broker.get_shard_ranges(**kwargs)]
+
+        self.assertEqual(['c-0'], names(includes='a'))
+        self.assertEqual(['c-0'], names(includes='f'))
+        self.assertEqual(['c-1'], names(includes='f\x00'))
+        self.assertEqual(['c-2'], names(includes='z'))
+        self.assertEqual(['c-1', 'c-2'], names(marker='f'))
+        self.assertEqual(['c-2'], names(marker='m'))
+        self.assertEqual(['c-0'], names(end_marker='f'))
+        self.assertEqual(['c-0', 'c-1'], names(end_marker='f\x00'))
+        self.assertEqual(['c-1'], names(marker='g', end_marker='h'))
+
+    def test_shard_range_table_missing(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(Timestamp('1').internal, 0)
+        with broker.get() as conn:
+            conn.execute('DROP TABLE shard_range')
+            conn.commit()
+        self.assertEqual([], broker.get_shard_ranges())
+        self.assertEqual(UNSHARDED, broker.get_sharding_state())
+        self.assertTrue(broker.empty())
+        shard_range = self._make_shard_range('c-1', '', '', Timestamp(1))
+        broker.merge_shard_ranges([shard_range])
+        self.assertEqual([shard_range], broker.get_shard_ranges())
+
+    def test_find_shard_bounds(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(Timestamp('1').internal, 0)
+        self.assertEqual([], broker.find_shard_bounds(2))
+        for i in range(7):
+            broker.put_object('o%d' % i, Timestamp(time()).internal, 0,
+                              'text/plain', EMPTY_ETAG)
+        broker.delete_object('o3', Timestamp(time()).internal)
+        # six objects left
+        self.assertEqual(['o1', 'o4', 'o6'], broker.find_shard_bounds(2))
+        self.assertEqual(['o2', 'o6'], broker.find_shard_bounds(3))
+        self.assertEqual([], broker.find_shard_bounds(7))
+
+    def test_get_and_remove_objects(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(Timestamp('1').internal, 0)
+        for i in range(5):
+            broker.put_object('o%d' % i, Timestamp(time()).internal, i,
+                              'text/plain', EMPTY_ETAG)
+        broker.delete_object('o2', Timestamp(time()).internal)
+        rows = broker.get_objects('o0', 'o3')
+        self.assertEqual(['o1', 'o2', 'o3'], [row['name'] for row in rows])
+        self.assertEqual([0, 1, 0], [row['deleted'] for row in rows])
+        self.assertEqual([1, 0, 3], [row['size'] for row in rows])
+        self.assertEqual(['o2', 'o3'], [
+            row['name'] for row in broker.get_objects('o0', 'o3',
+                                                      marker='o1')])
+        self.assertEqual(['o3', 'o4'], [
+            row['name'] for row in broker.get_objects('o2', '')])
+        self.assertEqual(['o0'], [
+            row['name'] for row in broker.get_objects('', '', limit=1)])
+
+        broker.remove_objects([row['ROWID'] for row in rows])
+        self.assertEqual(['o0', 'o4'], [
+            row['name'] for row in broker.get_objects('', '')])
+
     def test_reclaim(self):
         broker = ContainerBroker(':memory:', account='test_account',
                                  container='test_container')
@@ -1584,6 +1715,87 @@ class TestContainerBroker(unittest.TestCase):
         self.assertEqual([row[0] for row in listing],
                          ['o10', 'o1'])
 
+    def test_list_objects_iter_steps_over_pseudo_dirs(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(Timestamp('1').internal, 0)
+        names = ['a', 'b/', 'c0']
+        for i, count in enumerate((1, 2, 3, 4, 7)):
+            names.extend('d%d/%d' % (i, j) for j in range(count))
+        names.extend(['d2/x/y', 'e/1', 'f'])
+        for name in names:
+            broker.put_object(name, Timestamp(0).internal, 0,
+                              'text/plain', EMPTY_ETAG)
+        expected = ['a', 'b/', 'c0', 'd0/', 'd1/', 'd2/', 'd3/', 'd4/', 'e/',
+                    'f']
+
+        def check(skip_rows):
+            with mock.patch('swift.container.backend.DELIMITER_SKIP_ROWS',
+                            skip_rows):
+                for limit in range(1, len(expected) + 1):
+                    listing = broker.list_objects_iter(
+                        limit, None, None, None, '/')
+                    self.assertEqual(expected[:limit],
+                                     [row[0] for row in listing])
+                    listing = broker.list_objects_iter(
+                        limit, None, None, None, '/', reverse=True)
+                    self.assertEqual(expected[::-1][:limit],
+                                     [row[0] for row in listing])
+                listing = broker.list_objects_iter(
+                    100, 'd1/', 'e/', None, '/')
+                self.assertEqual(['d2/', 'd3/', 'd4/'],
+                                 [row[0] for row in listing])
+                listing = broker.list_objects_iter(
+                    100, 'e/', 'd1/', None, '/', reverse=True)
+                self.assertEqual(['d4/', 'd3/', 'd2/'],
+                                 [row[0] for row in listing])
+                listing = broker.list_objects_iter(100, None, None, 'd2/', '/')
+                self.assertEqual(['d2/0', 'd2/1', 'd2/2', 'd2/x/'],
+                                 [row[0] for row in listing])
+                listing = broker.list_objects_iter(100, None, None, None, None,
+                                                   path='d4')
+                self.assertEqual(['d4/%d' % j for j in range(7)],
+                                 [row[0] for row in listing])
+
+        # whether the rows of a pseudo-dir are stepped over or sought past,
+        # the listings are the same
+        for skip_rows in (1, 2, 3, 100):
+            check(skip_rows)
+
+    def test_list_objects_iter_policy_index(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(Timestamp('1').internal, 0)
+        for i in range(10):
+            broker.put_object('o%d' % i, Timestamp(0).internal, 0,
+                              'text/plain', EMPTY_ETAG,
+                              storage_policy_index=i % 2)
+            broker.put_object('d/o%d' % i, Timestamp(0).internal, 0,
+                              'text/plain', EMPTY_ETAG,
+                              storage_policy_index=i % 2)
+        listing = broker.list_objects_iter(3, 'o2', None, None, None,
+                                           storage_policy_index=1)
+        self.assertEqual(['o3', 'o5', 'o7'], [row[0] for row in listing])
+        listing = broker.list_objects_iter(3, 'o3', None, None, '/',
+                                           storage_policy_index=0,
+                                           reverse=True)
+        self.assertEqual(['o2', 'o0', 'd/'], [row[0] for row in listing])
+
+        with broker.get() as conn:
+            curs = broker._list_objects_query(conn, 'o2', False, None, 1,
+                                              False, 3)
+            self.assertEqual(['o3', 'o5', 'o7'], [row[0] for row in curs])
+
+    def test_list_objects_iter_policy_index_plan(self):
+        # the names of a policy's objects are read from an index
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(Timestamp('1').internal, 0)
+        with broker.get() as conn:
+            plan = conn.execute('EXPLAIN QUERY PLAN SELECT name FROM object '
+                                'WHERE name > ? AND deleted = 0 AND '
+                                'storage_policy_index = ? ORDER BY name',
+                                ('o2', 1)).fetchall()
+        self.assertIn('ix_object_deleted_policy_name',
+                      str([tuple(row) for row in plan]))
+
     def test_double_check_trailing_delimiter(self):
         # Test ContainerBroker.list_objects_iter for a
         # container that has an odd file with a trailing delimiter
@@ -2127,6 +2339,16 @@ class ContainerBrokerMigrationMixin(object):
             ContainerBroker.create_policy_stat_table
         ContainerBroker.create_policy_stat_table = lambda *args: None
 
+    def test_list_objects_iter_policy_index_plan(self):
+        # databases created with older schemas are not given the index
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(Timestamp('1').internal, 0)
+        with broker.get() as conn:
+            self.assertFalse(conn.execute('''
+                SELECT name FROM sqlite_master
+                WHERE name = 'ix_object_deleted_policy_name'
+            ''').fetchall())
+
     @classmethod
     @contextmanager
     def old_broker(cls):
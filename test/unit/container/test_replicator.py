@@ -24,10 +24,12 @@ import sqlite3
 
 from swift.common import db_replicator
 from swift.container import replicator, backend, server, sync_store
+from swift.container.backend import SHARD_CREATED, SHARD_CLEAVED
 from swift.container.reconciler import (
     MISPLACED_OBJECTS_ACCOUNT, get_reconciler_container_name)
 from swift.common.utils import Timestamp, encode_timestamps
 from swift.common.storage_policy import POLICIES
+from swift.common.swob import HTTPBadRequest
 
 from test.unit.common import test_db_replicator
 from test.unit import patch_policies, make_timestamp_iter, FakeLogger
@@ -453,6 +455,65 @@ class TestReplicatorSync(test_db_replicator.TestReplicatorSync):
         self.assertEqual(remote_put_timestamp,
                          remote_broker.get_info()['put_timestamp'])
 
+    def test_sync_shard_ranges(self):
+        ts = (Timestamp(t).internal for t in
+              itertools.count(int(time.time())))
+        broker = self._get_broker('a', 'c', node_index=0)
+        broker.initialize(next(ts), POLICIES.default.idx)
+        remote_broker = self._get_broker('a', 'c', node_index=1)
+        remote_broker.initialize(next(ts), POLICIES.default.idx)
+        shard_ranges = [
+            {'name': '.shards_a/c-1', 'lower': '', 'upper': 'm',
+             'timestamp': next(ts), 'object_count': 0, 'bytes_used': 0,
+             'state': SHARD_CREATED},
+            {'name': '.shards_a/c-2', 'lower': 'm', 'upper': '',
+             'timestamp': next(ts), 'object_count': 0, 'bytes_used': 0,
+             'state': SHARD_CREATED}]
+        broker.merge_shard_ranges(shard_ranges)
+        # the remote has a newer version of one of them
+        newer = dict(shard_ranges[1], timestamp=next(ts),
+                     state=SHARD_CLEAVED, object_count=2)
+        remote_broker.merge_shard_ranges([newer])
+
+        daemon = replicator.ContainerReplicator({})
+        part, node = self._get_broker_part_node(remote_broker)
+        info = broker.get_replication_info()
+        success = daemon._repl_to_node(node, broker, part, info)
+        self.assertTrue(success)
+        self.assertEqual([shard_ranges[0], newer],
+                         remote_broker.get_shard_ranges())
+        self.assertEqual(shard_ranges, broker.get_shard_ranges())
+
+    def test_sync_shard_ranges_peer_not_upgraded(self):
+        ts = (Timestamp(t).internal for t in
+              itertools.count(int(time.time())))
+        broker = self._get_broker('a', 'c', node_index=0)
+        broker.initialize(next(ts), POLICIES.default.idx)
+        remote_broker = self._get_broker('a', 'c', node_index=1)
+        remote_broker.initialize(next(ts), POLICIES.default.idx)
+        broker.merge_shard_ranges([
+            {'name': '.shards_a/c-1', 'lower': '', 'upper': '',
+             'timestamp': next(ts), 'object_count': 0, 'bytes_used': 0,
+             'state': SHARD_CREATED}])
+        broker.put_object('o', next(ts), 0, 'text/plain',
+                          'd41d8cd98f00b204e9800998ecf8427e')
+
+        daemon = replicator.ContainerReplicator({}, logger=self.logger)
+        part, node = self._get_broker_part_node(remote_broker)
+        info = broker.get_replication_info()
+        # a peer that rejects the op still gets the DB's rows
+        with mock.patch.object(
+                replicator.ContainerReplicatorRpc, 'merge_shard_ranges',
+                lambda *args: HTTPBadRequest(body='Unknown op')):
+            success = daemon._repl_to_node(node, broker, part, info)
+        self.assertTrue(success)
+        self.assertEqual(['o'], [row['name'] for row in
+                                 remote_broker.get_objects('', '')])
+        self.assertEqual([], remote_broker.get_shard_ranges())
+        warnings = self.logger.get_lines_for_level('warning')
+        self.assertEqual(1, len(warnings))
+        self.assertIn('Bad response 400', warnings[0])
+
     def test_sync_bogus_db_quarantines(self):
         ts = (Timestamp(t).internal for t in
               itertools.count(int(time.time())))
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import operator
 import os
 import mock
@@ -38,7 +39,8 @@ from swift.common.header_key_dict import HeaderKeyDict
 from swift.common.swob import (Request, WsgiBytesIO, HTTPNoContent)
 import swift.container
 from swift.container import server as container_server
-from swift.common import constraints
+from swift.container.backend import SHARD_ACTIVE, SHARD_CLEAVED
+from swift.common import constraints, listing_formats
 from swift.common.utils import (Timestamp, mkdirs, public, replication,
                                 storage_directory, lock_parent_directory)
 from test.unit import fake_http_connect, debug_logger
@@ -318,10 +320,11 @@ class TestContainerController(unittest.TestCase):
         req.content_length = 0
         resp = server_handler.OPTIONS(req)
         self.assertEqual(200, resp.status_int)
-        for verb in 'OPTIONS GET POST PUT DELETE HEAD REPLICATE'.split():
+        for verb in 'OPTIONS GET POST PUT DELETE HEAD REPLICATE ' \
+                'UPDATE'.split():
             self.assertTrue(
                 verb in resp.headers['Allow'].split(', '))
-        self.assertEqual(len(resp.headers['Allow'].split(', ')), 7)
+        self.assertEqual(len(resp.headers['Allow'].split(', ')), 8)
         self.assertEqual(resp.headers['Server'],
                          (self.controller.server_type + '/' + swift_version))
 
@@ -930,6 +933,42 @@ class TestContainerController(unittest.TestCase):
         resp = req.get_response(self.controller)
         self.assertEqual(resp.status_int, 400)
 
+    def test_async_commits(self):
+        self.assertIsNone(self.controller.committer)
+        self.controller = container_server.ContainerController(
+            {'devices': self.testdir, 'mount_check': 'false',
+             'async_commits': 'true', 'async_commit_interval': '5',
+             'recon_cache_path': self.testdir})
+        committer = self.controller.committer
+        self.assertEqual(5, committer.interval)
+        self.assertEqual(1048576, committer.pending_cap)
+        self.assertEqual(os.path.join(self.testdir, 'container.recon'),
+                         committer.rcache)
+        self.assertEqual('container_db_committer', committer.recon_key)
+        req = Request.blank('/sda1/p/a/c', method='PUT',
+                            headers={'X-Timestamp': '1'})
+        self.assertEqual(201, req.get_response(self.controller).status_int)
+        with mock.patch('swift.common.db.spawn') as mock_spawn:
+            req = Request.blank(
+                '/sda1/p/a/c/o', method='PUT', headers={
+                    'X-Timestamp': '2', 'X-Size': '0',
+                    'X-Content-Type': 'text/plain', 'X-Etag': 'x'})
+            self._update_object_put_headers(req)
+            self.assertEqual(201,
+                             req.get_response(self.controller).status_int)
+        mock_spawn.assert_called_once_with(committer._run)
+        # the object's record is left to the committer...
+        broker = self.controller._get_container_broker('sda1', 'p', 'a', 'c')
+        self.assertIs(committer, broker.committer)
+        self.assertEqual([broker.db_file], list(committer._waiting))
+        # ...unless a reader commits it first
+        req = Request.blank('/sda1/p/a/c', method='GET',
+                            query_string='format=json')
+        resp = req.get_response(self.controller)
+        self.assertEqual(['o'], [obj['name'] for obj in json.loads(resp.body)])
+        self.assertEqual({}, committer._waiting)
+        self.assertGreater(committer.get_stats()['reads'], 0)
+
     def test_POST_insufficient_storage(self):
         self.controller = container_server.ContainerController(
             {'devices': self.testdir})
@@ -1531,6 +1570,158 @@ class TestContainerController(unittest.TestCase):
         resp = req.get_response(self.controller)
         self.assertEqual(resp.status_int, 404)
 
+    def test_UPDATE(self):
+        ts = (Timestamp(t).internal for t in
+              itertools.count(int(time.time())))
+        req = Request.blank('/sda1/p/a/c', method='PUT', headers={
+            'X-Timestamp': next(ts)})
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 201)
+        policy_index = int(POLICIES.default)
+        items = [{'name': 'o1', 'created_at': next(ts), 'size': 1,
+                  'content_type': 'text/plain', 'etag': 'x',
+                  'storage_policy_index': policy_index},
+                 {'name': u'o2\u2603', 'created_at': next(ts), 'size': 2,
+                  'content_type': 'text/plain', 'etag': 'y'},
+                 {'name': 'o3', 'created_at': next(ts), 'size': 3,
+                  'content_type': 'text/plain', 'etag': 'z'}]
+        req = Request.blank('/sda1/p/a/c', method='UPDATE', headers={
+            'X-Timestamp': next(ts),
+            'X-Backend-Storage-Policy-Index': policy_index},
+            body=json.dumps(items))
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 202)
+        # a later update deletes one of the objects
+        items = [{'name': 'o3', 'created_at': next(ts), 'size': 0,
+                  'content_type': 'application/deleted', 'etag': 'noetag',
+                  'deleted': 1, 'storage_policy_index': policy_index}]
+        req = Request.blank('/sda1/p/a/c', method='UPDATE', headers={
+            'X-Timestamp': next(ts)}, body=json.dumps(items))
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 202)
+
+        req = Request.blank('/sda1/p/a/c', method='GET',
+                            query_string='format=json')
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(
+            [(u'o1', 1, 'x'), (u'o2\u2603', 2, 'y')],
+            [(o['name'], o['bytes'], o['hash'])
+             for o in json.loads(resp.body)])
+        self.assertEqual(resp.headers['X-Container-Object-Count'], '2')
+        self.assertEqual(resp.headers['X-Container-Bytes-Used'], '3')
+
+    def test_UPDATE_errors(self):
+        items = [{'name': 'o', 'created_at': Timestamp(2).internal,
+                  'size': 1, 'content_type': 'text/plain', 'etag': 'x'}]
+        # no container
+        req = Request.blank('/sda1/p/a/c', method='UPDATE', headers={
+            'X-Timestamp': Timestamp(1).internal}, body=json.dumps(items))
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 404)
+        # unless it is auto-created
+        req = Request.blank('/sda1/p/.a/c', method='UPDATE', headers={
+            'X-Timestamp': Timestamp(1).internal}, body=json.dumps(items))
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 202)
+        req = Request.blank('/sda1/p/.a/c', method='HEAD')
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.headers['X-Container-Object-Count'], '1')
+        # no timestamp
+        req = Request.blank('/sda1/p/.a/c', method='UPDATE',
+                            body=json.dumps(items))
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 400)
+        # bad bodies
+        for body in ('not json', json.dumps([{'name': 'o'}]),
+                     json.dumps([dict(items[0], size='big')]),
+                     json.dumps([dict(items[0], created_at='never')]),
+                     json.dumps({'name': 'o'})):
+            req = Request.blank('/sda1/p/.a/c', method='UPDATE', headers={
+                'X-Timestamp': Timestamp(1).internal}, body=body)
+            resp = req.get_response(self.controller)
+            self.assertEqual(resp.status_int, 400, body)
+        # unmounted
+        self.controller.mount_check = True
+        with mock.patch('swift.container.server.check_mount',
+                        return_value=False):
+            req = Request.blank('/sda1/p/.a/c', method='UPDATE', headers={
+                'X-Timestamp': Timestamp(1).internal},
+                body=json.dumps(items))
+            resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 507)
+
+    def test_sharded_container(self):
+        ts = (Timestamp(t).internal for t in
+              itertools.count(int(time.time())))
+        req = Request.blank('/sda1/p/a/c', method='PUT', headers={
+            'X-Timestamp': next(ts)})
+        self.assertEqual(201, req.get_response(self.controller).status_int)
+        req = Request.blank('/sda1/p/a/c/o', method='PUT', headers={
+            'X-Timestamp': next(ts), 'X-Size': 1,
+            'X-Content-Type': 'text/plain', 'X-Etag': 'x',
+            'X-Backend-Storage-Policy-Index': int(POLICIES.default)})
+        self.assertEqual(201, req.get_response(self.controller).status_int)
+
+        def do_head():
+            resp = Request.blank('/sda1/p/a/c', method='HEAD').get_response(
+                self.controller)
+            self.assertEqual(204, resp.status_int)
+            return resp.headers
+
+        def get_shard_ranges(**params):
+            req = Request.blank('/sda1/p/a/c', params=params, headers={
+                'X-Backend-Record-Type': 'shard'})
+            resp = req.get_response(self.controller)
+            self.assertEqual(200, resp.status_int)
+            self.assertEqual('shard', resp.headers['X-Backend-Record-Type'])
+            return [shard_range['name'] for shard_range in
+                    json.loads(resp.body)]
+
+        headers = do_head()
+        self.assertEqual('unsharded', headers['X-Backend-Sharding-State'])
+        self.assertEqual('1', headers['X-Container-Object-Count'])
+        self.assertEqual([], get_shard_ranges())
+
+        broker = self.controller._get_container_broker('sda1', 'p', 'a', 'c')
+        shard_ranges = [
+            {'name': '.shards_a/c-1', 'lower': '', 'upper': 'm',
+             'timestamp': next(ts), 'object_count': 3, 'bytes_used': 30,
+             'state': SHARD_CLEAVED},
+            {'name': '.shards_a/c-2', 'lower': 'm', 'upper': '',
+             'timestamp': next(ts), 'object_count': 4, 'bytes_used': 40,
+             'state': SHARD_CLEAVED}]
+        broker.merge_shard_ranges(shard_ranges)
+        headers = do_head()
+        self.assertEqual('sharding', headers['X-Backend-Sharding-State'])
+        self.assertEqual('1', headers['X-Container-Object-Count'])
+        self.assertEqual([], get_shard_ranges())
+
+        ts_active = next(ts)
+        broker.merge_shard_ranges([
+            dict(shard_range, state=SHARD_ACTIVE, timestamp=ts_active)
+            for shard_range in shard_ranges])
+        # the object left in the container is counted in its shards
+        headers = do_head()
+        self.assertEqual('sharded', headers['X-Backend-Sharding-State'])
+        self.assertEqual('7', headers['X-Container-Object-Count'])
+        self.assertEqual('70', headers['X-Container-Bytes-Used'])
+        self.assertEqual(['.shards_a/c-1', '.shards_a/c-2'],
+                         get_shard_ranges())
+        self.assertEqual(['.shards_a/c-1'], get_shard_ranges(includes='a'))
+        self.assertEqual(['.shards_a/c-2'], get_shard_ranges(marker='m'))
+        self.assertEqual(['.shards_a/c-1'], get_shard_ranges(end_marker='m'))
+
+        # a sharded container is not empty while its shards have objects
+        req = Request.blank('/sda1/p/a/c/o', method='DELETE', headers={
+            'X-Timestamp': next(ts),
+            'X-Backend-Storage-Policy-Index': int(POLICIES.default)})
+        self.assertEqual(204, req.get_response(self.controller).status_int)
+        self.assertEqual('7', do_head()['X-Container-Object-Count'])
+        req = Request.blank('/sda1/p/a/c', method='DELETE', headers={
+            'X-Timestamp': next(ts)})
+        self.assertEqual(409, req.get_response(self.controller).status_int)
+
     def test_object_update_with_offset(self):
         ts = (Timestamp(t).internal for t in
               itertools.count(int(time.time())))
@@ -2132,6 +2323,45 @@ class TestContainerController(unittest.TestCase):
         self.assertEqual(resp.content_type, 'text/plain')
         self.assertEqual(resp.body, plain_body)
 
+    def test_GET_listing_is_encoded_as_it_is_sent(self):
+        req = Request.blank(
+            '/sda1/p/a/c', environ={'REQUEST_METHOD': 'PUT',
+                                    'HTTP_X_TIMESTAMP': '0'})
+        resp = req.get_response(self.controller)
+        for i in range(3):
+            req = Request.blank(
+                '/sda1/p/a/c/%s' % i, environ={
+                    'REQUEST_METHOD': 'PUT',
+                    'HTTP_X_TIMESTAMP': '1',
+                    'HTTP_X_CONTENT_TYPE': 'text/plain',
+                    'HTTP_X_ETAG': 'x',
+                    'HTTP_X_SIZE': 0})
+            self._update_object_put_headers(req)
+            resp = req.get_response(self.controller)
+            self.assertEqual(resp.status_int, 201)
+        small_chunks = functools.partial(
+            listing_formats.encode_json_listing, chunk_size=1)
+        with mock.patch('swift.container.server.encode_json_listing',
+                        small_chunks), \
+                mock.patch.object(listing_formats, 'JSON_BATCH_SIZE', 1):
+            req = Request.blank('/sda1/p/a/c?format=json',
+                                environ={'REQUEST_METHOD': 'GET'})
+            resp = req.get_response(self.controller)
+            chunks = list(resp.app_iter)
+        self.assertEqual(resp.status_int, 200)
+        self.assertNotIn('Content-Length', resp.headers)
+        self.assertEqual(5, len(chunks))
+        self.assertEqual(['0', '1', '2'],
+                         [obj['name'] for obj in json.loads(''.join(chunks))])
+        for format in ('xml', 'plain'):
+            req = Request.blank('/sda1/p/a/c?format=%s' % format,
+                                environ={'REQUEST_METHOD': 'GET'})
+            resp = req.get_response(self.controller)
+            self.assertEqual(resp.status_int, 200)
+            self.assertNotIn('Content-Length', resp.headers)
+            self.assertIn('<name>2</name>' if format == 'xml' else '2\n',
+                          resp.body)
+
     def test_GET_json_last_modified(self):
         # make a container
         req = Request.blank(
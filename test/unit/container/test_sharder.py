@@ -0,0 +1,235 @@
+# Copyright (c) 2010-2016 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import unittest
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import mock
+
+from swift.common.swob import Request
+from swift.common.utils import Timestamp
+from swift.container import sharder
+from swift.container.backend import SHARD_ACTIVE, SHARD_CREATED, \
+    UNSHARDED, SHARDED
+from swift.container.server import ContainerController
+
+from test.unit import FakeRing, debug_logger, make_timestamp_iter, \
+    patch_policies
+
+
+@patch_policies
+class TestContainerSharder(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.devices = ['sda', 'sdb', 'sdc']
+        for device in self.devices:
+            os.mkdir(os.path.join(self.testdir, device))
+        self.logger = debug_logger()
+        self.controller = ContainerController(
+            {'devices': self.testdir, 'mount_check': 'false'},
+            logger=self.logger)
+        self.ts_iter = make_timestamp_iter()
+        self.ring = FakeRing()
+        with mock.patch('swift.container.sharder.Ring',
+                        return_value=self.ring):
+            self.sharder = sharder.ContainerSharder(
+                {'devices': self.testdir, 'mount_check': 'false',
+                 'shard_container_threshold': '4',
+                 'recon_cache_path': self.testdir}, logger=self.logger)
+
+    def tearDown(self):
+        rmtree(self.testdir, ignore_errors=True)
+
+    def _request(self, device, path, method, **kwargs):
+        req = Request.blank('/%s/0%s' % (device, path), method=method,
+                            **kwargs)
+        return req.get_response(self.controller)
+
+    def _put_objects(self, names, devices=None):
+        for device in devices or self.devices:
+            resp = self._request(device, '/a/c', 'PUT', headers={
+                'X-Timestamp': Timestamp(1).internal})
+            self.assertIn(resp.status_int, (201, 202))
+            for name in names:
+                resp = self._request(device, '/a/c/%s' % name, 'PUT',
+                                     headers={
+                                         'X-Timestamp': next(
+                                             self.ts_iter).internal,
+                                         'X-Size': 1,
+                                         'X-Content-Type': 'text/plain',
+                                         'X-Etag': 'x'})
+                self.assertEqual(201, resp.status_int)
+
+    def _get_broker(self, device, account='a', container='c'):
+        return self.controller._get_container_broker(
+            device, '0', account, container)
+
+    def _listing(self, device, account, container):
+        resp = self._request(device, '/%s/%s' % (account, container), 'GET',
+                             query_string='format=json')
+        if resp.status_int == 404:
+            return None
+        return [obj['name'] for obj in json.loads(resp.body)]
+
+    def _fake_send_to_node(self, node, part, account, container, body,
+                           policy_index):
+        resp = self._request(node['device'], '/%s/%s' % (account, container),
+                             'UPDATE', body=body, headers={
+                                 'X-Timestamp': next(self.ts_iter).internal,
+                                 'X-Backend-Storage-Policy-Index':
+                                 policy_index})
+        return 200 <= resp.status_int < 300
+
+    def _fake_head_container(self, node, part, account, container, **kwargs):
+        return self._request(node['device'], '/%s/%s' % (account, container),
+                             'HEAD').headers
+
+    def _run_once(self, local_devices=(0,)):
+        with mock.patch.object(self.sharder, '_find_local_devices'), \
+                mock.patch.object(self.sharder, '_send_to_node',
+                                  self._fake_send_to_node), \
+                mock.patch('swift.container.sharder.direct_head_container',
+                           self._fake_head_container):
+            self.sharder._local_device_ids = set(local_devices)
+            self.sharder.run_once()
+
+    def test_find_local_devices(self):
+        self.sharder.port = 1001
+        with mock.patch('swift.container.sharder.whataremyips',
+                        return_value=['10.0.0.1']):
+            self.sharder._find_local_devices()
+        self.assertEqual(set([1]), self.sharder._local_device_ids)
+
+    def test_small_container_not_sharded(self):
+        self._put_objects(['o0', 'o1', 'o2'])
+        self._run_once()
+        self.assertEqual(UNSHARDED,
+                         self._get_broker('sda').get_sharding_state())
+        self.assertEqual(3, self.sharder.stats['attempted'])
+        self.assertEqual(0, self.sharder.stats['planned'])
+
+    def test_shard_container(self):
+        names = ['o%d' % i for i in range(6)]
+        self._put_objects(names)
+        self._run_once()
+        stats = self.sharder.stats
+        self.assertEqual(1, stats['planned'])
+        self.assertEqual(4, stats['cleaved'])
+        self.assertEqual(1, stats['activated'])
+        self.assertEqual(0, stats['failures'])
+
+        # the leader split the container into ranges of two objects
+        broker = self._get_broker('sda')
+        self.assertEqual(SHARDED, broker.get_sharding_state())
+        shard_ranges = broker.get_shard_ranges()
+        self.assertEqual([('', 'o1'), ('o1', 'o3'), ('o3', 'o5'), ('o5', '')],
+                         [(shard_range['lower'], shard_range['upper'])
+                          for shard_range in shard_ranges])
+        self.assertEqual([SHARD_ACTIVE] * 4,
+                         [shard_range['state']
+                          for shard_range in shard_ranges])
+        self.assertEqual([2, 2, 2, 0], [shard_range['object_count']
+                                        for shard_range in shard_ranges])
+        # and copied the objects to every replica of the shards, even the
+        # empty one
+        for device in self.devices:
+            self.assertEqual(
+                [['o0', 'o1'], ['o2', 'o3'], ['o4', 'o5'], []],
+                [self._listing(device, *shard_range['name'].split('/'))
+                 for shard_range in shard_ranges])
+        # the other replicas of the root do not shard it themselves
+        self.assertEqual(UNSHARDED,
+                         self._get_broker('sdb').get_sharding_state())
+        # the root still holds the cleaved rows, but reports only those of
+        # its shards
+        self.assertEqual(6, broker.get_info()['object_count'])
+        resp = self._request('sda', '/a/c', 'HEAD')
+        self.assertEqual('sharded', resp.headers['X-Backend-Sharding-State'])
+        self.assertEqual('6', resp.headers['X-Container-Object-Count'])
+        self.assertEqual('6', resp.headers['X-Container-Bytes-Used'])
+
+        # on the next pass the leader moves the root's rows to the shards
+        # and refreshes the shard usage
+        self.sharder.shard_container_threshold = 1
+        self._put_objects(['o7'], devices=['sda'])
+        self._run_once()
+        self.assertEqual(7, self.sharder.stats['moved'])
+        self.assertEqual(0, self.sharder.stats['planned'])
+        self.assertEqual([], self._listing('sda', 'a', 'c'))
+        self.assertEqual(['o4', 'o5'], self._listing(
+            'sdb', *shard_ranges[2]['name'].split('/')))
+        self.assertEqual(['o7'], self._listing(
+            'sdc', *shard_ranges[3]['name'].split('/')))
+        self.assertEqual([2, 2, 2, 1], [
+            shard_range['object_count']
+            for shard_range in broker.get_shard_ranges()])
+        resp = self._request('sda', '/a/c', 'HEAD')
+        self.assertEqual('7', resp.headers['X-Container-Object-Count'])
+        self.assertEqual('sharded', resp.headers['X-Backend-Sharding-State'])
+
+        # once the shard ranges are replicated, the other replicas move
+        # their rows too
+        self._get_broker('sdb').merge_shard_ranges(
+            broker.get_shard_ranges())
+        self._run_once()
+        self.assertEqual(6, self.sharder.stats['moved'])
+        self.assertEqual([], self._listing('sdb', 'a', 'c'))
+        self.assertEqual(['o0', 'o1', 'o2', 'o3', 'o4', 'o5'],
+                         self._listing('sdc', 'a', 'c'))
+
+        # the shards themselves are left alone
+        self.assertEqual(3, self.sharder.stats['attempted'])
+        with open(os.path.join(self.testdir, 'container.recon')) as f:
+            recon = json.load(f)
+        self.assertEqual(6, recon['sharding_stats']['moved'])
+        self.assertIn('sharding_pass_completed', recon)
+
+    def test_cleave_failure(self):
+        self._put_objects(['o%d' % i for i in range(4)], devices=['sda'])
+
+        def fail_send(*args):
+            return False
+
+        with mock.patch.object(self.sharder, '_send_to_node', fail_send), \
+                mock.patch.object(self.sharder, '_find_local_devices'):
+            self.sharder._local_device_ids = set([0])
+            self.sharder.run_once()
+        self.assertEqual(1, self.sharder.stats['planned'])
+        self.assertEqual(0, self.sharder.stats['cleaved'])
+        broker = self._get_broker('sda')
+        self.assertEqual([SHARD_CREATED] * 3, [
+            shard_range['state'] for shard_range in
+            broker.get_shard_ranges()])
+
+        # the next pass picks up where it left off
+        self._run_once()
+        self.assertEqual(0, self.sharder.stats['planned'])
+        self.assertEqual(3, self.sharder.stats['cleaved'])
+        self.assertEqual(SHARDED, broker.get_sharding_state())
+
+    def test_not_leader(self):
+        self._put_objects(['o%d' % i for i in range(4)])
+        self._run_once(local_devices=(1, 2))
+        for device in self.devices:
+            self.assertEqual(UNSHARDED,
+                             self._get_broker(device).get_sharding_state())
+
+
+if __name__ == '__main__':
+    unittest.main()
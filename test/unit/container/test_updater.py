@@ -27,7 +27,7 @@ from eventlet import spawn, Timeout, listen
 
 from swift.common import utils
 from swift.container import updater as container_updater
-from swift.container.backend import ContainerBroker, DATADIR
+from swift.container.backend import ContainerBroker, DATADIR, SHARD_ACTIVE
 from swift.common.ring import RingData
 from swift.common.utils import normalize_timestamp
 
@@ -242,6 +242,37 @@ class TestContainerUpdater(unittest.TestCase):
         log_lines = cu.logger.get_lines_for_level('error')
         self.assertEqual(len(log_lines), 0)
 
+    def test_sharded_container_reports_shard_usage(self):
+        cu = container_updater.ContainerUpdater({
+            'devices': self.devices_dir,
+            'mount_check': 'false',
+            'swift_dir': self.testdir,
+            'interval': '1',
+            'concurrency': '1',
+            'node_timeout': '15',
+        })
+        containers_dir = os.path.join(self.sda1, DATADIR)
+        subdir = os.path.join(containers_dir, 'subdir')
+        os.makedirs(subdir)
+        cb = ContainerBroker(os.path.join(subdir, 'hash.db'), account='a',
+                             container='c')
+        cb.initialize(normalize_timestamp(1), 0)
+        cb.put_object('o', normalize_timestamp(2), 3, 'text/plain',
+                      '68b329da9893e34099c7d8ad5cb9c940')
+        cb.merge_shard_ranges([
+            {'name': '.shards_a/c-1', 'lower': '', 'upper': '',
+             'timestamp': normalize_timestamp(3), 'object_count': 5,
+             'bytes_used': 50, 'state': SHARD_ACTIVE}])
+        with mock.patch.object(cu, 'container_report',
+                               return_value=201) as mock_report:
+            cu.run_once()
+        # the object left in the container is not counted twice
+        self.assertEqual(2, mock_report.call_count)
+        self.assertEqual((5, 50), mock_report.call_args[0][5:7])
+        info = cb.get_info()
+        self.assertEqual(info['reported_object_count'], 5)
+        self.assertEqual(info['reported_bytes_used'], 50)
+
     def test_unicode(self):
         cu = container_updater.ContainerUpdater({
             'devices': self.devices_dir,
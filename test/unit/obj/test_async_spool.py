@@ -0,0 +1,117 @@
+# Copyright (c) 2010-2016 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import mock
+
+from swift.obj import async_spool
+from swift.obj.async_spool import AsyncSpool, decode_records, encode_record
+
+
+def make_update(obj, op='PUT'):
+    return {'op': op, 'account': 'a', 'container': 'c', 'obj': obj,
+            'headers': {'X-Timestamp': '0000000001.00000'}}
+
+
+class TestRecords(unittest.TestCase):
+
+    def test_encode_decode(self):
+        updates = [make_update('o%d' % i) for i in range(3)]
+        buf = ''.join(encode_record(update) for update in updates)
+        self.assertEqual((updates, 0), decode_records(buf))
+        self.assertEqual(([], 0), decode_records(''))
+
+    def test_decode_torn_record(self):
+        updates = [make_update('o1'), make_update('o2')]
+        buf = ''.join(encode_record(update) for update in updates)
+        # the last append was cut short by a crash
+        torn = encode_record(make_update('o3'))[:-5]
+        self.assertEqual((updates, len(torn)), decode_records(buf + torn))
+        # even within the header
+        self.assertEqual((updates, 3), decode_records(buf + torn[:3]))
+
+    def test_decode_corrupt_record(self):
+        records = [encode_record(make_update('o%d' % i)) for i in range(3)]
+        corrupt = records[1].replace('o1', 'x1')
+        self.assertEqual(
+            ([make_update('o0'), make_update('o2')], len(corrupt)),
+            decode_records(records[0] + corrupt + records[2]))
+        # garbage between records is skipped
+        self.assertEqual(
+            ([make_update('o0'), make_update('o2')], 6),
+            decode_records(records[0] + 'ASgarb' + records[2]))
+
+
+class TestAsyncSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.spool_dir = os.path.join(self.testdir, 'async_spool')
+        self.spool = AsyncSpool(self.spool_dir)
+
+    def tearDown(self):
+        rmtree(self.testdir, ignore_errors=True)
+
+    def test_empty_spool(self):
+        self.assertEqual([], self.spool.segments())
+        self.assertIsNone(self.spool.seal())
+        self.assertEqual({'updates': 0, 'bytes': 0, 'files': 0},
+                         self.spool.get_backlog())
+
+    def test_append_and_seal(self):
+        self.spool.append([make_update('o1')])
+        self.spool.append([make_update('o2'), make_update('o3')])
+        self.assertEqual([], self.spool.segments())
+        backlog = self.spool.get_backlog()
+        self.assertEqual(3, backlog['updates'])
+        self.assertEqual(1, backlog['files'])
+
+        segment = self.spool.seal()
+        self.assertEqual([segment], self.spool.segments())
+        self.assertFalse(os.path.exists(self.spool.current_path))
+        self.assertEqual(
+            ([make_update('o1'), make_update('o2'), make_update('o3')], 0),
+            self.spool.read_segment(segment))
+        # nothing more to seal
+        self.assertIsNone(self.spool.seal())
+
+        # later appends start a new current file
+        self.spool.append([make_update('o4')])
+        second = self.spool.seal()
+        self.assertEqual([segment, second], self.spool.segments())
+        self.assertEqual(4, self.spool.get_backlog()['updates'])
+        self.assertEqual(2, self.spool.get_backlog()['files'])
+
+    def test_append_seals_big_current_file(self):
+        with mock.patch.object(async_spool, 'SEGMENT_SIZE', 1):
+            self.spool.append([make_update('o1')])
+        self.assertEqual(1, len(self.spool.segments()))
+        self.assertFalse(os.path.exists(self.spool.current_path))
+
+    def test_segments_ignores_other_files(self):
+        self.spool.append([make_update('o1')])
+        segment = self.spool.seal()
+        self.spool.append([make_update('o2')])
+        with open(os.path.join(self.spool_dir, '.lock'), 'w'):
+            pass
+        self.assertEqual([segment], self.spool.segments())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -23,13 +23,14 @@ from shutil import rmtree
 from hashlib import md5
 from tempfile import mkdtemp
 import textwrap
+import xattr
 from test.unit import (FakeLogger, patch_policies, make_timestamp_iter,
                        DEFAULT_TEST_EC_TYPE)
 from swift.obj import auditor, replicator
 from swift.obj.diskfile import (
     DiskFile, write_metadata, invalidate_hash, get_data_dir,
     DiskFileManager, ECDiskFileManager, AuditLocation, clear_auditor_status,
-    get_auditor_status)
+    get_auditor_status, METADATA_KEY, COMPACT_METADATA_MAGIC)
 from swift.common.utils import (
     mkdirs, normalize_timestamp, Timestamp, readconf)
 from swift.common.storage_policy import (
@@ -243,6 +244,46 @@ class TestAuditor(unittest.TestCase):
                           policy=POLICIES.legacy))
         self.assertEqual(auditor_worker.quarantines, pre_quarantines + 1)
 
+    def test_object_audit_migrates_metadata(self):
+        data = '0' * 1024
+        timestamp = Timestamp(time.time())
+        with self.disk_file.create() as writer:
+            writer.write(data)
+            writer.put({
+                'ETag': md5(data).hexdigest(),
+                'X-Timestamp': timestamp.internal,
+                'Content-Length': str(len(data)),
+            })
+            writer.commit(timestamp)
+        path = os.path.join(self.disk_file._datadir,
+                            timestamp.internal + '.data')
+        location = AuditLocation(self.disk_file._datadir, 'sda', '0',
+                                 policy=POLICIES.legacy)
+        self.assertFalse(xattr.getxattr(path, METADATA_KEY).startswith(
+            COMPACT_METADATA_MAGIC))
+
+        auditor_worker = auditor.AuditorWorker(self.conf, self.logger,
+                                               self.rcache, self.devices)
+        auditor_worker.object_audit(location)
+        self.assertFalse(xattr.getxattr(path, METADATA_KEY).startswith(
+            COMPACT_METADATA_MAGIC))
+
+        conf = dict(self.conf, compact_metadata='true')
+        auditor_worker = auditor.AuditorWorker(conf, self.logger,
+                                               self.rcache, self.devices)
+        auditor_worker.object_audit(location)
+        self.assertTrue(xattr.getxattr(path, METADATA_KEY).startswith(
+            COMPACT_METADATA_MAGIC))
+        self.assertEqual(
+            self.logger.get_increment_counts().get('migrated_metadata'), 1)
+        self.assertEqual(auditor_worker.quarantines, 0)
+
+        # the object still audits cleanly, and is not migrated again
+        auditor_worker.object_audit(location)
+        self.assertEqual(
+            self.logger.get_increment_counts().get('migrated_metadata'), 1)
+        self.assertEqual(auditor_worker.quarantines, 0)
+
     def test_object_audit_will_not_swallow_errors_in_tests(self):
         timestamp = str(normalize_timestamp(time.time()))
         path = os.path.join(self.disk_file._datadir, timestamp + '.data')
@@ -20,6 +20,8 @@ import six.moves.cPickle as pickle
 import os
 import errno
 import itertools
+import json
+import random
 from unittest.util import safe_repr
 import mock
 import unittest
@@ -37,14 +39,16 @@ from hashlib import md5
 from contextlib import closing, contextmanager
 from gzip import GzipFile
 
-from eventlet import hubs, timeout, tpool
+from eventlet import hubs, sleep, spawn, timeout, tpool
 from swift.obj.diskfile import MD5_OF_EMPTY_STRING
+from test import unit
 from test.unit import (FakeLogger, mock as unit_mock, temptree,
                        patch_policies, debug_logger, EMPTY_ETAG,
                        make_timestamp_iter, DEFAULT_TEST_EC_TYPE)
 
 from nose import SkipTest
 from swift.obj import diskfile
+from swift.obj.async_spool import AsyncSpool
 from swift.common import utils
 from swift.common.utils import hash_path, mkdirs, Timestamp, encode_timestamps
 from swift.common import ring
@@ -52,10 +56,11 @@ from swift.common.splice import splice
 from swift.common.exceptions import DiskFileNotExist, DiskFileQuarantined, \
     DiskFileDeviceUnavailable, DiskFileDeleted, DiskFileNotOpen, \
     DiskFileError, ReplicationLockTimeout, DiskFileCollision, \
-    DiskFileExpired, SwiftException, DiskFileNoSpace, DiskFileXattrNotSupported
+    DiskFileExpired, SwiftException, DiskFileNoSpace, \
+    DiskFileXattrNotSupported, LockTimeout
 from swift.common.storage_policy import (
     POLICIES, get_policy_string, StoragePolicy, ECStoragePolicy,
-    BaseStoragePolicy, REPL_POLICY, EC_POLICY)
+    SlabStoragePolicy, BaseStoragePolicy, REPL_POLICY, EC_POLICY)
 
 
 test_policies = [
@@ -117,6 +122,136 @@ def _create_test_ring(path, policy):
                      reload_time=intended_reload_time)
 
 
+def _reference_get_ondisk_files(mgr, files, datadir, **kwargs):
+    """
+    The file-set resolution of get_ondisk_files as it was before being
+    rewritten as a single pass over keyed file records, kept to check that
+    the rewrite resolves every set of files in the same way.
+    """
+    def split_list(original_list, condition):
+        for i, item in enumerate(original_list):
+            if not condition(item):
+                return original_list[:i], original_list[i:]
+        return original_list, []
+
+    def split_gt(file_info_list, timestamp):
+        return split_list(file_info_list, lambda x: x['timestamp'] > timestamp)
+
+    def split_gte(file_info_list, timestamp):
+        return split_list(file_info_list,
+                          lambda x: x['timestamp'] >= timestamp)
+
+    results = {}
+    exts = defaultdict(list)
+    for afile in files:
+        try:
+            file_info = mgr.parse_on_disk_filename(afile)
+            file_info['filename'] = afile
+            exts[file_info['ext']].append(file_info)
+        except diskfile.DiskFileError:
+            results.setdefault('unexpected', []).append(
+                os.path.join(datadir, afile))
+    for ext in exts:
+        exts[ext] = sorted(
+            exts[ext], key=lambda info: info['timestamp'], reverse=True)
+
+    if exts.get('.ts'):
+        for ext in filter(lambda ext: ext != '.ts', exts.keys()):
+            exts[ext], older = split_gt(exts[ext], exts['.ts'][0]['timestamp'])
+            results.setdefault('obsolete', []).extend(older)
+        results.setdefault('obsolete', []).extend(exts['.ts'][1:])
+        exts['.ts'] = exts['.ts'][:1]
+
+    if exts.get('.meta'):
+        retain = 1
+        if exts['.meta'][1:]:
+            exts['.meta'][1:] = sorted(
+                exts['.meta'][1:],
+                key=lambda info: info['ctype_timestamp'], reverse=True)
+            if (exts['.meta'][1]['ctype_timestamp'] >
+                    exts['.meta'][0]['ctype_timestamp']):
+                if (exts['.meta'][1]['timestamp'] ==
+                        exts['.meta'][0]['timestamp']):
+                    exts['.meta'][:2] = [exts['.meta'][1], exts['.meta'][0]]
+                    retain = 1
+                else:
+                    retain = 2
+        results.setdefault('obsolete', []).extend(exts['.meta'][retain:])
+        exts['.meta'] = exts['.meta'][:retain]
+
+    if isinstance(mgr, diskfile.ECDiskFileManager):
+        durable_info = None
+        if exts.get('.durable'):
+            durable_info = exts['.durable'][0]
+            for ext in exts.keys():
+                exts[ext], older = split_gte(
+                    exts[ext], durable_info['timestamp'])
+                results.setdefault('obsolete', []).extend(older)
+        all_frags = exts.get('.data')
+        frag_sets = {}
+        durable_frag_set = None
+        while all_frags:
+            frag_set, all_frags = split_gte(
+                all_frags, all_frags[0]['timestamp'])
+            frag_set.sort(key=lambda info: info['frag_index'])
+            timestamp = frag_set[0]['timestamp']
+            frag_sets[timestamp] = frag_set
+            if durable_info and durable_info['timestamp'] == timestamp:
+                durable_frag_set = frag_set
+        chosen_frag = None
+        if durable_frag_set:
+            if kwargs.get('frag_index') is not None:
+                for info in durable_frag_set:
+                    if info['frag_index'] == kwargs['frag_index']:
+                        chosen_frag = info
+                        break
+            else:
+                chosen_frag = durable_frag_set[-1]
+        if chosen_frag:
+            results['data_info'] = chosen_frag
+            results['durable_frag_set'] = durable_frag_set
+        results['frag_sets'] = frag_sets
+        if exts.get('.durable') and not durable_frag_set:
+            results.setdefault('obsolete', []).extend(exts['.durable'])
+            exts.pop('.durable')
+        for frag_set in frag_sets.values():
+            if frag_set == durable_frag_set:
+                continue
+            results.setdefault('possible_reclaim', []).extend(frag_set)
+        if exts.get('.meta') and not durable_frag_set:
+            results.setdefault('possible_reclaim', []).extend(
+                exts.get('.meta'))
+    else:
+        if exts.get('.data'):
+            for ext in exts.keys():
+                if ext == '.data':
+                    exts[ext], obsolete = split_gte(
+                        exts[ext], exts['.data'][0]['timestamp'])
+                else:
+                    exts[ext], obsolete = split_gt(
+                        exts[ext], exts['.data'][0]['timestamp'])
+                results.setdefault('obsolete', []).extend(obsolete)
+            results['data_info'] = exts['.data'][0]
+        if exts.get('.meta') and not exts.get('.data'):
+            results.setdefault('possible_reclaim', []).extend(
+                exts.get('.meta'))
+
+    if exts.get('.ts'):
+        results['ts_info'] = exts['.ts'][0]
+    if 'data_info' in results and exts.get('.meta'):
+        results['meta_info'] = exts['.meta'][0]
+        ctype_info = exts['.meta'].pop()
+        if (ctype_info['ctype_timestamp']
+                > results['data_info']['timestamp']):
+            results['ctype_info'] = ctype_info
+    for info_key in ('data_info', 'meta_info', 'ts_info', 'ctype_info'):
+        info = results.get(info_key)
+        key = info_key[:-5] + '_file'
+        results[key] = os.path.join(
+            datadir, info['filename']) if info else None
+    return results
+
+
 @patch_policies
 class TestDiskFileModuleMethods(unittest.TestCase):
 
@@ -146,6 +281,7 @@ class TestDiskFileModuleMethods(unittest.TestCase):
 
     def tearDown(self):
         rmtree(self.testdir, ignore_errors=1)
+        unit.xattr_data = {}
 
     def _create_diskfile(self, policy):
         return self.df_mgr.get_diskfile(self.existing_device,
@@ -251,6 +387,154 @@ class TestDiskFileModuleMethods(unittest.TestCase):
             # check tempdir
             self.assertTrue(os.path.isdir(tmp_path))
 
+    def _metadata_xattrs(self, path):
+        return dict((k, v) for k, v in
+                    unit.xattr_data.get(os.stat(path).st_ino, {}).items()
+                    if k.startswith(diskfile.METADATA_KEY))
+
+    def test_compact_metadata(self):
+        path = os.path.join(self.testdir, 'obj')
+        open(path, 'w').close()
+        metadata = {'name': '/a/c/o', 'X-Timestamp': '1402600322.52126',
+                    'Content-Length': 10, 'X-Big': 2 ** 70,
+                    u'X-Object-Meta-☃': u'☃', '': ''}
+        diskfile.write_metadata(path, metadata, compact=True)
+        xattrs = self._metadata_xattrs(path)
+        self.assertEqual(xattrs.keys(), [diskfile.METADATA_KEY])
+        self.assertTrue(xattrs[diskfile.METADATA_KEY].startswith(
+            diskfile.COMPACT_METADATA_MAGIC + '\x01'))
+        self.assertLess(len(xattrs[diskfile.METADATA_KEY]),
+                        len(pickle.dumps(metadata, diskfile.PICKLE_PROTOCOL)))
+        read = diskfile.read_metadata(path)
+        self.assertEqual(read, metadata)
+        for key, value in read.items():
+            self.assertIs(type(value), type(metadata[key]))
+
+        # only pickle can encode other types
+        metadata['X-Float'] = 1.5
+        diskfile.write_metadata(path, metadata, compact=True)
+        xattrs = self._metadata_xattrs(path)
+        self.assertEqual(pickle.loads(xattrs[diskfile.METADATA_KEY]),
+                         metadata)
+        self.assertEqual(diskfile.read_metadata(path), metadata)
+
+    def test_compact_metadata_corner_cases(self):
+        for metadata in ({}, {'': ''}, {'X-Object-Meta-Long': 'v' * 70000}):
+            metastr = diskfile._encode_compact_metadata(metadata)
+            self.assertEqual(diskfile._decode_compact_metadata(metastr),
+                             metadata)
+        # the keys and values are separated by NULs
+        self.assertIsNone(diskfile._encode_compact_metadata(
+            {'name': '/a/c/o', 'X-Object-Meta-Nul': 'a\x00b'}))
+        self.assertIsNone(diskfile._encode_compact_metadata(
+            {'name': '/a/c/o', 'X-Object-Meta-Nul': u'a\x00b'}))
+
+    def test_compact_metadata_split_across_xattrs(self):
+        path = os.path.join(self.testdir, 'obj')
+        open(path, 'w').close()
+        metadata = dict(('X-Object-Meta-%d' % i, 'v' * i) for i in range(20))
+        diskfile.write_metadata(path, metadata, xattr_size=64, compact=True)
+        num_xattrs = len(self._metadata_xattrs(path))
+        self.assertGreater(num_xattrs, 1)
+        with mock.patch('xattr.getxattr',
+                        side_effect=unit._getxattr) as mock_getxattr:
+            self.assertEqual(diskfile.read_metadata(path), metadata)
+        # the length in the header saves looking for one more xattr
+        self.assertEqual(mock_getxattr.call_count, num_xattrs)
+
+        path = os.path.join(self.testdir, 'pickled')
+        open(path, 'w').close()
+        diskfile.write_metadata(path, metadata, xattr_size=64)
+        num_xattrs = len(self._metadata_xattrs(path))
+        with mock.patch('xattr.getxattr',
+                        side_effect=unit._getxattr) as mock_getxattr:
+            self.assertEqual(diskfile.read_metadata(path), metadata)
+        self.assertEqual(mock_getxattr.call_count, num_xattrs + 1)
+
+    def test_read_corrupt_compact_metadata(self):
+        path = os.path.join(self.testdir, 'obj')
+        open(path, 'w').close()
+        metastr = diskfile._encode_compact_metadata({'name': '/a/c/o'})
+
+        def check_corrupt(bad_metastr, msg):
+            xattr.setxattr(path, diskfile.METADATA_KEY, bad_metastr)
+            with self.assertRaises(ValueError) as cm:
+                diskfile.read_metadata(path)
+            self.assertIn(msg, str(cm.exception))
+
+        check_corrupt(metastr[:-1], 'expected')
+        check_corrupt(metastr[:6], 'unpack')
+        check_corrupt(metastr[:4] + '\x02' + metastr[5:],
+                      'unsupported version 2')
+        check_corrupt(metastr.replace('/a/c/o', '/a\x00c/o'),
+                      'expected 2 keys and values, got 3')
+        code_offset = diskfile._COMPACT_METADATA_HEADER.size
+        check_corrupt(metastr[:code_offset] + 'x' +
+                      metastr[code_offset + 1:], 'unknown type code')
+        check_corrupt(metastr[:code_offset] + 'su' + metastr[
+            code_offset + 2:].replace('/a/c/o', '/a/c/\xff'),
+            'can\'t decode')
+
+    def test_migrate_metadata(self):
+        path = os.path.join(self.testdir, 'obj')
+        open(path, 'w').close()
+        metadata = dict(('X-Object-Meta-%d' % i, 'v' * i) for i in range(20))
+        diskfile.write_metadata(path, metadata, xattr_size=64)
+        self.assertGreater(len(self._metadata_xattrs(path)), 1)
+
+        self.assertTrue(diskfile.migrate_metadata(path))
+        xattrs = self._metadata_xattrs(path)
+        self.assertEqual(xattrs.keys(), [diskfile.METADATA_KEY])
+        self.assertTrue(xattrs[diskfile.METADATA_KEY].startswith(
+            diskfile.COMPACT_METADATA_MAGIC))
+        self.assertEqual(diskfile.read_metadata(path), metadata)
+        # already compact
+        self.assertFalse(diskfile.migrate_metadata(path))
+
+    def test_read_metadata_while_migrated(self):
+        path = os.path.join(self.testdir, 'obj')
+        open(path, 'w').close()
+        metadata = dict(('X-Object-Meta-%d' % i, 'v' * i) for i in range(20))
+        diskfile.write_metadata(path, metadata, xattr_size=64)
+        real_getxattr = xattr.getxattr
+        migrated = []
+
+        def racing_getxattr(fd, key):
+            value = real_getxattr(fd, key)
+            if not migrated:
+                # the pickle is migrated just after its first xattr is read
+                migrated.append(None)
+                migrated[0] = diskfile.migrate_metadata(fd)
+            return value
+
+        with mock.patch('swift.obj.diskfile.xattr.getxattr',
+                        racing_getxattr):
+            self.assertEqual(diskfile.read_metadata(path), metadata)
+        self.assertEqual([True], migrated)
+
+        # pickled metadata that is corrupt is only read twice
+        diskfile.write_metadata(path, metadata, xattr_size=64)
+        xattr.setxattr(path, diskfile.METADATA_KEY + '1', 'garbage')
+        with mock.patch('swift.obj.diskfile.xattr.getxattr',
+                        wraps=real_getxattr) as mock_getxattr:
+            self.assertRaises(Exception, diskfile.read_metadata, path)
+        keys = [call[0][1] for call in mock_getxattr.call_args_list]
+        self.assertEqual(2, keys.count(diskfile.METADATA_KEY))
+
+    def test_migrate_metadata_leaves_big_metadata_pickled(self):
+        path = os.path.join(self.testdir, 'obj')
+        open(path, 'w').close()
+        metadata = dict(('X-Object-Meta-%d' % i, 'v' * i) for i in range(20))
+        diskfile.write_metadata(path, metadata, xattr_size=64)
+        xattrs = self._metadata_xattrs(path)
+        self.assertFalse(diskfile.migrate_metadata(path, xattr_size=64))
+        self.assertEqual(self._metadata_xattrs(path), xattrs)
+
+        metadata = {'name': '/a/c/o', 'X-Float': 1.5}
+        diskfile.write_metadata(path, metadata)
+        self.assertFalse(diskfile.migrate_metadata(path))
+        self.assertEqual(diskfile.read_metadata(path), metadata)
+
 
 @patch_policies
 class TestObjectAuditLocationGenerator(unittest.TestCase):
@@ -517,6 +801,102 @@ class TestDiskFileRouter(unittest.TestCase):
                 self.assertTrue(isinstance(manager, TestDiskFileManager))
 
 
+class TestGroupCommitter(unittest.TestCase):
+
+    def test_commit_batches_waiting_writers(self):
+        first_sync_started = utils.stdlib_threading.Event()
+        release_first_sync = utils.stdlib_threading.Event()
+        synced = []
+
+        def fake_syncfs(fd):
+            synced.append(fd)
+            if len(synced) == 1:
+                first_sync_started.set()
+                release_first_sync.wait()
+
+        results = {}
+
+        def do_commit(committer, fd):
+            results[fd] = committer.commit(fd)
+
+        with mock.patch('swift.obj.diskfile.syncfs', fake_syncfs):
+            committer = diskfile.GroupCommitter(max_batch=2)
+            first = utils.stdlib_threading.Thread(
+                target=do_commit, args=(committer, 1))
+            first.start()
+            first_sync_started.wait()
+            # these all queue up behind the first syncfs()
+            others = [utils.stdlib_threading.Thread(
+                target=do_commit, args=(committer, fd)) for fd in (2, 3, 4)]
+            for thread in others:
+                thread.start()
+            while committer._queue.qsize() < 3:
+                utils.stdlib_threading.Event().wait(0.001)
+            release_first_sync.set()
+            for thread in [first] + others:
+                thread.join()
+
+        # first writer alone, then the rest two at a time
+        self.assertEqual(3, len(synced))
+        self.assertEqual((1, True), results[1][:2])
+        self.assertEqual([1, 2, 2],
+                         sorted(results[fd][0] for fd in (2, 3, 4)))
+        self.assertEqual(2, sum(results[fd][1] for fd in (2, 3, 4)))
+
+    def test_commit_error(self):
+        error = OSError(errno.EIO, 'Input/output error')
+        with mock.patch('swift.obj.diskfile.syncfs', side_effect=error):
+            committer = diskfile.GroupCommitter()
+            with self.assertRaises(OSError) as cm:
+                committer.commit(1)
+        self.assertIs(error, cm.exception)
+
+
+class TestDeviceReadPool(unittest.TestCase):
+
+    def test_submit(self):
+        pool = diskfile.DeviceReadPool(threads=2)
+        requests = [pool.submit(lambda x: x * 2, i) for i in range(10)]
+        self.assertEqual([i * 2 for i in range(10)],
+                         [request.wait() for request in requests])
+        stats = pool.get_stats()
+        self.assertEqual(10, stats['reads'])
+        self.assertEqual(0, stats['queue_depth'])
+        self.assertEqual(10, stats['max_queue_depth'])
+        # the stats are reset once read
+        self.assertEqual(0, pool.get_stats()['reads'])
+
+    def test_submit_error(self):
+        error = IOError(errno.EIO, 'Input/output error')
+
+        def fail():
+            raise error
+
+        pool = diskfile.DeviceReadPool(threads=1)
+        with self.assertRaises(IOError) as cm:
+            pool.submit(fail).wait()
+        self.assertIs(error, cm.exception)
+
+    def test_queue_depth(self):
+        release = utils.stdlib_threading.Event()
+        pool = diskfile.DeviceReadPool(threads=1, queue_depth=2)
+        first = pool.submit(release.wait)
+        second = pool.submit(lambda: 'second')
+        # a third read waits for one of the first two to complete
+        third = spawn(pool.submit, lambda: 'third')
+        sleep(0.01)
+        self.assertEqual(2, pool.get_stats()['queue_depth'])
+        self.assertFalse(third.dead)
+        release.set()
+        first.wait()
+        self.assertEqual('second', second.wait())
+        self.assertEqual('third', third.wait().wait())
+        stats = pool.get_stats()
+        self.assertEqual(3, stats['reads'])
+        self.assertEqual(2, stats['max_queue_depth'])
+        self.assertGreater(stats['max_queue_ms'], 0)
+
+
 class BaseDiskFileTestMixin(object):
     """
     Bag of helpers that are useful in the per-policy DiskFile test classes.
@@ -619,6 +999,65 @@ class DiskFileManagerMixin(BaseDiskFileTestMixin):
                     self.fail('%s with files %s' % (str(e), files))
                 shuffle(files)
 
+    def _random_ondisk_files(self, rng):
+        # a few close timestamps, so that files often share them
+        timestamps = [Timestamp(t, offset=offset)
+                      for t in range(1, 5) for offset in (0, 0, 1)]
+        files = set()
+        for _ in range(rng.randint(0, 16)):
+            timestamp = rng.choice(timestamps)
+            ext = rng.choice(['.data', '.data', '.ts', '.meta', '.meta',
+                              '.durable', '.junk'])
+            if ext == '.data' and self.mgr_cls is diskfile.ECDiskFileManager:
+                files.add('%s#%d.data' % (timestamp.internal,
+                                          rng.randint(0, 3)))
+            elif ext == '.meta' and rng.randint(0, 1):
+                files.add(encode_timestamps(
+                    timestamp, rng.choice(timestamps), explicit=True) + ext)
+            else:
+                files.add(timestamp.internal + ext)
+            if not rng.randint(0, 20):
+                files.add('not-a-timestamp.data')
+        files = list(files)
+        rng.shuffle(files)
+        return files
+
+    def test_get_ondisk_files_matches_reference(self):
+        def summarize(results):
+            summary = dict(
+                (key, results.get(key)) for key in
+                ('data_file', 'meta_file', 'ts_file', 'ctype_file'))
+            for key in ('obsolete', 'possible_reclaim'):
+                summary[key] = sorted(
+                    info['filename'] for info in results.get(key, []))
+            summary['unexpected'] = sorted(results.get('unexpected', []))
+            summary['frag_sets'] = dict(
+                (timestamp.internal, [info['filename'] for info in frag_set])
+                for timestamp, frag_set in
+                results.get('frag_sets', {}).items())
+            summary['durable_frag_set'] = [
+                info['filename']
+                for info in results.get('durable_frag_set') or []]
+            return summary
+
+        datadir = '/srv/node/sda1/objects/0/abc/' + 'a' * 29 + 'abc'
+        frag_indexes = [None]
+        if self.mgr_cls is diskfile.ECDiskFileManager:
+            frag_indexes.extend(range(4))
+        for seed in range(500):
+            rng = random.Random(seed)
+            files = self._random_ondisk_files(rng)
+            for frag_index in frag_indexes:
+                expected = _reference_get_ondisk_files(
+                    self.df_mgr, list(files), datadir, frag_index=frag_index)
+                actual = self.df_mgr.get_ondisk_files(
+                    list(files), datadir, verify=False,
+                    frag_index=frag_index)
+                self.assertEqual(
+                    summarize(expected), summarize(actual),
+                    'Mismatch for %r with frag_index %r' % (
+                        files, frag_index))
+
     def _test_cleanup_ondisk_files_files(self, scenarios, policy,
                                          reclaim_age=None):
         # check that expected files are left in hashdir after cleanup
@@ -774,6 +1213,24 @@ class DiskFileManagerMixin(BaseDiskFileTestMixin):
                                   os.path.join(dp, 'tmp'))
         self.df_mgr.logger.increment.assert_called_with('async_pendings')
 
+    def test_pickle_async_update_to_spool(self):
+        self.df_mgr.async_spool = True
+        self.df_mgr.logger.increment = mock.MagicMock()
+        ts = Timestamp(10000.0).internal
+        for policy in POLICIES:
+            with mock.patch('swift.obj.diskfile.write_pickle') as wp:
+                self.df_mgr.pickle_async_update(self.existing_device1,
+                                                'a', 'c', 'o',
+                                                dict(a=1, b=2), ts, policy)
+            self.assertFalse(wp.called)
+            dp = self.df_mgr.construct_dev_path(self.existing_device1)
+            spool = AsyncSpool(os.path.join(
+                dp, diskfile.get_async_spool_dir(policy)))
+            spool.seal()
+            self.assertEqual(([{'a': 1, 'b': 2}], 0),
+                             spool.read_segment(spool.segments()[0]))
+        self.df_mgr.logger.increment.assert_called_with('async_pendings')
+
     def test_object_audit_location_generator(self):
         locations = list(self.df_mgr.object_audit_location_generator())
         self.assertEqual(locations, [])
@@ -3101,6 +3558,69 @@ class DiskFileMixin(BaseDiskFileTestMixin):
                 DiskFileNoSpace,
                 diskfile.write_metadata, 'n/a', metadata)
 
+    def _metadata_files(self, df):
+        return [os.path.join(df._datadir, f)
+                for f in os.listdir(df._datadir)
+                if f.endswith(('.data', '.meta'))]
+
+    def _metadata_is_compact(self, path):
+        return xattr.getxattr(path, diskfile.METADATA_KEY).startswith(
+            diskfile.COMPACT_METADATA_MAGIC)
+
+    def test_write_compact_metadata(self):
+        self.conf['compact_metadata'] = 'true'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df = self._create_test_file('1234567890', timestamp=self.ts())
+        df.write_metadata({'X-Timestamp': self.ts().internal,
+                           'X-Object-Meta-Test': 'data'})
+        paths = self._metadata_files(df)
+        self.assertEqual(len(paths), 2)
+        for path in paths:
+            self.assertTrue(self._metadata_is_compact(path))
+
+        df = self._simple_get_diskfile()
+        with df.open():
+            self.assertEqual(df.get_metadata()['X-Object-Meta-Test'], 'data')
+            self.assertEqual(
+                df.get_datafile_metadata()['Content-Length'], 10)
+        self.assertEqual(df.migrate_metadata(), 0)
+
+    def test_migrate_metadata(self):
+        df = self._create_test_file('1234567890', timestamp=self.ts())
+        df.write_metadata({'X-Timestamp': self.ts().internal,
+                           'X-Object-Meta-Test': 'data'})
+        df = self._simple_get_diskfile()
+        with df.open():
+            expected = df.get_metadata()
+        # not configured to write compact metadata
+        self.assertEqual(df.migrate_metadata(), 0)
+        for path in self._metadata_files(df):
+            self.assertFalse(self._metadata_is_compact(path))
+
+        self.conf['compact_metadata'] = 'true'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df = self._simple_get_diskfile()
+        with df.open():
+            pass
+        # left for a later audit if the partition is locked
+        lock_timeout = LockTimeout(10, 'lock')
+        try:
+            with mock.patch('swift.obj.diskfile.lock_path',
+                            side_effect=lock_timeout):
+                self.assertEqual(df.migrate_metadata(), 0)
+        finally:
+            lock_timeout.cancel()
+        for path in self._metadata_files(df):
+            self.assertFalse(self._metadata_is_compact(path))
+        self.assertEqual(df.migrate_metadata(), 2)
+        for path in self._metadata_files(df):
+            self.assertTrue(self._metadata_is_compact(path))
+        self.assertEqual(df.migrate_metadata(), 0)
+
+        df = self._simple_get_diskfile()
+        with df.open():
+            self.assertEqual(df.get_metadata(), expected)
+
     def _create_diskfile_dir(self, timestamp, policy):
         timestamp = Timestamp(timestamp)
         df = self._simple_get_diskfile(account='a', container='c',
@@ -3177,6 +3697,296 @@ class DiskFileMixin(BaseDiskFileTestMixin):
             if policy.policy_type == EC_POLICY:
                 self.assertTrue(isinstance(mock_fsync.call_args[0][0], int))
 
+    def test_put_group_commit(self):
+        conf = dict(self.conf, group_commit='yes')
+        df_router = diskfile.DiskFileRouter(conf, self.logger)
+        for policy in POLICIES:
+            df_mgr = df_router[policy]
+            self.assertTrue(df_mgr.group_commit)
+            df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c',
+                                     'o', policy=policy, frag_index=2)
+            self._create_ondisk_file(df, 'old', self.ts())
+            timestamp = self.ts()
+            self.logger.clear()
+            with mock.patch('swift.obj.diskfile.syncfs') as mock_syncfs, \
+                    mock.patch('swift.obj.diskfile.fsync') as mock_fsync, \
+                    mock.patch('swift.obj.diskfile.fsync_dir') as \
+                    mock_fsync_dir:
+                with df.create() as writer:
+                    writer.write('data')
+                    writer.put({
+                        'ETag': md5('data').hexdigest(),
+                        'X-Timestamp': timestamp.internal,
+                        'Content-Length': '4',
+                    })
+                    writer.commit(timestamp)
+            self.assertFalse(mock_fsync.called)
+            self.assertFalse(mock_fsync_dir.called)
+            expected = {
+                EC_POLICY: ['%s#2.data' % timestamp.internal,
+                            '%s.durable' % timestamp.internal],
+                REPL_POLICY: ['%s.data' % timestamp.internal],
+            }[policy.policy_type]
+            self.assertEqual(len(expected), mock_syncfs.call_count)
+            # the older .data is only cleaned up after the group commit
+            self.assertEqual(sorted(expected), sorted(os.listdir(
+                df._datadir)))
+            counts = self.logger.get_increment_counts()
+            self.assertEqual(len(expected), counts['group_commit.batches'])
+            self.assertEqual(
+                [(('group_commit.writes', 1), {})] * len(expected),
+                self.logger.log_dict['update_stats'])
+            self.assertEqual(len(expected),
+                             len(self.logger.log_dict['timing']))
+            rmtree(df._datadir)
+
+    def test_group_commit_not_available(self):
+        conf = dict(self.conf, group_commit='yes')
+        with mock.patch('swift.obj.diskfile.load_libc_function',
+                        return_value=diskfile.noop_libc_function):
+            df_mgr = self.mgr_cls(conf, self.logger)
+        self.assertFalse(df_mgr.group_commit)
+        self.assertIsNone(df_mgr.get_group_committer(self.testdir))
+        warnings = self.logger.get_lines_for_level('warning')
+        self.assertIn('syncfs', warnings[-1])
+
+    def _put_cacheable_object(self, df_mgr, policy, body='data',
+                              age=60, obj='o'):
+        df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c', obj,
+                                 policy=policy, frag_index=2)
+        timestamp = self.ts()
+        with df.create() as writer:
+            writer.write(body)
+            writer.put({
+                'ETag': md5(body).hexdigest(),
+                'X-Timestamp': timestamp.internal,
+                'Content-Length': str(len(body)),
+            })
+            writer.commit(timestamp)
+        # the hash dir must not have been modified too recently to be cached
+        mtime = time() - age
+        os.utime(df._datadir, (mtime, mtime))
+        return df
+
+    def _open_cacheable_object(self, df_mgr, policy, obj='o'):
+        return df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c', obj,
+                                   policy=policy, frag_index=2).open()
+
+    def test_ondisk_cache_disabled_by_default(self):
+        for policy in POLICIES:
+            df_mgr = self.df_router[policy]
+            self.assertEqual(0, df_mgr.ondisk_cache_size)
+            self._put_cacheable_object(df_mgr, policy)
+            self._open_cacheable_object(df_mgr, policy)
+            self._open_cacheable_object(df_mgr, policy)
+            self.assertFalse(df_mgr._ondisk_cache)
+            self.assertFalse(self.logger.get_increment_counts())
+
+    def test_ondisk_cache_hit(self):
+        conf = dict(self.conf, ondisk_cache_size='10')
+        df_router = diskfile.DiskFileRouter(conf, self.logger)
+        for policy in POLICIES:
+            df_mgr = df_router[policy]
+            df = self._put_cacheable_object(df_mgr, policy)
+            self.logger.clear()
+            expected = self._open_cacheable_object(df_mgr, policy)
+            with mock.patch('os.listdir') as mock_listdir, \
+                    mock.patch('swift.obj.diskfile.read_metadata') as \
+                    mock_read_metadata:
+                df = self._open_cacheable_object(df_mgr, policy)
+                self.assertEqual('data', ''.join(df.reader()))
+            self.assertFalse(mock_listdir.called)
+            self.assertFalse(mock_read_metadata.called)
+            self.assertEqual(expected.get_metadata(), df.get_metadata())
+            self.assertEqual(expected.get_datafile_metadata(),
+                             df.get_datafile_metadata())
+            self.assertEqual(expected.durable_timestamp,
+                             df.durable_timestamp)
+            self.assertEqual({'ondisk_cache.misses': 1,
+                              'ondisk_cache.hits': 1},
+                             self.logger.get_increment_counts())
+            # callers get their own copies of the cached metadata
+            df.get_metadata()['X-Object-Meta-Foo'] = 'bar'
+            df = self._open_cacheable_object(df_mgr, policy)
+            self.assertNotIn('X-Object-Meta-Foo', df.get_metadata())
+            rmtree(df._datadir)
+
+    def test_ondisk_cache_caches_tombstones(self):
+        conf = dict(self.conf, ondisk_cache_size='10')
+        df_router = diskfile.DiskFileRouter(conf, self.logger)
+        for policy in POLICIES:
+            df_mgr = df_router[policy]
+            df = self._put_cacheable_object(df_mgr, policy)
+            timestamp = self.ts()
+            df.delete(timestamp)
+            mtime = time() - 60
+            os.utime(df._datadir, (mtime, mtime))
+            self.logger.clear()
+            for i in range(2):
+                with self.assertRaises(DiskFileDeleted) as cm:
+                    self._open_cacheable_object(df_mgr, policy)
+                self.assertEqual(timestamp, cm.exception.timestamp)
+            self.assertEqual({'ondisk_cache.misses': 1,
+                              'ondisk_cache.hits': 1},
+                             self.logger.get_increment_counts())
+            rmtree(df._datadir)
+
+    def test_ondisk_cache_invalidated_by_write(self):
+        conf = dict(self.conf, ondisk_cache_size='10')
+        df_router = diskfile.DiskFileRouter(conf, self.logger)
+        for policy in POLICIES:
+            df_mgr = df_router[policy]
+            df = self._put_cacheable_object(df_mgr, policy)
+            self._open_cacheable_object(df_mgr, policy)
+            self.assertIn(df._datadir, df_mgr._ondisk_cache)
+            df.write_metadata({'X-Timestamp': self.ts().internal,
+                               'X-Object-Meta-Foo': 'bar'})
+            self.assertNotIn(df._datadir, df_mgr._ondisk_cache)
+            df = self._open_cacheable_object(df_mgr, policy)
+            self.assertEqual('bar', df.get_metadata()['X-Object-Meta-Foo'])
+            rmtree(df._datadir)
+
+    def test_ondisk_cache_detects_changed_hash_dir(self):
+        conf = dict(self.conf, ondisk_cache_size='10')
+        df_router = diskfile.DiskFileRouter(conf, self.logger)
+        for policy in POLICIES:
+            df_mgr = df_router[policy]
+            df = self._put_cacheable_object(df_mgr, policy)
+            self._open_cacheable_object(df_mgr, policy)
+            # another worker POSTs to the object...
+            other_mgr = self.mgr_cls(conf, self.logger)
+            other_df = other_mgr.get_diskfile(
+                self.existing_device, '0', 'a', 'c', 'o', policy=policy,
+                frag_index=2)
+            other_df.write_metadata({'X-Timestamp': self.ts().internal,
+                                     'X-Object-Meta-Foo': 'bar'})
+            mtime = time() - 30
+            os.utime(df._datadir, (mtime, mtime))
+            self.logger.clear()
+            df = self._open_cacheable_object(df_mgr, policy)
+            self.assertEqual('bar', df.get_metadata()['X-Object-Meta-Foo'])
+            self.assertEqual({'ondisk_cache.misses': 1},
+                             self.logger.get_increment_counts())
+            # ...and then deletes it
+            rmtree(df._datadir)
+            self.assertRaises(DiskFileNotExist,
+                              self._open_cacheable_object, df_mgr, policy)
+            self.assertNotIn(df._datadir, df_mgr._ondisk_cache)
+
+    def test_ondisk_cache_skips_recently_modified_hash_dir(self):
+        conf = dict(self.conf, ondisk_cache_size='10')
+        df_router = diskfile.DiskFileRouter(conf, self.logger)
+        for policy in POLICIES:
+            df_mgr = df_router[policy]
+            df = self._put_cacheable_object(df_mgr, policy, age=0)
+            self.logger.clear()
+            self._open_cacheable_object(df_mgr, policy)
+            self._open_cacheable_object(df_mgr, policy)
+            self.assertNotIn(df._datadir, df_mgr._ondisk_cache)
+            self.assertEqual({'ondisk_cache.misses': 2},
+                             self.logger.get_increment_counts())
+            rmtree(df._datadir)
+
+    def test_ondisk_cache_size(self):
+        conf = dict(self.conf, ondisk_cache_size='2')
+        df_router = diskfile.DiskFileRouter(conf, self.logger)
+        policy = POLICIES.default
+        df_mgr = df_router[policy]
+        datadirs = []
+        for obj in ('o1', 'o2', 'o3'):
+            df = self._put_cacheable_object(df_mgr, policy, obj=obj)
+            self._open_cacheable_object(df_mgr, policy, obj=obj)
+            datadirs.append(df._datadir)
+        self.assertEqual(datadirs[1:], list(df_mgr._ondisk_cache))
+
+    def _use_threaded_reads(self, **kwargs):
+        conf = dict(self.conf, threaded_reads='yes', disk_chunk_size='4',
+                    recon_cache_path=self.tmpdir, **kwargs)
+        self.df_router = diskfile.DiskFileRouter(conf, self.logger)
+        return self.df_router[POLICIES.default]
+
+    def test_threaded_reads(self):
+        df_mgr = self._use_threaded_reads(threaded_read_ahead='2')
+        self.assertTrue(df_mgr.threaded_reads)
+        df = self._create_test_file('1234567890')
+        quarantine_msgs = []
+        reader = df.reader(_quarantine_hook=quarantine_msgs.append)
+        with mock.patch.object(reader, '_drop_cache') as mock_drop_cache:
+            self.assertEqual('1234567890', ''.join(reader))
+        self.assertEqual([], quarantine_msgs)
+        self.assertTrue(mock_drop_cache.called)
+        self.assertIsNone(reader._fp)
+        pool = df_mgr.get_read_pool(df._device_path)
+        self.assertIs(pool, df_mgr.get_read_pool(df._device_path))
+        # two chunks read ahead at a time, the second time hitting the end
+        self.assertEqual(2, pool.get_stats()['reads'])
+
+        df = self._simple_get_diskfile()
+        with df.open():
+            reader = df.reader()
+            self.assertEqual('67890', ''.join(reader.app_iter_range(5, None)))
+        df = self._simple_get_diskfile()
+        with df.open():
+            reader = df.reader()
+            self.assertEqual('3456', ''.join(reader.app_iter_range(2, 6)))
+            self.assertIsNone(reader._fp)
+
+    def test_threaded_reads_partial_close(self):
+        df_mgr = self._use_threaded_reads()
+        df = self._create_test_file('1234567890')
+        reader = df.reader()
+        it = iter(reader)
+        self.assertEqual('1234', next(it))
+        it.close()
+        self.assertIsNone(reader._fp)
+        # the read of the next chunk, already submitted, was waited for
+        stats = df_mgr.get_read_pool(df._device_path).get_stats()
+        self.assertEqual(2, stats['reads'])
+        self.assertEqual(0, stats['queue_depth'])
+
+    def test_threaded_reads_not_enabled(self):
+        df = self._create_test_file('1234567890')
+        self.assertFalse(df.manager.threaded_reads)
+        self.assertIsNone(df.manager.get_read_pool(df._device_path))
+        self.assertEqual('1234567890', ''.join(df.reader()))
+
+    def test_threaded_read_stats(self):
+        df_mgr = self._use_threaded_reads(threaded_read_stats_interval='0')
+        df = self._create_test_file('1234567890')
+        ''.join(df.reader())
+        with open(os.path.join(self.tmpdir, 'object.recon')) as f:
+            recon = json.load(f)
+        stats = recon['object_threaded_reads'][str(os.getpid())]
+        self.assertEqual([self.existing_device], list(stats['devices']))
+        self.assertEqual(4, stats['devices'][self.existing_device]['reads'])
+        for key in ('queue_depth', 'max_queue_depth', 'avg_queue_ms',
+                    'max_queue_ms', 'avg_read_ms', 'max_read_ms'):
+            self.assertIn(key, stats['devices'][self.existing_device])
+        # stats are only written once per interval unless forced
+        df_mgr.threaded_read_stats_interval = 300
+        ''.join(self._simple_get_diskfile().open().reader())
+        with open(os.path.join(self.tmpdir, 'object.recon')) as f:
+            self.assertEqual(recon, json.load(f))
+        df_mgr.dump_read_stats(force=True)
+        with open(os.path.join(self.tmpdir, 'object.recon')) as f:
+            recon = json.load(f)
+        stats = recon['object_threaded_reads'][str(os.getpid())]
+        self.assertEqual(4, stats['devices'][self.existing_device]['reads'])
+
+    def test_threaded_read_stats_prunes_exited_workers(self):
+        df_mgr = self._use_threaded_reads(threaded_read_stats_interval='30')
+        now = time()
+        with open(os.path.join(self.tmpdir, 'object.recon'), 'w') as f:
+            json.dump({'object_threaded_reads': {
+                '1': {'devices': {}, 'updated': now - 100},
+                '2': {'devices': {}, 'updated': now - 60}}}, f)
+        ''.join(self._create_test_file('1234567890').reader())
+        df_mgr.dump_read_stats(force=True)
+        with open(os.path.join(self.tmpdir, 'object.recon')) as f:
+            recon = json.load(f)
+        self.assertEqual(sorted(['2', str(os.getpid())]),
+                         sorted(recon['object_threaded_reads']))
+
     def test_commit_ignores_cleanup_ondisk_files_error(self):
         for policy in POLICIES:
             # Check OSError from cleanup_ondisk_files is caught and ignored
@@ -3840,6 +4650,97 @@ class DiskFileMixin(BaseDiskFileTestMixin):
                             mock_trampoline:
                         _run_test()
 
+    def _get_zero_copy_range_reader(self, data):
+        # ranges are sent without an MD5 socket, so only splice() is needed
+        if not splice.available:
+            raise SkipTest("splice() support is missing")
+        df = self._create_test_file(data)
+        reader = df.reader()
+        reader._use_splice = True
+        reader._pipe_size = 4096
+        return reader
+
+    def _zero_copy_send_to_file(self, app_iter):
+        with tempfile.TemporaryFile() as fp:
+            app_iter.zero_copy_send(fp.fileno())
+            fp.seek(0)
+            return fp.read()
+
+    def test_zero_copy_send_range(self):
+        data = ''.join(chr(i % 251) for i in range(16385))
+        reader = self._get_zero_copy_range_reader(data)
+        it = reader.app_iter_range(100, 9000)
+        self.assertIsInstance(it, diskfile.ZeroCopyRangeIter)
+        self.assertTrue(it.can_zero_copy_send())
+        with mock.patch('swift.obj.diskfile.read_ahead_buffer_cache') as rabc:
+            self.assertEqual(self._zero_copy_send_to_file(it), data[100:9000])
+        self.assertEqual(len(rabc.mock_calls), 1)
+        self.assertEqual(rabc.mock_calls[0][1][1:], (100, 8900))
+        self.assertEqual(reader._bytes_read, 8900)
+        self.assertIsNone(reader._fp)
+
+    def test_zero_copy_send_ranges(self):
+        data = ''.join(chr(i % 251) for i in range(16385))
+        ranges = [(0, 10), (4000, 9000), (16380, 16385)]
+        reader = self._get_zero_copy_range_reader(data)
+        it = reader.app_iter_ranges(ranges, 'text/plain', 'BOUNDARY', 16385)
+        self.assertIsInstance(it, diskfile.ZeroCopyRangeIter)
+        with mock.patch('swift.obj.diskfile.read_ahead_buffer_cache') as rabc:
+            sent = self._zero_copy_send_to_file(it)
+        self.assertEqual([c[1][1:] for c in rabc.mock_calls],
+                         [(0, 10), (4000, 5000), (16380, 5)])
+        self.assertIsNone(reader._fp)
+
+        # same body as when the ranges are read through the file object
+        df = self._simple_get_diskfile()
+        with df.open():
+            reader = df.reader()
+            expected = ''.join(reader.app_iter_ranges(
+                ranges, 'text/plain', 'BOUNDARY', 16385))
+        self.assertEqual(sent, expected)
+        self.assertTrue(sent.startswith(
+            '--BOUNDARY\r\nContent-Type: text/plain\r\n'
+            'Content-Range: bytes 0-9/16385\r\n\r\n' + data[:10] + '\r\n'))
+        self.assertTrue(sent.endswith(data[16380:] + '\r\n--BOUNDARY--'))
+
+    def test_zero_copy_range_iter_can_be_iterated(self):
+        data = '012345678911234567892123456789'
+        reader = self._get_zero_copy_range_reader(data)
+        it = reader.app_iter_range(5, 15)
+        self.assertIsInstance(it, diskfile.ZeroCopyRangeIter)
+        self.assertEqual(''.join(it), data[5:15])
+        self.assertIsNone(reader._fp)
+
+        reader = self._get_zero_copy_range_reader(data)
+        it = reader.app_iter_ranges([(0, 10), (20, 30)], 'text/plain',
+                                    'BOUNDARY', 30)
+        value = ''.join(it)
+        self.assertIn('0123456789', value)
+        self.assertIn('2123456789', value)
+        self.assertIsNone(reader._fp)
+
+    def test_zero_copy_send_range_short_file(self):
+        data = '012345678911234567892123456789'
+        reader = self._get_zero_copy_range_reader(data)
+        quarantine_msgs = []
+        reader._quarantine_hook = quarantine_msgs.append
+        it = reader.app_iter_range(20, 40)
+        self.assertEqual(self._zero_copy_send_to_file(it), data[20:])
+        self.assertEqual(reader._bytes_read, 10)
+        # a partial read doesn't quarantine
+        self.assertEqual(quarantine_msgs, [])
+
+    def test_no_zero_copy_range_iter_without_splice(self):
+        df = self._create_test_file('012345678911234567892123456789')
+        reader = df.reader()
+        self.assertFalse(reader.can_zero_copy_send())
+        self.assertNotIsInstance(reader.app_iter_range(0, 10),
+                                 diskfile.ZeroCopyRangeIter)
+        self.assertNotIsInstance(
+            reader.app_iter_ranges([(0, 10), (20, 30)], 'text/plain',
+                                   'BOUNDARY', 30),
+            diskfile.ZeroCopyRangeIter)
+
     def test_create_unlink_cleanup_DiskFileNoSpace(self):
         # Test cleanup when DiskFileNoSpace() is raised.
         df = self.df_mgr.get_diskfile(self.existing_device, '0', 'abc', '123',
@@ -5932,6 +6833,373 @@ class TestSuffixHashes(unittest.TestCase):
                 mtime + 4,  # not modifed
             ])
 
+    # get_hashes tests - hashes_log behaviors
+
+    def _hashes_log_router(self):
+        conf = dict(self.conf, hashes_log='true')
+        return diskfile.DiskFileRouter(conf, self.logger)
+
+    def test_get_hashes_log_creates_log_not_pkl(self):
+        df_router = self._hashes_log_router()
+        for policy in self.iter_policies():
+            df_mgr = df_router[policy]
+            df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c',
+                                     'o', policy=policy, frag_index=4)
+            df.delete(self.ts())
+            suffix = os.path.basename(os.path.dirname(df._datadir))
+            hashes = df_mgr.get_hashes(self.existing_device, '0', [], policy)
+            self.assertIn(suffix, hashes)
+            part_path = os.path.join(
+                self.devices, 'sda1', diskfile.get_data_dir(policy), '0')
+            self.assertFalse(os.path.exists(
+                os.path.join(part_path, diskfile.HASH_FILE)))
+            hashes_log_file = os.path.join(part_path, diskfile.HASH_LOG_FILE)
+            self.assertEqual((hashes, 1),
+                             diskfile.read_hashes_log(hashes_log_file))
+            # the log round-trips the hashes without rehashing
+            with mock.patch.object(df_mgr, '_hash_suffix') as mock_hash:
+                self.assertEqual(hashes, df_mgr.get_hashes(
+                    self.existing_device, '0', [], policy))
+            self.assertFalse(mock_hash.called)
+
+    def test_get_hashes_log_converts_pkl(self):
+        df_router = self._hashes_log_router()
+        for policy in self.iter_policies():
+            # build a hashes.pkl the old way
+            df_mgr = self.df_router[policy]
+            df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c',
+                                     'o', policy=policy, frag_index=4)
+            df.delete(self.ts())
+            suffix_dir = os.path.dirname(df._datadir)
+            suffix = os.path.basename(suffix_dir)
+            hashes = df_mgr.get_hashes(self.existing_device, '0', [], policy)
+            part_path = os.path.join(
+                self.devices, 'sda1', diskfile.get_data_dir(policy), '0')
+            hashes_file = os.path.join(part_path, diskfile.HASH_FILE)
+            hashes_log_file = os.path.join(part_path, diskfile.HASH_LOG_FILE)
+            self.assertTrue(os.path.exists(hashes_file))
+            df_mgr.invalidate_hash(suffix_dir)
+            # ... and convert it
+            df_mgr = df_router[policy]
+            with mock.patch.object(df_mgr, '_hash_suffix',
+                                   return_value='fake') as mock_hash:
+                new_hashes = df_mgr.get_hashes(
+                    self.existing_device, '0', [], policy)
+            # only the invalidated suffix was rehashed
+            mock_hash.assert_called_once_with(suffix_dir, mock.ANY)
+            self.assertEqual(dict(hashes, **{suffix: 'fake'}), new_hashes)
+            self.assertFalse(os.path.exists(hashes_file))
+            self.assertEqual(new_hashes,
+                             diskfile.read_hashes_log(hashes_log_file)[0])
+
+    def test_get_hashes_log_appends_changes(self):
+        df_router = self._hashes_log_router()
+        for policy in self.iter_policies():
+            df_mgr = df_router[policy]
+            df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c',
+                                     'o', policy=policy, frag_index=4)
+            df.delete(self.ts())
+            suffix_dir = os.path.dirname(df._datadir)
+            suffix = os.path.basename(suffix_dir)
+            hashes = df_mgr.get_hashes(self.existing_device, '0', [], policy)
+            part_path = os.path.join(
+                self.devices, 'sda1', diskfile.get_data_dir(policy), '0')
+            hashes_log_file = os.path.join(part_path, diskfile.HASH_LOG_FILE)
+            invalidations_file = os.path.join(
+                part_path, diskfile.HASH_INVALIDATIONS_FILE)
+            with open(hashes_log_file) as f:
+                orig_log = f.read()
+            # invalidations are still journaled in hashes.invalid
+            df.delete(self.ts())
+            with open(invalidations_file) as f:
+                self.assertEqual(suffix + '\n', f.read())
+            with mock.patch('swift.obj.diskfile.write_hashes_log') as \
+                    mock_write:
+                new_hashes = df_mgr.get_hashes(
+                    self.existing_device, '0', [], policy)
+            self.assertFalse(mock_write.called)
+            self.assertNotEqual(hashes, new_hashes)
+            with open(invalidations_file) as f:
+                self.assertEqual('', f.read())
+            # one record to mark the suffix dirty, one for the new hash
+            with open(hashes_log_file) as f:
+                log_lines = f.read()[len(orig_log):].splitlines()
+            self.assertEqual(2, len(log_lines))
+            self.assertEqual([suffix, None], json.loads(log_lines[0]))
+            self.assertEqual((new_hashes, 3),
+                             diskfile.read_hashes_log(hashes_log_file))
+            # a vanished suffix is recorded as removed
+            rmtree(suffix_dir)
+            self.assertEqual({}, df_mgr.get_hashes(
+                self.existing_device, '0', [suffix], policy))
+            self.assertEqual(({}, 4),
+                             diskfile.read_hashes_log(hashes_log_file))
+
+    def test_get_hashes_log_compacts(self):
+        df_router = self._hashes_log_router()
+        for policy in self.iter_policies():
+            df_mgr = df_router[policy]
+            df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c',
+                                     'o', policy=policy, frag_index=4)
+            df.delete(self.ts())
+            suffix = os.path.basename(os.path.dirname(df._datadir))
+            part_path = os.path.join(
+                self.devices, 'sda1', diskfile.get_data_dir(policy), '0')
+            hashes_log_file = os.path.join(part_path, diskfile.HASH_LOG_FILE)
+            with mock.patch('swift.obj.diskfile.HASH_LOG_COMPACT_RECORDS', 2):
+                hashes = df_mgr.get_hashes(
+                    self.existing_device, '0', [], policy)
+                df_mgr.get_hashes(self.existing_device, '0', [suffix],
+                                  policy)
+                self.assertEqual(
+                    2, diskfile.read_hashes_log(hashes_log_file)[1])
+                df_mgr.get_hashes(self.existing_device, '0', [suffix],
+                                  policy)
+                self.assertEqual(
+                    (hashes, 1), diskfile.read_hashes_log(hashes_log_file))
+
+    def test_get_hashes_log_torn_record_rebuilds(self):
+        df_router = self._hashes_log_router()
+        for policy in self.iter_policies():
+            df_mgr = df_router[policy]
+            df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c',
+                                     'o', policy=policy, frag_index=4)
+            df.delete(self.ts())
+            hashes = df_mgr.get_hashes(self.existing_device, '0', [], policy)
+            part_path = os.path.join(
+                self.devices, 'sda1', diskfile.get_data_dir(policy), '0')
+            hashes_log_file = os.path.join(part_path, diskfile.HASH_LOG_FILE)
+            with open(hashes_log_file, 'ab') as f:
+                f.write('["abc"')
+            self.assertRaises(ValueError, diskfile.read_hashes_log,
+                              hashes_log_file)
+            self.assertEqual(hashes, df_mgr.get_hashes(
+                self.existing_device, '0', [], policy))
+            self.assertEqual((hashes, 1),
+                             diskfile.read_hashes_log(hashes_log_file))
+
+    def test_get_hashes_pkl_removes_stale_log(self):
+        df_router = self._hashes_log_router()
+        for policy in self.iter_policies():
+            df = df_router[policy].get_diskfile(
+                self.existing_device, '0', 'a', 'c', 'o', policy=policy,
+                frag_index=4)
+            df.delete(self.ts())
+            hashes = df_router[policy].get_hashes(
+                self.existing_device, '0', [], policy)
+            part_path = os.path.join(
+                self.devices, 'sda1', diskfile.get_data_dir(policy), '0')
+            hashes_log_file = os.path.join(part_path, diskfile.HASH_LOG_FILE)
+            self.assertTrue(os.path.exists(hashes_log_file))
+            self.assertEqual(hashes, self.df_router[policy].get_hashes(
+                self.existing_device, '0', [], policy))
+            self.assertFalse(os.path.exists(hashes_log_file))
+            self.assertTrue(os.path.exists(
+                os.path.join(part_path, diskfile.HASH_FILE)))
+
+
+@patch_policies([StoragePolicy(0, name='zero', is_default=True),
+                 SlabStoragePolicy(1, name='slab')])
+class TestSlabDiskFileManager(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.devices = os.path.join(self.testdir, 'node')
+        mkdirs(os.path.join(self.devices, 'sda1'))
+        self.conf = dict(devices=self.devices, mount_check='false')
+        self.logger = debug_logger('test-slab')
+        self.df_mgr = diskfile.SlabDiskFileManager(self.conf, self.logger)
+        self.policy = POLICIES[1]
+        self.part_path = os.path.join(
+            self.devices, 'sda1', diskfile.get_data_dir(self.policy), '0')
+        self.ts = make_timestamp_iter()
+
+    def tearDown(self):
+        rmtree(self.testdir, ignore_errors=True)
+
+    def _get_df(self, obj='o', df_mgr=None):
+        return (df_mgr or self.df_mgr).get_diskfile(
+            'sda1', '0', 'a', 'c', obj, policy=self.policy)
+
+    def _put(self, obj='o', body='body', timestamp=None):
+        df = self._get_df(obj)
+        timestamp = timestamp or next(self.ts)
+        with df.create() as writer:
+            writer.write(body)
+            writer.put({'X-Timestamp': timestamp.internal,
+                        'Content-Length': str(len(body)),
+                        'ETag': md5(body).hexdigest(),
+                        'Content-Type': 'text/plain'})
+        return df
+
+    def _read(self, obj='o', df_mgr=None):
+        df = self._get_df(obj, df_mgr)
+        with df.open():
+            metadata = df.get_metadata()
+            return metadata, ''.join(df.reader())
+
+    def test_router(self):
+        router = diskfile.DiskFileRouter(self.conf, self.logger)
+        self.assertIsInstance(router[self.policy],
+                              diskfile.SlabDiskFileManager)
+        self.assertIsInstance(router[POLICIES[0]], diskfile.DiskFileManager)
+        self.assertNotIsInstance(router[POLICIES[0]],
+                                 diskfile.SlabDiskFileManager)
+
+    def test_put_and_read(self):
+        for i in range(3):
+            self._put('o%d' % i, 'body%d' % i)
+        # no hash or suffix dirs, just the volume and index
+        self.assertEqual(['.lock', 'slab-0.vol', 'slab.index'],
+                         sorted(os.listdir(self.part_path)))
+        # a new manager reads the objects back from the index
+        df_mgr = diskfile.SlabDiskFileManager(self.conf, self.logger)
+        for i in range(3):
+            metadata, body = self._read('o%d' % i, df_mgr)
+            self.assertEqual('body%d' % i, body)
+            self.assertEqual('/a/c/o%d' % i, metadata['name'])
+        self.assertFalse(os.listdir(os.path.join(
+            self.devices, 'sda1', diskfile.get_tmp_dir(self.policy))))
+
+    def test_ranged_read(self):
+        self._put('x', 'left')
+        df = self._put('o', '0123456789')
+        self._put('y', 'right')
+        with df.open():
+            self.assertEqual('2345', ''.join(
+                df.reader().app_iter_range(2, 6)))
+            self.assertFalse(df.reader().can_zero_copy_send())
+
+    def test_post_and_delete(self):
+        t_put, t_post, t_delete = [next(self.ts) for _ in range(3)]
+        df = self._put(timestamp=t_put)
+        df.write_metadata({'X-Timestamp': t_post.internal,
+                           'X-Object-Meta-Color': 'blue'})
+        metadata, body = self._read()
+        self.assertEqual('blue', metadata['X-Object-Meta-Color'])
+        self.assertEqual('body', body)
+
+        df.delete(t_delete)
+        with self.assertRaises(DiskFileDeleted) as cm:
+            self._read()
+        self.assertEqual(t_delete, cm.exception.timestamp)
+        # the obsolete .data and .meta were removed from the index
+        index = self.df_mgr.get_slab_index(self.part_path)
+        self.assertEqual([t_delete.internal + '.ts'],
+                         list(index.get(df._datadir[-32:])))
+
+    def test_yield_hashes_and_get_hashes(self):
+        t_put = next(self.ts)
+        df = self._put(timestamp=t_put)
+        object_hash = os.path.basename(df._datadir)
+        suffix = object_hash[-3:]
+        self.assertEqual(
+            [(os.path.join(self.part_path, suffix), suffix)],
+            list(self.df_mgr.yield_suffixes('sda1', '0', self.policy)))
+        found = list(self.df_mgr.yield_hashes('sda1', '0', self.policy))
+        self.assertEqual(1, len(found))
+        self.assertEqual(object_hash, found[0][1])
+        self.assertEqual(t_put, found[0][2]['ts_data'])
+
+        hashes = self.df_mgr.get_hashes('sda1', '0', [], self.policy)
+        self.assertEqual([suffix], list(hashes))
+        # same hash as the object would have in a hash dir
+        repl_mgr = diskfile.DiskFileManager(self.conf, self.logger)
+        repl_df = repl_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o',
+                                        policy=POLICIES[0])
+        with repl_df.create() as writer:
+            writer.write('body')
+            writer.put({'X-Timestamp': t_put.internal,
+                        'Content-Length': '4',
+                        'ETag': md5('body').hexdigest()})
+        self.assertEqual(hashes, repl_mgr.get_hashes(
+            'sda1', '0', [], POLICIES[0]))
+
+        df.delete(next(self.ts))
+        new_hashes = self.df_mgr.get_hashes('sda1', '0', [], self.policy)
+        self.assertNotEqual(hashes[suffix], new_hashes[suffix])
+
+    def test_get_diskfile_from_hash(self):
+        df = self._put()
+        df2 = self.df_mgr.get_diskfile_from_hash(
+            'sda1', '0', os.path.basename(df._datadir), self.policy)
+        with df2.open():
+            self.assertEqual('/a/c/o', df2.get_metadata()['name'])
+        self.assertRaises(DiskFileNotExist,
+                          self.df_mgr.get_diskfile_from_hash,
+                          'sda1', '0', 'f' * 32, self.policy)
+
+    def test_audit_locations(self):
+        df = self._put()
+        locations = list(diskfile.object_audit_location_generator(
+            self.devices, mount_check=False))
+        self.assertEqual([df._datadir], [loc.path for loc in locations])
+        self.assertEqual(self.policy, locations[0].policy)
+        audit_df = self.df_mgr.get_diskfile_from_audit_location(locations[0])
+        with audit_df.open():
+            self.assertEqual('/a/c/o', audit_df.get_metadata()['name'])
+
+    def test_torn_record_is_truncated(self):
+        self._put('o1', 'one')
+        index_file = os.path.join(self.part_path, diskfile.SLAB_INDEX_FILE)
+        good_size = os.path.getsize(index_file)
+        with open(index_file, 'ab') as f:
+            f.write(diskfile._encode_slab_record(('x' * 32, 'junk'))[:-1])
+        df_mgr = diskfile.SlabDiskFileManager(self.conf, self.logger)
+        self.assertEqual('one', self._read('o1', df_mgr)[1])
+        self.assertEqual(good_size, df_mgr.get_slab_index(self.part_path).size)
+        self._put('o2', 'two')
+        self.assertEqual('two', self._read('o2', df_mgr)[1])
+        self.assertEqual('one', self._read('o1', df_mgr)[1])
+
+    def test_quarantine(self):
+        df = self._put(body='good')
+        volume_file = os.path.join(self.part_path, 'slab-0.vol')
+        with open(volume_file, 'r+b') as f:
+            f.write('evil')
+        df = self._get_df()
+        with df.open():
+            reader = df.reader()
+            self.assertEqual('evil', ''.join(reader))
+        quarantined = os.path.join(
+            self.devices, 'sda1', 'quarantined',
+            diskfile.get_data_dir(self.policy), os.path.basename(df._datadir))
+        files = os.listdir(quarantined)
+        self.assertEqual(1, len(files))
+        self.assertEqual('/a/c/o', diskfile.read_metadata(
+            os.path.join(quarantined, files[0]))['name'])
+        self.assertRaises(DiskFileNotExist, self._read)
+
+    def test_compact(self):
+        big = 'x' * diskfile.SLAB_COMPACT_BYTES
+        self._put('o1', big)
+        self._put('o2', 'two')
+        self.assertFalse(self.df_mgr.compact_slab(self.part_path))
+        self._put('o1', 'one')
+        # concurrent readers of the old volume are unaffected
+        df = self._get_df('o2').open()
+        self.assertTrue(self.df_mgr.compact_slab(self.part_path))
+        self.assertEqual('two', ''.join(df.reader()))
+        self.assertEqual(['.lock', 'slab-1.vol', 'slab.index'],
+                         sorted(os.listdir(self.part_path)))
+        self.assertEqual(len('one') + len('two'), os.path.getsize(
+            os.path.join(self.part_path, 'slab-1.vol')))
+        df_mgr = diskfile.SlabDiskFileManager(self.conf, self.logger)
+        self.assertEqual('one', self._read('o1', df_mgr)[1])
+        self.assertEqual('two', self._read('o2', df_mgr)[1])
+        self.assertEqual('one', self._read('o1')[1])
+
+    def test_get_hashes_with_listdir_compacts(self):
+        self._put('o1', 'x' * diskfile.SLAB_COMPACT_BYTES)
+        self._put('o1', 'one')
+        self.df_mgr._get_hashes(self.part_path)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.part_path, 'slab-0.vol')))
+        self.df_mgr._get_hashes(self.part_path, do_listdir=True)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.part_path, 'slab-0.vol')))
+        self.assertEqual('one', self._read('o1')[1])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -35,7 +35,8 @@ from swift.common.utils import (hash_path, mkdirs, normalize_timestamp,
                                 storage_directory)
 from swift.common import ring
 from swift.obj import diskfile, replicator as object_replicator
-from swift.common.storage_policy import StoragePolicy, POLICIES
+from swift.common.storage_policy import StoragePolicy, SlabStoragePolicy, \
+    POLICIES
 
 
 def _ips(*args, **kwargs):
@@ -1864,5 +1865,77 @@ class TestObjectReplicator(unittest.TestCase):
                             os.path.join(job['path']))
 
 
+@patch_policies([StoragePolicy(0, 'zero', True),
+                 SlabStoragePolicy(1, 'slab')])
+class TestObjectReplicatorSlab(unittest.TestCase):
+
+    def setUp(self):
+        utils.HASH_PATH_SUFFIX = 'endcap'
+        utils.HASH_PATH_PREFIX = ''
+        self.testdir = tempfile.mkdtemp()
+        self.devices = os.path.join(self.testdir, 'node')
+        mkdirs(os.path.join(self.devices, 'sda'))
+        _create_test_rings(self.testdir)
+        self.logger = debug_logger('test-replicator')
+        self.conf = dict(
+            bind_ip=_ips()[0], bind_port=6200, swift_dir=self.testdir,
+            devices=self.devices, mount_check='false', sync_method='rsync')
+        self.replicator = object_replicator.ObjectReplicator(
+            self.conf, logger=self.logger)
+        self.replicator._zero_stats()
+        self.replicator.all_devs_info = set()
+        self.df_mgr = self.replicator._df_router[POLICIES[1]]
+
+    def tearDown(self):
+        rmtree(self.testdir, ignore_errors=1)
+
+    def _put(self, partition, obj):
+        df = self.df_mgr.get_diskfile('sda', partition, 'a', 'c', obj,
+                                      policy=POLICIES[1])
+        with df.create() as writer:
+            writer.write('body')
+            writer.put({'X-Timestamp': normalize_timestamp(time.time()),
+                        'Content-Length': '4', 'ETag': 'etag'})
+        return os.path.basename(df._datadir)
+
+    def _get_job(self, partition):
+        for job in self.replicator.collect_jobs(override_policies=['1']):
+            if job['partition'] == partition:
+                return job
+        self.fail('No job for partition %s' % partition)
+
+    def test_update_syncs_with_ssync(self):
+        object_hash = self._put('0', 'o')
+        job = self._get_job('0')
+        self.assertIsInstance(job['policy'], SlabStoragePolicy)
+        self.assertFalse(job['delete'])
+        with mock.patch('swift.obj.replicator.http_connect',
+                        mock_http_connect(200)), \
+                mock.patch('swift.obj.ssync_sender.Sender') as mock_sender:
+            mock_sender.return_value.return_value = (True, {})
+            self.replicator.replication_count = 1
+            self.replicator.suffix_count = 0
+            self.replicator.suffix_sync = 0
+            self.replicator.suffix_hash = 0
+            self.replicator.partition_times = []
+            self.replicator.update(job)
+        self.assertEqual(len(job['nodes']), mock_sender.call_count)
+        for call in mock_sender.call_args_list:
+            self.assertEqual([object_hash[-3:]], call[0][3])
+            self.assertIs(self.df_mgr, call[1]['df_mgr'])
+
+    def test_delete_handoff_objs(self):
+        object_hashes = [self._put('1', 'o%d' % i) for i in range(2)]
+        job = self._get_job('1')
+        self.assertTrue(job['delete'])
+        success_paths, error_paths = self.replicator.delete_handoff_objs(
+            job, object_hashes[:1])
+        self.assertEqual(1, len(success_paths))
+        self.assertEqual([], error_paths)
+        index = self.df_mgr.get_slab_index(job['path'])
+        self.assertEqual({}, index.get(object_hashes[0]))
+        self.assertTrue(index.get(object_hashes[1]))
+
+
 if __name__ == '__main__':
     unittest.main()
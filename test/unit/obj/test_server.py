@@ -23,6 +23,7 @@ import errno
 import operator
 import os
 import mock
+import socket
 import six
 from six import StringIO
 import unittest
@@ -56,7 +57,7 @@ from swift.common.utils import hash_path, mkdirs, normalize_timestamp, \
     NullLogger, storage_directory, public, replication, encode_timestamps, \
     Timestamp
 from swift.common import constraints
-from swift.common.swob import Request, WsgiBytesIO
+from swift.common.swob import Request, Response, WsgiBytesIO
 from swift.common.splice import splice
 from swift.common.storage_policy import (StoragePolicy, ECStoragePolicy,
                                          POLICIES, EC_POLICY)
@@ -3666,6 +3667,57 @@ class TestObjectController(unittest.TestCase):
         self.assertEqual(errbuf.getvalue(), '')
         self.assertEqual(outbuf.getvalue()[:4], '405 ')
 
+    def test_call_zero_copy_uncorks(self):
+        if not hasattr(socket, 'TCP_CORK'):
+            raise SkipTest('TCP_CORK is not available')
+
+        class ZeroCopyIter(object):
+            def __init__(self, error=None):
+                self.error = error
+                self.sent_to = []
+
+            def __iter__(self):
+                return iter([])
+
+            def can_zero_copy_send(self):
+                return True
+
+            def zero_copy_send(self, wsockfd):
+                self.sent_to.append(wsockfd)
+                if self.error:
+                    raise self.error
+
+        for error in (None, IOError('boom')):
+            app_iter = ZeroCopyIter(error)
+            wsock = mock.MagicMock()
+            wsock.fileno.return_value = 42
+            env = {'REQUEST_METHOD': 'GET',
+                   'SCRIPT_NAME': '',
+                   'PATH_INFO': '/sda1/p/a/c/o',
+                   'SERVER_NAME': '127.0.0.1',
+                   'SERVER_PORT': '8080',
+                   'SERVER_PROTOCOL': 'HTTP/1.1',
+                   'wsgi.version': (1, 0),
+                   'wsgi.url_scheme': 'http',
+                   'wsgi.input': wsgi.Input(StringIO(), 0, sock=wsock),
+                   'wsgi.errors': StringIO()}
+            resp = Response(app_iter=app_iter)
+            with mock.patch.object(self.object_controller, 'GET',
+                                   return_value=resp):
+                body = self.object_controller(env, lambda *args: None)
+                if error:
+                    with self.assertRaises(IOError):
+                        list(body)
+                else:
+                    list(body)
+            self.assertEqual([42], app_iter.sent_to)
+            # the connection may be kept alive for another request, so the
+            # tail of the response is not left waiting behind the cork
+            self.assertEqual(
+                [mock.call(socket.IPPROTO_TCP, socket.TCP_CORK, 1),
+                 mock.call(socket.IPPROTO_TCP, socket.TCP_CORK, 0)],
+                wsock.setsockopt.mock_calls)
+
     def test_call_name_collision(self):
         def my_check(*args):
             return False
@@ -4477,6 +4529,51 @@ class TestObjectController(unittest.TestCase):
             'x-trans-id': '123',
             'referer': 'PUT http://localhost/sda1/0/a/c/o'}))
 
+    def test_container_update_to_shard(self):
+        container_updates = []
+
+        def capture_updates(ip, port, method, path, headers, *args, **kwargs):
+            container_updates.append((ip, port, method, path, headers))
+
+        req = Request.blank(
+            '/sda1/0/a/c/o',
+            environ={'REQUEST_METHOD': 'PUT'},
+            headers={'X-Timestamp': 1,
+                     'X-Trans-Id': '123',
+                     'X-Container-Host': 'chost:cport',
+                     'X-Container-Partition': 'cpartition',
+                     'X-Container-Device': 'cdevice',
+                     'X-Backend-Container-Path': '.shards_a/c-1',
+                     'Content-Type': 'text/plain'}, body='')
+        with mocked_http_conn(200, give_connect=capture_updates) as fake_conn:
+            with fake_spawn():
+                resp = req.get_response(self.object_controller)
+        self.assertRaises(StopIteration, fake_conn.code_iter.next)
+        self.assertEqual(resp.status_int, 201)
+        self.assertEqual(1, len(container_updates))
+        ip, port, method, path, headers = container_updates[0]
+        self.assertEqual('PUT', method)
+        self.assertEqual('/cdevice/cpartition/.shards_a/c-1/o', path)
+
+        # a bad container path is not used
+        req = Request.blank(
+            '/sda1/0/a/c/o',
+            environ={'REQUEST_METHOD': 'PUT'},
+            headers={'X-Timestamp': 2,
+                     'X-Container-Host': 'chost:cport',
+                     'X-Container-Partition': 'cpartition',
+                     'X-Container-Device': 'cdevice',
+                     'X-Backend-Container-Path': 'no-container',
+                     'Content-Type': 'text/plain'}, body='')
+        with mocked_http_conn() as fake_conn:
+            with fake_spawn():
+                resp = req.get_response(self.object_controller)
+        self.assertEqual(resp.status_int, 201)
+        self.assertEqual([], fake_conn.requests)
+        self.assertIn('invalid X-Backend-Container-Path',
+                      self.object_controller.logger.get_lines_for_level(
+                          'error')[0])
+
     def test_PUT_container_update_overrides(self):
         ts_iter = make_timestamp_iter()
 
@@ -6921,6 +7018,70 @@ class TestZeroCopy(unittest.TestCase):
         contents = response.read()
         self.assertEqual(contents, obj_contents)
 
+    def test_GET_range(self):
+        obj_contents = ''.join(chr(ord('a') + i % 26) for i in range(65536))
+        url_path = '/sda1/2100/a/c/o'
+
+        self.http_conn.request('PUT', url_path, obj_contents,
+                               {'X-Timestamp': '1402600322.52126'})
+        response = self.http_conn.getresponse()
+        self.assertEqual(response.status, 201)
+        response.read()
+
+        with mock.patch('swift.obj.diskfile.BaseDiskFileReader.'
+                        'zero_copy_send_ranges', autospec=True,
+                        side_effect=diskfile.BaseDiskFileReader.
+                        zero_copy_send_ranges) as mock_send:
+            self.http_conn.request('GET', url_path,
+                                   headers={'Range': 'bytes=1000-40999'})
+            response = self.http_conn.getresponse()
+            self.assertEqual(response.status, 206)
+            self.assertEqual(response.getheader('Content-Range'),
+                             'bytes 1000-40999/65536')
+            contents = response.read()
+        self.assertEqual(contents, obj_contents[1000:41000])
+        self.assertEqual(len(mock_send.mock_calls), 1)
+
+    def test_GET_multiple_ranges(self):
+        obj_contents = ''.join(chr(ord('a') + i % 26) for i in range(65536))
+        url_path = '/sda1/2100/a/c/o'
+
+        self.http_conn.request('PUT', url_path, obj_contents,
+                               {'X-Timestamp': '1402600322.52126'})
+        response = self.http_conn.getresponse()
+        self.assertEqual(response.status, 201)
+        response.read()
+
+        with mock.patch('swift.obj.diskfile.BaseDiskFileReader.'
+                        'zero_copy_send_ranges', autospec=True,
+                        side_effect=diskfile.BaseDiskFileReader.
+                        zero_copy_send_ranges) as mock_send:
+            self.http_conn.request(
+                'GET', url_path,
+                headers={'Range': 'bytes=0-9,30000-39999,-6'})
+            response = self.http_conn.getresponse()
+            self.assertEqual(response.status, 206)
+            content_type = response.getheader('Content-Type')
+            contents = response.read()
+        self.assertEqual(len(mock_send.mock_calls), 1)
+        self.assertTrue(content_type.startswith(
+            'multipart/byteranges;boundary='))
+        boundary = content_type.split('=', 1)[1]
+        self.assertEqual(len(contents),
+                         int(response.getheader('Content-Length')))
+
+        parts = contents.split('--' + boundary)
+        self.assertEqual(parts[0], '')
+        self.assertEqual(parts[-1], '--')
+        expected = [('0-9/65536', obj_contents[:10]),
+                    ('30000-39999/65536', obj_contents[30000:40000]),
+                    ('65530-65535/65536', obj_contents[65530:])]
+        self.assertEqual(len(parts[1:-1]), len(expected))
+        for part, (content_range, body) in zip(parts[1:-1], expected):
+            headers, part_body = part.split('\r\n\r\n', 1)
+            self.assertIn('Content-Range: bytes ' + content_range, headers)
+            self.assertEqual(part_body, body + '\r\n')
+
     def test_quarantine(self):
         obj_hash = hash_path('a', 'c', 'o')
         url_path = '/sda1/2100/a/c/o'
@@ -14,6 +14,7 @@
 # limitations under the License.
 
 import six.moves.cPickle as pickle
+import json
 import mock
 import os
 import unittest
@@ -27,12 +28,14 @@ from test.unit import FakeLogger
 from time import time
 from distutils.dir_util import mkpath
 
+import eventlet
 from eventlet import spawn, Timeout, listen
 from six.moves import range
 
 from swift.obj import updater as object_updater
+from swift.obj.async_spool import AsyncSpool
 from swift.obj.diskfile import (ASYNCDIR_BASE, get_async_dir, DiskFileManager,
-                                get_tmp_dir)
+                                get_tmp_dir, get_async_spool_dir)
 from swift.common.ring import RingData
 from swift.common import utils
 from swift.common.header_key_dict import HeaderKeyDict
@@ -486,6 +489,355 @@ class TestObjectUpdater(unittest.TestCase):
         self.assertEqual(daemon.logger.get_increment_counts(),
                          {'successes': 1, 'unlinks': 1, 'async_pendings': 1})
 
+    def _spool_updates(self, policy, updates):
+        conf = {'devices': self.devices_dir, 'mount_check': 'false',
+                'async_spool': 'true'}
+        dfmanager = DiskFileManager(conf, self.logger)
+        ts = (normalize_timestamp(t) for t in itertools.count(int(time())))
+        for op, account, container, obj in updates:
+            headers_out = HeaderKeyDict({
+                'x-size': 0,
+                'x-content-type': 'text/plain',
+                'x-etag': 'd41d8cd98f00b204e9800998ecf8427e',
+                'x-timestamp': next(ts),
+                'X-Backend-Storage-Policy-Index': int(policy),
+            })
+            data = {'op': op, 'account': account, 'container': container,
+                    'obj': obj, 'headers': headers_out}
+            dfmanager.pickle_async_update(self.sda1, account, container, obj,
+                                          data, next(ts), policy)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.sda1, get_async_dir(policy))))
+        return AsyncSpool(os.path.join(self.sda1, get_async_spool_dir(policy)))
+
+    def test_obj_spooled_updates(self):
+        policy = random.choice(list(POLICIES))
+        spool = self._spool_updates(policy, [
+            ('PUT', 'a', 'c', 'o1'), ('DELETE', 'a', 'c', 'o2'),
+            ('PUT', 'a', 'c2', 'o3')])
+        self.assertEqual(spool.get_backlog()['updates'], 3)
+        conf = {'devices': self.devices_dir, 'mount_check': 'false',
+                'swift_dir': self.testdir}
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        bodies = []
+
+        def capture_send(conn, data):
+            bodies.append(json.loads(data))
+
+        # one request to each of the nodes of each container
+        with mocked_http_conn(*[202] * 6, give_send=capture_send) as fake:
+            daemon.run_once()
+        self.assertEqual(['UPDATE'] * 6,
+                         [req['method'] for req in fake.requests])
+        self.assertEqual(['a/c'] * 3 + ['a/c2'] * 3,
+                         sorted(req['path'].split('/', 3)[3]
+                                for req in fake.requests))
+        for req in fake.requests:
+            self.assertEqual(req['headers']['X-Backend-Storage-Policy-Index'],
+                             str(int(policy)))
+            self.assertEqual(req['headers']['Content-Type'],
+                             'application/json')
+        bodies.sort(key=len)
+        self.assertEqual([[('o3', 0)]] * 3 + [[('o1', 0), ('o2', 1)]] * 3,
+                         [[(r['name'], r['deleted']) for r in body]
+                          for body in bodies])
+        deleted = bodies[-1][1]
+        self.assertEqual(deleted['content_type'], 'application/deleted')
+        self.assertEqual(deleted['etag'], 'noetag')
+        self.assertEqual(deleted['storage_policy_index'], int(policy))
+        self.assertEqual(daemon.logger.get_increment_counts(),
+                         {'successes': 3, 'unlinks': 1, 'async_pendings': 3})
+        self.assertEqual(spool.get_backlog(),
+                         {'updates': 0, 'bytes': 0, 'files': 0})
+
+    def test_obj_spooled_updates_failure(self):
+        policy = random.choice(list(POLICIES))
+        spool = self._spool_updates(policy, [
+            ('PUT', 'a', 'c', 'o1'), ('PUT', 'a', 'c', 'o2')])
+        conf = {'devices': self.devices_dir, 'mount_check': 'false',
+                'swift_dir': self.testdir}
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        with mocked_http_conn(202, 500, 202):
+            daemon.run_once()
+        self.assertEqual(daemon.logger.get_increment_counts(),
+                         {'failures': 2, 'unlinks': 1, 'async_pendings': 2})
+        # the updates are back in the spool, with the nodes they were sent to
+        self.assertEqual(spool.segments(), [])
+        self.assertEqual(spool.get_backlog()['updates'], 2)
+        spool.seal()
+        updates, skipped = spool.read_segment(spool.segments()[0])
+        self.assertEqual(['o1', 'o2'], [u['obj'] for u in updates])
+        for update in updates:
+            self.assertEqual(2, len(update['successes']))
+
+        # only the node that failed is sent them again
+        self.logger._clear()
+        with mocked_http_conn(202) as fake:
+            daemon.run_once()
+        self.assertEqual(1, len(fake.requests))
+        self.assertEqual(daemon.logger.get_increment_counts(),
+                         {'successes': 2, 'unlinks': 1})
+        self.assertEqual(spool.get_backlog()['updates'], 0)
+
+    def test_obj_spooled_updates_batches(self):
+        policy = random.choice(list(POLICIES))
+        self._spool_updates(policy, [
+            ('PUT', 'a', 'c', 'o%d' % i) for i in range(5)])
+        conf = {'devices': self.devices_dir, 'mount_check': 'false',
+                'swift_dir': self.testdir, 'spool_batch_size': '2'}
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        self.assertEqual(daemon.spool_batch_size, 2)
+        bodies = []
+
+        def capture_send(conn, data):
+            bodies.append(json.loads(data))
+
+        with mocked_http_conn(*[202] * 9, give_send=capture_send):
+            daemon.run_once()
+        self.assertEqual([1] * 3 + [2] * 6, sorted(len(b) for b in bodies))
+        self.assertEqual(daemon.logger.get_increment_counts()['successes'], 5)
+
+    def test_container_batch_update_fallback(self):
+        policy = random.choice(list(POLICIES))
+        conf = {'devices': self.devices_dir, 'mount_check': 'false',
+                'swift_dir': self.testdir}
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        node = {'id': 1, 'ip': '127.0.0.1', 'port': 1, 'device': 'sda1'}
+        updates = [
+            {'op': 'PUT', 'account': 'a', 'container': 'c', 'obj': obj,
+             'headers': HeaderKeyDict({
+                 'x-size': 0, 'x-content-type': 'text/plain',
+                 'x-etag': 'd41d8cd98f00b204e9800998ecf8427e',
+                 'x-timestamp': normalize_timestamp(time())})}
+            for obj in ('o1', 'o2')]
+        # a container server that does not support UPDATE is sent a PUT for
+        # each object
+        with mocked_http_conn(405, 201, 500) as fake:
+            node_id, sent = daemon.container_batch_update(
+                node, 0, 'a', 'c', updates, policy)
+        self.assertEqual(['UPDATE', 'PUT', 'PUT'],
+                         [req['method'] for req in fake.requests])
+        self.assertEqual(['/sda1/0/a/c', '/sda1/0/a/c/o1', '/sda1/0/a/c/o2'],
+                         [req['path'] for req in fake.requests])
+        self.assertEqual(node_id, 1)
+        self.assertEqual(sent, updates[:1])
+
+        with mocked_http_conn(507):
+            self.assertEqual((1, []), daemon.container_batch_update(
+                node, 0, 'a', 'c', updates, policy))
+        with mocked_http_conn(404):
+            self.assertEqual((1, updates), daemon.container_batch_update(
+                node, 0, 'a', 'c', updates, policy))
+
+    def _write_async_updates(self, policy, updates):
+        conf = {'devices': self.devices_dir, 'mount_check': 'false'}
+        dfmanager = DiskFileManager(conf, self.logger)
+        paths = []
+        for op, account, container, obj, timestamp in updates:
+            headers_out = HeaderKeyDict({
+                'x-size': 0,
+                'x-content-type': 'text/plain',
+                'x-etag': 'd41d8cd98f00b204e9800998ecf8427e',
+                'x-timestamp': timestamp,
+                'X-Backend-Storage-Policy-Index': int(policy),
+            })
+            data = {'op': op, 'account': account, 'container': container,
+                    'obj': obj, 'headers': headers_out}
+            dfmanager.pickle_async_update(self.sda1, account, container, obj,
+                                          data, timestamp, policy)
+            ohash = hash_path(account, container, obj)
+            paths.append(os.path.join(
+                self.sda1, get_async_dir(policy), ohash[-3:],
+                '%s-%s' % (ohash, timestamp)))
+        return paths
+
+    def test_object_sweep_newest_first(self):
+        policy = random.choice(list(POLICIES))
+        now = time()
+        paths = self._write_async_updates(policy, [
+            ('PUT', 'a', 'c', 'o%d' % i, normalize_timestamp(now - i))
+            for i in range(20)])
+        # an older update for o0 is unlinked rather than sent
+        older = self._write_async_updates(policy, [
+            ('PUT', 'a', 'c', 'o0', normalize_timestamp(now - 100))])[0]
+        seen = []
+        listed = []
+
+        class MockObjectUpdater(object_updater.ObjectUpdater):
+            def _listdir(self, path):
+                listed.append(path)
+                return super(MockObjectUpdater, self)._listdir(path)
+
+            def process_object_update(self, update_path, device, policy):
+                seen.append((update_path, len(listed)))
+                os.unlink(update_path)
+
+        cu = MockObjectUpdater({
+            'devices': self.devices_dir,
+            'mount_check': 'false',
+            'swift_dir': self.testdir}, logger=self.logger)
+        cu.object_sweep(self.sda1)
+        self.assertEqual(sorted(paths), sorted(path for path, _ in seen))
+        # the updates in each prefix dir are sent newest first...
+        for prefix_path in set(os.path.dirname(path) for path in paths):
+            self.assertEqual(
+                [path for path in paths
+                 if os.path.dirname(path) == prefix_path],
+                [path for path, _ in seen
+                 if os.path.dirname(path) == prefix_path])
+        # ...as soon as that prefix dir has been listed
+        self.assertLess(seen[0][1], len(listed))
+        self.assertFalse(os.path.exists(older))
+        self.assertEqual(self.logger.get_increment_counts(),
+                         {'unlinks': 1, 'async_pendings': 21})
+        self.assertEqual([], os.listdir(
+            os.path.join(self.sda1, get_async_dir(policy))))
+
+    def test_object_sweep_update_concurrency(self):
+        policy = random.choice(list(POLICIES))
+        paths = self._write_async_updates(policy, [
+            ('PUT', 'a', 'c', 'o%d' % i, normalize_timestamp(time()))
+            for i in range(10)])
+        running = []
+        max_running = []
+        failed = []
+
+        class MockObjectUpdater(object_updater.ObjectUpdater):
+            def process_object_update(self, update_path, device, policy):
+                running.append(update_path)
+                max_running.append(len(running))
+                eventlet.sleep(0.01)
+                running.remove(update_path)
+                if not failed:
+                    failed.append(update_path)
+                    raise Exception('boom')
+                os.unlink(update_path)
+
+        cu = MockObjectUpdater({
+            'devices': self.devices_dir,
+            'mount_check': 'false',
+            'swift_dir': self.testdir,
+            'update_concurrency': '3'}, logger=self.logger)
+        self.assertEqual(cu.update_concurrency, 3)
+        cu.object_sweep(self.sda1)
+        self.assertEqual(3, max(max_running))
+        self.assertEqual(10, len(max_running))
+        # an error processing one update does not stop the others
+        errors = self.logger.get_lines_for_level('error')
+        self.assertEqual(1, len(errors))
+        self.assertIn('ERROR processing', errors[0])
+        self.assertEqual(1, sum(os.path.exists(path) for path in paths))
+
+    def test_object_sweep_slowdown_is_cooperative(self):
+        policy = random.choice(list(POLICIES))
+        self._write_async_updates(policy, [
+            ('PUT', 'a', 'c', 'o%d' % i, normalize_timestamp(time()))
+            for i in range(6)])
+        events = []
+        real_sleep = eventlet.sleep
+
+        class MockObjectUpdater(object_updater.ObjectUpdater):
+            def process_object_update(self, update_path, device, policy):
+                events.append('update')
+                os.unlink(update_path)
+
+        def fake_sleep(seconds=0):
+            real_sleep(seconds)
+            if seconds == cu.slowdown:
+                events.append('slept')
+
+        cu = MockObjectUpdater({
+            'devices': self.devices_dir,
+            'mount_check': 'false',
+            'swift_dir': self.testdir,
+            'slowdown': '0.01',
+            'update_concurrency': '3'}, logger=self.logger)
+        with mock.patch('swift.obj.updater.eventlet.sleep', fake_sleep):
+            cu.object_sweep(self.sda1)
+        # the workers sleep for slowdown without holding up one another
+        self.assertEqual(['update'] * 3, events[:3])
+        self.assertEqual(6, events.count('update'))
+        self.assertEqual(6, events.count('slept'))
+
+    def test_object_sweep_container_backoff(self):
+        policy = random.choice(list(POLICIES))
+        now = time()
+        paths = self._write_async_updates(policy, [
+            ('PUT', 'a', 'c1', 'o1', normalize_timestamp(now)),
+            ('PUT', 'a', 'c1', 'o2', normalize_timestamp(now - 1)),
+            ('PUT', 'a', 'c2', 'o3', normalize_timestamp(now - 2))])
+        conf = {'devices': self.devices_dir, 'mount_check': 'false',
+                'swift_dir': self.testdir}
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        self.assertEqual(daemon.container_backoff, 10)
+        self.logger._clear()
+        # the update to c1 fails, so the next update to c1 is deferred but
+        # the update to c2 is still sent
+        with mocked_http_conn(500, 500, 500, 201, 201, 201) as fake:
+            daemon.run_once()
+        self.assertEqual(['/a/c1/o1'] * 3 + ['/a/c2/o3'] * 3,
+                         [req['path'][req['path'].index('/a/'):]
+                          for req in fake.requests])
+        self.assertEqual(daemon.logger.get_increment_counts(),
+                         {'failures': 1, 'deferrals': 1, 'successes': 1,
+                          'unlinks': 1})
+        self.assertEqual([True, True, False],
+                         [os.path.exists(path) for path in paths])
+        lags = self.logger.log_dict['timing_since']
+        self.assertEqual(['lag'], [args[0] for args, kwargs in lags
+                                   if args[0] != 'timing'])
+        drain_rates = [args for args, kwargs in self.logger.log_dict['timing']
+                       if args[0] == 'drain_rate']
+        self.assertEqual(1, len(drain_rates))
+        self.assertGreater(drain_rates[0][1], 0)
+
+        # backoffs are forgotten between sweeps
+        self.logger._clear()
+        with mocked_http_conn(*[201] * 6):
+            daemon.run_once()
+        self.assertEqual(daemon.logger.get_increment_counts(),
+                         {'successes': 2, 'unlinks': 2})
+
+    def test_container_backoff_doubles(self):
+        conf = {'devices': self.devices_dir, 'mount_check': 'false',
+                'swift_dir': self.testdir, 'interval': '35'}
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        daemon._container_backoffs = {}
+        with mock.patch('swift.obj.updater.time.time', return_value=100.0):
+            self.assertFalse(daemon._container_backed_off('a', 'c'))
+            expected = []
+            for i in range(4):
+                daemon._container_update_result('a', 'c', False)
+                expected.append(daemon._container_backoffs[('a', 'c')][1])
+            self.assertTrue(daemon._container_backed_off('a', 'c'))
+            self.assertFalse(daemon._container_backed_off('a', 'c2'))
+        # capped at the interval
+        self.assertEqual([110.0, 120.0, 135.0, 135.0], expected)
+        with mock.patch('swift.obj.updater.time.time', return_value=136.0):
+            self.assertFalse(daemon._container_backed_off('a', 'c'))
+        daemon._container_update_result('a', 'c', True)
+        self.assertEqual({}, daemon._container_backoffs)
+
+        daemon.container_backoff = 0
+        daemon._container_update_result('a', 'c', False)
+        self.assertEqual({}, daemon._container_backoffs)
+
+    def test_obj_spooled_updates_container_backoff(self):
+        policy = random.choice(list(POLICIES))
+        spool = self._spool_updates(policy, [
+            ('PUT', 'a', 'c', 'o1'), ('PUT', 'a', 'c', 'o2')])
+        conf = {'devices': self.devices_dir, 'mount_check': 'false',
+                'swift_dir': self.testdir, 'spool_batch_size': '1'}
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        self.logger._clear()
+        with mocked_http_conn(500, 500, 500):
+            daemon.run_once()
+        self.assertEqual(daemon.logger.get_increment_counts(),
+                         {'failures': 1, 'unlinks': 1})
+        self.assertEqual([(('deferrals', 1), {})],
+                         self.logger.log_dict['update_stats'])
+        self.assertEqual(spool.get_backlog()['updates'], 2)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -14,20 +14,25 @@
 # limitations under the License.
 
 import itertools
+import time
 from collections import defaultdict
 import unittest
+from eventlet import GreenPile, sleep
+from eventlet.event import Event
 from mock import patch
 from swift.proxy.controllers.base import headers_to_container_info, \
     headers_to_account_info, headers_to_object_info, get_container_info, \
     get_cache_key, get_account_info, get_info, get_object_info, \
-    Controller, GetOrHeadHandler, bytes_to_skip
+    Controller, GetOrHeadHandler, bytes_to_skip, InfoCache, \
+    clear_info_cache, prefetch_info
 from swift.common.swob import Request, HTTPException, RESPONSE_REASONS
 from swift.common import exceptions
 from swift.common.utils import split_path
 from swift.common.header_key_dict import HeaderKeyDict
 from swift.common.http import is_success
 from swift.common.storage_policy import StoragePolicy
-from test.unit import fake_http_connect, FakeRing, FakeMemcache
+from test.unit import fake_http_connect, FakeRing, FakeMemcache, \
+    debug_logger
 from swift.proxy import server as proxy_server
 from swift.common.request_helpers import (
     get_sys_meta_prefix, get_object_transient_sysmeta
@@ -117,13 +122,16 @@ class FakeApp(object):
     recheck_container_existence = 30
     recheck_account_existence = 30
 
-    def __init__(self, response_factory=None, statuses=None):
+    def __init__(self, response_factory=None, statuses=None, delay=0):
         self.responses = response_factory or \
             DynamicResponseFactory(*statuses or [])
         self.captured_envs = []
+        self.delay = delay
 
     def __call__(self, environ, start_response):
         self.captured_envs.append(environ)
+        if self.delay:
+            sleep(self.delay)
         response = self.responses.get_response(environ)
         reason = RESPONSE_REASONS[response.status_int][0]
         start_response('%d %s' % (response.status_int, reason),
@@ -142,6 +150,66 @@ class FakeCache(FakeMemcache):
         return self.stub or self.store.get(key)
 
 
+class TestInfoCache(unittest.TestCase):
+
+    def test_lru(self):
+        info_cache = InfoCache(2)
+        info_cache.set('account/a', {'status': 200})
+        info_cache.set('account/b', {'status': 200})
+        self.assertEqual({'status': 200}, info_cache.get('account/a'))
+        info_cache.set('account/c', {'status': 200})
+        # b was the least recently used
+        self.assertEqual(2, len(info_cache))
+        self.assertIsNone(info_cache.get('account/b'))
+        self.assertEqual({'status': 200}, info_cache.get('account/a'))
+        self.assertEqual({'status': 200}, info_cache.get('account/c'))
+
+    def test_ttl(self):
+        info_cache = InfoCache(10, ttl=5, negative_ttl=1)
+        now = time.time()
+        with patch('swift.proxy.controllers.base.time.time',
+                   return_value=now):
+            info_cache.set('account/a', {'status': 200})
+            info_cache.set('account/b', {'status': 404})
+            info_cache.set('account/c', {'status': 410})
+            info_cache.set('account/d', {'status': 200}, max_ttl=2)
+        with patch('swift.proxy.controllers.base.time.time',
+                   return_value=now + 1.5):
+            self.assertIsNotNone(info_cache.get('account/a'))
+            self.assertIsNone(info_cache.get('account/b'))
+            self.assertIsNone(info_cache.get('account/c'))
+            self.assertIsNotNone(info_cache.get('account/d'))
+        with patch('swift.proxy.controllers.base.time.time',
+                   return_value=now + 3):
+            self.assertIsNotNone(info_cache.get('account/a'))
+            self.assertIsNone(info_cache.get('account/d'))
+        with patch('swift.proxy.controllers.base.time.time',
+                   return_value=now + 6):
+            self.assertIsNone(info_cache.get('account/a'))
+        self.assertEqual(0, len(info_cache))
+
+        # negative caching may be turned off
+        info_cache = InfoCache(10, negative_ttl=0)
+        info_cache.set('account/b', {'status': 404})
+        self.assertIsNone(info_cache.get('account/b'))
+
+    def test_fetch_once_error(self):
+        info_cache = InfoCache(10)
+
+        def fetch():
+            sleep(0.01)
+            raise ValueError('kaboom')
+
+        pile = GreenPile()
+        pile.spawn(info_cache.fetch_once, 'account/a', fetch)
+        pile.spawn(info_cache.fetch_once, 'account/a', lambda: 'info')
+        with self.assertRaises(ValueError):
+            next(pile)
+        # the waiter went and got its own
+        self.assertEqual('info', next(pile))
+        self.assertEqual({}, info_cache._fetching)
+
+
 @patch_policies([StoragePolicy(0, 'zero', True, object_ring=FakeRing())])
 class TestFuncs(unittest.TestCase):
     def setUp(self):
@@ -282,6 +350,167 @@ class TestFuncs(unittest.TestCase):
         resp = get_container_info(req.environ, 'xxx')
         self.assertEqual(resp['bytes'], 3867)
 
+    def test_get_container_info_worker_infocache(self):
+        logger = debug_logger()
+        worker_infocache = InfoCache(10, logger=logger)
+        app = FakeApp()
+        memcache = FakeCache({})
+
+        def do_get():
+            req = Request.blank("/v1/a/c", environ={
+                'swift.cache': memcache,
+                'swift.worker_infocache': worker_infocache})
+            return get_container_info(req.environ, app)
+
+        info = do_get()
+        self.assertEqual(info['status'], 200)
+        self.assertEqual(info['bytes'], 6666)
+        self.assertEqual(app.responses.stats,
+                         {'account': 1, 'container': 1})
+        self.assertEqual(2, len(worker_infocache))
+
+        # another request needs neither memcache nor the backend
+        memcache.store.clear()
+        self.assertEqual(info, do_get())
+        self.assertEqual(app.responses.stats,
+                         {'account': 1, 'container': 1})
+        self.assertEqual({'hit': 1, 'miss': 2},
+                         logger.get_increment_counts())
+
+        # until the info expires
+        now = time.time()
+        with patch('swift.proxy.controllers.base.time.time',
+                   return_value=now + 6):
+            self.assertEqual(info, do_get())
+        self.assertEqual(app.responses.stats,
+                         {'account': 2, 'container': 2})
+
+        # or is cleared by this worker
+        memcache.store.clear()
+        clear_info_cache(None, {'swift.worker_infocache': worker_infocache},
+                         'a', 'c')
+        self.assertEqual(1, len(worker_infocache))
+        self.assertEqual(info, do_get())
+        self.assertEqual(app.responses.stats,
+                         {'account': 2, 'container': 3})
+
+    def test_get_container_info_worker_infocache_memcache_hit(self):
+        worker_infocache = InfoCache(10)
+        cache_key = get_cache_key('a', 'c')
+        memcache = FakeCache({})
+        memcache.store[cache_key] = {'status': 200, 'bytes': 3333}
+        req = Request.blank("/v1/a/c", environ={
+            'swift.cache': memcache,
+            'swift.worker_infocache': worker_infocache})
+        info = get_container_info(req.environ, FakeApp())
+        self.assertEqual(3333, info['bytes'])
+        self.assertEqual({'status': 200, 'bytes': 3333},
+                         worker_infocache.get(cache_key))
+
+    def test_get_container_info_worker_infocache_negative(self):
+        worker_infocache = InfoCache(10, ttl=5, negative_ttl=1)
+        app = FakeApp(statuses=[200, 404, 404])
+
+        def do_get():
+            req = Request.blank("/v1/a/c", environ={
+                'swift.worker_infocache': worker_infocache})
+            return get_container_info(req.environ, app)
+
+        now = time.time()
+        with patch('swift.proxy.controllers.base.time.time',
+                   return_value=now):
+            self.assertEqual(404, do_get()['status'])
+            self.assertEqual(404, do_get()['status'])
+        self.assertEqual(app.responses.stats,
+                         {'account': 1, 'container': 1})
+        # the not found container expires sooner than its account
+        with patch('swift.proxy.controllers.base.time.time',
+                   return_value=now + 2):
+            self.assertEqual(404, do_get()['status'])
+        self.assertEqual(app.responses.stats,
+                         {'account': 1, 'container': 2})
+
+    def test_get_container_info_coalesced(self):
+        logger = debug_logger()
+        worker_infocache = InfoCache(10, logger=logger)
+        app = FakeApp(delay=0.01)
+
+        def do_get():
+            req = Request.blank("/v1/a/c", environ={
+                'swift.worker_infocache': worker_infocache})
+            return get_container_info(req.environ, app)
+
+        pile = GreenPile()
+        for _junk in range(5):
+            pile.spawn(do_get)
+        infos = list(pile)
+        self.assertEqual([200] * 5, [info['status'] for info in infos])
+        self.assertEqual([6666] * 5, [info['bytes'] for info in infos])
+        # just the one request made it to the backend
+        self.assertEqual(app.responses.stats,
+                         {'account': 1, 'container': 1})
+        # four waiters each on the account and the container info
+        self.assertEqual(8, logger.get_increment_counts()['coalesced'])
+
+    def test_get_container_info_coalesced_error(self):
+        worker_infocache = InfoCache(10)
+        app = FakeApp(statuses=[200, 503, 200], delay=0.01)
+
+        def do_get():
+            req = Request.blank("/v1/a/c", environ={
+                'swift.worker_infocache': worker_infocache})
+            return get_container_info(req.environ, app)
+
+        pile = GreenPile()
+        for _junk in range(2):
+            pile.spawn(do_get)
+        # the waiter got no info to share, so tried for itself
+        self.assertEqual([0, 200],
+                         sorted(info['status'] for info in pile))
+        self.assertEqual(app.responses.stats,
+                         {'account': 1, 'container': 2})
+
+    def test_prefetch_info(self):
+        class FakeMultiCache(FakeCache):
+            def get_many(self, keys):
+                self.get_many_keys = keys
+                return dict((key, self.store[key]) for key in keys
+                            if key in self.store)
+
+        memcache = FakeMultiCache({})
+        memcache.store['account/a'] = {
+            'status': 200, 'container_count': 1, 'meta': {'k': u'\u2603'}}
+        worker_infocache = InfoCache(10)
+        worker_infocache.set('container/a/c1', {'status': 200, 'bytes': 1})
+        env = {'swift.cache': memcache,
+               'swift.worker_infocache': worker_infocache,
+               'swift.infocache': {'container/a/c2': {'status': 200}}}
+
+        # already had by the request
+        prefetch_info(env, 'a', 'c2')
+        self.assertEqual(['account/a'], memcache.get_many_keys)
+        self.assertEqual('\xe2\x98\x83',
+                         env['swift.infocache']['account/a']['meta']['k'])
+        # already had by the worker
+        prefetch_info(env, 'a', 'c1')
+        self.assertEqual({'status': 200, 'bytes': 1},
+                         env['swift.infocache']['container/a/c1'])
+        self.assertEqual(['account/a'], memcache.get_many_keys)
+
+        # memcache does not have it, so the lookup goes to the backend
+        # without asking memcache again
+        prefetch_info(env, 'a', 'c3')
+        self.assertEqual(['container/a/c3'], memcache.get_many_keys)
+        self.assertEqual(set(['container/a/c3']),
+                         env['swift.infocache_prefetch_misses'])
+        app = FakeApp()
+        env['PATH_INFO'] = '/v1/a/c3'
+        with patch.object(memcache, 'get') as mock_get:
+            info = get_container_info(env, app)
+        self.assertEqual(200, info['status'])
+        self.assertFalse(mock_get.called)
+        self.assertEqual(app.responses.stats, {'container': 1})
+
     def test_get_account_info_swift_source(self):
         app = FakeApp()
         req = Request.blank("/v1/a", environ={'swift.cache': FakeCache()})
@@ -689,6 +918,13 @@ class TestFuncs(unittest.TestCase):
             self.assertEqual(v, dst_headers[k])
         self.assertFalse('new-owner' in dst_headers)
 
+    def test_generate_request_headers_backend_keepalive(self):
+        self.app.backend_keepalive = True
+        base = Controller(self.app)
+        req = Request.blank('/v1/a/c/o')
+        dst_headers = base.generate_request_headers(req, transfer=True)
+        self.assertEqual('keep-alive', dst_headers['connection'])
+
     def test_generate_request_headers_with_sysmeta(self):
         base = Controller(self.app)
         good_hdrs = {'x-base-sysmeta-foo': 'ok',
@@ -830,6 +1066,174 @@ class TestFuncs(unittest.TestCase):
             client_chunks = list(app_iter)
         self.assertEqual(client_chunks, ['abcd1234', 'efgh5678'])
 
+    def _make_hedged_handler(self, node, budget=1):
+        self.app.hedge_budget = budget
+        for _ in range(10):
+            self.app.record_response_time(None, node, 0.01)
+            self.app.record_response_time(None, node, 0.01, chunk_read=True)
+        req = Request.blank('/v1/a/c/o')
+        handler = GetOrHeadHandler(
+            self.app, req, 'Object', None, None, None, {}, hedge=True)
+        self.app.add_hedge_budget()
+        return req, handler
+
+    class SlowSource(object):
+        def __init__(self, chunks):
+            self.chunks = list(chunks)
+            self.status = 200
+            self.nuked = False
+
+        def read(self, _read_size):
+            if self.chunks:
+                chunk = self.chunks.pop(0)
+                if isinstance(chunk, tuple):
+                    delay, chunk = chunk
+                    if isinstance(delay, Event):
+                        delay.wait()
+                    else:
+                        sleep(delay)
+                return chunk
+            return ''
+
+        def getheader(self, header):
+            if header.lower() == "content-length":
+                return str(sum(len(c if isinstance(c, str) else c[1])
+                               for c in self.chunks))
+
+        def getheaders(self):
+            return [('content-length', self.getheader('content-length'))]
+
+        def nuke_from_orbit(self):
+            self.nuked = True
+
+    def test_hedged_read_stall(self):
+        self.app.logger = debug_logger()
+        node = {'ip': '1.2.3.4', 'port': 6200, 'device': 'sda'}
+        node2 = {'ip': '1.2.3.5', 'port': 6200, 'device': 'sdb'}
+        source1 = self.SlowSource(['abcd', (1, '1234'), 'efgh'])
+        source1.swift_conn = object()
+        source2 = self.SlowSource(['5678efgh'])
+        req, handler = self._make_hedged_handler(node)
+
+        ranges = []
+
+        def fake_get_source_and_node(pool=None):
+            ranges.append(handler.backend_headers.get('Range'))
+            return source2, node2
+
+        app_iter = handler._make_app_iter(req, node, source1)
+        with patch.object(handler, '_get_source_and_node',
+                          fake_get_source_and_node):
+            client_chunks = list(app_iter)
+        # switched to the other node from where the stalled one had got to
+        self.assertEqual(client_chunks, ['abcd', '5678efgh'])
+        self.assertEqual(['bytes=4-11'], ranges)
+        self.assertTrue(source1.nuked)
+        self.assertEqual(['efgh'], source1.chunks)
+        self.assertEqual(
+            {'hedge.sent': 1, 'hedge.won': 1},
+            self.app.logger.get_increment_counts())
+
+    def test_hedged_read_stall_recovers(self):
+        self.app.logger = debug_logger()
+        node = {'ip': '1.2.3.4', 'port': 6200, 'device': 'sda'}
+        node2 = {'ip': '1.2.3.5', 'port': 6200, 'device': 'sdb'}
+        source1 = self.SlowSource(['abcd', (0.05, '1234'), 'efgh'])
+        req, handler = self._make_hedged_handler(node)
+        ranges = []
+        answered = []
+
+        def slow_get_source_and_node(pool=None):
+            ranges.append(handler.backend_headers.get('Range'))
+            sleep(1)
+            answered.append(True)
+            return self.SlowSource(['5678efgh']), node2
+
+        app_iter = handler._make_app_iter(req, node, source1)
+        start = time.time()
+        with patch.object(handler, '_get_source_and_node',
+                          slow_get_source_and_node):
+            client_chunks = list(app_iter)
+        # the stalled read finished first, so the read went on without
+        # waiting for the other node, which was let go
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(client_chunks, ['abcd', '1234', 'efgh'])
+        self.assertEqual(['bytes=4-11'], ranges)
+        self.assertNotIn('Range', handler.backend_headers)
+        self.assertFalse(source1.nuked)
+        sleep(1)
+        self.assertFalse(answered)
+        self.assertEqual(
+            {'hedge.sent': 1}, self.app.logger.get_increment_counts())
+
+    def test_hedged_read_stall_answered_late(self):
+        self.app.logger = debug_logger()
+        node = {'ip': '1.2.3.4', 'port': 6200, 'device': 'sda'}
+        node2 = {'ip': '1.2.3.5', 'port': 6200, 'device': 'sdb'}
+        stalled = Event()
+        source1 = self.SlowSource(['abcd', (stalled, '1234'), 'efgh'])
+        source2 = self.SlowSource(['5678efgh'])
+        req, handler = self._make_hedged_handler(node)
+
+        def fake_get_source_and_node(pool=None):
+            # the stalled read finishes just before the other node answers
+            stalled.send()
+            return source2, node2
+
+        app_iter = handler._make_app_iter(req, node, source1)
+        with patch.object(handler, '_get_source_and_node',
+                          fake_get_source_and_node):
+            client_chunks = list(app_iter)
+        self.assertEqual(client_chunks, ['abcd', '1234', 'efgh'])
+        self.assertNotIn('Range', handler.backend_headers)
+        self.assertFalse(source1.nuked)
+        self.assertTrue(source2.nuked)
+        self.assertEqual(
+            {'hedge.sent': 1}, self.app.logger.get_increment_counts())
+
+    def test_hedged_read_stall_timeout_from_chunk_reads(self):
+        self.app.logger = debug_logger()
+        node = {'ip': '1.2.3.4', 'port': 6200, 'device': 'sda'}
+        self.app.hedge_budget = 1
+        # headers come back quickly but chunk reads take a while
+        for _ in range(10):
+            self.app.record_response_time(None, node, 0.001)
+            self.app.record_response_time(None, node, 0.2, chunk_read=True)
+        req = Request.blank('/v1/a/c/o')
+        handler = GetOrHeadHandler(
+            self.app, req, 'Object', None, None, None, {}, hedge=True)
+        self.app.add_hedge_budget()
+        source1 = self.SlowSource(['abcd', (0.05, '1234'), 'efgh'])
+
+        app_iter = handler._make_app_iter(req, node, source1)
+        with patch('swift.proxy.controllers.base.spawn') as mock_spawn, \
+                patch.object(handler, '_get_source_and_node') as mock_gsn:
+            client_chunks = list(app_iter)
+        self.assertEqual(client_chunks, ['abcd', '1234', 'efgh'])
+        # a read which is quick for a chunk read spawns nothing at all
+        self.assertFalse(mock_spawn.called)
+        self.assertFalse(mock_gsn.called)
+        self.assertEqual({}, self.app.logger.get_increment_counts())
+        # each chunk read was timed
+        samples = self.app._hedge_response_times[
+            (None, self.app._error_limit_node_key(node), True)]
+        self.assertEqual(14, len(samples))
+
+    def test_hedged_read_stall_no_budget(self):
+        self.app.logger = debug_logger()
+        node = {'ip': '1.2.3.4', 'port': 6200, 'device': 'sda'}
+        source1 = self.SlowSource(['abcd', (0.05, '1234'), 'efgh'])
+        req, handler = self._make_hedged_handler(node, budget=0)
+
+        app_iter = handler._make_app_iter(req, node, source1)
+        with patch.object(handler, '_get_source_and_node') as mock_gsn:
+            client_chunks = list(app_iter)
+        self.assertEqual(client_chunks, ['abcd', '1234', 'efgh'])
+        self.assertFalse(mock_gsn.called)
+        self.assertEqual(
+            {'hedge.budget_exhausted': 1},
+            self.app.logger.get_increment_counts())
+
     def test_bytes_to_skip(self):
         # if you start at the beginning, skip nothing
         self.assertEqual(bytes_to_skip(1024, 0), 0)
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import mock
 import unittest
 
@@ -110,6 +111,146 @@ class TestContainerController(TestRingBase):
         from_memcache = self.app.memcache.get('container/a/c')
         self.assertTrue(from_memcache)
 
+    def _check_sharded_listing(self, query_string, shard_listings,
+                               shard_statuses=None, root_listing=None):
+        shard_ranges = [
+            {'name': '.shards_a/c-1', 'lower': '', 'upper': 'm'},
+            {'name': '.shards_a/c-2', 'lower': 'm', 'upper': ''}]
+        root_headers = {'X-Backend-Sharding-State': 'sharded',
+                        'X-Container-Object-Count': '4'}
+        root_body = json.dumps(root_listing or [])
+        # the root's own rows are asked for as JSON if the client did not
+        root_bodies = [root_body] if 'format=json' in query_string else \
+            ['', root_body]
+        root_statuses = [200] * len(root_bodies)
+        shard_statuses = shard_statuses or [200] * len(shard_listings)
+        bodies = root_bodies + [json.dumps(shard_ranges)] + [
+            json.dumps(listing) for listing in shard_listings]
+        headers = [root_headers] * len(root_bodies) + [
+            dict(root_headers, **{'X-Backend-Record-Type': 'shard'})
+        ] + [{}] * len(shard_listings)
+        req = Request.blank('/v1/a/c', query_string=query_string)
+        with mocked_http_conn(*(root_statuses + [200] + shard_statuses),
+                              body_iter=bodies,
+                              headers=headers) as fake_conn:
+            resp = req.get_response(self.app)
+        return resp, fake_conn.requests
+
+    def test_GET_sharded_container(self):
+        objects = [
+            {'name': name, 'hash': 'x', 'bytes': 1,
+             'content_type': 'text/plain',
+             'last_modified': '1970-01-01T00:00:01.000000'}
+            for name in ('a', 'b', 'n', 'o')]
+        resp, requests = self._check_sharded_listing(
+            'format=json', [objects[:2], objects[2:]])
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual(objects, json.loads(resp.body))
+        self.assertEqual('4', resp.headers['X-Container-Object-Count'])
+        self.assertEqual(['a/c', 'a/c', '.shards_a/c-1', '.shards_a/c-2'],
+                         [req['path'].split('/', 3)[3] for req in requests])
+        self.assertEqual('shard',
+                         requests[1]['headers']['X-Backend-Record-Type'])
+        # the second shard carries on after the first's last object
+        self.assertIn('marker=b', requests[3]['qs'])
+        self.assertIn('limit=9998', requests[3]['qs'])
+
+        resp, requests = self._check_sharded_listing(
+            'format=txt', [objects[:2], objects[2:]])
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual('a\nb\nn\no\n', resp.body)
+        self.assertEqual(['a/c', 'a/c', 'a/c', '.shards_a/c-1',
+                          '.shards_a/c-2'],
+                         [req['path'].split('/', 3)[3] for req in requests])
+        self.assertIn('format=json', requests[1]['qs'])
+
+        resp, requests = self._check_sharded_listing(
+            'format=xml', [objects[:2], objects[2:]])
+        self.assertEqual(200, resp.status_int)
+        self.assertIn('<name>n</name>', resp.body)
+        self.assertTrue(resp.body.startswith(
+            '<?xml version="1.0" encoding="UTF-8"?>\n<container name="c">'))
+
+        # the limit is met from the first shard
+        resp, requests = self._check_sharded_listing(
+            'format=json&limit=2', [objects[:2]])
+        self.assertEqual(objects[:2], json.loads(resp.body))
+        self.assertEqual(3, len(requests))
+
+    def test_GET_sharded_container_root_rows(self):
+        def record(name, timestamp):
+            return {'name': name, 'hash': 'x', 'bytes': 1,
+                    'content_type': 'text/plain',
+                    'last_modified': '1970-01-01T00:00:0%d.000000' % timestamp}
+
+        # rows not yet moved from the root, or sent to it since, are listed
+        # along with the shards' rows, and the newer of an object listed in
+        # both is kept
+        root_listing = [record('b', 2), record('c', 1), record('z', 1)]
+        resp, requests = self._check_sharded_listing(
+            'format=json', [[record('a', 1), record('b', 1)],
+                            [record('n', 1)]],
+            root_listing=root_listing)
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual([record('a', 1), record('b', 2), record('c', 1),
+                          record('n', 1), record('z', 1)],
+                         json.loads(resp.body))
+        resp, requests = self._check_sharded_listing(
+            'format=txt', [[record('a', 1), record('b', 1)],
+                           [record('n', 1)]],
+            root_listing=root_listing)
+        self.assertEqual('a\nb\nc\nn\nz\n', resp.body)
+
+        resp, requests = self._check_sharded_listing(
+            'format=json&limit=3', [[record('a', 1), record('b', 1)],
+                                    [record('n', 1)]],
+            root_listing=root_listing[:2])
+        self.assertEqual([record('a', 1), record('b', 2), record('c', 1)],
+                         json.loads(resp.body))
+
+        resp, requests = self._check_sharded_listing(
+            'format=json&reverse=true', [[record('n', 1)],
+                                         [record('b', 1), record('a', 1)]],
+            root_listing=list(reversed(root_listing)))
+        self.assertEqual([record('z', 1), record('n', 1), record('c', 1),
+                          record('b', 2), record('a', 1)],
+                         json.loads(resp.body))
+
+    def test_GET_sharded_container_subdirs(self):
+        resp, requests = self._check_sharded_listing(
+            'format=json&delimiter=/', [
+                [{'subdir': 'a/'}, {'subdir': 'm/'}],
+                [{'subdir': 'm/'}, {'subdir': 'z/'}]])
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual([{'subdir': 'a/'}, {'subdir': 'm/'},
+                          {'subdir': 'z/'}], json.loads(resp.body))
+
+    def test_GET_sharded_container_reverse(self):
+        resp, requests = self._check_sharded_listing(
+            'format=json&reverse=true&marker=x', [
+                [{'subdir': 'o/'}], [{'subdir': 'b/'}]])
+        self.assertEqual([{'subdir': 'o/'}, {'subdir': 'b/'}],
+                         json.loads(resp.body))
+        # the shard ranges are listed up to the marker and read in reverse
+        self.assertIn('end_marker=x', requests[1]['qs'])
+        self.assertIn('.shards_a/c-2', requests[2]['path'])
+        self.assertIn('.shards_a/c-1', requests[3]['path'])
+
+    def test_GET_sharded_container_shard_errors(self):
+        # every primary and handoff is asked for the shard's listing
+        node_count = self.CONTAINER_REPLICAS * 2
+        # a shard not yet created is empty
+        resp, requests = self._check_sharded_listing(
+            'format=json', [[]] * node_count + [[{'subdir': 'z/'}]],
+            shard_statuses=[404] * node_count + [200])
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual([{'subdir': 'z/'}], json.loads(resp.body))
+
+        resp, requests = self._check_sharded_listing(
+            'format=json', [[]] * node_count,
+            shard_statuses=[503] * node_count)
+        self.assertEqual(503, resp.status_int)
+
     def test_swift_owner(self):
         owner_headers = {
             'x-container-read': 'value', 'x-container-write': 'value',
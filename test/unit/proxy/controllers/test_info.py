@@ -31,10 +31,11 @@ class TestInfoController(unittest.TestCase):
         utils._swift_admin_info = {}
 
     def get_controller(self, expose_info=None, disallowed_sections=None,
-                       admin_key=None):
+                       admin_key=None, sorting_method='shuffle'):
         disallowed_sections = disallowed_sections or []
 
         app = Mock(spec=ProxyApp)
+        app.sorting_method = sorting_method
         return InfoController(app, None, expose_info,
                               disallowed_sections, admin_key)
 
@@ -162,6 +163,35 @@ class TestInfoController(unittest.TestCase):
         self.assertTrue('quux' in info['admin']['qux'])
         self.assertEqual(info['admin']['qux']['quux'], 'corge')
 
+    def test_get_admin_info_node_latency(self):
+        controller = self.get_controller(expose_info=True,
+                                         admin_key='secret-admin-key',
+                                         sorting_method='latency')
+        latency_info = {'1.2.3.4:6200/sda': {
+            'latency': 0.01, 'error_rate': 0.0, 'score': 0.01, 'age': 1.0}}
+        controller.app.get_node_latency_info.return_value = latency_info
+        utils._swift_admin_info = {'qux': {'quux': 'corge'}}
+
+        expires = int(time.time() + 86400)
+        sig = utils.get_hmac('GET', '/info', expires, 'secret-admin-key')
+        path = '/info?swiftinfo_sig={sig}&swiftinfo_expires={expires}'.format(
+            sig=sig, expires=expires)
+        req = Request.blank(
+            path, environ={'REQUEST_METHOD': 'GET'})
+        resp = controller.GET(req)
+        self.assertEqual('200 OK', str(resp))
+        info = json.loads(resp.body)
+        self.assertEqual(info['admin']['node_latency'], latency_info)
+        self.assertEqual(info['admin']['qux']['quux'], 'corge')
+
+        # not an admin request
+        req = Request.blank(
+            '/info', environ={'REQUEST_METHOD': 'GET'})
+        resp = controller.GET(req)
+        self.assertEqual('200 OK', str(resp))
+        self.assertNotIn('admin', json.loads(resp.body))
+        self.assertEqual(1, controller.app.get_node_latency_info.call_count)
+
     def test_head_admin_info(self):
         controller = self.get_controller(expose_info=True,
                                          admin_key='secret-admin-key')
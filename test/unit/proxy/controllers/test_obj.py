@@ -25,7 +25,7 @@ import json
 from hashlib import md5
 
 import mock
-from eventlet import Timeout
+from eventlet import sleep, Timeout
 from six import BytesIO
 from six.moves import range
 
@@ -289,6 +289,60 @@ class BaseObjectControllerMixin(object):
             resp = req.get_response(self.app)
         self.assertEqual(resp.status_int, 204)
 
+    def _check_sharded_update(self, method, codes, **kwargs):
+        captured = []
+
+        def capture_headers(ipaddr, port, device, partition, method, path,
+                            headers=None, **kwargs):
+            captured.append((method, path, headers))
+
+        req = swift.common.swob.Request.blank('/v1/a/c/o', method=method)
+        with set_http_connect(*codes, give_connect=capture_headers,
+                              **kwargs):
+            resp = req.get_response(self.app)
+        return resp, captured
+
+    def test_DELETE_sharded_container(self):
+        self.app.container_info['sharding_state'] = 'sharded'
+        shard_ranges = [
+            {'name': '.shards_a/c-1', 'lower': '', 'upper': 'n'},
+            {'name': '.shards_a/c-2', 'lower': 'n', 'upper': ''}]
+        # the shard ranges are not cached yet
+        codes = [200] + [204] * self.replicas()
+        resp, captured = self._check_sharded_update(
+            'DELETE', codes,
+            headers=[{'X-Backend-Record-Type': 'shard'}] +
+            [{}] * self.replicas(),
+            body_iter=[json.dumps(shard_ranges)] + [''] * self.replicas())
+        self.assertEqual(resp.status_int, 204)
+        method, path, headers = captured[0]
+        self.assertEqual(('GET', '/a/c', 'shard'),
+                         (method, path, headers['X-Backend-Record-Type']))
+        for method, path, headers in captured[1:]:
+            self.assertEqual('DELETE', method)
+            self.assertEqual('.shards_a/c-2',
+                             headers['X-Backend-Container-Path'])
+        self.assertEqual(shard_ranges,
+                         self.app.memcache.get('shard-updating/a/c'))
+
+        # now they are
+        self.app.memcache.set('shard-updating/a/c', shard_ranges[::-1])
+        resp, captured = self._check_sharded_update(
+            'DELETE', [204] * self.replicas())
+        self.assertEqual(resp.status_int, 204)
+        self.assertEqual(['.shards_a/c-2'] * self.replicas(), [
+            headers['X-Backend-Container-Path']
+            for method, path, headers in captured])
+
+    def test_DELETE_unsharded_container(self):
+        self.app.memcache.set('shard-updating/a/c', [
+            {'name': '.shards_a/c-1', 'lower': '', 'upper': ''}])
+        resp, captured = self._check_sharded_update(
+            'DELETE', [204] * self.replicas())
+        self.assertEqual(resp.status_int, 204)
+        for method, path, headers in captured:
+            self.assertNotIn('X-Backend-Container-Path', headers)
+
     def test_DELETE_missing_one(self):
         # Obviously this test doesn't work if we're testing 1 replica.
         # In that case, we don't have any failovers to check.
@@ -1078,6 +1132,57 @@ class TestReplicatedObjController(BaseObjectControllerMixin,
         self.assertEqual(resp.status_int, 200)
         self.assertIn('Accept-Ranges', resp.headers)
 
+    def test_GET_hedged(self):
+        self.app.hedged_gets = True
+        self.app.hedge_budget = 1
+        self.app.sort_nodes = lambda l: l
+        req = swift.common.swob.Request.blank('/v1/a/c/o')
+        # until the first node has answered enough requests there is no
+        # hedge timeout for it
+        for _ in range(10):
+            with set_http_connect(200):
+                resp = req.get_response(self.app)
+            self.assertEqual(resp.status_int, 200)
+        self.assertEqual({}, self.logger.get_increment_counts())
+
+        def slow_connect(*args, **kwargs):
+            if kwargs['connection_id'] == 0:
+                sleep(0.1)
+
+        # bodies are handed out as connections are made, and the first
+        # node's connection is made last
+        with set_http_connect(200, 200, body_iter=['fast', 'slow'],
+                              give_connect=slow_connect):
+            resp = req.get_response(self.app)
+            self.assertEqual(resp.status_int, 200)
+            self.assertEqual(resp.body, 'fast')
+            self.assertEqual({'hedge.sent': 1, 'hedge.won': 1},
+                             self.logger.get_increment_counts())
+            # the time saved is reported once the slow node answers
+            sleep(0.2)
+        self.assertEqual(['hedge.saved'], [
+            args[0] for args, kwargs in
+            self.logger.log_dict['timing_since']])
+
+    def test_GET_hedged_no_budget(self):
+        self.app.hedged_gets = True
+        self.app.hedge_budget = 0
+        self.app.sort_nodes = lambda l: l
+        req = swift.common.swob.Request.blank('/v1/a/c/o')
+        for _ in range(10):
+            with set_http_connect(200):
+                req.get_response(self.app)
+
+        def slow_connect(*args, **kwargs):
+            sleep(0.1)
+
+        with set_http_connect(200, body='slow', give_connect=slow_connect):
+            resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(resp.body, 'slow')
+        self.assertEqual({'hedge.budget_exhausted': 1},
+                         self.logger.get_increment_counts())
+
     def test_GET_transfer_encoding_chunked(self):
         req = swift.common.swob.Request.blank('/v1/a/c/o')
         with set_http_connect(200, headers={'transfer-encoding': 'chunked'}):
@@ -1622,6 +1727,14 @@ class TestECObjController(BaseObjectControllerMixin, unittest.TestCase):
         self.assertEqual(len(real_body), len(resp.body))
         self.assertEqual(real_body, resp.body)
 
+    def test_GET_with_body_coding_pipeline(self):
+        self.app.ec_pipeline_depth = 2
+        with mock.patch('swift.proxy.controllers.obj.tpool.execute',
+                        side_effect=lambda f, *a: f(*a)) as mock_execute:
+            self.test_GET_with_body()
+        # one decode per segment, off the hub
+        self.assertEqual(4, mock_execute.call_count)
+
     def test_PUT_simple(self):
         req = swift.common.swob.Request.blank('/v1/a/c/o', method='PUT',
                                               body='')
@@ -1634,6 +1747,13 @@ class TestECObjController(BaseObjectControllerMixin, unittest.TestCase):
             resp = req.get_response(self.app)
         self.assertEqual(resp.status_int, 201)
 
+    def test_PUT_with_body_coding_pipeline(self):
+        self.app.ec_pipeline_depth = 2
+        with mock.patch('swift.proxy.controllers.obj.tpool.execute',
+                        side_effect=lambda f, *a: f(*a)) as mock_execute:
+            self.test_PUT_with_body()
+        self.assertTrue(mock_execute.called)
+
     def test_PUT_with_body_and_bad_etag(self):
         segment_size = self.policy.ec_segment_size
         test_body = ('asdf' * segment_size)[:-10]
@@ -2260,6 +2380,123 @@ class TestECObjController(BaseObjectControllerMixin, unittest.TestCase):
         self.assertEqual(len(response_map),
                          len(primary_nodes) - self.policy.ec_ndata)
 
+    def _make_systematic_response_map(self, test_data):
+        etag = md5(test_data).hexdigest()
+        ec_archive_bodies = self._make_ec_archive_bodies(test_data)
+        _part, primary_nodes = self.obj_ring.get_nodes('a', 'c', 'o')
+        return {
+            (n['ip'], n['port']): StubResponse(200, ec_archive_bodies[i], {
+                'X-Object-Sysmeta-Ec-Content-Length': len(test_data),
+                'X-Object-Sysmeta-Ec-Etag': etag,
+                'X-Object-Sysmeta-Ec-Frag-Index': i,
+            }) for i, n in enumerate(primary_nodes)
+        }, primary_nodes
+
+    def test_GET_systematic_data_fragments_only(self):
+        self.assertTrue(self.policy.ec_systematic)  # sanity
+        segment_size = self.policy.ec_segment_size
+        test_data = ('test' * segment_size)[:-657]
+        response_map, primary_nodes = \
+            self._make_systematic_response_map(test_data)
+
+        def get_response(req):
+            return response_map.pop((req['ip'], req['port']))
+
+        driver = self.policy.pyeclib_driver
+        req = swob.Request.blank('/v1/a/c/o')
+        with capture_http_requests(get_response) as log, \
+                mock.patch.object(driver, 'decode') as mock_decode:
+            resp = req.get_response(self.app)
+            body = resp.body
+
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(body, test_data)
+        # only the primaries holding data fragments were asked...
+        self.assertEqual(
+            sorted((n['ip'], n['port'])
+                   for n in primary_nodes[:self.policy.ec_ndata]),
+            sorted((conn.req['ip'], conn.req['port']) for conn in log))
+        # ... and their fragments were simply joined up
+        self.assertFalse(mock_decode.called)
+
+    def test_GET_systematic_with_range(self):
+        segment_size = self.policy.ec_segment_size
+        test_data = ('test' * segment_size)[:-657]
+        response_map, _junk = self._make_systematic_response_map(test_data)
+
+        def get_response(req):
+            resp = response_map.pop((req['ip'], req['port']))
+            start, end = [int(x) for x in
+                          req['headers']['Range'].split('=')[1].split('-')]
+            body = resp.body
+            end = min(end, len(body) - 1)
+            resp = StubResponse(206, body[start:end + 1], resp.headers)
+            resp.headers['Content-Type'] = 'text/plain'
+            resp.headers['Content-Range'] = 'bytes %s-%s/%s' % (
+                start, end, len(body))
+            resp.headers['Content-Length'] = end + 1 - start
+            return resp
+
+        driver = self.policy.pyeclib_driver
+        req = swob.Request.blank('/v1/a/c/o', headers={
+            'Range': 'bytes=%s-%s' % (segment_size - 3, segment_size + 4)})
+        with capture_http_requests(get_response), \
+                mock.patch.object(driver, 'decode') as mock_decode:
+            resp = req.get_response(self.app)
+            body = resp.body
+
+        self.assertEqual(resp.status_int, 206)
+        self.assertEqual(body,
+                         test_data[segment_size - 3:segment_size + 5])
+        self.assertFalse(mock_decode.called)
+
+    def test_GET_systematic_falls_back_to_parity(self):
+        segment_size = self.policy.ec_segment_size
+        test_data = ('test' * segment_size)[:-657]
+        response_map, primary_nodes = \
+            self._make_systematic_response_map(test_data)
+        # one of the data fragments is missing
+        data_node = random.choice(primary_nodes[:self.policy.ec_ndata])
+        response_map[(data_node['ip'], data_node['port'])] = StubResponse(404)
+
+        def get_response(req):
+            return response_map.pop((req['ip'], req['port']))
+
+        driver = self.policy.pyeclib_driver
+        req = swob.Request.blank('/v1/a/c/o')
+        with capture_http_requests(get_response) as log, \
+                mock.patch.object(driver, 'decode',
+                                  wraps=driver.decode) as mock_decode:
+            resp = req.get_response(self.app)
+            body = resp.body
+
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(body, test_data)
+        # one parity fragment made up for the missing data fragment
+        self.assertEqual(len(log), self.policy.ec_ndata + 1)
+        self.assertEqual(4, mock_decode.call_count)
+
+    def test_GET_not_systematic_decodes(self):
+        segment_size = self.policy.ec_segment_size
+        test_data = ('test' * segment_size)[:-657]
+        response_map, _junk = self._make_systematic_response_map(test_data)
+
+        def get_response(req):
+            return response_map.pop((req['ip'], req['port']))
+
+        driver = self.policy.pyeclib_driver
+        req = swob.Request.blank('/v1/a/c/o')
+        with capture_http_requests(get_response), \
+                mock.patch.object(driver, 'decode',
+                                  wraps=driver.decode) as mock_decode, \
+                mock.patch.object(self.policy, '_ec_type', 'shss'):
+            resp = req.get_response(self.app)
+            body = resp.body
+
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(body, test_data)
+        self.assertEqual(4, mock_decode.call_count)
+
     def test_GET_with_single_missed_overwrite_does_not_need_handoff(self):
         obj1 = self._make_ec_object_stub()
         obj2 = self._make_ec_object_stub()
@@ -2886,5 +3123,75 @@ class TestECObjController(BaseObjectControllerMixin, unittest.TestCase):
         self.assertEqual(resp.headers['Accept-Ranges'], 'bytes')
 
 
+class TestECCodingPipeline(unittest.TestCase):
+
+    def setUp(self):
+        # the calls sleep cooperatively, standing in for native threads
+        patcher = mock.patch('swift.proxy.controllers.obj.tpool.execute',
+                             side_effect=lambda f, *a: f(*a))
+        self.mock_execute = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_inline(self):
+        pipeline = obj.ECCodingPipeline()
+        self.assertEqual([4], pipeline.submit(lambda x: x * 2, 2))
+        self.assertEqual([], pipeline.drain())
+        self.assertFalse(self.mock_execute.called)
+
+    def test_results_in_order(self):
+        finished = []
+
+        def work(n, delay):
+            sleep(delay)
+            finished.append(n)
+            return n
+
+        pipeline = obj.ECCodingPipeline(3)
+        results = []
+        for n, delay in enumerate((0.05, 0.01, 0.0, 0.02, 0.0)):
+            results.extend(pipeline.submit(work, n, delay))
+        results.extend(pipeline.drain())
+        self.assertEqual([0, 1, 2, 3, 4], results)
+        # they didn't finish in that order though
+        self.assertNotEqual([0, 1, 2, 3, 4], finished)
+        self.assertEqual(5, self.mock_execute.call_count)
+
+    def test_depth(self):
+        in_progress = []
+        max_in_progress = []
+
+        def work(n):
+            in_progress.append(n)
+            max_in_progress.append(len(in_progress))
+            sleep(0.01)
+            in_progress.remove(n)
+            return n
+
+        pipeline = obj.ECCodingPipeline(2)
+        results = []
+        for n in range(6):
+            results.extend(pipeline.submit(work, n))
+            self.assertLessEqual(len(pipeline._pending), 2)
+        results.extend(pipeline.drain())
+        self.assertEqual(list(range(6)), results)
+        self.assertEqual(2, max(max_in_progress))
+
+    def test_error(self):
+        def work(n):
+            # the failing call is over before the one ahead of it, so it
+            # is found as soon as that one is waited for
+            if n == 1:
+                raise ECDriverError('kaboom')
+            sleep(0.01)
+            return n
+
+        pipeline = obj.ECCodingPipeline(2)
+        self.assertEqual([], pipeline.submit(work, 0))
+        self.assertEqual([], pipeline.submit(work, 1))
+        with self.assertRaises(ECDriverError) as cm:
+            pipeline.submit(work, 2)
+        self.assertEqual('kaboom', str(cm.exception))
+
+
 if __name__ == '__main__':
     unittest.main()
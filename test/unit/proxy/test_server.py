@@ -53,9 +53,9 @@ from swift.common.utils import hash_path, storage_directory, \
     iter_multipart_mime_documents, public
 
 from test.unit import (
-    connect_tcp, readuntil2crlfs, FakeLogger, fake_http_connect, FakeRing,
-    FakeMemcache, debug_logger, patch_policies, write_fake_ring,
-    mocked_http_conn, DEFAULT_TEST_EC_TYPE)
+    connect_tcp, readuntil2crlfs, read_chunked_body, FakeLogger,
+    fake_http_connect, FakeRing, FakeMemcache, debug_logger, patch_policies,
+    write_fake_ring, mocked_http_conn, DEFAULT_TEST_EC_TYPE)
 from swift.proxy import server as proxy_server
 from swift.proxy.controllers.obj import ReplicatedObjectController
 from swift.obj import server as object_server
@@ -64,7 +64,7 @@ from swift.common.middleware import proxy_logging, versioned_writes, \
 from swift.common.middleware.acl import parse_acl, format_acl
 from swift.common.exceptions import ChunkReadTimeout, DiskFileNotExist, \
     APIVersionError, ChunkWriteTimeout
-from swift.common import utils, constraints
+from swift.common import bufferedhttp, utils, constraints
 from swift.common.utils import mkdirs, NullLogger
 from swift.common.wsgi import monkey_patch_mimetools, loadapp
 from swift.proxy.controllers import base as proxy_base
@@ -722,6 +722,36 @@ class TestProxyServer(unittest.TestCase):
         finally:
             rmtree(swift_dir, ignore_errors=True)
 
+    def test_backend_keepalive(self):
+        self.addCleanup(bufferedhttp.set_connection_pool, None)
+        app = proxy_server.Application({}, FakeMemcache(),
+                                       container_ring=FakeRing(),
+                                       account_ring=FakeRing())
+        self.assertFalse(app.backend_keepalive)
+        self.assertIsNone(bufferedhttp._connection_pool)
+
+        app = proxy_server.Application({'backend_keepalive': 'yes'},
+                                       FakeMemcache(),
+                                       container_ring=FakeRing(),
+                                       account_ring=FakeRing())
+        self.assertTrue(app.backend_keepalive)
+        pool = bufferedhttp._connection_pool
+        self.assertIsInstance(pool, bufferedhttp.ConnectionPool)
+        self.assertEqual(8, pool.max_idle_per_node)
+        self.assertEqual(10, pool.idle_timeout)
+        self.assertIs(app.logger, pool.logger)
+
+        app = proxy_server.Application({'backend_keepalive': 'yes',
+                                        'backend_max_idle_per_node': '3',
+                                        'backend_idle_timeout': '2.5'},
+                                       FakeMemcache(),
+                                       container_ring=FakeRing(),
+                                       account_ring=FakeRing())
+        self.assertIsNot(pool, bufferedhttp._connection_pool)
+        pool = bufferedhttp._connection_pool
+        self.assertEqual(3, pool.max_idle_per_node)
+        self.assertEqual(2.5, pool.idle_timeout)
+
     def test_node_timing(self):
         baseapp = proxy_server.Application({'sorting_method': 'timing'},
                                            FakeMemcache(),
@@ -749,6 +779,153 @@ class TestProxyServer(unittest.TestCase):
                        {'ip': '127.0.0.1'}]
         self.assertEqual(res, exp_sorting)
 
+    def test_node_latency(self):
+        baseapp = proxy_server.Application({'sorting_method': 'latency',
+                                            'node_timeout': '10'},
+                                           FakeMemcache(),
+                                           container_ring=FakeRing(),
+                                           account_ring=FakeRing())
+        self.assertEqual(baseapp.node_latency, {})
+        self.assertEqual(0.3, baseapp.latency_decay)
+        sda = {'ip': '127.0.0.1', 'port': 6200, 'device': 'sda'}
+        sdb = {'ip': '127.0.0.1', 'port': 6200, 'device': 'sdb'}
+        sdc = {'ip': '127.0.0.2', 'port': 6200, 'device': 'sdc'}
+
+        # measurements are kept per device, not per ip
+        baseapp.set_node_timing(sda, 0.1)
+        baseapp.set_node_timing(sdb, 1.0)
+        self.assertEqual(baseapp.node_timings, {})
+        self.assertEqual(0.1, baseapp.node_latency_score(sda))
+        self.assertEqual(1.0, baseapp.node_latency_score(sdb))
+        self.assertEqual(0.0, baseapp.node_latency_score(sdc))
+
+        # moving average
+        baseapp.set_node_timing(sda, 0.2)
+        self.assertAlmostEqual(0.13, baseapp.node_latency_score(sda))
+
+        # errors are weighted by node_timeout
+        baseapp.error_occurred(sdb, 'oops')
+        stats = baseapp.node_latency['127.0.0.1:6200/sdb']
+        self.assertEqual(1.0, stats['latency'])
+        self.assertAlmostEqual(0.3, stats['error_rate'])
+        self.assertAlmostEqual(4.0, baseapp.node_latency_score(sdb))
+        try:
+            raise Exception('kaboom')
+        except Exception:
+            baseapp.exception_occurred(sdc, 'Object', 'oops')
+        self.assertAlmostEqual(10.0, baseapp.node_latency_score(sdc))
+
+        info = baseapp.get_node_latency_info()
+        self.assertEqual(['127.0.0.1:6200/sda', '127.0.0.1:6200/sdb',
+                          '127.0.0.2:6200/sdc'], sorted(info))
+        self.assertAlmostEqual(4.0, info['127.0.0.1:6200/sdb']['score'])
+        self.assertAlmostEqual(0.3, info['127.0.0.1:6200/sdb']['error_rate'])
+
+        # the best of two nodes picked at random goes first
+        nodes = [sdc, sdb, sda]
+        with mock.patch('swift.proxy.server.shuffle', lambda l: l), \
+                mock.patch('swift.proxy.server.sample',
+                           side_effect=[[0, 1], [1, 0]]):
+            res = baseapp.sort_nodes(nodes)
+        self.assertIs(res, nodes)
+        self.assertEqual([sdb, sda, sdc], res)
+        with mock.patch('swift.proxy.server.shuffle', lambda l: l), \
+                mock.patch('swift.proxy.server.sample',
+                           side_effect=[[2, 1], [0, 1]]):
+            res = baseapp.sort_nodes(nodes)
+        self.assertEqual([sda, sdb, sdc], res)
+        # whatever the choices, the worst node never goes first
+        for _ in range(20):
+            self.assertNotEqual(sdc, baseapp.sort_nodes(nodes)[0])
+
+        # measurements expire
+        with mock.patch('swift.proxy.server.time',
+                        return_value=time.time() + baseapp.timing_expiry):
+            self.assertEqual(0.0, baseapp.node_latency_score(sdc))
+            self.assertEqual({}, baseapp.get_node_latency_info())
+
+    def test_node_latency_other_sorting_method(self):
+        baseapp = proxy_server.Application({'sorting_method': 'timing'},
+                                           FakeMemcache(),
+                                           container_ring=FakeRing(),
+                                           account_ring=FakeRing())
+        node = {'ip': '127.0.0.1', 'port': 6200, 'device': 'sda'}
+        baseapp.set_node_timing(node, 0.1)
+        baseapp.error_occurred(node, 'oops')
+        self.assertEqual({}, baseapp.node_latency)
+        self.assertEqual(['127.0.0.1'], list(baseapp.node_timings))
+
+    def test_hedge_timeout(self):
+        baseapp = proxy_server.Application({'hedged_gets': 'yes',
+                                            'hedge_percentile': '90'},
+                                           FakeMemcache(),
+                                           container_ring=FakeRing(),
+                                           account_ring=FakeRing())
+        self.assertTrue(baseapp.hedged_gets)
+        self.assertEqual(90, baseapp.hedge_percentile)
+        sda = {'ip': '127.0.0.1', 'port': 6200, 'device': 'sda'}
+        sdb = {'ip': '127.0.0.1', 'port': 6200, 'device': 'sdb'}
+        for i in range(1, proxy_server.HEDGE_MIN_SAMPLES):
+            baseapp.record_response_time(0, sda, i / 100.0)
+        self.assertIsNone(baseapp.get_hedge_timeout(0, sda))
+        baseapp.record_response_time(0, sda, 0.1)
+        self.assertEqual(0.1, baseapp.get_hedge_timeout(0, sda))
+        # kept per policy and device
+        self.assertIsNone(baseapp.get_hedge_timeout(1, sda))
+        self.assertIsNone(baseapp.get_hedge_timeout(0, sdb))
+        # only recent response times count
+        for i in range(proxy_server.HEDGE_SAMPLES):
+            baseapp.record_response_time(0, sda, 1.0 + i)
+        self.assertEqual(91.0, baseapp.get_hedge_timeout(0, sda))
+        # chunk read times are kept apart from response times
+        self.assertIsNone(baseapp.get_hedge_timeout(0, sda, chunk_read=True))
+        for i in range(proxy_server.HEDGE_MIN_SAMPLES):
+            baseapp.record_response_time(0, sda, 0.5, chunk_read=True)
+        self.assertEqual(0.5, baseapp.get_hedge_timeout(
+            0, sda, chunk_read=True))
+        self.assertEqual(91.0, baseapp.get_hedge_timeout(0, sda))
+
+    def test_hedge_budget(self):
+        baseapp = proxy_server.Application({'hedge_budget': '0.25'},
+                                           FakeMemcache(),
+                                           container_ring=FakeRing(),
+                                           account_ring=FakeRing())
+        self.assertFalse(baseapp.hedged_gets)
+        baseapp.logger = debug_logger()
+        for i in range(3):
+            baseapp.add_hedge_budget()
+        self.assertFalse(baseapp.take_hedge())
+        baseapp.add_hedge_budget()
+        self.assertTrue(baseapp.take_hedge())
+        self.assertFalse(baseapp.take_hedge())
+        self.assertEqual({'hedge.sent': 1, 'hedge.budget_exhausted': 2},
+                         baseapp.logger.get_increment_counts())
+        # unused budget only saves up so far
+        for i in range(100):
+            baseapp.add_hedge_budget()
+        for i in range(proxy_server.HEDGE_BURST):
+            self.assertTrue(baseapp.take_hedge())
+        self.assertFalse(baseapp.take_hedge())
+
+    def test_ec_coding_threads(self):
+        with mock.patch('swift.proxy.server.tpool') as mock_tpool:
+            app = proxy_server.Application({}, FakeMemcache(),
+                                           container_ring=FakeRing(),
+                                           account_ring=FakeRing())
+        self.assertEqual(0, app.ec_coding_threads)
+        self.assertEqual(0, app.ec_pipeline_depth)
+        self.assertFalse(mock_tpool.set_num_threads.called)
+
+        with mock.patch('swift.proxy.server.tpool') as mock_tpool:
+            app = proxy_server.Application({'ec_coding_threads': '4',
+                                            'ec_pipeline_depth': '3'},
+                                           FakeMemcache(),
+                                           container_ring=FakeRing(),
+                                           account_ring=FakeRing())
+        self.assertEqual(4, app.ec_coding_threads)
+        self.assertEqual(3, app.ec_pipeline_depth)
+        mock_tpool.set_num_threads.assert_called_once_with(4)
+
     def test_node_affinity(self):
         baseapp = proxy_server.Application({'sorting_method': 'affinity',
                                             'read_affinity': 'r1=1'},
@@ -4448,7 +4625,7 @@ class TestObjectController(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 200'
         self.assertEqual(headers[:len(exp)], exp)
-        containers = fd.read().split('\n')
+        containers = read_chunked_body(fd).split('\n')
         self.assertTrue(ustr in containers)
         # List account with ustr container (test json)
         sock = connect_tcp(('localhost', prolis.getsockname()[1]))
@@ -4460,7 +4637,7 @@ class TestObjectController(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 200'
         self.assertEqual(headers[:len(exp)], exp)
-        listing = json.loads(fd.read())
+        listing = json.loads(read_chunked_body(fd))
         self.assertTrue(ustr.decode('utf8') in [l['name'] for l in listing])
         # List account with ustr container (test xml)
         sock = connect_tcp(('localhost', prolis.getsockname()[1]))
@@ -4472,7 +4649,7 @@ class TestObjectController(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 200'
         self.assertEqual(headers[:len(exp)], exp)
-        self.assertTrue('<name>%s</name>' % ustr in fd.read())
+        self.assertTrue('<name>%s</name>' % ustr in read_chunked_body(fd))
         # Create ustr object with ustr metadata in ustr container
         sock = connect_tcp(('localhost', prolis.getsockname()[1]))
         fd = sock.makefile()
@@ -4495,7 +4672,7 @@ class TestObjectController(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 200'
         self.assertEqual(headers[:len(exp)], exp)
-        objects = fd.read().split('\n')
+        objects = read_chunked_body(fd).split('\n')
         self.assertTrue(ustr in objects)
         # List ustr container with ustr object (test json)
         sock = connect_tcp(('localhost', prolis.getsockname()[1]))
@@ -4508,7 +4685,7 @@ class TestObjectController(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 200'
         self.assertEqual(headers[:len(exp)], exp)
-        listing = json.loads(fd.read())
+        listing = json.loads(read_chunked_body(fd))
         self.assertEqual(listing[0]['name'], ustr.decode('utf8'))
         # List ustr container with ustr object (test xml)
         sock = connect_tcp(('localhost', prolis.getsockname()[1]))
@@ -4521,7 +4698,7 @@ class TestObjectController(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 200'
         self.assertEqual(headers[:len(exp)], exp)
-        self.assertTrue('<name>%s</name>' % ustr in fd.read())
+        self.assertTrue('<name>%s</name>' % ustr in read_chunked_body(fd))
         # Retrieve ustr object with ustr metadata
         sock = connect_tcp(('localhost', prolis.getsockname()[1]))
         fd = sock.makefile()
@@ -8330,7 +8507,7 @@ class TestSocketObjectVersions(unittest.TestCase):
                      'X-Storage-Token: t\r\n\r\n' % vc)
             fd.flush()
             headers = readuntil2crlfs(fd)
-            body = fd.read()
+            body = read_chunked_body(fd)
             return headers, body
 
         # Ensure we have the right number of versions saved
@@ -8435,7 +8612,7 @@ class TestSocketObjectVersions(unittest.TestCase):
             headers = readuntil2crlfs(fd)
             exp = 'HTTP/1.1 2'  # 2xx series response
             self.assertEqual(headers[:len(exp)], exp)
-            body = fd.read()
+            body = read_chunked_body(fd)
             versions = [x for x in body.split('\n') if x]
             self.assertEqual(len(versions), segment - 1)
 
@@ -8556,7 +8733,7 @@ class TestSocketObjectVersions(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 2'  # 2xx series response
         self.assertEqual(headers[:len(exp)], exp)
-        body = fd.read()
+        body = read_chunked_body(fd)
         versions = [x for x in body.split('\n') if x]
         self.assertEqual(len(versions), 1)
 